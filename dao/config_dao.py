@@ -17,6 +17,19 @@ def create_sc_odm(config: SystemConfig) -> TradeConfigInfo:
     sc_odm.direction = t_config.direction
     sc_odm.is_backtest = t_config.is_backtest
     sc_odm.strategy_ids = t_config.strategies
+    sc_odm.lazy_kline = getattr(t_config, "lazy_kline", False)
+    sc_odm.aggregate_kline = getattr(t_config, "aggregate_kline", False)
+    sc_odm.async_order = getattr(t_config, "async_order", False)
+    sc_odm.write_behind = getattr(t_config, "write_behind", False)
+    sc_odm.backtest_dump = getattr(t_config, "backtest_dump", "mongo")
+    sc_odm.backtest_processes = getattr(t_config, "backtest_processes", 1)
+    sc_odm.backtest_chunks = getattr(t_config, "backtest_chunks", 1)
+    sc_odm.backtest_warmup_days = getattr(t_config, "backtest_warmup_days", 30)
+    sc_odm.replay_dir = getattr(t_config, "replay_dir", "")
+    sc_odm.prescan = getattr(t_config, "prescan", False)
+    sc_odm.notify_digest_window = getattr(t_config, "notify_digest_window", 0)
+    sc_odm.metrics_port = getattr(t_config, "metrics_port", 0)
+    sc_odm.metrics_log_interval = getattr(t_config, "metrics_log_interval", 0)
     bd = BacktestDays()
     bd.start_date = t_config.start_date
     bd.end_date = t_config.end_date
@@ -34,36 +47,58 @@ def get_fc_odms() -> list[FutureConfigInfo]:
     return FutureConfigInfo.objects().order_by("symbol")
 
 
+def build_fc_odm(config: FutureConfig) -> FutureConfigInfo:
+    """根据配置文件内容生成期货配置信息, 不保存到数据库中"""
+    long_config = LongConfig()
+    ltc = config.long_trade_config
+    long_config.base_scale = ltc.base_scale
+    long_config.profit_start_scale_1 = ltc.profit_start_scale_1
+    long_config.profit_start_scale_2 = ltc.profit_start_scale_2
+    long_config.promote_scale_1 = ltc.promote_scale_1
+    long_config.promote_scale_2 = ltc.promote_scale_2
+    long_config.promote_target_1 = ltc.promote_target_1
+    long_config.promote_target_2 = ltc.promote_target_2
+    long_config.stop_loss_scale = ltc.stop_loss_scale
+    short_config = ShortConfig()
+    stc = config.short_trade_config
+    short_config.base_scale = stc.base_scale
+    short_config.profit_start_scale = stc.profit_start_scale
+    short_config.promote_scale = stc.promote_scale
+    short_config.promote_target = stc.promote_target
+    short_config.stop_loss_scale = stc.stop_loss_scale
+    return FutureConfigInfo(
+        symbol=config.symbol,
+        name=config.name,
+        open_pos_scale=config.open_pos_scale,
+        switch_days=config.switch_days,
+        main_symbols=config.main_symbols,
+        multiple=config.multiple,
+        is_active=bool(config.is_active),
+        long_config=long_config,
+        short_config=short_config,
+    )
+
+
+def build_fc_odms(configs: list[FutureConfig]) -> list[FutureConfigInfo]:
+    """生成期货配置信息, 与数据库中读取的一样按品种排序"""
+    fc_odms = [build_fc_odm(config) for config in configs]
+    return sorted(fc_odms, key=lambda fc_odm: fc_odm.symbol)
+
+
 def craeate_fc_odm(configs: list[FutureConfig]) -> list[FutureConfigInfo]:
     for config in configs:
-        long_config = LongConfig()
-        ltc = config.long_trade_config
-        long_config.base_scale = ltc.base_scale
-        long_config.profit_start_scale_1 = ltc.profit_start_scale_1
-        long_config.profit_start_scale_2 = ltc.profit_start_scale_2
-        long_config.promote_scale_1 = ltc.promote_scale_1
-        long_config.promote_scale_2 = ltc.promote_scale_2
-        long_config.promote_target_1 = ltc.promote_target_1
-        long_config.promote_target_2 = ltc.promote_target_2
-        long_config.stop_loss_scale = ltc.stop_loss_scale
-        short_config = ShortConfig()
-        stc = config.short_trade_config
-        short_config.base_scale = stc.base_scale
-        short_config.profit_start_scale = stc.profit_start_scale
-        short_config.promote_scale = stc.promote_scale
-        short_config.promote_target = stc.promote_target
-        short_config.stop_loss_scale = stc.stop_loss_scale
+        fc_odm = build_fc_odm(config)
         FutureConfigInfo.objects(symbol=config.symbol).update_one(
             upsert=True,
             full_result=True,
-            set_on_insert__symbol=config.symbol,
-            set_on_insert__name=config.name,
-            set__open_pos_scale=config.open_pos_scale,
-            set__switch_days=config.switch_days,
-            set__main_symbols=config.main_symbols,
-            set__multiple=config.multiple,
-            set__is_active=bool(config.is_active),
-            set__long_config=long_config,
-            set__short_config=short_config,
+            set_on_insert__symbol=fc_odm.symbol,
+            set_on_insert__name=fc_odm.name,
+            set__open_pos_scale=fc_odm.open_pos_scale,
+            set__switch_days=fc_odm.switch_days,
+            set__main_symbols=fc_odm.main_symbols,
+            set__multiple=fc_odm.multiple,
+            set__is_active=fc_odm.is_active,
+            set__long_config=fc_odm.long_config,
+            set__short_config=fc_odm.short_config,
         )
     return get_fc_odms()
@@ -26,3 +26,11 @@ def get_future_configs(configs: list[FutureConfig], is_backtest=False
         if len(fc_odms) == 0:
             fc_odms = dao.craeate_fc_odm(configs)
     return fc_odms
+
+
+def build_future_configs(configs: list[FutureConfig]
+                         ) -> list[odm_fc.FutureConfigInfo]:
+    '''根据给定的配置生成期货交易品种的配置信息, 不读写数据库
+    用于并行回测和参数扫描, 各进程使用各自的配置, 互不影响
+    '''
+    return dao.build_fc_odms(configs)
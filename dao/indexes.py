@@ -0,0 +1,222 @@
+"""数据库索引管理
+
+所需的索引在各模型的 meta 中声明, 连接数据库后由 ensure_indexes 统一创建并检查。
+HOT_QUERIES 列出交易过程中频繁执行查询的 DAO 函数, explain_hot_queries 用 QueryRecorder
+记录这些函数通过存储执行的查询, 再按 MongoStorage 相同的方式生成查询集执行 explain,
+确认这些查询都使用了索引, 不会扫描整个集合。DIRECT_QUERIES 为不经过存储的 DAO 中的查询。
+预加载交易状态时读取整个集合的查询本来就是全集合扫描, 不在其中。
+"""
+
+import logging
+from datetime import date, datetime
+from typing import Callable, Optional
+
+from mongoengine import Document
+from mongoengine.queryset.queryset import QuerySet
+
+import dao.trade.bottom_trade_dao as bdao
+import dao.trade.main_trade_dao as mdao
+import dao.trade.storage as storage
+import dao.trade.trade_dao as dao
+import dao.trade.trade_service as t_service
+from dao.odm.future_config import FutureConfigInfo
+from dao.odm.future_trade import (
+    BottomOpenVolume,
+    BottomOpenVolumeTip,
+    BottomTradeStatus,
+    MainDailyConditionTip,
+    MainJointSymbolStatus,
+    MainOpenVolume,
+    MainTradeStatus,
+    SwitchSymbolTradeRecord,
+)
+from dao.odm.trade_log import TradeRecord
+from dao.trade.storage import MongoStorage, TradeStorage
+
+logger = logging.getLogger(__name__)
+
+# 需要创建索引的模型
+INDEXED_DOCUMENTS: tuple[type[Document], ...] = (
+    MainTradeStatus,
+    BottomTradeStatus,
+    MainJointSymbolStatus,
+    SwitchSymbolTradeRecord,
+    MainOpenVolume,
+    BottomOpenVolume,
+    MainDailyConditionTip,
+    BottomOpenVolumeTip,
+    TradeRecord,
+    FutureConfigInfo,
+)
+
+_SYMBOL = "SHFE.rb2405"
+_CUSTOM_SYMBOL = "SHFE_rb_main_long"
+_DAY = datetime(2024, 1, 2)
+
+# 频繁执行查询的 DAO 函数, 键为查询名称
+HOT_QUERIES: dict[str, Callable[[], object]] = {
+    "main_trade_status": lambda: mdao.getTradeStatus(_SYMBOL, 1),
+    "main_trade_status_by_custom_symbol": lambda: (
+        mdao.getTradeStatusByCustomSymbol(_CUSTOM_SYMBOL)
+    ),
+    "bottom_trade_status": lambda: bdao.getTradeStatus(_SYMBOL, 1),
+    "bottom_trade_status_by_custom_symbol": lambda: (
+        bdao.getTradeStatusByCustomSymbol(_CUSTOM_SYMBOL)
+    ),
+    "main_joint_symbol_status": lambda: (
+        dao.getMainJointSymbolStatus(_CUSTOM_SYMBOL)
+    ),
+    "switch_symbol_trade_record": lambda: (
+        dao.getSwitchSymbolTradeRecord(_CUSTOM_SYMBOL, _SYMBOL)
+    ),
+    "pending_switch_symbol_trade_records": (
+        dao.getPendingSwitchSymbolTradeRecords
+    ),
+    "main_open_volume": lambda: mdao.getOpenVolume(_SYMBOL, 1),
+    "bottom_open_volume": lambda: bdao.getOpenVolume(_SYMBOL, 1),
+    "last_main_daily_condition_tips": mdao.getLastDailyConditionTips,
+    "last_bottom_open_volume_tips": bdao.getLastOpenVolumeTips,
+    "bottom_open_volume_tips_last_7d": lambda: t_service.get_last7d_count(
+        BottomOpenVolumeTip(symbol=_SYMBOL, direction=1, dkline_time=_DAY)
+    ),
+}
+
+# 不经过存储的 DAO 中频繁执行的查询, 值为生成查询集的函数
+DIRECT_QUERIES: dict[str, Callable[[], QuerySet]] = {
+    "trade_record": lambda: TradeRecord.objects(
+        trade_date=date(2024, 1, 2)
+    ).limit(1),
+    "future_config": lambda: FutureConfigInfo.objects(symbol=_SYMBOL),
+}
+
+
+class QueryRecorder(TradeStorage):
+    """记录 DAO 函数通过存储执行的查询, 不访问数据库
+
+    queries 中每个查询为 (操作, 模型, 排序, 查询条件),
+    find_one 返回字段为默认值的新文档, 依赖查询结果的后续查询也会被记录
+    """
+
+    def __init__(self):
+        self.queries: list[tuple[str, type, Optional[str], dict]] = []
+
+    def save(self, *docs, durable=False, cascade=False):
+        pass
+
+    def insert(self, docs):
+        pass
+
+    def delete(self, doc):
+        pass
+
+    def find(self, doc_cls, order_by=None, **filters):
+        self.queries.append(("find", doc_cls, order_by, filters))
+        return []
+
+    def find_one(self, doc_cls, order_by=None, **filters):
+        self.queries.append(("find_one", doc_cls, order_by, filters))
+        return doc_cls()
+
+    def count(self, doc_cls, **filters):
+        self.queries.append(("count", doc_cls, None, filters))
+        return 0
+
+    def upsert(self, doc_cls, pk, on_insert, values):
+        return 0
+
+
+def record_queries(func: Callable[[], object]) -> list[tuple]:
+    """返回 DAO 函数通过存储执行的查询"""
+    recorder = QueryRecorder()
+    previous = storage.get_storage()
+    storage.set_storage(recorder)
+    try:
+        func()
+    finally:
+        storage.set_storage(previous)
+    return recorder.queries
+
+
+def ensure_indexes() -> dict[str, list]:
+    """创建所有模型声明的索引, 返回创建后仍缺少的索引"""
+    for doc_cls in INDEXED_DOCUMENTS:
+        try:
+            doc_cls.ensure_indexes()
+        except Exception as e:
+            # 如已有数据违反唯一索引, 不影响其他索引的创建
+            logger.error(f"创建 {doc_cls.__name__} 的索引失败: {e}")
+    missing = check_indexes()
+    for name, indexes in missing.items():
+        logger.warning(f"集合 {name} 缺少索引: {indexes}")
+    return missing
+
+
+def check_indexes() -> dict[str, list]:
+    """返回各集合中缺少的声明索引, 键为集合名"""
+    missing = {}
+    for doc_cls in INDEXED_DOCUMENTS:
+        result = doc_cls.compare_indexes()
+        if result["missing"]:
+            missing[doc_cls._get_collection_name()] = result["missing"]
+    return missing
+
+
+def explain_hot_queries() -> dict[str, dict]:
+    """对每个频繁执行的查询执行 explain, 返回查询名称到执行计划的映射
+
+    DAO 函数执行了多个查询时, 查询名称后加上序号, 如 name[1]
+    """
+    plans = {}
+    for name, func in HOT_QUERIES.items():
+        queries = record_queries(func)
+        for i, query in enumerate(queries):
+            key = name if len(queries) == 1 else f"{name}[{i}]"
+            plans[key] = explain_query(*query)
+    for name, query in DIRECT_QUERIES.items():
+        plans[name] = query().explain()
+    return plans
+
+
+def explain_query(
+    op: str, doc_cls: type, order_by: Optional[str], filters: dict
+) -> dict:
+    """按 MongoStorage 执行查询的方式生成查询集并执行 explain"""
+    queryset = MongoStorage.get_queryset(doc_cls, order_by, **filters)
+    if op == "count":
+        # 查询集的 explain 只能解释 find, 计数的执行计划通过 explain 命令获取
+        return doc_cls._get_db().command(
+            "explain",
+            {
+                "count": doc_cls._get_collection_name(),
+                "query": queryset._query,
+            },
+            verbosity="queryPlanner",
+        )
+    if op == "find_one":
+        queryset = queryset.limit(1)
+    return queryset.explain()
+
+
+def get_plan_stages(plan) -> set[str]:
+    """返回执行计划中用到的所有阶段, 如 IXSCAN, FETCH, COLLSCAN"""
+    stages = set()
+    if isinstance(plan, dict):
+        stage = plan.get("stage")
+        if isinstance(stage, str):
+            stages.add(stage)
+        for value in plan.values():
+            stages |= get_plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            stages |= get_plan_stages(value)
+    return stages
+
+
+def get_collscan_queries(plans: dict[str, dict]) -> list[str]:
+    """返回执行计划的最优方案中扫描整个集合的查询名称"""
+    return [
+        name
+        for name, plan in plans.items()
+        if "COLLSCAN"
+        in get_plan_stages(plan.get("queryPlanner", {}).get("winningPlan"))
+    ]
@@ -178,6 +178,8 @@ class MainOpenVolume(TradePosBase):
     期货合约，交易方向，开仓价格，开仓时间，开仓订单id，开仓条件，是否平仓，平仓信息id，最后更新时间
     """
 
+    meta = {"indexes": [("symbol", "direction")]}
+
     # 开仓条件
     open_condition = EmbeddedDocumentField(MainOpenCondition)
     # 止盈止损条件
@@ -189,6 +191,7 @@ class MainOpenVolume(TradePosBase):
 
 
 class MainDailyConditionTip(Document):
+    meta = {"indexes": ["-kline_time"]}
     id = StringField(primary_key=True)
     custom_symbol = StringField(required=True)
     # 期货合约
@@ -216,6 +219,9 @@ class MainDailyConditionTip(Document):
 class BottomOpenVolumeTip(Document):
     """摸底策略开仓盘前提示信息"""
 
+    meta = {
+        "indexes": ["-dkline_time", ("symbol", "direction", "-dkline_time")]
+    }
     id = StringField(primary_key=True)
     custom_symbol = StringField(required=True)
     # 期货合约
@@ -251,6 +257,7 @@ class BottomCloseVolume(CloseVolume):
 
 
 class BottomOpenVolume(TradePosBase):
+    meta = {"indexes": [("symbol", "direction")]}
     # 盘前提示记录
     tip = ReferenceField(BottomOpenVolumeTip)
     # 是否平仓
@@ -264,7 +271,10 @@ class TradeStatus(Document):
 
     meta = {
         "abstract": True,
-        "indexes": [{"fields": ["symbol", "direction"], "unique": True}],
+        "indexes": [
+            {"fields": ["symbol", "direction"], "unique": True},
+            "custom_symbol",
+        ],
     }
     # 主连合约+交易策略+交易方向
     custom_symbol: str = StringField(required=True)
@@ -336,7 +346,9 @@ class SwitchSymbolTradeRecord(Document):
 
     meta = {
         "indexes": [
-            {"fields": ["custom_symbol", "next_symbol"], "unique": True}
+            {"fields": ["custom_symbol", "next_symbol"], "unique": True},
+            ("custom_symbol", "current_symbol", "current_close_status"),
+            ("current_close_status", "-quote_time"),
         ]
     }
     id: str = StringField(primary_key=True)
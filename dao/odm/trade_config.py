@@ -38,6 +38,34 @@ class TradeConfigInfo(Document):
     account_type: int = IntField(required=True, default=0)
     account_balance: float = FloatField(default=10000000.00)
     strategy_ids: List[int] = ListField(IntField(), default=[1, 2])
+    # 是否惰性订阅日内K线
+    lazy_kline: bool = BooleanField(default=False)
+    # 是否由5分钟线在本地合成30分钟线和3小时线
+    aggregate_kline: bool = BooleanField(default=False)
+    # 是否异步处理委托, 下单后不等待委托完成
+    async_order: bool = BooleanField(default=False)
+    # 是否延迟写入盘中交易状态的更新
+    write_behind: bool = BooleanField(default=False)
+    # 回测时交易数据保存在内存中, 回测结束后的去向: mongo: 写入数据库, 空: 不保存,
+    # 其他: 写入的文件路径
+    backtest_dump: str = StringField(default="mongo")
+    # 并行回测的进程数, 1: 不并行, 0: 使用CPU核数
+    backtest_processes: int = IntField(default=1)
+    # 回测区间按日期分段并行回测的段数, 1: 不分段
+    backtest_chunks: int = IntField(default=1)
+    # 分段回测时每段提前开始回测的自然日数, 用于与前一段的持仓衔接
+    backtest_warmup_days: int = IntField(default=30)
+    # 回测行情文件目录, 非空时使用本地K线文件回放行情, 不连接天勤服务器,
+    # 目录中需要的文件见 utils.replay_api
+    replay_dir: str = StringField(default="")
+    # 本地回放时是否预扫描日线条件, 跳过当日不可能开仓的空闲交易员
+    prescan: bool = BooleanField(default=False)
+    # 实盘时合并开平仓提示的时间窗口(秒), 0: 每条提示单独发送, 止损提示总是立即发送
+    notify_digest_window: float = FloatField(default=0)
+    # 运行指标的本机 HTTP 端口(Prometheus 文本格式), 0: 不启动
+    metrics_port: int = IntField(default=0)
+    # 把运行指标写入日志的间隔(秒), 0: 不定期写入; 两项都为 0 时不统计运行指标
+    metrics_log_interval: int = IntField(default=0)
     backtest_days: BacktestDays = EmbeddedDocumentField(BacktestDays)
     tq_account: Account = EmbeddedDocumentField(Account)
     rohon_account: RohonAccount = EmbeddedDocumentField(RohonAccount)
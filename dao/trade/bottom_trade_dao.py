@@ -1,6 +1,6 @@
 import hashlib
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 import dao.trade.trade_dao as dao
 from dao.odm.future_trade import (
@@ -12,42 +12,75 @@ from dao.odm.future_trade import (
     MainJointSymbolStatus,
     TradeStatus,
 )
+from dao.trade.storage import get_storage
 from utils.common_tools import get_china_date_from_dt, get_china_tz_now
 
 
 def getBottomOpenVolumeTips() -> List[BottomOpenVolumeTip]:
-    return BottomOpenVolumeTip.objects()
+    return get_storage().find(BottomOpenVolumeTip, order_by="-dkline_time")
+
+
+def getLastOpenVolumeTips() -> Optional[List[BottomOpenVolumeTip]]:
+    """获取最近一日的开仓提示, 没有提示时返回 None"""
+    storage = get_storage()
+    last = storage.find_one(BottomOpenVolumeTip, order_by="-dkline_time")
+    if last is None:
+        return None
+    return storage.find(BottomOpenVolumeTip, dkline_time=last.dkline_time)
+
+
+def countOpenVolumeTips(symbol: str, direction: int, since: datetime) -> int:
+    """获取指定时间之后的开仓提示数量"""
+    return get_storage().count(
+        BottomOpenVolumeTip,
+        symbol=symbol,
+        direction=direction,
+        dkline_time__gte=since,
+    )
 
 
 def getTradeStatus(symbol: str, direction: int) -> BottomTradeStatus:
     """根据自定义合约代码获取交易状态信息"""
-    return BottomTradeStatus.objects(
-        symbol=symbol, direction=direction
-    ).first()
+    return get_storage().find_one(
+        BottomTradeStatus, symbol=symbol, direction=direction
+    )
 
 
 def getTradeStatusByCustomSymbol(
     custom_symbol: str,
 ) -> list[BottomTradeStatus]:
     """根据自定义合约代码获取交易状态信息"""
-    return BottomTradeStatus.objects(custom_symbol=custom_symbol)
+    return get_storage().find(BottomTradeStatus, custom_symbol=custom_symbol)
+
+
+def getAllTradeStatus() -> list[BottomTradeStatus]:
+    """获取所有交易状态信息"""
+    return get_storage().find(BottomTradeStatus)
 
 
 def createTradeStatus(
-    custom_symbol: str, symbol: str, direction: int, dt: datetime
+    custom_symbol: str,
+    symbol: str,
+    direction: int,
+    dt: datetime,
+    save: bool = True,
 ) -> BottomTradeStatus:
+    """创建交易状态信息, save 为假时不保存, 由调用者批量写入"""
     ts = BottomTradeStatus()
     ts.custom_symbol = custom_symbol
     ts.symbol = symbol
     ts.direction = direction
     ts.last_modified = dt
-    ts.save()
+    if save:
+        get_storage().save(ts)
     return ts
 
 
 def getOpenVolume(symbol: str, direction: int) -> BottomOpenVolume:
     """根据主连合约代码,合约代码，交易方向返回数据库中该合约的开仓信息"""
-    return BottomOpenVolume.objects(symbol=symbol, direction=direction).first()
+    return get_storage().find_one(
+        BottomOpenVolume, symbol=symbol, direction=direction
+    )
 
 
 def openPosAndUpdateStatus(
@@ -76,18 +109,19 @@ def createOpenVolumeTip(
     dc = open_condition.daily_condition
     key = ts.custom_symbol + ts.symbol + dc.kline_time.strftime("%Y-%m-%d")
     key_hash = hashlib.sha1(key.encode()).hexdigest()
-    return BottomOpenVolumeTip.objects(id=key_hash).update_one(
-        upsert=True,
-        set_on_insert__id=key_hash,
-        set_on_insert__custom_symbol=ts.custom_symbol,
-        set_on_insert__symbol=ts.symbol,
-        set_on_insert__dkline_time=get_china_date_from_dt(dc.kline_time),
-        set_on_insert__direction=ts.direction,
-        set_on_insert__last_price=dc.close,
-        set_on_insert__need_trade=False,
-        set__volume=pos,
-        set__last_modified=get_china_tz_now(),
-        set_on_insert__open_condition=open_condition,
+    return get_storage().upsert(
+        BottomOpenVolumeTip,
+        key_hash,
+        on_insert={
+            "custom_symbol": ts.custom_symbol,
+            "symbol": ts.symbol,
+            "dkline_time": get_china_date_from_dt(dc.kline_time),
+            "direction": ts.direction,
+            "last_price": dc.close,
+            "need_trade": False,
+            "open_condition": open_condition,
+        },
+        values={"volume": pos, "last_modified": get_china_tz_now()},
     )
 
 
@@ -1,5 +1,6 @@
 import hashlib
 from datetime import datetime
+from typing import Optional
 
 from pandas import DataFrame
 
@@ -15,34 +16,50 @@ from dao.odm.future_trade import (
     MainTradeStatus,
     TradeStatus,
 )
+from dao.trade.storage import get_storage
 from utils.common_tools import get_china_date_from_dt, get_china_tz_now
 
 
 def getTradeStatus(symbol: str, direction: int) -> MainTradeStatus:
     """根据自定义合约代码获取交易状态信息"""
-    return MainTradeStatus.objects(symbol=symbol, direction=direction).first()
+    return get_storage().find_one(
+        MainTradeStatus, symbol=symbol, direction=direction
+    )
 
 
 def getTradeStatusByCustomSymbol(custom_symbol: str) -> list[MainTradeStatus]:
     """根据自定义合约代码获取交易状态信息"""
-    return MainTradeStatus.objects(custom_symbol=custom_symbol)
+    return get_storage().find(MainTradeStatus, custom_symbol=custom_symbol)
+
+
+def getAllTradeStatus() -> list[MainTradeStatus]:
+    """获取所有交易状态信息"""
+    return get_storage().find(MainTradeStatus)
 
 
 def createTradeStatus(
-    custom_symbol: str, symbol: str, direction: int, dt: datetime
+    custom_symbol: str,
+    symbol: str,
+    direction: int,
+    dt: datetime,
+    save: bool = True,
 ) -> MainTradeStatus:
+    """创建交易状态信息, save 为假时不保存, 由调用者批量写入"""
     ts = MainTradeStatus()
     ts.custom_symbol = custom_symbol
     ts.symbol = symbol
     ts.direction = direction
     ts.last_modified = dt
-    ts.save()
+    if save:
+        get_storage().save(ts)
     return ts
 
 
 def getOpenVolume(symbol: str, direction: int) -> MainOpenVolume:
     """根据主连合约代码,合约代码，交易方向返回数据库中该合约的开仓信息"""
-    return MainOpenVolume.objects(symbol=symbol, direction=direction).first()
+    return get_storage().find_one(
+        MainOpenVolume, symbol=symbol, direction=direction
+    )
 
 
 def openPosAndUpdateStatus(
@@ -111,19 +128,30 @@ def createDailyConditionTip(
     dc = open_condition.daily_condition
     key = ts.custom_symbol + ts.symbol + dc.kline_time.strftime("%Y-%m-%d")
     key_hash = hashlib.sha1(key.encode()).hexdigest()
-    return MainDailyConditionTip.objects(id=key_hash).update_one(
-        upsert=True,
-        set_on_insert__id=key_hash,
-        set_on_insert__custom_symbol=ts.custom_symbol,
-        set_on_insert__symbol=ts.symbol,
-        set_on_insert__direction=ts.direction,
-        set_on_insert__ema9=dc.ema9,
-        set_on_insert__ema22=dc.ema22,
-        set_on_insert__ema60=dc.ema60,
-        set_on_insert__macd=dc.macd,
-        set_on_insert__close=dc.close,
-        set_on_insert__open=dc.open,
-        set_on_insert__condition_id=dc.condition_id,
-        set_on_insert__kline_time=get_china_date_from_dt(dc.kline_time),
-        set__last_modified=get_china_tz_now(),
+    return get_storage().upsert(
+        MainDailyConditionTip,
+        key_hash,
+        on_insert={
+            "custom_symbol": ts.custom_symbol,
+            "symbol": ts.symbol,
+            "direction": ts.direction,
+            "ema9": dc.ema9,
+            "ema22": dc.ema22,
+            "ema60": dc.ema60,
+            "macd": dc.macd,
+            "close": dc.close,
+            "open": dc.open,
+            "condition_id": dc.condition_id,
+            "kline_time": get_china_date_from_dt(dc.kline_time),
+        },
+        values={"last_modified": get_china_tz_now()},
     )
+
+
+def getLastDailyConditionTips() -> Optional[list[MainDailyConditionTip]]:
+    """获取最近一日的日线条件提示, 没有提示时返回 None"""
+    storage = get_storage()
+    last = storage.find_one(MainDailyConditionTip, order_by="-kline_time")
+    if last is None:
+        return None
+    return storage.find(MainDailyConditionTip, kline_time=last.kline_time)
@@ -0,0 +1,336 @@
+"""交易数据的存储
+
+dao.trade 中的查询和保存都通过 get_storage() 返回的存储进行:
+MongoStorage 通过 mongoengine 读写数据库, 是默认的存储;
+MemoryStorage 把文档保存在内存中, 用于回测, 回测结束时可以把所有文档写入数据库或文件。
+TimedStorage 包装其他存储, 启用运行指标时统计每次调用的时间。
+查询条件只支持字段相等和 __gt, __gte, __lt, __lte, __ne 比较。
+"""
+
+import logging
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Optional
+
+from bson import ObjectId, json_util
+from mongoengine import Document, ObjectIdField
+from mongoengine.queryset.queryset import QuerySet
+from pymongo import ReplaceOne
+
+from dao.write_behind import get_writer
+from utils.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+DAO_CALL_SECONDS = get_metrics().histogram(
+    "dao_call_seconds", "交易数据存储每次调用的时间(秒)", label="op"
+)
+
+# 回测结束后把内存中的文档写入数据库
+DUMP_TO_MONGO = "mongo"
+
+
+class TradeStorage(ABC):
+    @abstractmethod
+    def save(
+        self, *docs: Optional[Document], durable=False, cascade=False
+    ) -> None:
+        """保存文档, durable 为真时立即写入, 忽略为 None 的文档"""
+
+    @abstractmethod
+    def insert(self, docs: list[Document]) -> None:
+        """批量保存同一类型的新文档"""
+
+    @abstractmethod
+    def delete(self, doc: Document) -> None:
+        """删除文档"""
+
+    @abstractmethod
+    def find(
+        self, doc_cls: type, order_by: Optional[str] = None, **filters
+    ) -> list:
+        """返回符合条件的文档, order_by 为排序字段, 以 - 开头时倒序"""
+
+    def find_one(
+        self, doc_cls: type, order_by: Optional[str] = None, **filters
+    ) -> Optional[Document]:
+        """返回符合条件的第一个文档"""
+        docs = self.find(doc_cls, order_by, **filters)
+        return docs[0] if docs else None
+
+    def count(self, doc_cls: type, **filters) -> int:
+        """返回符合条件的文档数量"""
+        return len(self.find(doc_cls, **filters))
+
+    @abstractmethod
+    def upsert(self, doc_cls: type, pk, on_insert: dict, values: dict) -> int:
+        """按主键更新文档的 values 字段, 文档不存在时先用 on_insert 创建"""
+
+    def flush(self) -> None:
+        """写入所有待写入的更新"""
+
+    def close(self) -> None:
+        """交易结束时调用"""
+
+
+class MongoStorage(TradeStorage):
+    """通过 mongoengine 读写数据库, 启用延迟写入时交易状态的更新由后台线程写入"""
+
+    def save(self, *docs, durable=False, cascade=False):
+        writer = get_writer()
+        if not cascade:
+            writer.save(*docs, durable=durable)
+            return
+        writer.flush()
+        for doc in docs:
+            if doc is not None:
+                doc.save(cascade=True)
+
+    def insert(self, docs):
+        if docs:
+            type(docs[0]).objects.insert(docs, load_bulk=False)
+
+    def delete(self, doc):
+        # 先写入待写入的更新, 防止删除后又被写回
+        get_writer().flush()
+        doc.delete()
+
+    @staticmethod
+    def get_queryset(
+        doc_cls: type, order_by: Optional[str] = None, **filters
+    ) -> QuerySet:
+        """按查询条件和排序生成查询集, 未指定排序时使用模型 objects 的默认排序"""
+        queryset = doc_cls.objects(**filters)
+        if order_by is not None:
+            queryset = queryset.order_by(order_by)
+        return queryset
+
+    def find(self, doc_cls, order_by=None, **filters):
+        return list(self.get_queryset(doc_cls, order_by, **filters))
+
+    def find_one(self, doc_cls, order_by=None, **filters):
+        return self.get_queryset(doc_cls, order_by, **filters).first()
+
+    def count(self, doc_cls, **filters):
+        return self.get_queryset(doc_cls, **filters).count()
+
+    def upsert(self, doc_cls, pk, on_insert, values):
+        updates = {f"set_on_insert__{k}": v for k, v in on_insert.items()}
+        updates.update({f"set__{k}": v for k, v in values.items()})
+        return doc_cls.objects(pk=pk).update_one(upsert=True, **updates)
+
+    def flush(self):
+        get_writer().flush()
+
+
+def _as_utc(value):
+    """与数据库查询一致, 没有时区的时间按 UTC 处理"""
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _match(value, op: str, target) -> bool:
+    value, target = _as_utc(value), _as_utc(target)
+    if op == "eq":
+        return value == target
+    if op == "ne":
+        return value != target
+    if value is None:
+        return False
+    if op == "gt":
+        return value > target
+    if op == "gte":
+        return value >= target
+    if op == "lt":
+        return value < target
+    if op == "lte":
+        return value <= target
+    raise ValueError(f"不支持的查询条件: {op}")
+
+
+class MemoryStorage(TradeStorage):
+    """把文档保存在内存中, 保存的是文档对象本身, 查询返回的也是同一个对象
+
+    dump 为 DUMP_TO_MONGO 时, close 把所有文档写入数据库,
+    为其他非空字符串时作为文件路径, 每行写入一个文档, 为空时不保存。
+    """
+
+    def __init__(self, dump: str = ""):
+        self.dump = dump
+        self._closed = False
+        # 键为集合名, 值为主键到文档的映射, 按保存顺序排列
+        self._collections: dict[str, dict[object, Document]] = {}
+
+    def save(self, *docs, durable=False, cascade=False):
+        for doc in docs:
+            if doc is None:
+                continue
+            if doc.pk is None:
+                doc.pk = self._new_pk(type(doc))
+            self._get_collection(type(doc))[doc.pk] = doc
+
+    def insert(self, docs):
+        self.save(*docs)
+
+    def delete(self, doc):
+        if doc.pk is not None:
+            self._get_collection(type(doc)).pop(doc.pk, None)
+
+    def find(self, doc_cls, order_by=None, **filters):
+        conditions = []
+        for key, target in filters.items():
+            name, _, op = key.partition("__")
+            conditions.append((name, op or "eq", target))
+        docs = [
+            doc
+            for doc in self._get_collection(doc_cls).values()
+            if all(
+                _match(getattr(doc, name), op, target)
+                for name, op, target in conditions
+            )
+        ]
+        if order_by is not None:
+            name = order_by.lstrip("-")
+            # 与数据库一致, 空值排在最小的位置
+            docs.sort(
+                key=lambda d: (
+                    getattr(d, name) is not None,
+                    _as_utc(getattr(d, name)),
+                ),
+                reverse=order_by.startswith("-"),
+            )
+        return docs
+
+    def upsert(self, doc_cls, pk, on_insert, values):
+        collection = self._get_collection(doc_cls)
+        doc = collection.get(pk)
+        if doc is None:
+            doc = doc_cls(pk=pk, **on_insert)
+            collection[pk] = doc
+        for name, value in values.items():
+            setattr(doc, name, value)
+        return 1
+
+    def close(self):
+        # 只保存一次
+        if self._closed or not self.dump:
+            return
+        self._closed = True
+        if self.dump == DUMP_TO_MONGO:
+            self.dump_to_mongo()
+        else:
+            self.dump_to_file(self.dump)
+
+    def dump_to_mongo(self) -> None:
+        """把所有文档写入数据库, 已存在的文档被替换"""
+        for docs in self._collections.values():
+            if not docs:
+                continue
+            doc_cls = type(next(iter(docs.values())))
+            try:
+                doc_cls._get_collection().bulk_write(
+                    [
+                        ReplaceOne({"_id": pk}, doc.to_mongo(), upsert=True)
+                        for pk, doc in docs.items()
+                    ],
+                    ordered=False,
+                )
+            except Exception as e:
+                # 如与数据库中已有的数据违反唯一索引, 不影响其他集合的写入
+                logger.error(f"写入 {doc_cls.__name__} 失败: {e}")
+                continue
+            logger.info(f"已写入 {doc_cls.__name__} {len(docs)} 条")
+
+    def dump_to_file(self, path: str) -> None:
+        """把所有文档写入文件, 每行为一个包含集合名和文档的 JSON"""
+        count = 0
+        with open(path, "w", encoding="utf-8") as f:
+            for name, docs in self._collections.items():
+                for doc in docs.values():
+                    line = {"collection": name, "document": doc.to_mongo()}
+                    f.write(json_util.dumps(line, ensure_ascii=False))
+                    f.write("\n")
+                    count += 1
+        logger.info(f"已写入 {count} 条交易数据到 {path}")
+
+    def _get_collection(self, doc_cls: type) -> dict[object, Document]:
+        return self._collections.setdefault(doc_cls._get_collection_name(), {})
+
+    @staticmethod
+    def _new_pk(doc_cls: type):
+        id_field = doc_cls._fields[doc_cls._meta["id_field"]]
+        if isinstance(id_field, ObjectIdField):
+            return ObjectId()
+        return str(ObjectId())
+
+
+class TimedStorage(TradeStorage):
+    """统计被包装的存储每次调用的时间, 按操作分别统计"""
+
+    def __init__(self, storage: TradeStorage):
+        self.storage = storage
+        self._timers = {
+            op: DAO_CALL_SECONDS.labels(op)
+            for op in (
+                "save",
+                "insert",
+                "delete",
+                "find",
+                "find_one",
+                "count",
+                "upsert",
+                "flush",
+                "close",
+            )
+        }
+
+    def save(self, *docs, durable=False, cascade=False):
+        with self._timers["save"].time():
+            self.storage.save(*docs, durable=durable, cascade=cascade)
+
+    def insert(self, docs):
+        with self._timers["insert"].time():
+            self.storage.insert(docs)
+
+    def delete(self, doc):
+        with self._timers["delete"].time():
+            self.storage.delete(doc)
+
+    def find(self, doc_cls, order_by=None, **filters):
+        with self._timers["find"].time():
+            return self.storage.find(doc_cls, order_by, **filters)
+
+    def find_one(self, doc_cls, order_by=None, **filters):
+        with self._timers["find_one"].time():
+            return self.storage.find_one(doc_cls, order_by, **filters)
+
+    def count(self, doc_cls, **filters):
+        with self._timers["count"].time():
+            return self.storage.count(doc_cls, **filters)
+
+    def upsert(self, doc_cls, pk, on_insert, values):
+        with self._timers["upsert"].time():
+            return self.storage.upsert(doc_cls, pk, on_insert, values)
+
+    def flush(self):
+        with self._timers["flush"].time():
+            self.storage.flush()
+
+    def close(self):
+        with self._timers["close"].time():
+            self.storage.close()
+
+
+_storage: TradeStorage = MongoStorage()
+
+
+def get_storage() -> TradeStorage:
+    """返回当前使用的存储"""
+    return _storage
+
+
+def set_storage(storage: TradeStorage) -> None:
+    """设置交易数据使用的存储, 需在生成交易员之前设置"""
+    global _storage
+    _storage = storage
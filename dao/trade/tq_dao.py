@@ -2,6 +2,7 @@ from tqsdk.objs import Order
 
 import utils.tqsdk_tools as tq_tools
 from dao.odm.tq_odm import TqOrder, TqTrade
+from dao.trade.storage import get_storage
 
 
 def createTqOrder(order: Order):
@@ -41,4 +42,4 @@ def createTqOrder(order: Order):
                 trade.trade_date_time
             )
             tq_order.trade_list.append(tq_trade)
-    tq_order.save()
+    get_storage().save(tq_order)
@@ -1,22 +1,25 @@
 from datetime import datetime
 
+from mongoengine import Document
+
 from dao.odm.future_trade import (
     CloseVolume,
     MainJointSymbolStatus,
     SwitchSymbolTradeRecord,
     TradeStatus,
 )
+from dao.trade.storage import get_storage
 from utils.common_tools import get_custom_symbol
 
 
 def updateSwitchSymbolTradeRecord(sstr: SwitchSymbolTradeRecord):
     """更新换月交易记录"""
-    sstr.save(cascade=True)
+    get_storage().save(sstr, durable=True, cascade=True)
 
 
 def createSwitchSymbolTradeRecord(
     current_status: TradeStatus, next_status: TradeStatus, quote_time: datetime
-):
+) -> SwitchSymbolTradeRecord:
     """创建换月交易记录"""
     sstr = SwitchSymbolTradeRecord()
     sstr.custom_symbol = current_status.custom_symbol
@@ -28,31 +31,45 @@ def createSwitchSymbolTradeRecord(
     if next_status.trade_status != 1:
         sstr.next_need_open = True
     sstr.last_modified = quote_time
+    return sstr
+
+
+def getPendingSwitchSymbolTradeRecords() -> list[SwitchSymbolTradeRecord]:
+    """获取所有未完成平仓的换月交易记录, 按交易时间倒序排列"""
+    return get_storage().find(
+        SwitchSymbolTradeRecord,
+        order_by="-quote_time",
+        current_close_status=False,
+    )
 
 
 def getSwitchSymbolTradeRecord(
     custom_symbol: str, symbol: str
 ) -> SwitchSymbolTradeRecord:
     """获取换月交易记录"""
-    return SwitchSymbolTradeRecord.objects(
+    return get_storage().find_one(
+        SwitchSymbolTradeRecord,
+        order_by="-quote_time",
         custom_symbol=custom_symbol,
         current_symbol=symbol,
         current_close_status=False,
-    ).first()
+    )
 
 
 def updateTradeStatus(ts: TradeStatus):
-    """更新交易状态信息到数据库中"""
-    ts.save(cascade=True)
+    """更新交易状态信息到数据库中, 启用延迟写入时由后台线程批量写入"""
+    get_storage().save(ts, ts.open_pos_info)
 
 
 def deleteTradeStatus(ts: TradeStatus):
-    ts.delete()
+    get_storage().delete(ts)
 
 
 def getMainJointSymbolStatus(custom_symbol: str) -> MainJointSymbolStatus:
     """根据主连合约获取策略交易状态，如果不存在则在数据库中创建"""
-    return MainJointSymbolStatus.objects(custom_symbol=custom_symbol).first()
+    return get_storage().find_one(
+        MainJointSymbolStatus, custom_symbol=custom_symbol
+    )
 
 
 def createMainJointSymbolStatus(
@@ -62,9 +79,10 @@ def createMainJointSymbolStatus(
     direction: int,
     s_name: str,
     dt: datetime,
+    save: bool = True,
 ) -> MainJointSymbolStatus:
     """根据传入参数创建主连合约状态信息并保存到数据库中,
-    参数 direction: 0:多头, 1:空头."""
+    参数 direction: 0:多头, 1:空头. save 为假时不保存, 由调用者批量写入."""
     mjss = MainJointSymbolStatus()
     mjss.custom_symbol = get_custom_symbol(mj_symbol, bool(direction), s_name)
     mjss.main_joint_symbol = mj_symbol
@@ -72,10 +90,21 @@ def createMainJointSymbolStatus(
     mjss.next_symbol = next_symbol
     mjss.direction = direction
     mjss.last_modified = dt
-    mjss.save()
+    if save:
+        get_storage().save(mjss)
     return mjss
 
 
+def getAllMainJointSymbolStatus() -> list[MainJointSymbolStatus]:
+    """获取所有主连合约状态信息"""
+    return get_storage().find(MainJointSymbolStatus)
+
+
+def insertDocuments(docs: list[Document]):
+    """批量插入同一类型的新文档"""
+    get_storage().insert(docs)
+
+
 def save_close_volume(ts: TradeStatus, cpd: dict, cv: CloseVolume):
     """主策略和摸底策略共用方法，用来保存"""
     opi = ts.open_pos_info
@@ -88,7 +117,7 @@ def save_close_volume(ts: TradeStatus, cpd: dict, cv: CloseVolume):
     cv.last_modified = cpd["trade_time"]
     cv.close_type = cpd["close_type"]
     cv.close_message = cpd["close_message"]
-    cv.save()
+    get_storage().save(cv)
     opi.close_pos_infos.append(cv)
     ts.carrying_volume = ts.carrying_volume - cv.volume
     if ts.carrying_volume == 0:
@@ -96,7 +125,7 @@ def save_close_volume(ts: TradeStatus, cpd: dict, cv: CloseVolume):
         ts.end_time = cv.trade_time
         opi.is_close = True
         opi.last_modified = cv.trade_time
-    ts.save(cascade=True)
+    get_storage().save(ts, opi, durable=True)
 
 
 def save_open_volume(ts: TradeStatus, opd: dict, ov):
@@ -108,12 +137,12 @@ def save_open_volume(ts: TradeStatus, opd: dict, ov):
     ov.trade_time = opd["trade_time"]
     ov.order_id = opd["order_id"]
     ov.last_modified = opd["trade_time"]
-    ov.save()
+    get_storage().save(ov)
     ts.trade_status = 1
     ts.carrying_volume = ov.volume
     ts.start_time = ov.trade_time
     ts.open_pos_info = ov
-    ts.save(cascade=True)
+    get_storage().save(ts, durable=True)
 
 
 def switch_symbol(
@@ -124,17 +153,17 @@ def switch_symbol(
     trade_status_list: [TradeStatus],
 ):
     """重置期货合约交易状态信息, 用于下一个交易合约使用"""
-    mj_status.save()
-    current_status.delete()
-    next_status.save()
-    new_status.save()
+    storage = get_storage()
+    storage.save(mj_status, durable=True)
+    storage.delete(current_status)
+    storage.save(next_status, new_status, durable=True)
     for ts in trade_status_list:
         if ts != next_status and ts != new_status:
-            ts.delete()
+            storage.delete(ts)
 
 
 def closeout(sts: TradeStatus, symbol: str, t_time: datetime) -> TradeStatus:
     """平仓"""
     sts.closeout(t_time)
-    sts.save()
+    get_storage().save(sts, durable=True)
     return sts
@@ -1,8 +1,7 @@
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 
-from mongoengine.queryset.visitor import Q
 from tqsdk.objs import Order
 
 import dao.trade.bottom_trade_dao as bdao
@@ -29,6 +28,87 @@ from utils.tqsdk_tools import get_datetime_from_ns
 
 logger = logging.getLogger(__name__)
 
+# 未完成平仓的换月交易记录, 键为 (custom_symbol, current_symbol), 第一次使用时从数据库加载
+_switch_records: Optional[dict[tuple[str, str], SwitchSymbolTradeRecord]] = (
+    None
+)
+
+# 生成交易员前预加载的状态, 未预加载时为 None, 逐条查询数据库
+# 主连合约状态, 键为 custom_symbol
+_mj_statuses: Optional[dict[str, MainJointSymbolStatus]] = None
+# 交易状态, 按类型分开, 键为 (symbol, direction)
+_trade_statuses: Optional[dict[type, dict[tuple[str, int], TradeStatus]]] = (
+    None
+)
+# 最近的摸底开仓提示
+_last_bottom_tips: Optional[list[BottomOpenVolumeTip]] = None
+# 预加载期间新建的状态, 由 save_created_states 批量写入数据库
+_created_states: Optional[list] = None
+
+
+def preload_states():
+    """生成交易员前加载所有主连合约状态, 交易状态和最近的摸底开仓提示
+
+    每个集合只查询一次, 之后的查找直接从内存中返回, 不存在的状态先在内存中创建,
+    生成交易员后调用 save_created_states 批量写入数据库。
+    """
+    global _mj_statuses, _trade_statuses, _last_bottom_tips, _created_states
+    try:
+        mj_statuses = {
+            mjss.custom_symbol: mjss
+            for mjss in dao.getAllMainJointSymbolStatus()
+        }
+        trade_statuses = {
+            MainTradeStatus: _index_trade_statuses(mdao.getAllTradeStatus()),
+            BottomTradeStatus: _index_trade_statuses(bdao.getAllTradeStatus()),
+        }
+    except Exception as e:
+        logger.warning(f"预加载交易状态失败: {e}")
+        clear_preloaded_states()
+        return
+    _mj_statuses = mj_statuses
+    _trade_statuses = trade_statuses
+    _last_bottom_tips = _load_last_bottom_tips()
+    _created_states = []
+
+
+def save_created_states():
+    """批量写入预加载期间新建的状态, 已单独保存过的状态不再写入"""
+    global _created_states
+    if not _created_states:
+        _created_states = None
+        return
+    grouped: dict[type, list] = {}
+    for doc in _created_states:
+        if doc.pk is None:
+            grouped.setdefault(type(doc), []).append(doc)
+    _created_states = None
+    for docs in grouped.values():
+        dao.insertDocuments(docs)
+
+
+def clear_preloaded_states():
+    """清除预加载的状态, 之后的查找重新逐条查询数据库"""
+    global _mj_statuses, _trade_statuses, _last_bottom_tips, _created_states
+    _mj_statuses = None
+    _trade_statuses = None
+    _last_bottom_tips = None
+    _created_states = None
+
+
+def _index_trade_statuses(
+    statuses: list[TradeStatus],
+) -> dict[tuple[str, int], TradeStatus]:
+    result = {}
+    for ts in statuses:
+        result.setdefault((ts.symbol, ts.direction), ts)
+    return result
+
+
+def _add_created_state(doc):
+    if _created_states is not None:
+        _created_states.append(doc)
+
 
 def get_MJStatus(
     mj_symbol: str,
@@ -48,7 +128,11 @@ def get_MJStatus(
             direction,
             strategy_name,
             ctools.get_china_date_from_str(quote_date),
+            save=_created_states is None,
         )
+        _add_created_state(mjss)
+        if _mj_statuses is not None:
+            _mj_statuses[mjss.custom_symbol] = mjss
     return mjss
 
 
@@ -59,6 +143,8 @@ def _get_MJStatus(
     custom_symbol = ctools.get_custom_symbol(
         mj_symbol, bool(direction), strategy_name
     )
+    if _mj_statuses is not None:
+        return _mj_statuses.get(custom_symbol)
     mjss = dao.getMainJointSymbolStatus(custom_symbol)
     return mjss
 
@@ -66,25 +152,69 @@ def _get_MJStatus(
 def get_main_trade_status(
     custom_symbol: str, symbol: str, direction: int, quote_date: str
 ) -> MainTradeStatus:
-    ts = mdao.getTradeStatus(symbol, direction)
-    if ts is None:
-        dt = ctools.get_china_date_from_str(quote_date)
-        ts = mdao.createTradeStatus(custom_symbol, symbol, direction, dt)
-    return ts
+    return _get_trade_status(
+        MainTradeStatus, mdao, custom_symbol, symbol, direction, quote_date
+    )
 
 
 def get_bottom_trade_status(
     custom_symbol: str, symbol: str, direction: int, quote_date: str
 ) -> BottomTradeStatus:
-    ts = bdao.getTradeStatus(symbol, direction)
+    return _get_trade_status(
+        BottomTradeStatus, bdao, custom_symbol, symbol, direction, quote_date
+    )
+
+
+def _get_trade_status(
+    doc_cls: type,
+    status_dao,
+    custom_symbol: str,
+    symbol: str,
+    direction: int,
+    quote_date: str,
+) -> TradeStatus:
+    """获取交易状态, 不存在则创建, mdao 和 bdao 提供相同的查询和创建方法"""
+    statuses = None
+    if _trade_statuses is not None:
+        statuses = _trade_statuses[doc_cls]
+        ts = statuses.get((symbol, direction))
+    else:
+        ts = status_dao.getTradeStatus(symbol, direction)
     if ts is None:
         dt = ctools.get_china_date_from_str(quote_date)
-        ts = bdao.createTradeStatus(custom_symbol, symbol, direction, dt)
+        ts = status_dao.createTradeStatus(
+            custom_symbol,
+            symbol,
+            direction,
+            dt,
+            save=_created_states is None,
+        )
+        _add_created_state(ts)
+        if statuses is not None:
+            statuses[(symbol, direction)] = ts
     return ts
 
 
+def _forget_trade_statuses(
+    doc_cls: type, custom_symbol: str, keep: tuple[TradeStatus, ...] = ()
+):
+    """从预加载的交易状态中移除已删除的状态"""
+    if _trade_statuses is None:
+        return
+    statuses = _trade_statuses[doc_cls]
+    for key, ts in list(statuses.items()):
+        if ts.custom_symbol == custom_symbol and all(
+            ts is not k for k in keep
+        ):
+            del statuses[key]
+
+
 def del_trade_status(ts: TradeStatus):
     dao.deleteTradeStatus(ts)
+    if _trade_statuses is not None:
+        statuses = _trade_statuses.get(type(ts), {})
+        if statuses.get((ts.symbol, ts.direction)) is ts:
+            del statuses[(ts.symbol, ts.direction)]
 
 
 def get_main_ov(symbol: str, direction: int) -> MainOpenVolume:
@@ -127,22 +257,48 @@ def close_ops(status: TradeStatus, c_type: int, c_message: str, order: Order):
         return bdao.closePosAndUpdateStatus(status, c_dict)
 
 
+def load_switch_symbol_trade_records():
+    """从数据库加载所有未完成平仓的换月交易记录, 同一合约只保留最近的一条"""
+    global _switch_records
+    records: dict[tuple[str, str], SwitchSymbolTradeRecord] = {}
+    try:
+        for record in dao.getPendingSwitchSymbolTradeRecords():
+            records.setdefault(
+                (record.custom_symbol, record.current_symbol), record
+            )
+    except Exception as e:
+        logger.warning(f"加载换月交易记录失败: {e}")
+    _switch_records = records
+
+
+def _register_switch_symbol_trade_record(record: SwitchSymbolTradeRecord):
+    """在内存中记录或移除换月交易记录"""
+    if _switch_records is None:
+        load_switch_symbol_trade_records()
+    key = (record.custom_symbol, record.current_symbol)
+    if record.current_close_status:
+        if _switch_records.get(key) is record:
+            del _switch_records[key]
+    else:
+        _switch_records[key] = record
+
+
 def update_switch_symbol_trade_record(record: SwitchSymbolTradeRecord):
     """更新换月交易记录"""
     dao.updateSwitchSymbolTradeRecord(record)
+    _register_switch_symbol_trade_record(record)
 
 
 def get_switch_symbol_trade_record(
     status: TradeStatus,
-) -> SwitchSymbolTradeRecord:
-    """获取换月交易记录"""
-    try:
-        return dao.getSwitchSymbolTradeRecord(
-            status.custom_symbol, status.symbol
-        )
-    except Exception as e:
-        logger.warning("获取换月交易记录失败", e)
-        return None
+) -> Optional[SwitchSymbolTradeRecord]:
+    """获取未完成平仓的换月交易记录
+
+    盘中每次行情更新都会调用, 从内存中查找, 不访问数据库
+    """
+    if _switch_records is None:
+        load_switch_symbol_trade_records()
+    return _switch_records.get((status.custom_symbol, status.symbol))
 
 
 def switch_symbol(
@@ -175,11 +331,12 @@ def switch_symbol(
             quote_date,
         )
     if current_status.trade_status == 1:
-        dao.createSwitchSymbolTradeRecord(
+        record = dao.createSwitchSymbolTradeRecord(
             current_status,
             next_status,
             ctools.get_china_date_from_str(quote_date),
         )
+        _register_switch_symbol_trade_record(record)
     next_status.last_modified = last_modified
     new_status = None
     if isinstance(current_status, MainTradeStatus):
@@ -198,6 +355,12 @@ def switch_symbol(
             quote_date,
         )
         bdao.switch_symbol(mj_status, current_status, next_status, new_status)
+    # 换月后该主连合约除下一个和新交易状态外的交易状态都已删除
+    _forget_trade_statuses(
+        type(current_status),
+        mj_status.custom_symbol,
+        (next_status, new_status),
+    )
 
 
 def _get_cdict_from_order(order: Order, c_type: int, c_message: str) -> dict:
@@ -238,64 +401,81 @@ def store_daily_condition_tip(
 
 def get_last_daily_condition_tips() -> Optional[list[MainDailyConditionTip]]:
     """获取最近一日的主策略日线提示信息"""
-    print(MainDailyConditionTip)
-    if MainDailyConditionTip is not None:
-        return MainDailyConditionTip.get_last_tips()
-    return None
+    return mdao.getLastDailyConditionTips()
 
 
 def store_b_open_volume_tip(
     status: BottomTradeStatus, open_condition: BottomOpenCondition, pos: int
 ) -> BottomOpenVolumeTip:
     """将开仓信息保存至数据库，并更新合约交易状态信息"""
-    return bdao.createOpenVolumeTip(status, open_condition, pos)
+    global _last_bottom_tips
+    result = bdao.createOpenVolumeTip(status, open_condition, pos)
+    if _last_bottom_tips is not None:
+        # 新的提示可能改变最近的提示, 重新加载
+        _last_bottom_tips = _load_last_bottom_tips()
+    return result
 
 
 def get_last_bottom_tips() -> Optional[list[BottomOpenVolumeTip]]:
     """获取最近的开仓提示信息"""
-    return BottomOpenVolumeTip.get_last_tips()
+    return bdao.getLastOpenVolumeTips()
+
+
+def _load_last_bottom_tips() -> list[BottomOpenVolumeTip]:
+    try:
+        return list(get_last_bottom_tips() or [])
+    except Exception as e:
+        logger.warning(f"加载摸底开仓提示失败: {e}")
+        return []
+
+
+def _as_utc(dt: datetime) -> datetime:
+    """与数据库查询一致, 没有时区的时间按 UTC 处理"""
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
 
 
 def get_last_bottom_tip_by_symbol(
     symbol: str, direction: int
 ) -> Optional[BottomOpenVolumeTip]:
-    queryset = None
-    try:
-        queryset = get_last_bottom_tips()
-    except Exception:
-        return None
-    if queryset is not None:
-        return queryset.filter(
-            Q(symbol=symbol) & Q(direction=direction)
-        ).first()
-    return None
+    tips = _last_bottom_tips
+    if tips is None:
+        tips = _load_last_bottom_tips()
+    return next(
+        (
+            tip
+            for tip in tips
+            if tip.symbol == symbol and tip.direction == direction
+        ),
+        None,
+    )
 
 
 def get_lbt_by_symbol_date(
     symbol: str, direction: int, date_time: datetime
 ) -> Optional[BottomOpenVolumeTip]:
     """根据合约，方向和日期查找是否有摸底提示记录"""
-    queryset = None
-    try:
-        queryset = get_last_bottom_tips()
-    except Exception:
-        return None
-    if queryset is not None:
-        return queryset.filter(
-            Q(symbol=symbol)
-            & Q(direction=direction)
-            & Q(dkline_time=date_time)
-        ).first()
-    return None
+    tips = _last_bottom_tips
+    if tips is None:
+        tips = _load_last_bottom_tips()
+    date_time = _as_utc(date_time)
+    return next(
+        (
+            tip
+            for tip in tips
+            if tip.symbol == symbol
+            and tip.direction == direction
+            and tip.dkline_time is not None
+            and _as_utc(tip.dkline_time) == date_time
+        ),
+        None,
+    )
 
 
 def get_last7d_count(bovt: BottomOpenVolumeTip) -> int:
     """获取最近7天的开仓提示数量"""
-    return BottomOpenVolumeTip.objects(
-        Q(symbol=bovt.symbol)
-        & Q(direction=bovt.direction)
-        & Q(dkline_time__gte=bovt.dkline_time - timedelta(days=7))
-    ).count()
+    return bdao.countOpenVolumeTips(
+        bovt.symbol, bovt.direction, bovt.dkline_time - timedelta(days=7)
+    )
 
 
 def store_tq_order(order: Order) -> TqOrder:
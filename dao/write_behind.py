@@ -0,0 +1,124 @@
+"""交易状态的延迟写入
+
+盘中频繁更新的交易状态(如移动止损价)先记录在内存中, 同一文档的多次更新只保留最后一次,
+由后台线程定时通过 bulk_write 批量写入数据库。
+开平仓等需要保证持久化的更新使用同步写入: 先写入所有待写入的更新, 再返回。
+未启动后台线程时所有更新都直接保存, 与 Document.save 一致。
+"""
+
+import logging
+import threading
+from typing import Optional
+
+from mongoengine import Document
+from pymongo import ReplaceOne
+
+logger = logging.getLogger(__name__)
+
+# 后台线程写入间隔(秒)
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+
+class WriteBehindWriter:
+    def __init__(self):
+        # 待写入的文档快照, 键为 (集合名, 主键)
+        self._pending: dict[tuple[str, object], tuple[type, dict]] = {}
+        self._lock = threading.Lock()
+        # 保证批量写入按顺序进行, 同步写入会等待正在进行的后台写入完成
+        self._flush_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.interval = DEFAULT_FLUSH_INTERVAL
+        self.queued_count = 0
+        self.written_count = 0
+        self.flush_count = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, interval: float = DEFAULT_FLUSH_INTERVAL) -> None:
+        """启动后台写入线程"""
+        if self.is_running:
+            return
+        self.interval = interval
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="write-behind", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """停止后台写入线程, 并写入所有待写入的更新"""
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def save(self, *docs: Optional[Document], durable: bool = False) -> None:
+        """保存文档
+
+        后台线程运行时记录文档快照, durable 为真时立即写入所有待写入的更新;
+        后台线程未运行或文档尚未保存过时直接保存。
+        """
+        for doc in docs:
+            if doc is None:
+                continue
+            if not self.is_running or doc.pk is None:
+                doc.save()
+                continue
+            key = (doc._get_collection_name(), doc.pk)
+            snapshot = (type(doc), doc.to_mongo().to_dict())
+            with self._lock:
+                self._pending[key] = snapshot
+                self.queued_count += 1
+        if durable:
+            self.flush()
+
+    def flush(self) -> None:
+        """写入所有待写入的更新, 写入失败的更新在没有更新的快照时重新放回队列"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return
+            self.flush_count += 1
+            requests: dict[str, tuple[type, list]] = {}
+            for (name, pk), (doc_cls, data) in batch.items():
+                requests.setdefault(name, (doc_cls, []))[1].append(
+                    ReplaceOne({"_id": pk}, data)
+                )
+            for name, (doc_cls, operations) in requests.items():
+                try:
+                    doc_cls._get_collection().bulk_write(
+                        operations, ordered=False
+                    )
+                    self.written_count += len(operations)
+                except Exception as e:
+                    logger.error(f"批量写入 {name} 失败: {e}")
+                    with self._lock:
+                        for key, snapshot in batch.items():
+                            if key[0] == name:
+                                self._pending.setdefault(key, snapshot)
+
+    def stats(self) -> dict:
+        """返回写入统计: 待写入数量, 累计更新次数, 实际写入次数, 批量写入次数"""
+        return {
+            "pending": len(self._pending),
+            "queued": self.queued_count,
+            "written": self.written_count,
+            "flushes": self.flush_count,
+        }
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.flush()
+
+
+_writer = WriteBehindWriter()
+
+
+def get_writer() -> WriteBehindWriter:
+    """返回进程内共享的延迟写入器"""
+    return _writer
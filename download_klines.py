@@ -0,0 +1,54 @@
+from tqsdk import TqApi, TqAuth
+from utils import common
+from utils import config_utils as c_utils
+import sys
+import logging
+from utils import global_var as gvar
+from utils.kline_store import KlineStore, fill_store
+import warnings
+# 忽略所有警告信息
+warnings.filterwarnings("ignore")
+
+log_level = "info"
+logger = logging.getLogger(__name__)
+# 盯盘人使用的公共行情合约
+COMMON_SYMBOL = "KQ.m@SHFE.au"
+
+
+def main():
+    '''下载回测需要的K线到本地数据仓库, 仓库目录通过命令行参数或系统配置中的 replay_dir 指定
+    下载系统配置中回测时间段(以及之前的历史数据)内参与交易品种的主连合约和标的合约,
+    已下载的部分不会重复下载, 之后把 replay_dir 设为仓库目录即可在本地回放回测
+    '''
+    try:
+        log_config_file = f'log_config_{gvar.ENV_NAME}'
+        common.setup_log_config(log_level, log_config_file)
+        config = c_utils.get_system_config()
+        t_config = config.trade_config
+        root = sys.argv[1] if len(sys.argv) > 1 else t_config.replay_dir
+        configs = [c for c in c_utils.get_future_configs() if c.is_active]
+        main_months = {c.symbol: c.main_symbols for c in configs}
+        symbols = [COMMON_SYMBOL] + [
+            c.symbol for c in configs if c.symbol != COMMON_SYMBOL
+        ]
+        tq_config = config.tq_config
+        api = TqApi(auth=TqAuth(tq_config.user, tq_config.password))
+        try:
+            downloaded = fill_store(
+                api,
+                KlineStore(root),
+                symbols,
+                main_months,
+                t_config.start_date,
+                t_config.end_date,
+            )
+        finally:
+            api.close()
+        logger.info(f"数据仓库 {root} 已包含 {len(downloaded)} 个合约")
+    except Exception as e:
+        logger.exception(e)
+        return str(e)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+from typing import Optional
+
+from exe_departments.traders import Trader
+
+
+class TraderDispatcher:
+    """交易员调度器
+
+    记录每个合约对应的交易员, 行情更新后只唤醒 quote 或K线发生变化的合约所对应的交易员,
+    交易员依赖的合约在交易开始前确定, 盘中不会变化。
+    """
+
+    def __init__(self, traders: list[Trader]):
+        self._traders = traders
+        self._symbol_traders: dict[str, list[int]] = {}
+        for index, trader in enumerate(traders):
+            for symbol in trader.symbols:
+                self._symbol_traders.setdefault(symbol, []).append(index)
+        # 行情更新次数和被唤醒的交易员总数
+        self.update_count = 0
+        self.dispatch_count = 0
+
+    def get_traders(self, symbols: Optional[set[str]]) -> list[Trader]:
+        """返回依赖于变化合约的交易员, 保持原有顺序
+
+        symbols 为 None 表示无法判断哪些合约发生了变化, 返回全部交易员
+        """
+        self.update_count += 1
+        if symbols is None:
+            traders = self._traders
+        else:
+            indexes: set[int] = set()
+            for symbol in symbols:
+                indexes.update(self._symbol_traders.get(symbol, ()))
+            traders = [self._traders[i] for i in sorted(indexes)]
+        self.dispatch_count += len(traders)
+        return traders
+
+    def stats(self) -> dict:
+        """返回调度统计: 交易员数量, 合约数量, 行情更新次数, 被唤醒的交易员总数"""
+        return {
+            "traders": len(self._traders),
+            "symbols": len(self._symbol_traders),
+            "updates": self.update_count,
+            "dispatched": self.dispatch_count,
+        }
@@ -1,28 +1,74 @@
 import time
 from abc import ABC, abstractmethod
-from datetime import datetime
+from datetime import date, datetime
+from typing import Optional
 
 from tqsdk import BacktestFinished, TqApi, tafunc
 
 import dao.config_service as c_service
+import dao.trade.trade_service as t_service
 import dao.trade_log.log_service as l_service
 import utils.common_tools as c_tools
 import utils.email_tools as email_tools
 import utils.tqsdk_tools as tq_tools
 from dao.odm.future_config import FutureConfigInfo
 from dao.odm.trade_log import InvolvedSymbol, SymbolList, TradeRecord
+from dao.trade.storage import get_storage
+from dao.write_behind import get_writer
+from exe_departments.dispatchers import TraderDispatcher
 from exe_departments.traders import MainStrategyTrader, TestTrader, Trader
-from utils.config_utils import get_future_configs
+from strategies.indicators import get_indicator_hub
+from strategies.prescan import SignalScan, scan_replay
+from utils.config_utils import FutureConfig, get_future_configs
+from utils.kline_hub import KlineHub
+from utils.log_tools import LoggerGetter
+from utils.metrics import get_metrics
+from utils.notifier import get_notifier
+from utils.order_manager import OrderManager
+from utils.replay_api import ReplayApi
+
+LOOP_ITERATIONS = get_metrics().counter(
+    "staker_loop_iterations_total", "盯盘人处理行情更新的次数"
+)
+WAIT_UPDATE_SECONDS = get_metrics().histogram(
+    "staker_wait_update_seconds", "盯盘人每次等待行情更新的时间(秒)"
+)
 
 
 class Staker(ABC):
-    logger = c_tools.LoggerGetter()
+    logger = LoggerGetter()
     """盯盘人，负责加载期货品种配置，并为每个品种生成一个交易人。当盯盘品种价格等参数发生改变时向交易人发送信号"""
 
-    def __init__(self, api: TqApi, direction: int, strategy_ids: list[int]):
+    def __init__(
+        self,
+        api: TqApi,
+        direction: int,
+        strategy_ids: list[int],
+        *,
+        lazy_kline: bool = False,
+        aggregate_kline: bool = False,
+        async_order: bool = False,
+        write_behind: bool = False,
+    ):
         self._api = api
+        # 最近一次行情更新中发生变化的合约
+        self._changed_symbols: Optional[set[str]] = None
+        self._dispatcher: Optional[TraderDispatcher] = None
+        # 行情订阅中心, 所有交易员共享同一份 quote 和K线序列
+        self._kline_hub = KlineHub(api, lazy_kline, aggregate_kline)
+        # 同步委托等待成交期间发生变化的合约, 并入下一次行情更新, 为 None 时无法判断
+        self._order_wait_symbols: Optional[set[str]] = set()
+        # 委托管理, 所有交易员共享
+        self._order_manager = OrderManager(
+            api, async_order, self._sync_order_wait
+        )
+        # 盘中从内存中查找换月交易记录
+        t_service.load_switch_symbol_trade_records()
+        if write_behind:
+            # 盘中交易状态的更新由后台线程批量写入数据库
+            get_writer().start()
         # 引入该变量是为了有一种可以和天勤服务器时间同步的方式判断是否处于交易时间的方法
-        self._common_quote = api.get_quote("KQ.m@SHFE.au")
+        self._common_quote = self._kline_hub.get_quote("KQ.m@SHFE.au")
         self.direction = direction
         self.strategy_ids = strategy_ids
         self.future_configs: list[
@@ -30,11 +76,49 @@ class Staker(ABC):
         ] = self._init_future_configs()
         self._init_status()
 
+    def _wait_update(self, deadline: Optional[float] = None) -> bool:
+        """等待行情更新, 记录发生变化的合约, 同步本地合成的K线并处理已完成的委托"""
+        with WAIT_UPDATE_SECONDS.time():
+            updated = self._api.wait_update(deadline=deadline)
+        self._sync_update()
+        return updated
+
+    def _sync_update(self):
+        """行情更新后记录发生变化的合约, 同步本地合成的K线并处理已完成的委托"""
+        LOOP_ITERATIONS.inc()
+        changed = tq_tools.get_changed_symbols(self._api)
+        self._kline_hub.update(changed)
+        waited, self._order_wait_symbols = self._order_wait_symbols, set()
+        if changed is not None and waited is not None:
+            changed |= waited
+        else:
+            changed = None
+        self._changed_symbols = changed
+        self._order_manager.update()
+
+    def _sync_order_wait(self):
+        """同步委托等待成交期间的行情更新: 记录发生变化的合约并同步本地合成的K线
+
+        这期间的行情更新不经过调度, 变化的合约在下一次行情更新时一并唤醒对应的交易员
+        """
+        changed = tq_tools.get_changed_symbols(self._api)
+        self._kline_hub.update(changed, is_order_wait=True)
+        if changed is None or self._order_wait_symbols is None:
+            self._order_wait_symbols = None
+        else:
+            self._order_wait_symbols |= changed
+
     def _init_status(self):
         """初始化盯盘人的状态，使得盯盘人可以进行下一日交易"""
-        self.traders: list[Trader] = self._init_traders(
-            self.direction, self.strategy_ids
-        )
+        self.traders: list[Trader] = self._create_traders()
+
+    def _create_traders(self) -> list[Trader]:
+        """预加载交易状态后生成交易员, 并批量保存新建的交易状态"""
+        t_service.preload_states()
+        try:
+            return self._init_traders(self.direction, self.strategy_ids)
+        finally:
+            t_service.save_created_states()
 
     def _handle_trade(self):
         """交易相关操作，包括盘前提示，交易，盘后操作
@@ -87,9 +171,29 @@ class Staker(ABC):
 class RealStaker(Staker):
     """实盘交易盯盘人"""
 
-    def __init__(self, api: TqApi, direction: int, strategy_ids: list[int]):
-        super().__init__(api, direction, strategy_ids)
+    def __init__(
+        self,
+        api: TqApi,
+        direction: int,
+        strategy_ids: list[int],
+        *,
+        lazy_kline: bool = False,
+        aggregate_kline: bool = False,
+        async_order: bool = False,
+        write_behind: bool = False,
+    ):
+        super().__init__(
+            api,
+            direction,
+            strategy_ids,
+            lazy_kline=lazy_kline,
+            aggregate_kline=aggregate_kline,
+            async_order=async_order,
+            write_behind=write_behind,
+        )
         self.trade_record = self._get_trade_record()
+        # 开平仓等通知由后台线程发送, 交易线程不等待网络 I/O
+        get_notifier().start()
 
     def _init_future_configs(self) -> list[FutureConfigInfo]:
         return c_service.get_future_configs(get_future_configs())
@@ -98,7 +202,17 @@ class RealStaker(Staker):
         """加载交易员"""
         traders = []
         for f_config in self.future_configs:
-            traders.append(Trader(self._api, f_config, strategy_ids, d, False))
+            traders.append(
+                Trader(
+                    self._api,
+                    f_config,
+                    strategy_ids,
+                    d,
+                    False,
+                    self._kline_hub,
+                    self._order_manager,
+                )
+            )
         return traders
 
     def _get_trade_record(self) -> TradeRecord:
@@ -184,20 +298,23 @@ class RealStaker(Staker):
                 c_tools.sendSystemStartupMsg(
                     datetime.now(), self.direction, self.strategy_ids
                 )
-                self._api.wait_update()
+                self._dispatcher = TraderDispatcher(traders)
+                self._wait_update()
                 while True:
                     if c_tools.none_trade_time():
                         break
                     elif tq_tools.is_trading_period(
                         self._api, self._common_quote
                     ):
-                        self._api.wait_update()
-                        for trader in traders:
+                        self._wait_update()
+                        for trader in self._dispatcher.get_traders(
+                            self._changed_symbols
+                        ):
                             trader.execute_trade()
                     else:
                         # 等待1分钟后尝试更新行情，并在等待超过15:10后返回
                         time.sleep(60)
-                        self._api.wait_update(
+                        self._wait_update(
                             deadline=tq_tools.get_break_time(
                                 self._common_quote
                             )
@@ -215,6 +332,14 @@ class RealStaker(Staker):
             for trader in traders:
                 trader.execute_after_trade()
         l_service.finish_trade_record(tr)
+        logger.info(f"指标计算统计: {get_indicator_hub().stats()}")
+        logger.info(f"行情订阅统计: {self._kline_hub.stats()}")
+        if self._dispatcher is not None:
+            logger.info(f"交易员调度统计: {self._dispatcher.stats()}")
+        logger.info(f"委托统计: {self._order_manager.stats()}")
+        get_writer().flush()
+        logger.info(f"延迟写入统计: {get_writer().stats()}")
+        logger.info(f"通知统计: {get_notifier().stats()}")
         logger.info("收盘工作完成".center(100, "*"))
 
     def start_work(self):
@@ -243,13 +368,44 @@ class RealStaker(Staker):
 class BTStaker(Staker):
     """回测交易盯盘人"""
 
-    def __init__(self, api: TqApi, direction: int, strategy_ids: list[int]):
-        super().__init__(api, direction, strategy_ids)
+    def __init__(
+        self,
+        api: TqApi,
+        direction: int,
+        strategy_ids: list[int],
+        *,
+        lazy_kline: bool = False,
+        aggregate_kline: bool = False,
+        async_order: bool = False,
+        write_behind: bool = False,
+        future_configs: Optional[list[FutureConfig]] = None,
+        keep_alive: bool = True,
+        prescan: bool = False,
+    ):
+        # 只回测部分品种或使用其他参数时的品种配置, 不写入数据库,
+        # 为 None 时回测配置文件中的所有品种
+        self._shard_configs = future_configs
+        # 回测结束后是否继续等待行情更新, 为假时 start_work 在回测结束后返回
+        self._keep_alive = keep_alive
+        # 日线条件的预扫描结果, 只用于本地行情回放
+        self._prescan = prescan
+        self._scan: Optional[SignalScan] = None
+        super().__init__(
+            api,
+            direction,
+            strategy_ids,
+            lazy_kline=lazy_kline,
+            aggregate_kline=aggregate_kline,
+            async_order=async_order,
+            write_behind=write_behind,
+        )
 
     def _init_future_configs(self) -> list[FutureConfigInfo]:
-        return c_service.get_future_configs(
-            get_future_configs(), is_backtest=True
-        )
+        if self._shard_configs is None:
+            return c_service.get_future_configs(
+                get_future_configs(), is_backtest=True
+            )
+        return c_service.build_future_configs(self._shard_configs)
 
     def _init_traders(self, d, strategy_ids) -> list[Trader]:
         """加载交易员"""
@@ -259,7 +415,15 @@ class BTStaker(Staker):
         traders = []
         for config in self.future_configs:
             traders.append(
-                TestTrader(self._api, config, strategy_ids, d, True)
+                TestTrader(
+                    self._api,
+                    config,
+                    strategy_ids,
+                    d,
+                    True,
+                    self._kline_hub,
+                    self._order_manager,
+                )
             )
         self.logger.debug("reinit traders fininshed")
         return traders
@@ -281,6 +445,35 @@ class BTStaker(Staker):
         for trader in filter(lambda t: t.is_active, self.traders):
             mj_symbol = trader._config.f_info.symbol
             self.logger.info(f"{mj_symbol}")
+        if self._prescan:
+            self._scan = self._scan_signals()
+
+    def _scan_signals(self) -> Optional[SignalScan]:
+        """本地行情回放时预扫描所有合约的日线条件"""
+        if not isinstance(self._api, ReplayApi):
+            self.logger.warning("只有本地行情回放支持预扫描, 不进行预扫描")
+            return None
+        if not self.traders:
+            return None
+        # 交易方向 1: 多头 0: 空头 2: 多空
+        directions = [d for d in (1, 0) if self.direction in (d, 2)]
+        config = self.traders[0]._config
+        return scan_replay(
+            self._api,
+            directions,
+            config.getDailyK_Duration(),
+            config.getKlineLength(),
+        )
+
+    def _may_trade(self, trader: Trader, days: list[date]) -> bool:
+        """交易员的交易策略在这些交易日中是否可能有交易操作"""
+        return any(
+            self._scan.may_trade(strategy, days)
+            for strategy in trader.trade_strategies
+        )
+
+    def _get_quote_ns(self) -> int:
+        return tafunc.time_to_ns_timestamp(self._common_quote.datetime)
 
     def _handle_trade(self):
         """回测交易相关操作，在其中循环每天交易操作
@@ -288,10 +481,10 @@ class BTStaker(Staker):
         """
         while True:
             # 每完成一个循环，需要重新生成 traders 来初始化日线条件
-            self._api.wait_update()
-            self.traders = self._init_traders(
-                self.direction, self.strategy_ids
-            )
+            self._wait_update()
+            for trader in self.traders:
+                trader.release()
+            self.traders = self._create_traders()
             traders = list(filter(lambda t: t.is_active, self.traders))
             self._execute_before_trade()
             self._execute_trade(traders)
@@ -311,6 +504,10 @@ class BTStaker(Staker):
         except BacktestFinished:
             logger.info("回测完成")
             logger.info(self._api._account.tqsdk_stat)
+            # 回测结束后保存内存中的交易数据
+            get_storage().close()
+            if not self._keep_alive:
+                return
             # api.close()
             # 打印回测的详细信息
             # logger.info(self._api._account.trade_log)
@@ -328,12 +525,36 @@ class BTStaker(Staker):
 
     def _execute_trade(self, traders: list[Trader]):
         logger = self.logger
+        close_ns = None
+        if self._scan is not None:
+            # 只唤醒当日可能有交易操作的交易员, 都不需要唤醒时直接跳到收盘前
+            days, close_ns = self._scan.get_session(self._get_quote_ns())
+            active = [t for t in traders if self._may_trade(t, days)]
+            self._scan.skipped_count += len(traders) - len(active)
+            if not active and self._api.fast_forward(close_ns):
+                self._sync_update()
+                self._scan.fast_forward_count += 1
+            self._dispatcher = TraderDispatcher(active)
+        else:
+            self._dispatcher = TraderDispatcher(traders)
         while tq_tools.is_trading_period(self._api, self._common_quote):
-            self._api.wait_update()
-            for trader in traders:
+            self._wait_update()
+            if close_ns is not None and self._get_quote_ns() >= close_ns:
+                # 行情缺少收盘时刻时已进入下一个交易日, 恢复唤醒全部交易员
+                close_ns = None
+                self._dispatcher = TraderDispatcher(traders)
+            for trader in self._dispatcher.get_traders(self._changed_symbols):
                 trader.execute_trade()
         logger.info((f"{self.quote_time}-交易结束 开始进入盘后操作").center(100, "*"))
 
     def _execute_after_trade(self):
         logger = self.logger
+        logger.debug(f"指标计算统计: {get_indicator_hub().stats()}")
+        logger.debug(f"行情订阅统计: {self._kline_hub.stats()}")
+        logger.debug(f"交易员调度统计: {self._dispatcher.stats()}")
+        logger.debug(f"委托统计: {self._order_manager.stats()}")
+        get_writer().flush()
+        logger.debug(f"延迟写入统计: {get_writer().stats()}")
+        if self._scan is not None:
+            logger.debug(f"预扫描统计: {self._scan.stats()}")
         logger.debug("回测无须收盘操作-跳过")
@@ -17,7 +17,15 @@ from strategies.main_joint_symbol_strategies.smjs_strategies import (
     MJMainStrategy,
     MJStrategy,
 )
-from utils.common import LoggerGetter
+from strategies.trade_strategies.trade_strategies import TradeStrategy
+from utils.kline_hub import KlineHub
+from utils.log_tools import LoggerGetter
+from utils.metrics import get_metrics
+from utils.order_manager import OrderManager
+
+EXECUTE_TRADE_SECONDS = get_metrics().histogram(
+    "trader_execute_trade_seconds", "交易员每次执行交易操作的时间(秒)"
+)
 
 
 class StrategyTrader:
@@ -101,6 +109,32 @@ class StrategyTrader:
         if self.short_mjs is not None:
             self.short_mjs.execute_trade()
 
+    def release(self):
+        if self.long_mjs is not None:
+            self.long_mjs.release()
+        if self.short_mjs is not None:
+            self.short_mjs.release()
+
+    @property
+    def symbols(self) -> set[str]:
+        """主连策略交易的合约"""
+        symbols: set[str] = set()
+        if self.long_mjs is not None:
+            symbols |= self.long_mjs.symbols
+        if self.short_mjs is not None:
+            symbols |= self.short_mjs.symbols
+        return symbols
+
+    @property
+    def trade_strategies(self) -> list[TradeStrategy]:
+        """主连策略的全部交易策略"""
+        strategies: list[TradeStrategy] = []
+        if self.long_mjs is not None:
+            strategies += self.long_mjs.trade_strategies
+        if self.short_mjs is not None:
+            strategies += self.short_mjs.trade_strategies
+        return strategies
+
 
 class MainStrategyTrader(StrategyTrader):
     """主力合约交易员"""
@@ -150,14 +184,18 @@ class Trader:
         strategy_ids: List[int],
         direction: int = 2,
         is_bt: bool = False,
+        kline_hub: Optional[KlineHub] = None,
+        order_manager: Optional[OrderManager] = None,
     ):
         self.is_active = future_info.is_active
-        self._config = StrategyConfig(api, future_info, direction, is_bt)
+        self._config = StrategyConfig(
+            api, future_info, direction, is_bt, kline_hub, order_manager
+        )
         self.strategy_traders: List[StrategyTrader] = self._init_s_traders(
             strategy_ids
         )
         self.is_finished = False
-        self._mj_d_klines = api.get_kline_serial(
+        self._mj_d_klines = self._config.kline_hub.get_kline_serial(
             future_info.symbol, self._config.getDailyK_Duration()
         )
 
@@ -175,9 +213,10 @@ class Trader:
 
     def execute_trade(self):
         """根据该品种配置和当前交易时间，执行交易操作"""
-        if self.is_active and self._is_trading_time():
-            for s_trader in self.strategy_traders:
-                s_trader.execute_trade()
+        with EXECUTE_TRADE_SECONDS.time():
+            if self.is_active and self._is_trading_time():
+                for s_trader in self.strategy_traders:
+                    s_trader.execute_trade()
 
     def execute_before_trade(self):
         """交易前的准备工作
@@ -194,6 +233,30 @@ class Trader:
         for s_trader in self.strategy_traders:
             s_trader.execute_after_trade()
 
+    @property
+    def symbols(self) -> set[str]:
+        """交易员依赖的合约: 主连合约和各策略交易的合约"""
+        symbols = {self._config.f_info.symbol}
+        for s_trader in self.strategy_traders:
+            symbols |= s_trader.symbols
+        return symbols
+
+    @property
+    def trade_strategies(self) -> list[TradeStrategy]:
+        """各策略交易人的全部交易策略"""
+        strategies: list[TradeStrategy] = []
+        for s_trader in self.strategy_traders:
+            strategies += s_trader.trade_strategies
+        return strategies
+
+    def release(self):
+        """交易员不再使用时释放其订阅的K线序列"""
+        for s_trader in self.strategy_traders:
+            s_trader.release()
+        self._config.kline_hub.release_kline_serial(
+            self._config.f_info.symbol, self._config.getDailyK_Duration()
+        )
+
 
 class TestTrader(Trader):
     def _init_s_traders(self, strategy_ids: List[int]) -> List[StrategyTrader]:
@@ -0,0 +1,411 @@
+"""在多个进程中回测的主管
+
+各子进程由 _init_worker 统一初始化: 配置日志, 连接数据库并读取系统配置,
+之后每次回测只需在子进程中生成新的 TradeManager。
+参数扫描使用本地回放时, 子进程中的各次回测还共用已读取的行情数据, 合成K线和预扫描结果。
+"""
+
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import dao.config_service as c_service
+import utils.config_utils as c_utils
+from dao.odm.trade_config import TradeConfigInfo
+from dao.trade.storage import DUMP_TO_MONGO
+from headquarters.headquarters import DBA, AccountManager, TradeManager
+from strategies.indicators import get_indicator_hub
+from utils import common
+from utils import global_var as gvar
+from utils import param_sweep as sweep
+from utils.backtest_report import (
+    find_splice_day,
+    get_stat,
+    merge_backtest_results,
+    splice_trade_logs,
+    to_plain,
+)
+from utils.config_utils import FutureConfig
+from utils.log_tools import LoggerGetter
+from utils.replay_api import ReplayData
+
+logger = logging.getLogger(__name__)
+
+# 子进程中复用的系统配置, 每个进程只连接一次数据库
+_worker_trade_config: Optional[TradeConfigInfo] = None
+
+
+def _init_worker() -> None:
+    """回测子进程的初始化, 配置日志, 连接数据库并读取系统配置"""
+    global _worker_trade_config
+    common.setup_log_config("info", f"log_config_{gvar.ENV_NAME}")
+    config = c_utils.get_system_config()
+    DBA(config).create_db()
+    _worker_trade_config = c_service.get_system_config(config)
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """返回子进程已初始化的进程池"""
+    # 天勤在后台线程中运行事件循环, 子进程不使用 fork
+    context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(
+        workers, mp_context=context, initializer=_init_worker
+    )
+
+
+def _run_backtest(**kwargs) -> TradeManager:
+    """在子进程中使用新的 TqSim 账户完成一次回测, kwargs 为 TradeManager 的回测参数"""
+    trade_manager = TradeManager(
+        AccountManager(_worker_trade_config), keep_alive=False, **kwargs
+    )
+    trade_manager.start_work()
+    return trade_manager
+
+
+def split_future_configs(
+    configs: list[FutureConfig], shard_count: int
+) -> list[list[FutureConfig]]:
+    """把参与交易的品种依次分配到各组, 不参与交易的品种不回测, 不返回空的分组"""
+    active = [config for config in configs if config.is_active]
+    shards = [active[i::shard_count] for i in range(max(shard_count, 1))]
+    return [shard for shard in shards if shard]
+
+
+def get_shard_dump(backtest_dump: str, index: int) -> str:
+    """每组回测数据的去向, 写入文件时每组使用单独的文件"""
+    if backtest_dump in ("", DUMP_TO_MONGO):
+        return backtest_dump
+    root, ext = os.path.splitext(backtest_dump)
+    return f"{root}.{index}{ext}"
+
+
+def _run_backtest_shard(index: int, symbols: list[str], dump: str) -> dict:
+    """在子进程中回测一组品种, 返回该组的回测结果"""
+    configs = [c for c in c_utils.get_future_configs() if c.symbol in symbols]
+    trade_manager = _run_backtest(
+        future_configs=configs, backtest_dump=get_shard_dump(dump, index)
+    )
+    return {
+        "index": index,
+        "symbols": symbols,
+        **_get_backtest_result(trade_manager),
+    }
+
+
+def _get_backtest_result(trade_manager: TradeManager) -> dict:
+    """回测结束后的成交记录, 统计结果和成交合约的合约信息"""
+    account = trade_manager.tqApi._account
+    trade_log = to_plain(account.trade_log)
+    traded = {
+        f"{t['exchange_id']}.{t['instrument_id']}"
+        for day in trade_log.values()
+        for t in day["trades"]
+    }
+    quotes = trade_manager.tqApi._data.get("quotes", {})
+    return {
+        "trade_log": trade_log,
+        "tqsdk_stat": to_plain(getattr(account, "tqsdk_stat", {})),
+        "quotes": {
+            symbol: {"volume_multiple": quotes[symbol]["volume_multiple"]}
+            for symbol in traded
+        },
+    }
+
+
+class BacktestRunner:
+    """并行回测主管
+
+    把配置文件中参与交易的品种分成若干组, 每组在单独的进程中使用独立的
+    TqApi, TqSim 账户和内存存储回测, 最后合并各组的成交记录, 账户截面和统计结果。
+    各组账户的初始资金都为配置的账户资金, 开仓手数按各自的账户计算,
+    合并统计以各组初始资金之和为基数。
+    """
+
+    logger = LoggerGetter()
+
+    def __init__(self, processes: int, backtest_dump: str = DUMP_TO_MONGO):
+        # 进程数, 为 0 时使用 CPU 核数
+        self.processes = processes if processes > 0 else os.cpu_count()
+        self.backtest_dump = backtest_dump
+        self.report: Optional[dict] = None
+
+    def start_work(self):
+        logger = self.logger
+        shards = split_future_configs(
+            c_utils.get_future_configs(), self.processes
+        )
+        symbols = [[config.symbol for config in shard] for shard in shards]
+        logger.info(f"并行回测: {len(shards)} 个进程")
+        for index, shard_symbols in enumerate(symbols):
+            logger.info(f"第 {index} 组品种: {shard_symbols}")
+        with _get_pool(len(shards)) as pool:
+            results = list(
+                pool.map(
+                    _run_backtest_shard,
+                    range(len(shards)),
+                    symbols,
+                    [self.backtest_dump] * len(shards),
+                )
+            )
+        self.report = merge_backtest_results(results)
+        for result in results:
+            logger.info(f"第 {result['index']} 组统计: {result['tqsdk_stat']}")
+        logger.info(
+            f"合并统计(按 {self.report['account_count']} 个账户的初始资金之和 "
+            f"{self.report['init_balance']} 计算): {self.report['tqsdk_stat']}"
+        )
+        return self.report
+
+
+def _to_date(value) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def split_backtest_days(start_dt, end_dt, chunk_count: int) -> list[tuple]:
+    """把回测区间按自然日均分为若干段, 返回各段的起止日期
+
+    第一段的开始和最后一段的结束沿用回测区间的起止时间, 其他分界为日期,
+    每段的结束日期为下一段开始的前一天
+    """
+    first, last = _to_date(start_dt), _to_date(end_dt)
+    days = (last - first).days + 1
+    count = max(min(chunk_count, days), 1)
+    bounds = [first + timedelta(days=days * i // count) for i in range(count)]
+    starts = [start_dt] + bounds[1:]
+    ends = [bound - timedelta(days=1) for bound in bounds[1:]] + [end_dt]
+    return list(zip(starts, ends))
+
+
+def _run_backtest_chunk(
+    index: int, start_dt: date, end_dt: date, dump: str
+) -> dict:
+    """在子进程中回测一段区间, 返回该段的回测结果"""
+    trade_manager = _run_backtest(
+        backtest_dump=dump, backtest_days=(start_dt, end_dt)
+    )
+    return {
+        "index": index,
+        "start": start_dt,
+        "end": end_dt,
+        **_get_backtest_result(trade_manager),
+    }
+
+
+class WalkForwardRunner:
+    """分段回测主管
+
+    把回测区间分成若干段, 每段在单独的进程中使用独立的 TqApi, TqSim 账户和内存存储回测。
+    除第一段外, 每段提前 backtest_warmup_days 天开始回测, 各段的K线序列本身已包含
+    开始之前的历史K线, 提前开始是为了让持仓与前一段衔接。
+    最后依次在相邻两段都没有持仓的交易日衔接各段的结果, 没有这样的交易日时
+    把后一段与前一段合并后重新回测。
+    """
+
+    logger = LoggerGetter()
+
+    def __init__(self, trade_config: TradeConfigInfo):
+        self.chunks = split_backtest_days(
+            trade_config.backtest_days.start_date,
+            trade_config.backtest_days.end_date,
+            trade_config.backtest_chunks,
+        )
+        self.warmup_days = trade_config.backtest_warmup_days
+        self.backtest_dump = trade_config.backtest_dump
+        self.report: Optional[dict] = None
+
+    def start_work(self):
+        logger = self.logger
+        chunks = self.chunks
+        first = _to_date(chunks[0][0])
+        starts = [chunks[0][0]] + [
+            max(start - timedelta(days=self.warmup_days), first)
+            for start, _ in chunks[1:]
+        ]
+        logger.info(f"分段回测: {len(chunks)} 段, 预热 {self.warmup_days} 天")
+        for index, (start, end) in enumerate(chunks):
+            logger.info(
+                f"第 {index} 段: {start} 至 {end}, 从 {starts[index]} 开始回测"
+            )
+        with _get_pool(min(len(chunks), os.cpu_count())) as pool:
+            results = list(
+                pool.map(
+                    _run_backtest_chunk,
+                    range(len(chunks)),
+                    starts,
+                    [end for _, end in chunks],
+                    [self._get_dump(i) for i in range(len(chunks))],
+                )
+            )
+            self.report = self._reconcile(pool, results)
+        for result in results:
+            logger.info(f"第 {result['index']} 段统计: {result['tqsdk_stat']}")
+        for note in self.report["differences"]:
+            logger.info(f"与连续回测的差异: {note}")
+        logger.info(f"合并统计: {self.report['tqsdk_stat']}")
+        return self.report
+
+    def _get_dump(self, index: int) -> str:
+        """各段的回测数据包含预热期间的交易, 不写入数据库, 写入文件时每段使用单独的文件"""
+        if self.backtest_dump == DUMP_TO_MONGO:
+            return ""
+        return get_shard_dump(self.backtest_dump, index)
+
+    def _reconcile(self, pool: Executor, results: list[dict]) -> dict:
+        """依次衔接各段的结果, 记录可能与连续回测不同的地方"""
+        quotes: dict = {}
+        for result in results:
+            quotes.update(result["quotes"])
+        differences = []
+        splices = []
+        # 已衔接的结果, 以及它与当前段的衔接日
+        spliced, spliced_day = {}, None
+        current = results[0]
+        for result in results[1:]:
+            index = result["index"]
+            day = find_splice_day(current["trade_log"], result["trade_log"])
+            if day is None:
+                differences.append(
+                    f"第 {index} 段与前一段没有同时空仓的交易日, "
+                    f"已从 {current['start']} 开始连续回测至 {result['end']}"
+                )
+                current = pool.submit(
+                    _run_backtest_chunk,
+                    current["index"],
+                    current["start"],
+                    result["end"],
+                    self._get_dump(current["index"]),
+                ).result()
+                quotes.update(current["quotes"])
+                continue
+            spliced = self._splice(spliced, spliced_day, current)
+            spliced_day = day
+            current = result
+            splices.append({"index": index, "day": day})
+            differences.append(
+                f"{day} 之后使用第 {index} 段的结果: 开仓手数按该段账户的权益计算, "
+                f"权益与连续回测不同时手数可能不同; 该段之前已平仓的交易状态没有带入该段"
+            )
+        trade_log = self._splice(spliced, spliced_day, current)
+        if splices:
+            differences.append(
+                "每段开始时按当时的主力合约重新生成主连合约状态, 换月时间可能与连续回测不同"
+            )
+        return {
+            "trade_log": trade_log,
+            "tqsdk_stat": get_stat(trade_log, quotes),
+            "chunk_stats": [result["tqsdk_stat"] for result in results],
+            "splices": splices,
+            "differences": differences,
+        }
+
+    @staticmethod
+    def _splice(spliced: dict, day: Optional[str], result: dict) -> dict:
+        if day is None:
+            return result["trade_log"]
+        return splice_trade_logs(spliced, result["trade_log"], day)
+
+
+# 参数扫描子进程中共用的本地回放行情, 每个进程只读取一次行情目录
+_replay_data: Optional[ReplayData] = None
+
+
+def _get_replay_data() -> Optional[ReplayData]:
+    """本地回放时返回子进程中共用的行情数据, 使用天勤行情时返回 None"""
+    global _replay_data
+    replay_dir = _worker_trade_config.replay_dir
+    if not replay_dir:
+        return None
+    if _replay_data is None:
+        _replay_data = ReplayData(replay_dir)
+    return _replay_data
+
+
+def _run_sweep_group(
+    runs: list[tuple[int, dict]], configs: list[FutureConfig]
+) -> list[dict]:
+    """在子进程中依次回测一组参数组合, 回测数据不保存"""
+    results = []
+    for index, params in runs:
+        result = {"index": index, "params": params, "tqsdk_stat": None}
+        try:
+            trade_manager = _run_backtest(
+                future_configs=sweep.apply_params(configs, params),
+                backtest_dump="",
+                replay_data=_get_replay_data(),
+            )
+            result["tqsdk_stat"] = to_plain(
+                getattr(trade_manager.tqApi._account, "tqsdk_stat", {})
+            )
+        except Exception as e:
+            logger.exception(e)
+            result["error"] = repr(e)
+        finally:
+            # 下一次回测使用新的K线序列, 不能沿用本次的指标状态
+            get_indicator_hub().clear()
+        results.append(result)
+    return results
+
+
+class ParamSweeper:
+    """参数扫描主管
+
+    按扫描配置生成止盈止损参数组合, 在多个进程中回测配置文件中参与交易的品种,
+    按指定的统计指标排序后写入结果表。
+    """
+
+    logger = LoggerGetter()
+
+    def __init__(self, spec: sweep.SweepSpec):
+        self.spec = spec
+        config = c_utils.get_system_config()
+        DBA(config).create_db()
+        # 与子进程一致, 使用数据库中的系统配置
+        trade_config = c_service.get_system_config(config)
+        if not trade_config.is_backtest:
+            raise ValueError("参数扫描只能在回测模式下进行")
+        self.direction = trade_config.direction
+        self.strategy_ids = list(trade_config.strategy_ids)
+        self.results: list[dict] = []
+
+    def start_work(self) -> list[dict]:
+        logger = self.logger
+        spec = self.spec
+        configs = [c for c in c_utils.get_future_configs() if c.is_active]
+        unused = sorted(
+            set(spec.space)
+            - sweep.get_used_params(self.direction, self.strategy_ids)
+        )
+        if unused:
+            logger.warning(
+                f"交易方向和策略不使用以下参数, 不参与扫描: {unused}"
+            )
+        param_list = sweep.get_sweep_params(
+            spec, self.direction, self.strategy_ids
+        )
+        if not param_list or not configs:
+            logger.warning("没有需要回测的参数组合或品种")
+            return []
+        processes = spec.processes if spec.processes > 0 else os.cpu_count()
+        groups = sweep.group_runs(list(enumerate(param_list)), processes)
+        logger.info(
+            f"参数扫描: {len(param_list)} 个参数组合, {len(groups)} 个进程"
+        )
+        with _get_pool(len(groups)) as pool:
+            futures = [
+                pool.submit(_run_sweep_group, group, configs)
+                for group in groups
+            ]
+            results = [r for future in futures for r in future.result()]
+        self.results = sweep.rank_results(results, spec.metric)
+        sweep.write_results(self.results, spec.output)
+        for result in self.results[:5]:
+            stat = result["tqsdk_stat"] or {}
+            logger.info(
+                f"第 {result['rank']} 名 {spec.metric}="
+                f"{stat.get(spec.metric)}: {result['params']}"
+            )
+        logger.info(f"参数扫描结果已写入 {spec.output}")
+        return self.results
@@ -1,16 +1,27 @@
+from datetime import date
 from typing import Optional
 
 from mongoengine import connect
 from tqsdk import TqApi, TqAuth, TqBacktest, TqKq, TqSim
 
 import dao.config_service as c_service
+import dao.indexes as indexes
 import utils.config_utils as c_utils
 from dao.odm.trade_config import TradeConfigInfo
+from dao.trade.storage import (
+    MemoryStorage,
+    TimedStorage,
+    get_storage,
+    set_storage,
+)
+from dao.write_behind import get_writer
 from exe_departments.stakers import BTStaker, RealStaker
-
-# from utils import global_var as gvar
-from utils.common_tools import LoggerGetter, tz_utc_8
-from utils.config_utils import SystemConfig
+from utils.common_tools import tz_utc_8
+from utils.config_utils import FutureConfig, SystemConfig
+from utils.log_tools import LoggerGetter
+from utils.metrics import get_metrics
+from utils.notifier import get_notifier
+from utils.replay_api import ReplayApi, ReplayData
 
 
 class Commander:
@@ -20,16 +31,33 @@ class Commander:
         DBA：管理数据库连接。将对接好的数据库交给其他角色使用。
         AccountManager：管理交易账户。根据交易系统配置生成交易账户.
         TradeManager：交易主管。负责利用系统提供的资源开展交易工作。
+        BacktestRunner：并行回测主管。把品种分组后在多个进程中同时回测。
+        WalkForwardRunner：分段回测主管。把回测区间分段后在多个进程中同时回测。
     """
 
     def __init__(self):
+        # 回测主管在子进程中使用本模块的角色, 在这里导入以避免循环导入
+        from headquarters.backtest_runner import (
+            BacktestRunner,
+            WalkForwardRunner,
+        )
+
         _config = c_utils.get_system_config()
         self._dba = DBA(_config)
         self._dba.create_db()
         self._account_manager = AccountManager(
             c_service.get_system_config(_config)
         )
-        self.trade_manager = TradeManager(self._account_manager)
+        trade_config = self._account_manager.trade_config
+        if trade_config.is_backtest and trade_config.backtest_chunks > 1:
+            self.trade_manager = WalkForwardRunner(trade_config)
+        elif trade_config.is_backtest and trade_config.backtest_processes != 1:
+            self.trade_manager = BacktestRunner(
+                trade_config.backtest_processes,
+                trade_config.backtest_dump,
+            )
+        else:
+            self.trade_manager = TradeManager(self._account_manager)
 
     def start_work(self):
         """交易的开端"""
@@ -61,6 +89,8 @@ class DBA:
             db_name = "future_trade"
         db_url = f"{self._url}{db_name}?authSource=admin"
         connect(host=db_url, tz_aware=True, tzinfo=tz_utc_8)
+        # 连接后创建并检查各集合所需的索引
+        indexes.ensure_indexes()
 
 
 class AccountManager:
@@ -92,23 +122,69 @@ class AccountManager:
 class TradeManager:
     logger = LoggerGetter()
 
-    def __init__(self, acc_manager: AccountManager):
+    def __init__(
+        self,
+        acc_manager: AccountManager,
+        future_configs: Optional[list[FutureConfig]] = None,
+        keep_alive: bool = True,
+        backtest_dump: Optional[str] = None,
+        backtest_days: Optional[tuple[date, date]] = None,
+        replay_data: Optional[ReplayData] = None,
+    ):
+        """future_configs, keep_alive, backtest_dump, backtest_days 和 replay_data 只用于回测:
+        只回测的品种, 回测结束后是否继续等待, 覆盖系统配置中回测数据的去向和回测区间,
+        以及已读取的本地回放行情
+        """
         trade_config = acc_manager.trade_config
         is_backtest = trade_config.is_backtest
         direction = trade_config.direction
         trade_account = acc_manager.trade_account
         if is_backtest:
             self.logger.info("使用回测模式")
-            self.tqApi = TqApi(
-                account=trade_account,
-                auth=acc_manager.tq_auth,
-                backtest=TqBacktest(
-                    start_dt=trade_config.backtest_days.start_date,
-                    end_dt=trade_config.backtest_days.end_date,
-                ),
-            )
+            # 回测时交易数据保存在内存中, 回测结束后再统一保存
+            if backtest_dump is None:
+                backtest_dump = trade_config.backtest_dump
+            set_storage(MemoryStorage(backtest_dump))
+            if backtest_days is None:
+                backtest_days = (
+                    trade_config.backtest_days.start_date,
+                    trade_config.backtest_days.end_date,
+                )
+            start_dt, end_dt = backtest_days
+            if trade_config.replay_dir:
+                self.logger.info(
+                    f"使用本地行情回放: {trade_config.replay_dir}"
+                )
+                self.tqApi = ReplayApi(
+                    trade_config.replay_dir,
+                    start_dt,
+                    end_dt,
+                    trade_account._init_balance,
+                    replay_data,
+                )
+                # 本地回放结束后没有需要等待的行情
+                keep_alive = False
+            else:
+                if trade_config.prescan:
+                    self.logger.warning(
+                        "只有本地行情回放支持预扫描, 不进行预扫描"
+                    )
+                self.tqApi = TqApi(
+                    account=trade_account,
+                    auth=acc_manager.tq_auth,
+                    backtest=TqBacktest(start_dt=start_dt, end_dt=end_dt),
+                )
             self.staker = BTStaker(
-                self.tqApi, direction, trade_config.strategy_ids
+                self.tqApi,
+                direction,
+                trade_config.strategy_ids,
+                lazy_kline=trade_config.lazy_kline,
+                aggregate_kline=trade_config.aggregate_kline,
+                async_order=trade_config.async_order,
+                write_behind=trade_config.write_behind,
+                future_configs=future_configs,
+                keep_alive=keep_alive,
+                prescan=bool(trade_config.replay_dir) and trade_config.prescan,
             )
         else:
             self.logger.info("使用实盘模式")
@@ -116,13 +192,35 @@ class TradeManager:
                 self.logger.info("使用实盘账户进行交易")
             else:
                 self.logger.info("使用模拟账户进行交易")
+            get_notifier().digest_window = trade_config.notify_digest_window
             self.tqApi = TqApi(account=trade_account, auth=acc_manager.tq_auth)
             self.staker = RealStaker(
-                self.tqApi, direction, trade_config.strategy_ids
+                self.tqApi,
+                direction,
+                trade_config.strategy_ids,
+                lazy_kline=trade_config.lazy_kline,
+                aggregate_kline=trade_config.aggregate_kline,
+                async_order=trade_config.async_order,
+                write_behind=trade_config.write_behind,
             )
+        self._start_metrics(trade_config)
+
+    def _start_metrics(self, trade_config: TradeConfigInfo) -> None:
+        """配置了端口或日志间隔时启用运行指标, 并统计交易数据存储的调用时间"""
+        port = trade_config.metrics_port
+        log_interval = trade_config.metrics_log_interval
+        if not port and not log_interval:
+            return
+        get_metrics().start(port or None, log_interval)
+        if not isinstance(get_storage(), TimedStorage):
+            set_storage(TimedStorage(get_storage()))
 
     def start_work(self):
         logger = self.logger
         logger.info("交易准备开始")
         self.staker.start_work()
+        get_writer().stop()
+        get_notifier().stop()
+        get_metrics().stop()
+        get_storage().close()
         self.tqApi.close()
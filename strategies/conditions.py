@@ -0,0 +1,173 @@
+"""主策略开仓条件的向量化计算
+
+每个函数对K线序列中的所有K线一次性计算条件序号, 返回与K线序列等长的数组,
+0 表示不满足条件。计算规则与 mts_long.py / mts_short.py 中逐根K线的判断一致,
+依赖当前交易状态的条件(如日线条件序号, 3小时线交叉距离)以参数传入, 对所有K线使用同一个值。
+"""
+
+import numpy as np
+from pandas import DataFrame
+
+from strategies.tools import diff_two_values
+
+
+def _get_main_values(klines: DataFrame) -> tuple:
+    """返回主策略常用指标的数组: ema9, ema22, ema60, macd, close, open"""
+    return tuple(
+        klines[name].to_numpy(dtype=float)
+        for name in ("ema9", "ema22", "ema60", "MACD.close", "close", "open")
+    )
+
+
+def main_long_daily(klines: DataFrame) -> np.ndarray:
+    """做多日线条件 1-5"""
+    e9, e22, e60, macd, close, open_p = _get_main_values(klines)
+    diff9_60 = diff_two_values(e9, e60)
+    diffc_60 = diff_two_values(close, e60)
+    diff22_60 = diff_two_values(e22, e60)
+    low = np.minimum(open_p, close)
+    is_up = e22 > e60
+    cond1 = (
+        (e22 < e60)
+        & ((diff9_60 < 1) | (diff22_60 < 1))
+        & (close > e60)
+        & (macd > 0)
+        & ((e9 > e22) | (macd > 0))
+    )
+    cond2 = is_up & (diff22_60 < 1) & (close > e60)
+    cond3 = (
+        is_up
+        & (1 < diff9_60)
+        & (diff9_60 < 3)
+        & (e9 > e22)
+        & (e22 > low)
+        & (low > e60)
+    )
+    cond4 = (
+        is_up
+        & (1 < diff22_60)
+        & (diff22_60 < 3)
+        & (diff9_60 < 2)
+        & (e22 > close)
+        & (close > e60)
+        & (e22 > e9)
+        & (e9 > e60)
+    )
+    cond5 = (
+        is_up
+        & (diff22_60 > 3)
+        & (diffc_60 < 3)
+        & (e22 > close)
+        & (close > e60)
+        & (e22 > open_p)
+        & (open_p > e60)
+    )
+    return np.select(
+        [cond1, cond2, cond3, cond4, cond5], [1, 2, 3, 4, 5], 0
+    ).astype(float)
+
+
+def main_long_3h(
+    klines: DataFrame, daily_condition: float, is_c2_matched: bool
+) -> np.ndarray:
+    """做多3小时线条件 1-6
+
+    daily_condition: 日线满足的条件序号
+    is_c2_matched: 3小时线 EMA22 与 EMA9 下穿 EMA60 的距离是否在5根以内
+    """
+    e9, e22, e60, macd, close, open_p = _get_main_values(klines)
+    diffc_60 = diff_two_values(close, e60)
+    diffo_60 = diff_two_values(open_p, e60)
+    diff22_60 = diff_two_values(e22, e60)
+    diff9_60 = diff_two_values(e9, e60)
+    conds = np.zeros(len(klines))
+    if daily_condition in [1, 2]:
+        cond1 = (
+            (e22 < e60)
+            & (e9 < e60)
+            & (
+                (diff22_60 < 1)
+                | (
+                    (1 < diff22_60)
+                    & (diff22_60 < 2)
+                    & ((macd > 0) | (close > e60))
+                )
+            )
+        )
+        is_up = (close > e9) & (e9 > e22) & (e22 > e60)
+        cond5 = is_up & (diff9_60 < 1) & (diff22_60 < 1) & (macd > 0)
+        conds = np.select(
+            [cond1, is_up & is_c2_matched, cond5], [1, 2, 5], 0
+        ).astype(float)
+    elif daily_condition in [3, 4]:
+        cond3 = (
+            (close > e60)
+            & (e60 > e22)
+            & (macd > 0)
+            & (diff22_60 < 1)
+            & (e9 < e60)
+        )
+        cond6 = (daily_condition == 3) & (diff9_60 < 1) & (diff22_60 < 1)
+        conds = np.select([cond3, cond6], [3, 6], 0).astype(float)
+    elif daily_condition == 5:
+        conds = np.where((e60 > e22) & (e22 > e9), 4.0, 0.0)
+    return np.where((diffc_60 < 3) | (diffo_60 < 3), conds, 0.0)
+
+
+def main_long_minute(klines: DataFrame) -> np.ndarray:
+    """做多30分钟线和5分钟线条件"""
+    _, _, e60, macd, close, _ = _get_main_values(klines)
+    diffc_60 = diff_two_values(close, e60)
+    return np.where((close > e60) & (macd > 0) & (diffc_60 < 1.2), 1.0, 0.0)
+
+
+def main_short_daily(
+    klines: DataFrame, has_no_matched_cond: bool
+) -> np.ndarray:
+    """做空日线条件
+
+    has_no_matched_cond: 前一根日线是否满足不开仓条件
+    """
+    if has_no_matched_cond:
+        return np.zeros(len(klines))
+    _, e22, e60, macd, close, _ = _get_main_values(klines)
+    return np.where((e22 > e60) & (macd < 0) & (e22 > close), 1.0, 0.0)
+
+
+def main_short_3h(klines: DataFrame) -> np.ndarray:
+    """做空3小时线条件"""
+    e9, e22, e60, macd, close, open_p = _get_main_values(klines)
+    diffc_60 = diff_two_values(close, e60)
+    diff9_60 = diff_two_values(e9, e60)
+    diff22_60 = diff_two_values(e22, e60)
+    return np.where(
+        (e22 > e60)
+        & ((e22 > e9) | ((e22 < e9) & (close < e60) & (open_p > e60)))
+        & (diff9_60 < 3)
+        & (diff22_60 < 3)
+        & (diffc_60 < 3)
+        & (macd < 0),
+        1.0,
+        0.0,
+    )
+
+
+def main_short_30m(klines: DataFrame, is_within_2days: bool) -> np.ndarray:
+    """做空30分钟线条件
+
+    is_within_2days: 30分钟线上一次满足条件是否在规定时间之内
+    """
+    if not is_within_2days:
+        return np.zeros(len(klines))
+    e9, e22, e60, macd, close, _ = _get_main_values(klines)
+    diff22_60 = diff_two_values(e22, e60)
+    diff9_60 = diff_two_values(e9, e60)
+    return np.where(
+        (((e60 > e22) & (e22 > e9)) | ((e22 > e60) & (e60 > e9)))
+        & (diff9_60 < 2)
+        & (diff22_60 < 1)
+        & (macd < 0)
+        & (e60 > close),
+        1.0,
+        0.0,
+    )
@@ -1,13 +1,24 @@
+from typing import Optional
+
 from tqsdk import TqApi
 from dao.odm.future_config import FutureConfigInfo
+from utils.kline_hub import KlineHub
+from utils.order_manager import OrderManager
 
 
 class StrategyConfig:
     '''策略配置'''
     def __init__(self, api: TqApi, f_info: FutureConfigInfo, direction: int,
-                 is_backtest: bool = False):
+                 is_backtest: bool = False,
+                 kline_hub: Optional[KlineHub] = None,
+                 order_manager: Optional[OrderManager] = None):
         self.api: TqApi = api
-        self.quote = api.get_quote(f_info.symbol) # type: ignore
+        # 行情订阅中心, 由盯盘人创建并传递给所有交易员共享
+        self.kline_hub = kline_hub if kline_hub is not None else KlineHub(api)
+        # 委托管理, 由盯盘人创建并传递给所有交易员共享
+        self.order_manager = order_manager if order_manager is not None \
+            else OrderManager(api)
+        self.quote = self.kline_hub.get_quote(f_info.symbol) # type: ignore
         self.f_info = f_info
         self.direction = direction
         self.is_backtest = is_backtest
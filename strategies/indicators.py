@@ -0,0 +1,400 @@
+import weakref
+from typing import Optional
+
+import numpy as np
+from pandas import DataFrame, Series
+
+# MACD 参数: 短周期, 长周期, DEA 周期
+MACD_PARAMS = (12, 24, 4)
+# 主策略和摸底策略使用的 EMA 周期
+MAIN_EMA_PERIODS = (9, 22, 60)
+BOTTOM_EMA_PERIODS = (5, 20, 60)
+# 交叉索引支持的比较方式
+_COMPARES = {
+    "<=": np.less_equal,
+    ">=": np.greater_equal,
+    "<": np.less,
+    ">": np.greater,
+}
+
+
+def calc_ema(values: np.ndarray, n: int) -> np.ndarray:
+    """与 tafunc.ema 计算方式一致的指数移动平均, 返回未取整的结果"""
+    return Series(values).ewm(span=n, adjust=False).mean().to_numpy()
+
+
+def _alpha(n: int) -> float:
+    return 2 / (n + 1)
+
+
+def _seeded_ema_response(r: float, b: float, steps: np.ndarray) -> np.ndarray:
+    """以 r**t 为输入序列, 计算 b 为系数的 EMA 序列
+
+    用于计算 DEA 在种子变化后的修正量, 输入序列的第一项即为种子。
+    """
+    c = 1 - b
+    if abs(r - c) < 1e-12:
+        return r**steps * (1 + b * steps)
+    k = b * r / (r - c)
+    return k * r**steps + (1 - k) * c**steps
+
+
+class CrossIndex:
+    """K线序列的交叉事件索引
+
+    记录收盘价及各 EMA 与 EMA60 等指标比较的结果, 条件以 (指标, 比较方式, 指标) 表示,
+    如 ("ema9", "<=", "ema60")。已完成的K线只在窗口滑动(新K线生成)或指标重新计算后
+    向量化计算一次, 得到截至每根K线最近一次满足条件的位置; 每个 tick 只刷新正在变化的
+    最后一根K线, 所以查询最近一次满足条件的位置是 O(1) 的。
+    """
+
+    def __init__(self):
+        self._values: dict[str, np.ndarray] = {}
+        self._prefix: dict = {}
+        self._stale = True
+        self.rebuild_count = 0
+
+    @property
+    def size(self) -> int:
+        return len(self._values["id"]) if self._values else 0
+
+    def invalidate(self) -> None:
+        """已完成K线的指标发生变化, 下一次同步时重建索引"""
+        self._stale = True
+
+    def sync(self, klines: DataFrame) -> None:
+        """与K线序列同步, 有新K线生成时重建索引, 否则只刷新最后一根K线"""
+        values = self._values
+        if (
+            self._stale
+            or not values
+            or len(klines) != len(values["id"])
+            or klines["id"].iat[-1] != values["id"][-1]
+        ):
+            self._rebuild(klines)
+            return
+        for name, array in values.items():
+            array[-1] = klines[name].iat[-1]
+
+    def holds(self, cond: tuple[str, str, str], pos: int) -> bool:
+        """某根K线是否满足条件"""
+        a, op, b = cond
+        return bool(_COMPARES[op](self._values[a][pos], self._values[b][pos]))
+
+    def last_pos(
+        self, cond: tuple[str, str, str], end: Optional[int] = None
+    ) -> int:
+        """返回 end(含) 之前最近一根满足条件的K线位置, 不存在时返回 -1"""
+        last = self.size - 1
+        if end is None or end > last:
+            end = last
+        if end < 0:
+            return -1
+        if end == last:
+            if self.holds(cond, last):
+                return last
+            end -= 1
+            if end < 0:
+                return -1
+        return int(self._get_prefix(cond)[end])
+
+    def last_followed_pos(
+        self, first: tuple[str, str, str], second: tuple[str, str, str]
+    ) -> int:
+        """返回最近一根满足 first 条件, 且下一根K线满足 second 条件的K线位置"""
+        last = self.size - 1
+        if last < 1:
+            return -1
+        if self.holds(first, last - 1) and self.holds(second, last):
+            return last - 1
+        key = (first, second)
+        if key not in self._prefix:
+            mask = self._mask(first, slice(0, last - 1)) & self._mask(
+                second, slice(1, last)
+            )
+            hits = np.flatnonzero(mask)
+            self._prefix[key] = int(hits[-1]) if hits.size else -1
+        return self._prefix[key]
+
+    def pos_before(self, dt: int) -> int:
+        """返回生成时间早于 dt 的最后一根K线位置"""
+        if "datetime" not in self._prefix:
+            dts = self._values["datetime"]
+            self._prefix["datetime"] = np.where(np.isnan(dts), -np.inf, dts)
+        return int(np.searchsorted(self._prefix["datetime"], dt)) - 1
+
+    def get_id(self, pos: int) -> float:
+        return self._values["id"][pos]
+
+    def _rebuild(self, klines: DataFrame) -> None:
+        self._values = {
+            name: klines[name].to_numpy(dtype=float).copy()
+            for name in klines.columns
+            if name in ("id", "datetime", "close")
+            or (name.startswith("ema") and name[3:].isdigit())
+        }
+        self._prefix = {}
+        self._stale = False
+        self.rebuild_count += 1
+
+    def _mask(self, cond: tuple[str, str, str], rows: slice) -> np.ndarray:
+        a, op, b = cond
+        return _COMPARES[op](self._values[a][rows], self._values[b][rows])
+
+    def _get_prefix(self, cond: tuple[str, str, str]) -> np.ndarray:
+        """已完成的K线中, 截至每根K线最近一次满足条件的位置"""
+        prefix = self._prefix.get(cond)
+        if prefix is None:
+            mask = self._mask(cond, slice(0, self.size - 1))
+            prefix = np.maximum.accumulate(
+                np.where(mask, np.arange(len(mask)), -1)
+            )
+            self._prefix[cond] = prefix
+        return prefix
+
+
+class IndicatorEngine:
+    """为一条K线序列增量计算 EMA 和 MACD 指标
+
+    天勤的K线序列是长度固定的滑动窗口, tqsdk.ta 以窗口中第一根有效K线作为种子计算指标,
+    所以窗口滑动后整列指标都会随种子变化。引擎保存未取整的指标状态, 新K线到来时对重叠部分
+    做一次向量化的种子修正, 只对新生成和正在变化的K线做递推计算。
+    当K线数量变化或历史数据被改写时, 退回全量计算。
+    """
+
+    # 连续增量计算的次数上限, 超过后全量计算一次以消除累计的浮点误差
+    max_incremental = 1000
+
+    def __init__(
+        self,
+        ema_periods: tuple[int, ...],
+        macd_params: tuple[int, int, int] = MACD_PARAMS,
+    ):
+        self.ema_periods = tuple(ema_periods)
+        self.short, self.long, self.m = macd_params
+        self._periods = sorted(set(self.ema_periods) | {self.short, self.long})
+        self.full_count = 0
+        self.incremental_count = 0
+        self._since_full = 0
+        self._ids: Optional[np.ndarray] = None
+        self._closes: Optional[np.ndarray] = None
+        self._emas: dict[int, np.ndarray] = {}
+        self._diff: Optional[np.ndarray] = None
+        self._dea: Optional[np.ndarray] = None
+        # 已写入最新指标的K线序列, 使用弱引用避免延长天勤序列的生命周期
+        self._filled: list[weakref.ref] = []
+        self.crosses = CrossIndex()
+
+    def update(self, klines: DataFrame) -> None:
+        """根据K线序列的变化更新指标, 并将结果写入K线序列"""
+        ids = klines["id"].to_numpy(dtype=float)
+        closes = klines["close"].to_numpy(dtype=float)
+        shift = self._get_shift(ids, closes)
+        if shift is None or not self._update_incremental(closes, shift):
+            self._update_full(closes)
+            self.crosses.invalidate()
+        elif shift > 0:
+            # 窗口滑动后种子变化, 已完成K线的指标都会改变
+            self.crosses.invalidate()
+        self._ids = ids.copy()
+        self._closes = closes.copy()
+        self._filled = []
+        self._fill(klines)
+
+    def is_current(self, klines: DataFrame) -> bool:
+        """K线序列与上一次计算时的数据是否完全一致"""
+        if self._ids is None or self._closes is None:
+            return False
+        return np.array_equal(
+            klines["id"].to_numpy(dtype=float), self._ids, equal_nan=True
+        ) and np.array_equal(
+            klines["close"].to_numpy(dtype=float),
+            self._closes,
+            equal_nan=True,
+        )
+
+    def has_filled(self, klines: DataFrame) -> bool:
+        """该K线序列是否已写入最新的指标"""
+        return any(ref() is klines for ref in self._filled)
+
+    def add_periods(self, ema_periods: tuple[int, ...]) -> None:
+        """增加需要计算的 EMA 周期, 有新周期时下一次更新全量计算"""
+        new_periods = [n for n in ema_periods if n not in self.ema_periods]
+        if new_periods:
+            self.ema_periods = self.ema_periods + tuple(new_periods)
+            self._periods = sorted(set(self._periods) | set(new_periods))
+            self.reset()
+
+    def reset(self) -> None:
+        """清除指标状态, 下一次更新时全量计算"""
+        self._ids = None
+        self._closes = None
+        self._filled = []
+        self.crosses.invalidate()
+
+    def _get_shift(self, ids: np.ndarray, closes: np.ndarray) -> Optional[int]:
+        """返回K线序列与上一次计算时相比滑动的K线数量, 无法增量计算时返回 None"""
+        if self._ids is None or self._closes is None:
+            return None
+        size = len(ids)
+        if size != len(self._ids):
+            return None
+        if self._since_full >= self.max_incremental:
+            return None
+        if np.isnan(ids[-1]) or np.isnan(self._ids[-1]):
+            return None
+        shift = int(ids[-1] - self._ids[-1])
+        if shift < 0 or shift >= size - 1:
+            return None
+        # 上一次计算时已经完成的K线, 其数据不应发生变化, 否则视为历史数据被改写
+        keep = size - shift - 1
+        if not np.array_equal(
+            ids[: keep + 1], self._ids[shift:], equal_nan=True
+        ):
+            return None
+        if not np.array_equal(
+            closes[:keep], self._closes[shift : shift + keep], equal_nan=True
+        ):
+            return None
+        return shift
+
+    def _update_full(self, closes: np.ndarray) -> None:
+        for n in self._periods:
+            self._emas[n] = calc_ema(closes, n)
+        self._diff = self._emas[self.short] - self._emas[self.long]
+        self._dea = calc_ema(self._diff, self.m)
+        self.full_count += 1
+        self._since_full = 0
+
+    def _update_incremental(self, closes: np.ndarray, shift: int) -> bool:
+        """对窗口重叠部分做种子修正, 对其余K线递推计算, 无法处理时返回 False"""
+        size = len(closes)
+        valid = ~np.isnan(closes)
+        start = int(np.argmax(valid))
+        keep = size - shift - 1
+        if not valid[start:].all() or start >= keep:
+            return False
+        steps = np.arange(keep - start)
+        old_start = start + shift
+        x0 = closes[start]
+        old_emas = self._emas
+        emas = {}
+        for n, old in old_emas.items():
+            a = _alpha(n)
+            new = np.full(size, np.nan)
+            new[start:keep] = old[old_start : shift + keep] + (
+                1 - a
+            ) ** steps * (x0 - old[old_start])
+            for i in range(keep, size):
+                new[i] = a * closes[i] + (1 - a) * new[i - 1]
+            emas[n] = new
+        b = _alpha(self.m)
+        diff = emas[self.short] - emas[self.long]
+        old_diff, old_dea = self._diff, self._dea
+        dea = np.full(size, np.nan)
+        dea[start:keep] = (
+            old_dea[old_start : shift + keep]
+            + (1 - b) ** steps * (old_diff[old_start] - old_dea[old_start])
+            + (x0 - old_emas[self.short][old_start])
+            * _seeded_ema_response(1 - _alpha(self.short), b, steps)
+            - (x0 - old_emas[self.long][old_start])
+            * _seeded_ema_response(1 - _alpha(self.long), b, steps)
+        )
+        for i in range(keep, size):
+            dea[i] = b * diff[i] + (1 - b) * dea[i - 1]
+        self._emas = emas
+        self._diff = diff
+        self._dea = dea
+        self.incremental_count += 1
+        self._since_full += 1
+        return True
+
+    def _fill(self, klines: DataFrame) -> None:
+        """将指标写入K线序列, 列名及取整方式与 tools.fill_macd 等方法一致"""
+        for n in self.ema_periods:
+            klines[f"ema{n}"] = np.round(self._emas[n], 3)
+        bar = np.round(2 * (self._diff - self._dea), 3)
+        # 用 K 线图模拟 MACD 指标柱状图
+        klines["MACD.open"] = 0.0
+        klines["MACD.close"] = bar
+        klines["MACD.high"] = np.where(bar > 0, bar, 0.0)
+        klines["MACD.low"] = np.where(bar < 0, bar, 0.0)
+        klines["diff"] = self._diff
+        klines["dea"] = self._dea
+        self._filled.append(weakref.ref(klines))
+
+
+class IndicatorHub:
+    """进程内共享的指标计算中心
+
+    同一合约同一周期的K线, 不论被多少个策略使用(多空, 主策略和摸底策略), 每根K线只计算一次指标。
+    每个 (合约, K线周期) 对应一个计算引擎, 引擎计算所有策略需要的 EMA 周期的并集。
+    天勤对相同参数的K线请求返回同一个序列对象, 此时后来的策略直接跳过计算;
+    如果是数据相同的另一个序列对象(如实盘中日线的拷贝), 则只写入已计算好的指标。
+    """
+
+    def __init__(self):
+        self._engines: dict[tuple[str, int], IndicatorEngine] = {}
+        # 实际计算指标的次数
+        self.computed_count = 0
+        # 使用已计算好的指标, 省去计算的次数
+        self.saved_count = 0
+
+    def fill(
+        self,
+        symbol: str,
+        duration: int,
+        ema_periods: tuple[int, ...],
+        klines: DataFrame,
+    ) -> None:
+        """为K线序列填充指标, 指标已是最新时不再重复计算"""
+        key = (symbol, duration)
+        engine = self._engines.get(key)
+        if engine is None:
+            engine = IndicatorEngine(ema_periods)
+            self._engines[key] = engine
+        else:
+            engine.add_periods(ema_periods)
+        if engine.is_current(klines):
+            self.saved_count += 1
+            if not engine.has_filled(klines):
+                engine._fill(klines)
+            return
+        engine.update(klines)
+        self.computed_count += 1
+
+    def get_cross_index(self, symbol: str, duration: int) -> CrossIndex:
+        """返回某个合约某个周期K线的交叉事件索引"""
+        key = (symbol, duration)
+        if key not in self._engines:
+            self._engines[key] = IndicatorEngine(())
+        return self._engines[key].crosses
+
+    def release(self, symbol: str) -> None:
+        """释放某个合约所有周期的计算引擎"""
+        for key in [k for k in self._engines if k[0] == symbol]:
+            del self._engines[key]
+
+    def clear(self) -> None:
+        self._engines.clear()
+        self.computed_count = 0
+        self.saved_count = 0
+
+    def stats(self) -> dict:
+        """返回指标计算的统计信息"""
+        engines = self._engines.values()
+        return {
+            "engines": len(self._engines),
+            "computed": self.computed_count,
+            "saved": self.saved_count,
+            "full": sum(e.full_count for e in engines),
+            "incremental": sum(e.incremental_count for e in engines),
+        }
+
+
+_hub = IndicatorHub()
+
+
+def get_indicator_hub() -> IndicatorHub:
+    """返回进程内共享的指标计算中心"""
+    return _hub
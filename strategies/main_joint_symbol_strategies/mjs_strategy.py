@@ -29,12 +29,36 @@ class MJStrategy(Strategy):
 
     def _update_trade_strategy(self):
         """更新策略的合约状态表"""
+        old_strategies = [
+            self.current_trade_strategy,
+            self.next_trade_strategy,
+        ]
         self.current_trade_strategy = self._create_trade_strategy(
             self.mjs_status.current_symbol
         )
         self.next_trade_strategy = self._create_trade_strategy(
             self.mjs_status.next_symbol
         )
+        for strategy in old_strategies:
+            strategy.release_klines()
+
+    def release(self):
+        """释放当前合约和下一合约策略订阅的K线序列"""
+        self.current_trade_strategy.release_klines()
+        self.next_trade_strategy.release_klines()
+
+    @property
+    def symbols(self) -> set[str]:
+        """当前合约和下一合约"""
+        return {
+            self.current_trade_strategy.symbol,
+            self.next_trade_strategy.symbol,
+        }
+
+    @property
+    def trade_strategies(self) -> list[TradeStrategy]:
+        """当前合约和下一合约的交易策略"""
+        return [self.current_trade_strategy, self.next_trade_strategy]
 
     def switch_symbol(self):
         """盘前换月
@@ -108,8 +132,13 @@ class MJStrategy(Strategy):
         self.next_trade_strategy.fill_indicators_by_type(indicator_type)
 
     def _is_changing(self, k_type: int) -> bool:
-        """k_type: 1: 交易日结束 2: 日线, 3: 3小时线, 4: 30分钟线, 5: 5分钟线"""
-        return self.current_trade_strategy.is_changing(k_type)
+        """k_type: 1: 3小时线, 2: 30分钟线, 3: 5分钟线
+
+        惰性订阅模式下两个合约的日内K线可能只订阅了其中一个, 任一合约K线变化时都需要填充指标
+        """
+        return self.current_trade_strategy.is_changing(
+            k_type
+        ) or self.next_trade_strategy.is_changing(k_type)
 
     @abstractmethod
     def _create_trade_strategy(self, symbol: str) -> TradeStrategy:
@@ -0,0 +1,226 @@
+"""主策略日线条件的预扫描
+
+主策略只有在日线条件满足时才会开仓。本地行情回放时全部K线在回测开始前已知,
+预扫描一次性计算每个合约在回测区间每个交易日的日线条件, 记录可能开仓的 (合约, 方向, 交易日)。
+没有持仓, 没有未完成委托, 当日又不可能开仓的交易策略在盘中不做任何操作,
+盯盘人在这些交易日不再唤醒它们, 所有交易员都如此时直接跳到收盘前, 回测结果与逐个时刻回放相同。
+
+盘中使用的是前一根日线(位置 -2)的条件, 日线序列是长度固定的滑动窗口, 指标以窗口中第一根K线为种子,
+所以这里对每根日线按它在盘中所处的窗口计算指标, 而不是对全部K线计算一次。
+日线指标只在交易员生成时计算, 如果合约当日的第一根K线在交易员生成之后才出现,
+日线序列上移后位置 -2 的指标是它作为最后一根K线时计算的, 这种情况也一并计算。
+"""
+
+import bisect
+from datetime import date, datetime, time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from pandas import DataFrame
+
+import strategies.conditions as conditions
+from strategies.indicators import MACD_PARAMS, MAIN_EMA_PERIODS
+from strategies.tools import diff_two_values
+from strategies.trade_strategies.mts.main_trade_strategy import (
+    MainTradeStrategy,
+)
+from strategies.trade_strategies.trade_strategies import TradeStrategy
+from utils.common_tools import tz_utc_8
+from utils.log_tools import LoggerGetter
+from utils.replay_api import get_trading_day
+
+# 盯盘人以15点收盘作为一个交易日交易的结束
+CLOSE_TIME = time(15)
+
+
+def _ema_step(weighted: np.ndarray, cur: np.ndarray, n: int) -> np.ndarray:
+    """EMA 递推一步, 运算顺序与 pandas ewm(span=n, adjust=False) 一致"""
+    alpha = 1.0 / (1.0 + (n - 1) / 2)
+    old_wt = 1.0 * (1.0 - alpha)
+    updated = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+    return np.where(
+        np.isnan(weighted), cur, np.where(weighted != cur, updated, weighted)
+    )
+
+
+def windowed_indicators(
+    closes: np.ndarray,
+    length: int,
+    position: int = -2,
+    ema_periods: tuple[int, ...] = MAIN_EMA_PERIODS,
+    macd_params: tuple[int, int, int] = MACD_PARAMS,
+) -> dict[str, np.ndarray]:
+    """计算每根K线位于长度为 length 的K线序列的 position 位置时的 EMA 和 MACD 柱
+
+    窗口中截至该K线共 length + position + 1 根K线, 数据不足时从第一根K线开始。
+    返回与 closes 等长的数组, 取整方式与 IndicatorEngine 写入K线序列的方式一致
+    """
+    width = max(length + position + 1, 1)
+    padded = np.r_[np.full(width - 1, np.nan), closes.astype(float)]
+    # 每行为一根K线所在窗口中截至该K线的收盘价
+    windows = sliding_window_view(padded, width)
+    short, long, m = macd_params
+    periods = sorted(set(ema_periods) | {short, long})
+    emas = {n: windows[:, 0].copy() for n in periods}
+    diff = emas[short] - emas[long]
+    dea = diff.copy()
+    for col in range(1, width):
+        cur = windows[:, col]
+        for n in periods:
+            emas[n] = _ema_step(emas[n], cur, n)
+        diff = emas[short] - emas[long]
+        dea = _ema_step(dea, diff, m)
+    results = {f"ema{n}": np.round(emas[n], 3) for n in ema_periods}
+    results["MACD.close"] = np.round(2 * (diff - dea), 3)
+    return results
+
+
+def scan_daily_conditions(
+    klines: DataFrame, length: int, direction: int, position: int = -2
+) -> np.ndarray:
+    """返回每根日线作为盘中前一根日线时, 主策略日线条件的序号, 0 为不满足
+
+    klines 为合约的全部日线, 需要 open 和 close 列,
+    position 为计算指标时该日线在日线序列中的位置
+    """
+    values = windowed_indicators(klines["close"].to_numpy(), length, position)
+    frame = DataFrame(values)
+    frame["close"] = klines["close"].to_numpy(dtype=float)
+    frame["open"] = klines["open"].to_numpy(dtype=float)
+    if direction == 1:
+        return conditions.main_long_daily(frame)
+    e9, e22, e60 = values["ema9"], values["ema22"], values["ema60"]
+    # 与 MainShortTradeStrategy._no_matched_open_cond 一致
+    no_matched = (
+        (diff_two_values(e9, e60) < 2) | (diff_two_values(e22, e60) < 2)
+    ) & (e60 < frame["close"].to_numpy())
+    return np.where(no_matched, 0.0, conditions.main_short_daily(frame, False))
+
+
+def get_candidate_days(
+    bar_days: list[date],
+    conds: np.ndarray,
+    last_conds: np.ndarray,
+    trading_days: list[date],
+) -> set[date]:
+    """返回日线条件可能满足的交易日
+
+    交易日 D 盘中的前一根日线, 在合约当日第一根K线生成后为 D 之前的最后一根日线,
+    生成前为再往前一根日线, 任一满足条件都视为可能开仓。
+    bar_days 为每根日线所属的交易日, conds 和 last_conds 分别为日线位于序列
+    倒数第二根和最后一根时计算指标得到的条件序号
+    """
+    counts = np.searchsorted(
+        np.array(bar_days, dtype="datetime64[D]"),
+        np.array(trading_days, dtype="datetime64[D]"),
+        side="right",
+    )
+    size = len(conds)
+    candidates = set()
+    for day, count in zip(trading_days, counts):
+        checks = (
+            (conds, count - 2),
+            (conds, count - 3),
+            (last_conds, count - 2),
+        )
+        if any(0 <= pos < size and c[pos] > 0 for c, pos in checks):
+            candidates.add(day)
+    return candidates
+
+
+class SignalScan:
+    """预扫描的结果: 每个 (合约, 方向) 可能开仓的交易日"""
+
+    logger = LoggerGetter()
+
+    def __init__(
+        self,
+        candidates: dict[tuple[str, int], set[date]],
+        trading_days: list[date],
+    ):
+        self.candidates = candidates
+        self.trading_days = sorted(trading_days)
+        # 被跳过的交易员数(按交易日累计)和直接跳到收盘前的交易日数
+        self.skipped_count = 0
+        self.fast_forward_count = 0
+
+    def get_session(self, now: int) -> tuple[list[date], int]:
+        """返回从 now 到下一次收盘经过的交易日, 以及收盘时间(纳秒)
+
+        收盘后到夜盘开始前的时刻属于当前交易日, 其后的交易在下一个交易日
+        """
+        day = get_trading_day(now)
+        close = _get_close_ns(day)
+        if now < close:
+            return [day], close
+        pos = bisect.bisect_right(self.trading_days, day)
+        if pos >= len(self.trading_days):
+            return [day], close
+        next_day = self.trading_days[pos]
+        return [day, next_day], _get_close_ns(next_day)
+
+    def is_candidate(self, symbol: str, direction: int, day: date) -> bool:
+        days = self.candidates.get((symbol, direction))
+        # 没有预扫描的合约按可能开仓处理
+        return days is None or day in days
+
+    def may_trade(self, strategy: TradeStrategy, days: list[date]) -> bool:
+        """交易策略在这些交易日中是否可能有交易操作"""
+        if not isinstance(strategy, MainTradeStrategy):
+            return True
+        if not strategy.is_idle:
+            return True
+        return any(
+            self.is_candidate(strategy.symbol, strategy.direction, day)
+            for day in days
+        )
+
+    def stats(self) -> dict:
+        """返回预扫描统计: 合约方向数, 可能开仓的合约交易日数, 跳过的交易员数, 跳到收盘前的交易日数"""
+        return {
+            "symbols": len(self.candidates),
+            "candidates": sum(len(d) for d in self.candidates.values()),
+            "skipped": self.skipped_count,
+            "fast_forward": self.fast_forward_count,
+        }
+
+
+def _get_close_ns(day: date) -> int:
+    close = datetime.combine(day, CLOSE_TIME, tz_utc_8)
+    return int(close.timestamp()) * 10**9
+
+
+def scan_replay(
+    api, directions: list[int], duration: int, length: int
+) -> SignalScan:
+    """对本地行情回放中的所有合约做预扫描
+
+    api 为 ReplayApi, 需要在回放开始前读取全部日线。
+    扫描结果保存在 api 的行情数据中, 共用行情数据且参数相同的回放不再重复扫描
+    """
+    trading_days = api.get_trading_days()
+    key = (tuple(directions), duration, length, tuple(trading_days))
+    candidates = api.replay_data.scans.get(key)
+    if candidates is not None:
+        scan = SignalScan(candidates, trading_days)
+        scan.logger.info(f"使用已有的日线条件预扫描结果: {scan.stats()}")
+        return scan
+    candidates = {}
+    for symbol in api.get_symbols():
+        klines = api.get_history_klines(symbol, duration)
+        # 日线的时间为所属交易日的零点
+        bar_days = [
+            datetime.fromtimestamp(int(ns) // 10**9, tz_utc_8).date()
+            for ns in klines["datetime"].to_numpy(np.int64)
+        ]
+        for direction in directions:
+            candidates[(symbol, direction)] = get_candidate_days(
+                bar_days,
+                scan_daily_conditions(klines, length, direction),
+                scan_daily_conditions(klines, length, direction, -1),
+                trading_days,
+            )
+    api.replay_data.scans[key] = candidates
+    scan = SignalScan(candidates, trading_days)
+    scan.logger.info(f"日线条件预扫描完成: {scan.stats()}")
+    return scan
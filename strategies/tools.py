@@ -5,31 +5,50 @@ from pandas import Series
 from tqsdk import tafunc
 from tqsdk.ta import EMA, MACD
 
-import utils.common_tools as c_tools
 import utils.email_tools as email_tools
+from strategies.indicators import CrossIndex
 from utils import global_var as gvar
+from utils.notifier import EMAIL, PUSHDEER, get_notifier
+
+# 平仓类型: 止损
+STOP_LOSS = 0
+# 开平仓提示合并发送时的分组
+TRADE_DIGEST_GROUP = "trade"
 
 
 def sendTradePosMsg(tradeMsg: dict):
-    if tradeMsg["direction"]:
-        dir_str = "做多"
+    """发送开平仓提示, 止损立即发送, 其余在通知的合并模式下合并为摘要发送"""
+    tradeMsg = {**tradeMsg, "today": datetime.now().strftime("%Y-%m-%d")}
+    if tradeMsg.get("c_type") == STOP_LOSS:
+        for channel, title, content in format_trade_messages([tradeMsg]):
+            get_notifier().notify(channel, title, content)
+    else:
+        get_notifier().notify_digest(
+            TRADE_DIGEST_GROUP, tradeMsg, format_trade_messages
+        )
+
+
+def format_trade_messages(msgs: list[dict]) -> list[tuple[str, str, str]]:
+    """把开平仓提示转换为 PushDeer 消息和邮件, 多条提示合并为一条"""
+    contexts = [
+        {**msg, "dir_str": "做多" if msg["direction"] else "做空"}
+        for msg in msgs
+    ]
+    o_or_c = {c["o_or_c"] for c in contexts}
+    o_or_c = o_or_c.pop() if len(o_or_c) == 1 else "开平仓"
+    if len(contexts) == 1:
+        c = contexts[0]
+        title = f"## {gvar.ENV_NAME} 环境 {c['custom_symbol']} {c['dir_str']} {o_or_c}"
     else:
-        dir_str = "做空"
-    title = f"## {gvar.ENV_NAME} 环境 {tradeMsg['custom_symbol']} {dir_str} {tradeMsg['o_or_c']}"
-    content = f"{tradeMsg['t_time']} **{tradeMsg['symbol']}** {tradeMsg['message']} **{tradeMsg['pos']}** 手，成交价 **¥{tradeMsg['price']}**"
-    email_context = {
-        "today": datetime.now().strftime("%Y-%m-%d"),
-        "env_name": gvar.ENV_NAME,
-        "o_or_c": tradeMsg["o_or_c"],
-        "symbol": tradeMsg["symbol"],
-        "dir_str": dir_str,
-        "t_time": tradeMsg["t_time"],
-        "message": tradeMsg["message"],
-        "pos": tradeMsg["pos"],
-        "price": tradeMsg["price"],
-    }
-    c_tools.sendPushDeerMsg(title, content)
-    email_tools.send_trade_message(email_context)
+        title = f"## {gvar.ENV_NAME} 环境 {len(contexts)} 笔{o_or_c}"
+    content = "\n\n".join(
+        f"{c['t_time']} **{c['symbol']}** {c['message']} **{c['pos']}** 手，成交价 **¥{c['price']}**"
+        for c in contexts
+    )
+    subject, html = email_tools.render_trade_message(
+        contexts[0]["today"], o_or_c, contexts
+    )
+    return [(PUSHDEER, title, content), (EMAIL, subject, html)]
 
 
 def fill_macd(klines):
@@ -195,3 +214,52 @@ def has_set_k_attr(kline: Series, attr_value: str) -> bool:
 def diff_two_value(first: float, second: float) -> float:
     """计算两个值的差值，返回差值的绝对值"""
     return round(abs(first - second) / second * 100, 3)
+
+
+def diff_two_values(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """diff_two_value 的向量化版本
+
+    np.round 与 round 在恰好处于两个取整结果中间的值上可能不一致, 这些值改用 round 计算。
+    """
+    values = np.abs(first - second) / second * 100
+    result = np.round(values, 3)
+    scaled = values * 1000
+    for i in np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6):
+        result[i] = round(values[i], 3)
+    return result
+
+
+def find_last_cross_pos(crosses: CrossIndex) -> tuple[int, bool]:
+    """倒序查找收盘价 >= EMA60, 且其后一根K线 EMA22 > EMA60 的K线位置
+
+    返回 (停止查找的位置, 是否找到), 结果与倒序逐行遍历一致:
+    最后一根K线收盘价 >= EMA60 时立即停止, 未找到时停止于第一根K线。
+    """
+    above = ("close", ">=", "ema60")
+    last = crosses.size - 1
+    if crosses.holds(above, last):
+        return last, False
+    pos = crosses.last_followed_pos(above, ("ema22", ">", "ema60"))
+    if pos < 0:
+        return 0, False
+    return pos, True
+
+
+def find_ema_cross_ids(crosses: CrossIndex) -> tuple[float, float]:
+    """倒序查找最近一根 EMA9 <= EMA60 的K线 id(k2), 以及在其之后(含)
+    最近一根 EMA22 <= EMA60 的K线 id(k1), 未找到的 id 为 0"""
+    pos1 = crosses.last_pos(("ema22", "<=", "ema60"))
+    pos2 = crosses.last_pos(("ema9", "<=", "ema60"))
+    k1 = crosses.get_id(pos1) if pos1 >= 0 and pos1 >= pos2 else 0
+    k2 = crosses.get_id(pos2) if pos2 >= 0 else 0
+    return k1, k2
+
+
+def find_last_below_pos(crosses: CrossIndex, before: int) -> int:
+    """查找生成时间早于 before 的K线中, 最近一根收盘价 <= EMA60 或 EMA5 <= EMA60
+    的K线位置, 不存在时返回 -1"""
+    end = crosses.pos_before(before)
+    return max(
+        crosses.last_pos(("close", "<=", "ema60"), end),
+        crosses.last_pos(("ema5", "<=", "ema60"), end),
+    )
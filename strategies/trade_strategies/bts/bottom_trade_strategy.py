@@ -14,12 +14,15 @@ from dao.odm.future_trade import (
     BottomTradeStatus,
 )
 from strategies.entity import StrategyConfig
+from strategies.indicators import BOTTOM_EMA_PERIODS
 from strategies.trade_strategies.trade_strategies import TradeStrategy
-from utils.common_tools import LoggerGetter
+from utils.log_tools import LoggerGetter
 
 
 class BottomTradeStrategy(TradeStrategy):
     logger = LoggerGetter()
+    ema_periods = BOTTOM_EMA_PERIODS
+    intraday_types = (3, 4)
 
     def __init__(self, config: StrategyConfig, symbol: str):
         super().__init__(config, symbol)
@@ -35,11 +38,10 @@ class BottomTradeStrategy(TradeStrategy):
             self.fill_indicators_by_type(3)
             self.fill_indicators_by_type(4)
         elif k_type == 2:
-            tools.fill_bottom_indicators(self._d_klines)
-        elif k_type == 3:
-            tools.fill_bottom_indicators(self._3h_klines)
-        elif k_type == 4:
-            tools.fill_bottom_indicators(self._30m_klines)
+            self._fill_indicators(k_type, self._d_klines)
+        elif k_type in self._intraday_klines:
+            # 惰性订阅模式下, 未订阅的日内K线不填充指标
+            self._fill_indicators(k_type, self._intraday_klines[k_type])
 
     def _can_get_tips(self) -> bool:
         """是否符合摸底提示条件
@@ -57,7 +59,9 @@ class BottomTradeStrategy(TradeStrategy):
             if self._match_dk_condition():
                 if self._match_3h_condition():
                     if self._match_30m_condition():
-                        logger.info("<摸底策略>符合生成开仓提示条件".ljust(100, "-"))
+                        logger.info(
+                            "<摸底策略>符合生成开仓提示条件".ljust(100, "-")
+                        )
                         return True
         return False
 
@@ -86,31 +90,33 @@ class BottomTradeStrategy(TradeStrategy):
         logger = self.logger
         trade_date_str = self.trade_date_str
         log_str = (
-            "{} {} 前一交易日最后30分钟线时间:{}, 满足条件的30分"
-            "钟线时间{}, 满足条件前一根30分钟线ema5:{}, ema60:{}, close:{}."
+            "%s %s 前一交易日最后30分钟线时间:%s, 满足条件的30分"
+            "钟线时间%s, 满足条件前一根30分钟线ema5:%s, ema60:%s, close:%s."
         )
         m30_klines = self._30m_klines
-        m30_klines = m30_klines[
-            m30_klines.datetime < last_matched_kline.datetime
-        ].iloc[::-1]
-        wanted_kline = m30_klines.iloc[-10]
         distance = 5
         is_match = False
-        for i, t_kline in m30_klines.iterrows():
+        pos = tools.find_last_below_pos(
+            self._get_cross_index(4, m30_klines), last_matched_kline.datetime
+        )
+        if pos >= 0:
+            t_kline = m30_klines.iloc[pos]
             e5, _, e60, _, close, _, _, _ = self._get_indicators(t_kline)
-            if close <= e60 or e5 <= e60:
-                wanted_kline = self._30m_klines.iloc[i + 1]
-                content = log_str.format(
-                    trade_date_str,
-                    self.symbol,
-                    tq_tools.get_date_str(last_matched_kline.datetime),
-                    tq_tools.get_date_str(wanted_kline.datetime),
-                    e5,
-                    e60,
-                    close,
-                )
-                logger.debug(content)
-                break
+            wanted_kline = m30_klines.iloc[pos + 1]
+            logger.debug(
+                log_str,
+                trade_date_str,
+                self.symbol,
+                tq_tools.get_date_str(last_matched_kline.datetime),
+                tq_tools.get_date_str(wanted_kline.datetime),
+                e5,
+                e60,
+                close,
+            )
+        else:
+            wanted_kline = m30_klines[
+                m30_klines.datetime < last_matched_kline.datetime
+            ].iloc[9]
         if is_macd_matched:
             last_date = tafunc.time_to_datetime(last_matched_kline.datetime)
             last_date = datetime(
@@ -170,17 +176,20 @@ class BottomTradeStrategy(TradeStrategy):
 
     def _generate_tips(self):
         if self._can_get_tips():
-            log_str = "{} {} {} 符合开仓条件, 开盘后注意关注开仓 " "前一日收盘价:{}, 预计开仓:{} 手"
+            log_str = (
+                "%s %s %s 符合开仓条件, 开盘后注意关注开仓 "
+                "前一日收盘价:%s, 预计开仓:%s 手"
+            )
             dkline = self.last_daily_kline
             pos = self._calc_open_pos(dkline.close)
-            content = log_str.format(
+            self.logger.info(
+                log_str,
                 self.trade_date,
                 self.symbol,
                 self.trade_status.custom_symbol,
                 dkline.close,
                 pos,
             )
-            self.logger.info(content)
             service.store_b_open_volume_tip(
                 self.trade_status, self.open_condition, pos
             )
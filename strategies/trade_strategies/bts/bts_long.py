@@ -30,16 +30,23 @@ class BottomLongTradeStrategy(BottomTradeStrategy, LongTradeStrategy):
             _,
         ) = self._get_indicators(kline)
         log_str = (
-            "{} {} <摸底做多> 满足日线 K线时间:{} ema5:{} ema20:{} "
-            "ema60:{} 收盘:{} MACD:{}"
+            "%s %s <摸底做多> 满足日线 K线时间:%s ema5:%s ema20:%s "
+            "ema60:%s 收盘:%s MACD:%s"
         )
         if e5 < e20 < e60 and close > e5:
             if macd > 0:
                 self._macd_matched = True
-            content = log_str.format(
-                trade_time, s, k_date_str_short, e5, e20, e60, close, macd
+            logger.debug(
+                log_str,
+                trade_time,
+                s,
+                k_date_str_short,
+                e5,
+                e20,
+                e60,
+                close,
+                macd,
             )
-            logger.debug(content)
             result = True
             self._set_open_condition(
                 kline, self.open_condition.daily_condition
@@ -53,10 +60,9 @@ class BottomLongTradeStrategy(BottomTradeStrategy, LongTradeStrategy):
         _, _, _, macd, _, trade_time, _, k_date_str = self._get_indicators(
             kline
         )
-        log_str = "{} {} <摸底做多> 满足3小时 K线时间:{} MACD:{}"
+        log_str = "%s %s <摸底做多> 满足3小时 K线时间:%s MACD:%s"
         if macd > 0:
-            content = log_str.format(trade_time, self.symbol, k_date_str, macd)
-            logger.debug(content)
+            logger.debug(log_str, trade_time, self.symbol, k_date_str, macd)
             result = True
             self._set_open_condition(
                 kline, self.open_condition.hourly_condition
@@ -78,13 +84,14 @@ class BottomLongTradeStrategy(BottomTradeStrategy, LongTradeStrategy):
             _,
         ) = self._get_indicators(kline)
         log_str = (
-            "{} {} <摸底做多> 满足30分钟条件 K线时间:{} ema5:{} ema20:{} "
-            "ema60:{} 收盘:{} MACD:{}"
+            "%s %s <摸底做多> 满足30分钟条件 K线时间:%s ema5:%s ema20:%s "
+            "ema60:%s 收盘:%s MACD:%s"
         )
         if close > e60 and e5 > e60:
             if self._is_within_distance(kline, self._macd_matched):
                 result = True
-                content = log_str.format(
+                logger.debug(
+                    log_str,
                     trade_time,
                     self.symbol,
                     k_date_str_short,
@@ -94,7 +101,6 @@ class BottomLongTradeStrategy(BottomTradeStrategy, LongTradeStrategy):
                     close,
                     macd,
                 )
-                logger.debug(content)
                 self._set_open_condition(
                     kline, self.open_condition.minute_30_condition
                 )
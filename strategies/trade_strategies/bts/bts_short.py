@@ -21,13 +21,14 @@ class BottomShortTradeStrategy(BottomTradeStrategy, ShortTradeStrategy):
             _,
         ) = self._get_indicators(kline)
         log_str = (
-            "{} {} <摸底做空> 满足日线 K线时间:{} ema5:{} ema20:{} "
-            "ema60:{} 收盘:{} MACD:{}"
+            "%s %s <摸底做空> 满足日线 K线时间:%s ema5:%s ema20:%s "
+            "ema60:%s 收盘:%s MACD:%s"
         )
         if e5 > e20 > e60 and close < e5:
             if macd < 0:
                 self._macd_matched = True
-            content = log_str.format(
+            logger.debug(
+                log_str,
                 trade_time,
                 self.symbol,
                 k_date_str_short,
@@ -37,14 +38,15 @@ class BottomShortTradeStrategy(BottomTradeStrategy, ShortTradeStrategy):
                 close,
                 macd,
             )
-            logger.debug(content)
             result = True
             try:
                 self._set_open_condition(
                     kline, self.open_condition.daily_condition
                 )
             except ValueError as e:
-                self.logger.debug(f"{self.symbol}-{self.direction}:设置开仓条件出现错误")
+                self.logger.debug(
+                    f"{self.symbol}-{self.direction}:设置开仓条件出现错误"
+                )
                 raise e
         return result
 
@@ -55,10 +57,9 @@ class BottomShortTradeStrategy(BottomTradeStrategy, ShortTradeStrategy):
         _, _, _, macd, _, trade_time, _, k_date_str = self._get_indicators(
             kline
         )
-        log_str = "{} {} <摸底做空> 满足3小时 K线时间:{} MACD:{}"
+        log_str = "%s %s <摸底做空> 满足3小时 K线时间:%s MACD:%s"
         if macd < 0:
-            content = log_str.format(trade_time, self.symbol, k_date_str, macd)
-            logger.debug(content)
+            logger.debug(log_str, trade_time, self.symbol, k_date_str, macd)
             result = True
             self._set_open_condition(
                 kline, self.open_condition.hourly_condition
@@ -81,16 +82,23 @@ class BottomShortTradeStrategy(BottomTradeStrategy, ShortTradeStrategy):
             k_date_str,
         ) = self._get_indicators(kline)
         log_str = (
-            "{} {} <摸底做空> 满足30分钟条件 K线时间:{} ema5:{} ema20:{} "
-            "ema60:{} 收盘:{} MACD:{}"
+            "%s %s <摸底做空> 满足30分钟条件 K线时间:%s ema5:%s ema20:%s "
+            "ema60:%s 收盘:%s MACD:%s"
         )
         if close < e60 and e5 < e60:
             if self._is_within_distance(kline, self._macd_matched):
                 result = True
-                content = log_str.format(
-                    trade_time, s, k_date_str, e5, e20, e60, close, macd
+                logger.debug(
+                    log_str,
+                    trade_time,
+                    s,
+                    k_date_str,
+                    e5,
+                    e20,
+                    e60,
+                    close,
+                    macd,
                 )
-                logger.debug(content)
                 self._set_open_condition(
                     kline, self.open_condition.minute_30_condition
                 )
@@ -14,12 +14,14 @@ from dao.odm.future_trade import (
     MainTradeStatus,
 )
 from strategies.entity import StrategyConfig
+from strategies.indicators import MAIN_EMA_PERIODS
 from strategies.trade_strategies.trade_strategies import TradeStrategy
-from utils.common_tools import LoggerGetter
+from utils.log_tools import LoggerGetter
 
 
 class MainTradeStrategy(TradeStrategy):
     logger = LoggerGetter()
+    ema_periods = MAIN_EMA_PERIODS
 
     def __init__(self, config: StrategyConfig, symbol: str):
         super().__init__(config, symbol)
@@ -32,13 +34,14 @@ class MainTradeStrategy(TradeStrategy):
             self.fill_indicators_by_type(4)
             self.fill_indicators_by_type(5)
         elif k_type == 2:
-            tools.fill_main_indicators(self._d_klines)
-        elif k_type == 3:
-            tools.fill_main_indicators(self._3h_klines)
-        elif k_type == 4:
-            tools.fill_main_indicators(self._30m_klines)
-        elif k_type == 5:
-            tools.fill_main_indicators(self._5m_klines)
+            self._fill_indicators(k_type, self._d_klines)
+        elif k_type in self._intraday_klines:
+            # 惰性订阅模式下, 未订阅的日内K线不填充指标
+            self._fill_indicators(k_type, self._intraday_klines[k_type])
+
+    def _need_intraday_klines(self) -> bool:
+        """未持仓且日线满足条件时, 需要检测日内K线的开仓条件"""
+        return not self.is_trading and bool(self._match_dk_condition())
 
     def _can_open_pos(self) -> bool:
         """判断是否可以开仓"""
@@ -48,7 +51,11 @@ class MainTradeStrategy(TradeStrategy):
                 if self._match_3h_condition():
                     if self._match_30m_condition():
                         if self._match_5m_condition():
-                            logger.info("<主策略>符合开仓条件, 请注意开仓提示".ljust(100, "-"))
+                            logger.info(
+                                "<主策略>符合开仓条件, 请注意开仓提示".ljust(
+                                    100, "-"
+                                )
+                            )
                             return True
         return False
 
@@ -57,10 +64,11 @@ class MainTradeStrategy(TradeStrategy):
         logger = self.logger
         trade_date_str = self.trade_date_str
         price = self.current_price
-        log_str = "{} {} {} {} 现价:{} 止损价:{} 手数:{}"
+        log_str = "%s %s %s %s 现价:%s 止损价:%s 手数:%s"
         if self._has_match_stop_loss():
             pos = self.carrying_volume
-            content = log_str.format(
+            logger.info(
+                log_str,
                 trade_date_str,
                 self.symbol,
                 self.trade_status.custom_symbol,
@@ -69,7 +77,6 @@ class MainTradeStrategy(TradeStrategy):
                 self.close_condition.stop_loss_price,
                 pos,
             )
-            logger.info(content)
             self.closeout(0, self.close_condition.sl_reason)
 
     def _init_trade_status(self, symbol: str) -> MainTradeStatus:
@@ -122,32 +129,23 @@ class MainTradeStrategy(TradeStrategy):
         logger = self.logger
         trade_time = self.trade_date_str
         log_str = (
-            "{} {} <做空> 当前日k线生成时间:{} 最近一次30分钟收盘价与EMA60"
-            "交叉时间{} 交叉前一根30分钟K线ema60:{} close:{}"
+            "%s %s <做空> 当前日k线生成时间:%s 最近一次30分钟收盘价与EMA60"
+            "交叉时间%s 交叉前一根30分钟K线ema60:%s close:%s"
         )
         daily_klines = self._d_klines
         c_dkline = daily_klines.iloc[-1]
         l_dkline = self._get_last_kline_in_trade(daily_klines)
         l30m_kline = daily_klines.iloc[-9]
         c_date = tq_tools.get_datetime_from_ns(c_dkline.datetime)
-        temp_df = self._30m_klines.iloc[::-1]
-        e60, close = 0, 0
-        for i, temp_kline in temp_df.iterrows():
-            _, _, e60, _, close, _, trade_time, _, _ = self._get_indicators(
-                temp_kline
-            )
-            if close >= e60:
-                # 30分钟收盘价和ema60还未交叉，不符合开仓条件
-                if i == 199:
-                    break
-                else:
-                    t30m_kline = self._30m_klines.iloc[i + 1]
-                    _, et22, et60, _, _, _, _, _, _ = self._get_indicators(
-                        t30m_kline
-                    )
-                    if et22 > et60:
-                        l30m_kline = t30m_kline
-                        break
+        m30_klines = self._30m_klines
+        pos, is_found = tools.find_last_cross_pos(
+            self._get_cross_index(4, m30_klines)
+        )
+        _, _, e60, _, close, _, trade_time, _, _ = self._get_indicators(
+            m30_klines.iloc[pos]
+        )
+        if is_found:
+            l30m_kline = m30_klines.iloc[pos + 1]
         temp_date = tq_tools.get_datetime_from_ns(l30m_kline.datetime)
         # 当30分钟线生成时间小于21点，其所在日线为当日，否则为下一日日线
         if temp_date.hour < 21:
@@ -163,9 +161,7 @@ class MainTradeStrategy(TradeStrategy):
         if not l_klines.empty:
             l_kline = l_klines.iloc[-1]
             logger.debug(
-                log_str.format(
-                    trade_time, self.symbol, c_date, temp_date, e60, close
-                )
+                log_str, trade_time, self.symbol, c_date, temp_date, e60, close
             )
             logger.debug(
                 f"当前日线id:{c_dkline.id},生成时间:{c_date},"
@@ -183,43 +179,18 @@ class MainTradeStrategy(TradeStrategy):
             ):
                 limite_day = 3
             if c_dkline.id - l_kline.id <= limite_day:
-                logger.debug(f"满足做空30分钟条件，两个日线间隔在{limite_day}日内。")
+                logger.debug(
+                    f"满足做空30分钟条件，两个日线间隔在{limite_day}日内。"
+                )
                 return True
         return False
 
     def _match_3hk_c2_distance(self) -> bool:
-        # logger = self.logger
-        klines = self._3h_klines.iloc[::-1]
-        # log_str = 'k2:{},e9:{},e60:{},date:{}/k1:{},e22:{},e60:{},date:{}'
-        k1, k2 = 0, 0
-        is_done_1 = False
-        for _, kline in klines.iterrows():
-            # logger.debug(f'kline:{kline}')
-            e9 = kline.ema9
-            e22 = kline.ema22
-            e60 = kline.ema60
-            if not is_done_1 and e22 <= e60:
-                k1 = kline.id
-                # date1 = get_date_str(kline.datetime)
-                # ema22 = e22
-                # ema60_1 = e60
-                is_done_1 = True
-                # logger.debug(log_debug_1.format(
-                #    k1, e9, e22, e60, date1
-                # ))
-            if e9 <= e60:
-                k2 = kline.id
-                # date2 = get_date_str(kline.datetime)
-                # ema9 = e9
-                # ema60_2 = e60
-                # logger.debug(log_debug_2.format(
-                #    k2, e9, e22, e60, date2
-                # ))
-                break
+        """3小时线最近一次 EMA22 <= EMA60 与 EMA9 <= EMA60 的距离在5根以内"""
+        k1, k2 = tools.find_ema_cross_ids(
+            self._get_cross_index(3, self._3h_klines)
+        )
         if 0 <= k1 - k2 <= 5:
-            # logger.debug(log_str.format(
-            # k2, ema9, ema60_2, date2, k1, ema22, ema60_1, date1))
-            # logger.debug('两个交点距离小于等于5,符合条件')
             return True
         return False
 
@@ -1,4 +1,7 @@
+from tqsdk.objs import Order
+
 import dao.trade.trade_service as service
+import strategies.conditions as conditions
 import strategies.tools as tools
 import utils.tqsdk_tools as tq_tools
 from strategies.trade_strategies.mts.main_trade_strategy import (
@@ -9,128 +12,87 @@ from strategies.trade_strategies.trade_strategies import LongTradeStrategy
 
 class MainLongTradeStrategy(MainTradeStrategy, LongTradeStrategy):
     def _try_take_profit(self) -> None:
-        logger = self.logger
+        """止盈委托完成后再输出日志和更新止盈阶段, 委托未完成时不会重复止盈"""
         price = self.current_price
-        s = self.symbol
-        kline = self._get_last_kline_in_trade(self._d_klines)
         sc = self.close_condition
-        log_str = "{} {} <做多> 止赢{} 现价:{} 手数:{} 剩余仓位:{} 止赢起始价:{}"
         sp_log = "止盈条件{}-售出{}"
-        trade_time = tq_tools.get_date_str(kline.datetime)
         if self._get_profit_condition() in [1, 2, 3]:
             self._try_improve_stop_loss()
             if self._is_f5m_closeout():
-                self.closeout(1, sp_log.format(sc.take_profit_cond, "100%"))
-                content = log_str.format(
-                    trade_time,
-                    s,
-                    sc.take_profit_cond,
-                    price,
-                    self.carrying_volume,
-                    0,
-                    sc.tp_started_point,
+                self.closeout(
+                    1,
+                    sp_log.format(sc.take_profit_cond, "100%"),
+                    lambda order: self._log_take_profit(order, price),
                 )
-                logger.info(content)
         elif self._get_profit_condition() in [4]:
             if sc.take_profit_stage == 1:
-                sc.take_profit_stage = 2
                 carry_pos = self.carrying_volume
                 sold_pos = carry_pos // 2 if carry_pos > 1 else carry_pos
+
+                def on_closed(order: Order):
+                    sc.take_profit_stage = 2
+                    service.update_trade_status(
+                        self.trade_status, self.trade_date
+                    )
+                    self._log_take_profit(order, price)
+
                 self.close_pos(
-                    sold_pos, 1, sp_log.format(sc.take_profit_cond, "50%")
-                )
-                content = log_str.format(
-                    trade_time,
-                    s,
-                    sc.take_profit_cond,
-                    price,
                     sold_pos,
-                    self.carrying_volume,
-                    sc.tp_started_point,
+                    1,
+                    sp_log.format(sc.take_profit_cond, "50%"),
+                    on_closed,
                 )
-                logger.info(content)
             elif sc.take_profit_stage == 2:
                 if price >= self._calc_price(
                     self.trade_status.open_pos_info.trade_price, 3.0, True
                 ):
                     self.closeout(
-                        1, sp_log.format(sc.take_profit_cond, "剩余全部")
+                        1,
+                        sp_log.format(sc.take_profit_cond, "剩余全部"),
+                        lambda order: self._log_take_profit(order, price),
                     )
-                    content = log_str.format(
-                        trade_time,
-                        s,
-                        sc.take_profit_cond,
-                        price,
-                        sc.tp_started_point,
-                    )
-                    logger.info(content)
+
+    def _log_take_profit(self, order: Order, price: float) -> None:
+        """止盈委托完成后输出成交手数和剩余仓位"""
+        sc = self.close_condition
+        kline = self._get_last_kline_in_trade(self._d_klines)
+        self.logger.info(
+            "%s %s <做多> 止赢%s 现价:%s 手数:%s 剩余仓位:%s 止赢起始价:%s",
+            tq_tools.get_date_str(kline.datetime),
+            self.symbol,
+            sc.take_profit_cond,
+            price,
+            order.volume_orign,
+            self.carrying_volume,
+            sc.tp_started_point,
+        )
 
     def _match_dk_condition(self) -> bool:
         logger = self.logger
-        kline = self.last_daily_kline
-        (
-            e9,
-            e22,
-            e60,
-            macd,
-            close,
-            open_p,
-            trade_time,
-            k_date_str_short,
-            _,
-        ) = self._get_indicators(kline)
-        log_str = (
-            "{} {} <做多> 满足日线{} K线时间:{} ema9:{} ema22:{} "
-            "ema60:{} 收盘:{} diff9_60:{} diffc_60:{} diff22_60:{} "
-            "MACD:{}"
-        )
-        cond_number = 0
-        if tools.has_set_k_attr(kline, "l_condition"):
-            return kline.l_condition
-        diff9_60 = tools.diff_two_value(e9, e60)
-        diffc_60 = tools.diff_two_value(close, e60)
-        diff22_60 = tools.diff_two_value(e22, e60)
-        if e22 < e60:
-            # 日线条件1
-            if (
-                (diff9_60 < 1 or diff22_60 < 1)
-                and close > e60
-                and macd > 0
-                and (e9 > e22 or macd > 0)
-            ):
-                cond_number = 1
-        elif e22 > e60:
-            # 日线条件2
-            if diff22_60 < 1 and close > e60:
-                cond_number = 2
-            # 日线条件3
-            elif (
-                1 < diff9_60 < 3
-                and e9 > e22
-                and e22 > min(open_p, close) > e60
-            ):
-                cond_number = 3
-            # 日线条件4
-            elif (
-                1 < diff22_60 < 3
-                and diff9_60 < 2
-                and e22 > close > e60
-                and e22 > e9 > e60
-            ):
-                cond_number = 4
-            # 日线条件5
-            elif (
-                diff22_60 > 3
-                and diffc_60 < 3
-                and e22 > close > e60
-                and e22 > open_p > e60
-            ):
-                cond_number = 5
-        self._set_klines_value(
-            self._d_klines, kline.name, "l_condition", cond_number
+        pos = self.last_daily_pos
+        cond_number, is_new = self._get_kline_condition(
+            self._d_klines, pos, "l_condition", conditions.main_long_daily
         )
-        if cond_number > 0:
-            content = log_str.format(
+        if is_new and cond_number > 0:
+            kline = self._d_klines.iloc[pos]
+            (
+                e9,
+                e22,
+                e60,
+                macd,
+                close,
+                _,
+                trade_time,
+                k_date_str_short,
+                _,
+            ) = self._get_indicators(kline)
+            log_str = (
+                "%s %s <做多> 满足日线%s K线时间:%s ema9:%s ema22:%s "
+                "ema60:%s 收盘:%s diff9_60:%s diffc_60:%s diff22_60:%s "
+                "MACD:%s"
+            )
+            logger.info(
+                log_str,
                 trade_time,
                 self.symbol,
                 cond_number,
@@ -139,80 +101,48 @@ class MainLongTradeStrategy(MainTradeStrategy, LongTradeStrategy):
                 e22,
                 e60,
                 close,
-                diff9_60,
-                diffc_60,
-                diff22_60,
+                tools.diff_two_value(e9, e60),
+                tools.diff_two_value(close, e60),
+                tools.diff_two_value(e22, e60),
                 macd,
             )
-            logger.info(content)
             self._set_open_condition(
                 kline, cond_number, self.open_condition.daily_condition
             )
-        return self._d_klines.loc[kline.name].l_condition
+        return cond_number
 
     def _match_3h_condition(self) -> bool:
         """做多3小时线检测"""
         logger = self.logger
         dkline = self._get_last_kline_in_trade(self._d_klines)
-        kline = self._get_last_kline_in_trade(self._3h_klines)
-        if tools.has_set_k_attr(kline, "l_condition"):
-            return kline.l_condition
-        (
-            e9,
-            e22,
-            e60,
-            macd,
-            close,
-            open_p,
-            trade_time,
-            _,
-            k_date_str,
-        ) = self._get_indicators(kline)
-        diffc_60 = tools.diff_two_value(close, e60)
-        diffo_60 = tools.diff_two_value(open_p, e60)
-        diff22_60 = tools.diff_two_value(e22, e60)
-        diff9_60 = tools.diff_two_value(e9, e60)
-        log_str = (
-            "{} {} <做多> 满足3小时{} K线时间:{} "
-            "ema9:{} ema22:{} ema60:{} 收盘:{} 开盘:{} "
-            "diffc_60:{} diffo_60:{} diff22_60:{} MACD:{}"
+        cond_number, is_new = self._get_kline_condition(
+            self._3h_klines,
+            -2,
+            "l_condition",
+            lambda klines: conditions.main_long_3h(
+                klines, dkline.l_condition, self._match_3hk_c2_distance()
+            ),
         )
-        cond_number = 0
-        if diffc_60 < 3 or diffo_60 < 3:
-            if dkline.l_condition in [1, 2]:
-                if (
-                    e22 < e60
-                    and e9 < e60
-                    and (
-                        diff22_60 < 1
-                        or (1 < diff22_60 < 2 and (macd > 0 or close > e60))
-                    )
-                ):
-                    cond_number = 1
-                elif close > e9 > e22 > e60:
-                    if self._match_3hk_c2_distance():
-                        cond_number = 2
-                    elif diff9_60 < 1 and diff22_60 < 1 and macd > 0:
-                        cond_number = 5
-            elif dkline.l_condition in [3, 4]:
-                if (
-                    close > e60 > e22
-                    and macd > 0
-                    and diff22_60 < 1
-                    and e9 < e60
-                ):
-                    cond_number = 3
-                elif (
-                    dkline.l_condition == 3 and diff9_60 < 1 and diff22_60 < 1
-                ):
-                    cond_number = 6
-            elif dkline.l_condition == 5 and (e60 > e22 > e9):
-                cond_number = 4
-        self._set_klines_value(
-            self._3h_klines, kline.name, "l_condition", cond_number
-        )
-        if cond_number > 0:
-            content = log_str.format(
+        if is_new and cond_number > 0:
+            kline = self._get_last_kline_in_trade(self._3h_klines)
+            (
+                e9,
+                e22,
+                e60,
+                macd,
+                close,
+                open_p,
+                trade_time,
+                _,
+                k_date_str,
+            ) = self._get_indicators(kline)
+            log_str = (
+                "%s %s <做多> 满足3小时%s K线时间:%s "
+                "ema9:%s ema22:%s ema60:%s 收盘:%s 开盘:%s "
+                "diffc_60:%s diffo_60:%s diff22_60:%s MACD:%s"
+            )
+            logger.info(
+                log_str,
                 trade_time,
                 self.symbol,
                 cond_number,
@@ -222,111 +152,68 @@ class MainLongTradeStrategy(MainTradeStrategy, LongTradeStrategy):
                 e60,
                 close,
                 open_p,
-                diffc_60,
-                diffo_60,
-                diff22_60,
+                tools.diff_two_value(close, e60),
+                tools.diff_two_value(open_p, e60),
+                tools.diff_two_value(e22, e60),
                 macd,
             )
-            logger.info(content)
             self._set_open_condition(
                 kline, cond_number, self.open_condition.hourly_condition
             )
-        return self._3h_klines.loc[kline.name].l_condition
+        return cond_number
 
     def _match_30m_condition(self) -> bool:
         """做多30分钟线检测"""
-        logger = self.logger
-        kline = self._get_last_kline_in_trade(self._30m_klines)
-        if tools.has_set_k_attr(kline, "l_condition"):
-            return kline.l_condition
-        (
-            e9,
-            e22,
-            e60,
-            macd,
-            close,
-            _,
-            trade_time,
-            _,
-            k_date_str,
-        ) = self._get_indicators(kline)
-        diffc_60 = tools.diff_two_value(close, e60)
-        log_str = (
-            "{} {} <做多> 满足30分钟条件 K线时间:{} ema9:{} ema22:{} "
-            "ema60:{} 收盘:{} diffc_60:{} MACD:{}"
+        return self._match_minute_condition(
+            self._30m_klines, "30分钟", self.open_condition.minute_30_condition
         )
-        if close > e60 and macd > 0 and diffc_60 < 1.2:
-            self._set_klines_value(
-                self._30m_klines, kline.name, "l_condition", 1
-            )
-            content = log_str.format(
-                trade_time,
-                self.symbol,
-                k_date_str,
-                e9,
-                e22,
-                e60,
-                close,
-                diffc_60,
-                macd,
-            )
-            logger.info(content)
-            self._set_open_condition(
-                kline, 1, self.open_condition.minute_30_condition
-            )
-        else:
-            self._set_klines_value(
-                self._30m_klines, kline.name, "l_condition", 0
-            )
-        return self._30m_klines.loc[kline.name].l_condition
 
     def _match_5m_condition(self) -> bool:
         """做多5分钟线检测"""
+        return self._match_minute_condition(
+            self._5m_klines, "5分钟", self.open_condition.minute_5_condition
+        )
+
+    def _match_minute_condition(
+        self, klines, k_name: str, indicator_values
+    ) -> bool:
+        """做多30分钟线和5分钟线的检测条件相同"""
         logger = self.logger
-        kline = self._get_last_kline_in_trade(self._5m_klines)
-        if tools.has_set_k_attr(kline, "l_condition"):
-            return kline.l_condition
-        (
-            e9,
-            e22,
-            e60,
-            macd,
-            close,
-            _,
-            trade_time,
-            _,
-            k_date_str,
-        ) = self._get_indicators(kline)
-        diffc_60 = tools.diff_two_value(close, e60)
-        log_str = (
-            "{} {} <做多> 满足5分钟条件 K线时间:{} "
-            "ema9:{} ema22:{} ema60:{} 收盘:{} diffc_60:{} MACD:{}"
+        cond_number, is_new = self._get_kline_condition(
+            klines, -2, "l_condition", conditions.main_long_minute
         )
-        if close > e60 and macd > 0 and diffc_60 < 1.2:
-            self._set_klines_value(
-                self._5m_klines, kline.name, "l_condition", 1
+        if is_new and cond_number > 0:
+            kline = self._get_last_kline_in_trade(klines)
+            (
+                e9,
+                e22,
+                e60,
+                macd,
+                close,
+                _,
+                trade_time,
+                _,
+                k_date_str,
+            ) = self._get_indicators(kline)
+            log_str = (
+                "%s %s <做多> 满足%s条件 K线时间:%s ema9:%s ema22:%s "
+                "ema60:%s 收盘:%s diffc_60:%s MACD:%s"
             )
-            content = log_str.format(
+            logger.info(
+                log_str,
                 trade_time,
                 self.symbol,
+                k_name,
                 k_date_str,
                 e9,
                 e22,
                 e60,
                 close,
-                diffc_60,
+                tools.diff_two_value(close, e60),
                 macd,
             )
-            logger.info(content)
-            self._set_open_condition(
-                kline, 1, self.open_condition.minute_5_condition
-            )
-            return True
-        else:
-            self._set_klines_value(
-                self._5m_klines, kline.name, "l_condition", 0
-            )
-        return self._5m_klines.loc[kline.name, "l_condition"]
+            self._set_open_condition(kline, 1, indicator_values)
+        return cond_number
 
     def _has_match_stop_loss(self) -> bool:
         if self.is_trading:
@@ -379,7 +266,7 @@ class MainLongTradeStrategy(MainTradeStrategy, LongTradeStrategy):
         trade_price = self.trade_status.open_pos_info.trade_price
         trade_config = self.config.f_info.long_config
         sc = self.close_condition
-        log_str = "{} {} <做多> 现价{} 达到1:{} 盈亏比,将止损价提高至{}"
+        log_str = "%s %s <做多> 现价%s 达到1:%s 盈亏比,将止损价提高至%s"
         promote_price = self._calc_price(
             trade_price, trade_config.promote_scale_1, True
         )
@@ -396,21 +283,20 @@ class MainLongTradeStrategy(MainTradeStrategy, LongTradeStrategy):
             sc.has_increase_slp = True
             service.update_trade_status(self.trade_status, self.trade_date)
             logger.debug(
-                log_str.format(
-                    self.trade_date_str,
-                    self.symbol,
-                    self.current_price,
-                    trade_config.promote_scale_1,
-                    sc.stop_loss_price,
-                )
+                log_str,
+                self.trade_date_str,
+                self.symbol,
+                self.current_price,
+                trade_config.promote_scale_1,
+                sc.stop_loss_price,
             )
 
     def _is_f5m_closeout(self) -> bool:
         logger = self.logger
         kline = self._get_last_kline_in_trade(self._d_klines)
         log_str = (
-            "{} {} <做多> 满足最后5分钟止盈 止盈条件:{} 当前价:{} "
-            "日线EMA9:{} 日线EMA22:{} EMA60:{}"
+            "%s %s <做多> 满足最后5分钟止盈 止盈条件:%s 当前价:%s "
+            "日线EMA9:%s 日线EMA22:%s EMA60:%s"
         )
         e9, e22, e60, _, _, _, trade_time, _, _ = self._get_indicators(kline)
         price = self.current_price
@@ -419,16 +305,12 @@ class MainLongTradeStrategy(MainTradeStrategy, LongTradeStrategy):
         if self.is_last_5m:
             if sc.take_profit_cond == 1 and price < e60 and e9 < e22:
                 logger.debug(
-                    log_str.format(
-                        trade_time, self.symbol, 1, price, e9, e22, e60
-                    )
+                    log_str, trade_time, self.symbol, 1, price, e9, e22, e60
                 )
                 return True
             elif sc.take_profit_cond in [2, 3] and price < e22 and e9 < e22:
                 logger.debug(
-                    log_str.format(
-                        trade_time, self.symbol, 2, price, e9, e22, e60
-                    )
+                    log_str, trade_time, self.symbol, 2, price, e9, e22, e60
                 )
                 return True
         return False
@@ -444,7 +326,9 @@ class MainLongTradeStrategy(MainTradeStrategy, LongTradeStrategy):
         """
         logger = self.logger
         if self.is_trading:
-            log_str = "{} {} <做多> 现价:{} 达到止盈价{} 开始监控 " "止损价提高到:{}"
+            log_str = (
+                "%s %s <做多> 现价:%s 达到止盈价%s 开始监控 " "止损价提高到:%s"
+            )
             price = self.current_price
             sc = self.close_condition
             if sc.has_enter_tp:
@@ -458,13 +342,12 @@ class MainLongTradeStrategy(MainTradeStrategy, LongTradeStrategy):
                     sc.take_profit_stage = 1
                 service.update_trade_status(self.trade_status, self.trade_date)
                 logger.info(
-                    log_str.format(
-                        self.trade_date_str,
-                        self.symbol,
-                        price,
-                        sc.tp_started_point,
-                        sc.stop_loss_price,
-                    )
+                    log_str,
+                    self.trade_date_str,
+                    self.symbol,
+                    price,
+                    sc.tp_started_point,
+                    sc.stop_loss_price,
                 )
                 return sc.take_profit_cond
         return 0
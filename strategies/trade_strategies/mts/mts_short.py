@@ -1,4 +1,7 @@
+from tqsdk.objs import Order
+
 import dao.trade.trade_service as service
+import strategies.conditions as conditions
 import strategies.tools as tools
 import utils.tqsdk_tools as tq_tools
 from strategies.trade_strategies.mts.main_trade_strategy import (
@@ -9,6 +12,7 @@ from strategies.trade_strategies.trade_strategies import ShortTradeStrategy
 
 class MainShortTradeStrategy(MainTradeStrategy, ShortTradeStrategy):
     def _try_take_profit(self) -> None:
+        """止盈委托完成后再输出日志"""
         logger = self.logger
         symbol = self.symbol
         kline = self._get_last_kline_in_trade(self._d_klines)
@@ -26,9 +30,9 @@ class MainShortTradeStrategy(MainTradeStrategy, ShortTradeStrategy):
         ) = self._get_indicators(kline)
         diff22_60 = tools.diff_two_value(e22, e60)
         log_str = (
-            "{} {} <做空> 全部止赢 现价:{} 手数:{} diff22_60:{} "
-            "close:{} macd:{} 之前符合条件K线日期{} macd{} "
-            "close:{} open:{}"
+            "%s %s <做空> 全部止赢 现价:%s 手数:%s diff22_60:%s "
+            "close:%s macd:%s 之前符合条件K线日期%s macd%s "
+            "close:%s open:%s"
         )
         self._try_improve_stop_loss()
         if self._get_profit_condition(kline):
@@ -38,75 +42,72 @@ class MainShortTradeStrategy(MainTradeStrategy, ShortTradeStrategy):
                 for t_dk in dks:
                     t_macd = t_dk["MACD.close"]
                     if not tools.is_nline(t_dk) and t_macd > 0:
-                        order = self.closeout(1, "趋势止盈")
-                        content = log_str.format(
-                            trade_time,
-                            symbol,
-                            self.current_price,
-                            order.volume_orign,
-                            diff22_60,
-                            close,
-                            macd,
-                            tq_tools.get_date_str_short(t_dk.datetime),
-                            t_macd,
-                            t_dk.close,
-                            t_dk.open,
-                        )
-                        logger.debug(content)
+                        price = self.current_price
+
+                        def on_closed(order: Order):
+                            logger.debug(
+                                log_str,
+                                trade_time,
+                                symbol,
+                                price,
+                                order.volume_orign,
+                                diff22_60,
+                                close,
+                                macd,
+                                tq_tools.get_date_str_short(t_dk.datetime),
+                                t_macd,
+                                t_dk.close,
+                                t_dk.open,
+                            )
+
+                        self.closeout(1, "趋势止盈", on_closed)
                         return
                 self.close_condition.has_stop_tp = True
                 service.update_trade_status(self.trade_status, trade_time)
 
     def _match_dk_condition(self) -> bool:
         logger = self.logger
-        kline = self.last_daily_kline
-        if tools.has_set_k_attr(kline, "s_condition"):
-            return kline.s_condition
-        (
-            e9,
-            e22,
-            e60,
-            macd,
-            close,
-            _,
-            trade_time,
-            k_date_str_short,
-            _,
-        ) = self._get_indicators(kline)
-        log_str = (
-            "{} {} <做空> 满足日线 K线时间:{} ema9:{} ema22:{} "
-            "ema60:{} 收盘:{} MACD:{}"
+        pos = self.last_daily_pos
+        cond_number, is_new = self._get_kline_condition(
+            self._d_klines,
+            pos,
+            "s_condition",
+            lambda klines: conditions.main_short_daily(
+                klines, self._no_matched_open_cond()
+            ),
         )
-        content = log_str.format(
-            trade_time,
-            self.symbol,
-            k_date_str_short,
-            e9,
-            e22,
-            e60,
-            close,
-            macd,
-        )
-        # 日线条件
-        if e22 > e60 and macd < 0 and e22 > close:
-            is_matched = not self._no_matched_open_cond()
-            if is_matched:
-                self._set_klines_value(
-                    self._d_klines, kline.name, "s_condition", 1
-                )
-                logger.info(content)
-                self._set_open_condition(
-                    kline, 1, self.open_condition.daily_condition
-                )
-            else:
-                self._set_klines_value(
-                    self._d_klines, kline.name, "s_condition", 0
-                )
-        else:
-            self._set_klines_value(
-                self._d_klines, kline.name, "s_condition", 0
+        if is_new and cond_number > 0:
+            kline = self._d_klines.iloc[pos]
+            (
+                e9,
+                e22,
+                e60,
+                macd,
+                close,
+                _,
+                trade_time,
+                k_date_str_short,
+                _,
+            ) = self._get_indicators(kline)
+            log_str = (
+                "%s %s <做空> 满足日线 K线时间:%s ema9:%s ema22:%s "
+                "ema60:%s 收盘:%s MACD:%s"
+            )
+            logger.info(
+                log_str,
+                trade_time,
+                self.symbol,
+                k_date_str_short,
+                e9,
+                e22,
+                e60,
+                close,
+                macd,
+            )
+            self._set_open_condition(
+                kline, 1, self.open_condition.daily_condition
             )
-        return self._d_klines.loc[kline.name, "s_condition"]
+        return cond_number
 
     def _no_matched_open_cond(self) -> bool:
         # logger = self.logger
@@ -139,40 +140,29 @@ class MainShortTradeStrategy(MainTradeStrategy, ShortTradeStrategy):
     def _match_3h_condition(self) -> bool:
         """做空3小时线检测"""
         logger = self.logger
-        kline = self._get_last_kline_in_trade(self._3h_klines)
-        if tools.has_set_k_attr(kline, "s_condition"):
-            return kline.s_condition
-        (
-            e9,
-            e22,
-            e60,
-            macd,
-            close,
-            open_p,
-            trade_time,
-            _,
-            k_date_str,
-        ) = self._get_indicators(kline)
-        diffc_60 = tools.diff_two_value(close, e60)
-        diff9_60 = tools.diff_two_value(e9, e60)
-        diff22_60 = tools.diff_two_value(e22, e60)
-        log_str = (
-            "{} {} <做空> 满足3小时 K线时间:{} "
-            "ema9:{} ema22:{} ema60:{} 收盘:{} 开盘:{}"
-            "diffc_60:{} diff9_60:{} diff22_60{} MACD:{}"
+        cond_number, is_new = self._get_kline_condition(
+            self._3h_klines, -2, "s_condition", conditions.main_short_3h
         )
-        if (
-            e22 > e60
-            and (e22 > e9 or (e22 < e9 and close < e60 and open_p > e60))
-            and diff9_60 < 3
-            and diff22_60 < 3
-            and diffc_60 < 3
-            and macd < 0
-        ):
-            self._set_klines_value(
-                self._3h_klines, kline.name, "s_condition", 1
+        if is_new and cond_number > 0:
+            kline = self._get_last_kline_in_trade(self._3h_klines)
+            (
+                e9,
+                e22,
+                e60,
+                macd,
+                close,
+                open_p,
+                trade_time,
+                _,
+                k_date_str,
+            ) = self._get_indicators(kline)
+            log_str = (
+                "%s %s <做空> 满足3小时 K线时间:%s "
+                "ema9:%s ema22:%s ema60:%s 收盘:%s 开盘:%s"
+                "diffc_60:%s diff9_60:%s diff22_60%s MACD:%s"
             )
-            content = log_str.format(
+            logger.info(
+                log_str,
                 trade_time,
                 self.symbol,
                 k_date_str,
@@ -181,56 +171,49 @@ class MainShortTradeStrategy(MainTradeStrategy, ShortTradeStrategy):
                 e60,
                 close,
                 open_p,
-                diffc_60,
-                diff9_60,
-                diff22_60,
+                tools.diff_two_value(close, e60),
+                tools.diff_two_value(e9, e60),
+                tools.diff_two_value(e22, e60),
                 macd,
             )
-            logger.info(content)
             self._set_open_condition(
                 kline, 1, self.open_condition.hourly_condition
             )
-        else:
-            self._set_klines_value(
-                self._3h_klines, kline.name, "s_condition", 0
-            )
-        return self._3h_klines.loc[kline.name, "s_condition"]
+        return cond_number
 
     def _match_30m_condition(self) -> bool:
         """做空30分钟线检测"""
         logger = self.logger
-        kline = self._get_last_kline_in_trade(self._30m_klines)
-        if tools.has_set_k_attr(kline, "s_condition"):
-            return kline.s_condition
-        (
-            e9,
-            e22,
-            e60,
-            macd,
-            close,
-            _,
-            trade_time,
-            _,
-            k_date_str,
-        ) = self._get_indicators(kline)
-        diff22_60 = tools.diff_two_value(e22, e60)
-        diff9_60 = tools.diff_two_value(e9, e60)
-        log_str = (
-            "{} {} <做空> 满足30分钟 K线时间:{} ema9:{} "
-            "ema22:{} ema60:{} 收盘:{} diff22_60:{} diff9_60:{} MACD:{}"
+
+        def evaluate(klines):
+            # is_within_2days 开销较大, 只在最近一根K线满足其余条件时计算
+            conds = conditions.main_short_30m(klines, True)
+            if conds[-2] > 0 and not self.is_within_2days():
+                return conditions.main_short_30m(klines, False)
+            return conds
+
+        cond_number, is_new = self._get_kline_condition(
+            self._30m_klines, -2, "s_condition", evaluate
         )
-        if (
-            (e60 > e22 > e9 or e22 > e60 > e9)
-            and diff9_60 < 2
-            and diff22_60 < 1
-            and macd < 0
-            and e60 > close
-            and self.is_within_2days()
-        ):
-            self._set_klines_value(
-                self._30m_klines, kline.name, "s_condition", 1
+        if is_new and cond_number > 0:
+            kline = self._get_last_kline_in_trade(self._30m_klines)
+            (
+                e9,
+                e22,
+                e60,
+                macd,
+                close,
+                _,
+                trade_time,
+                _,
+                k_date_str,
+            ) = self._get_indicators(kline)
+            log_str = (
+                "%s %s <做空> 满足30分钟 K线时间:%s ema9:%s "
+                "ema22:%s ema60:%s 收盘:%s diff22_60:%s diff9_60:%s MACD:%s"
             )
-            content = log_str.format(
+            logger.info(
+                log_str,
                 trade_time,
                 self.symbol,
                 k_date_str,
@@ -238,19 +221,14 @@ class MainShortTradeStrategy(MainTradeStrategy, ShortTradeStrategy):
                 e22,
                 e60,
                 close,
-                diff22_60,
-                diff9_60,
+                tools.diff_two_value(e22, e60),
+                tools.diff_two_value(e9, e60),
                 macd,
             )
-            logger.info(content)
             self._set_open_condition(
                 kline, 1, self.open_condition.minute_30_condition
             )
-        else:
-            self._set_klines_value(
-                self._30m_klines, kline.name, "s_condition", 0
-            )
-        return self._30m_klines.loc[kline.name, "s_condition"]
+        return cond_number
 
     def _match_5m_condition(self) -> bool:
         return True
@@ -287,7 +265,7 @@ class MainShortTradeStrategy(MainTradeStrategy, ShortTradeStrategy):
         trade_price = self.trade_status.open_pos_info.trade_price
         trade_config = self.config.f_info.short_config
         sc = self.close_condition
-        log_str = "{} {} <做空> 现价{} 达到1:{} 盈亏比,将止损价提高至{}"
+        log_str = "%s %s <做空> 现价%s 达到1:%s 盈亏比,将止损价提高至%s"
         promote_price = self._calc_price(
             trade_price, trade_config.promote_scale, False
         )
@@ -302,28 +280,28 @@ class MainShortTradeStrategy(MainTradeStrategy, ShortTradeStrategy):
             sc.has_increase_slp = True
             service.update_trade_status(self.trade_status, self.trade_date)
             logger.debug(
-                log_str.format(
-                    self.trade_date_str,
-                    self.symbol,
-                    price,
-                    trade_config.promote_scale,
-                    sc.stop_loss_price,
-                )
+                log_str,
+                self.trade_date_str,
+                self.symbol,
+                price,
+                trade_config.promote_scale,
+                sc.stop_loss_price,
             )
 
     def _is_f5m_closeout(self) -> bool:
         logger = self.logger
         kline = self._get_last_kline_in_trade(self._d_klines)
-        log_str = "{} {} <做空> 满足最后5分钟止盈,当前价:{} " "日线EMA9:{} 日线EMA22:{} MACD:{}"
+        log_str = (
+            "%s %s <做空> 满足最后5分钟止盈,当前价:%s "
+            "日线EMA9:%s 日线EMA22:%s MACD:%s"
+        )
         e9, e22, _, macd, _, _, trade_time, _, _ = self._get_indicators(kline)
         price = self.current_price
         trade_time = tq_tools.get_date_str(trade_time)
         if self.is_last_5m:
             if macd > 0 and price > e9:
                 logger.debug(
-                    log_str.format(
-                        trade_time, self.symbol, price, e9, e22, macd
-                    )
+                    log_str, trade_time, self.symbol, price, e9, e22, macd
                 )
                 return True
         return False
@@ -1,7 +1,10 @@
+import logging
 from abc import ABC, abstractmethod
 from datetime import datetime
 from math import ceil
+from typing import Callable, Optional
 
+import numpy as np
 from pandas import DataFrame
 from tqsdk import tafunc
 from tqsdk.objs import Order
@@ -11,7 +14,9 @@ import strategies.tools as tools
 import utils.tqsdk_tools as tq_tools
 from dao.odm.future_trade import TradeStatus
 from strategies.entity import StrategyConfig
-from utils.common_tools import LoggerGetter, get_china_date_from_str
+from strategies.indicators import CrossIndex, get_indicator_hub
+from utils.common_tools import get_china_date_from_str
+from utils.log_tools import LoggerGetter, log_event
 
 
 class Strategy(ABC):
@@ -38,22 +43,23 @@ class Strategy(ABC):
 class TradeStrategy(Strategy):
     """交易策略基类"""
 
+    # 策略使用的 EMA 周期, 由子类指定
+    ema_periods: tuple[int, ...] = ()
+    # 策略使用的日内K线类型 3:3小时线 4:30分钟线 5:5分钟线, 由子类指定
+    intraday_types: tuple[int, ...] = (3, 4, 5)
+
     def __init__(self, config: StrategyConfig, symbol: str):
         super().__init__(config)
         self.api = config.api
         self.symbol = symbol
         self._ts = self._init_trade_status(symbol)
-        self.quote = self.api.get_quote(symbol)
+        self.quote = config.kline_hub.get_quote(symbol)
         self._d_klines = self._init_daily_klines()
-        self._3h_klines = self.api.get_kline_serial(
-            symbol, self.config.get3hK_Duration()
-        )
-        self._30m_klines = self.api.get_kline_serial(
-            symbol, self.config.get30mK_Duration()
-        )
-        self._5m_klines = config.api.get_kline_serial(
-            symbol, self.config.get5mK_Duration()
-        )
+        self._intraday_klines: dict[int, DataFrame] = {}
+        # 惰性订阅模式下, 日内K线在第一次使用时才订阅
+        if not config.kline_hub.lazy:
+            for k_type in self.intraday_types:
+                self._subscribe_intraday_klines(k_type)
         self.fill_indicators_by_type(1)
         self._open_condition = None
         self._close_condition = None
@@ -72,43 +78,59 @@ class TradeStrategy(Strategy):
         默认不提供该功能，只在摸底策略中提供盘前提示功能
         """
         self._generate_tips()
+        self._try_release_intraday_klines()
 
     def execute_trade(self):
-        """在交易期间，循环执行该方法尝试交易"""
-        self._trade_switch_symbol()
-        if self.is_trading:
-            self._try_close_pos()
-        else:
-            self._try_open_pos()
+        """在交易期间，循环执行该方法尝试交易, 有未完成的委托时等待委托完成"""
+        if not self.has_pending_order:
+            self._trade_switch_symbol()
+        if not self.has_pending_order:
+            if self.is_trading:
+                self._try_close_pos()
+            else:
+                self._try_open_pos()
+        self._try_release_intraday_klines()
 
     def execute_after_trade(self):
         """在收盘后执行"""
 
-    def closeout(self, c_type: int, c_message: str) -> Order:
-        """全部平仓, 可以安全调用，不会重复平仓
+    def closeout(
+        self,
+        c_type: int,
+        c_message: str,
+        on_closed: Optional[Callable[[Order], None]] = None,
+    ) -> Optional[Order]:
+        """全部平仓, 可以安全调用，不会重复平仓, 委托完成后调用 on_closed
 
         c_type: 0: 止损, 1: 止盈, 2: 换月, 3: 人工平仓
         """
         return self.close_pos(
-            self.trade_status.carrying_volume, c_type, c_message
+            self.trade_status.carrying_volume, c_type, c_message, on_closed
         )
 
     def open_pos(self, pos: int) -> Order:
-        """进行开仓相关操作，并记录开仓信息，输出日志"""
-        order = self._trade_pos(pos, "OPEN", self._get_open_direction())
+        """进行开仓相关操作，委托完成后记录开仓信息，输出日志"""
+        return self._trade_pos(
+            pos,
+            "OPEN",
+            self._get_open_direction(),
+            lambda order: self._after_open_pos(order, pos),
+        )
+
+    def _after_open_pos(self, order: Order, pos: int) -> None:
         t_price = self.current_price if order.is_error else order.trade_price
         self._set_open_pos_info(t_price)
         order.trade_price = t_price
         self._store_open_pos_info(order)
-        log_str = "{} {} {} 开仓 价格:{} 数量:{}"
-        self.logger.info(
-            log_str.format(
-                tq_tools.get_date_str(self.trade_date),
-                self.symbol,
-                self.trade_status.custom_symbol,
-                t_price,
-                pos,
-            )
+        log_event(
+            self.logger,
+            logging.INFO,
+            "开仓",
+            trade_date=tq_tools.get_date_str(self.trade_date),
+            symbol=self.symbol,
+            custom_symbol=self.trade_status.custom_symbol,
+            price=t_price,
+            pos=pos,
         )
         if not self.config.is_backtest:
             tradeMsg = {
@@ -122,21 +144,54 @@ class TradeStrategy(Strategy):
                 "message": "开仓",
             }
             tools.sendTradePosMsg(tradeMsg)
-        return order
 
-    def close_pos(self, pos: int, c_type: int, c_message: str) -> Order:
-        """根据数量进行平仓，并记录平仓信息，输出日志"""
-        order = None
-        t_price = 0.0
-        if self.is_trading:
-            order = self._trade_pos(pos, "CLOSE", self._get_close_direction())
-            t_price = (
-                self.current_price if order.is_error else order.trade_price
-            )
-            order.trade_price = t_price
-            order.close_volume = service.close_ops(
-                self.trade_status, c_type, c_message, order
-            )
+    def close_pos(
+        self,
+        pos: int,
+        c_type: int,
+        c_message: str,
+        on_closed: Optional[Callable[[Order], None]] = None,
+    ) -> Optional[Order]:
+        """根据数量进行平仓，委托完成后记录平仓信息，输出日志, 再调用 on_closed
+
+        没有持仓时不平仓, 返回 None
+        """
+        if not self.is_trading:
+            return None
+        return self._trade_pos(
+            pos,
+            "CLOSE",
+            self._get_close_direction(),
+            lambda order: self._after_close_pos(
+                order, pos, c_type, c_message, on_closed
+            ),
+        )
+
+    def _after_close_pos(
+        self,
+        order: Order,
+        pos: int,
+        c_type: int,
+        c_message: str,
+        on_closed: Optional[Callable[[Order], None]],
+    ) -> None:
+        t_price = self.current_price if order.is_error else order.trade_price
+        order.trade_price = t_price
+        order.close_volume = service.close_ops(
+            self.trade_status, c_type, c_message, order
+        )
+        log_event(
+            self.logger,
+            logging.INFO,
+            "平仓",
+            trade_date=tq_tools.get_date_str(self.trade_date),
+            symbol=self.symbol,
+            custom_symbol=self.trade_status.custom_symbol,
+            price=t_price,
+            pos=pos,
+            c_type=c_type,
+            message=c_message,
+        )
         if not self.config.is_backtest:
             tradeMsg = {
                 "custom_symbol": self.trade_status.custom_symbol,
@@ -147,28 +202,22 @@ class TradeStrategy(Strategy):
                 "t_time": tq_tools.get_date_str(order.insert_date_time),
                 "o_or_c": "平仓",
                 "message": c_message,
+                "c_type": c_type,
             }
             tools.sendTradePosMsg(tradeMsg)
-        return order
+        if on_closed is not None:
+            on_closed(order)
 
     def is_changing(self, k_type: int) -> bool:
         """判断是否有某个周期的K线正在发生改变
 
         k_type:  1: 3小时线, 2: 30分钟线, 3: 5分钟线
         """
+        klines = self._intraday_klines.get(k_type + 2)
+        if klines is None:
+            return False
         try:
-            if k_type == 1:
-                return self.config.api.is_changing(
-                    self._3h_klines.iloc[-1], "datetime"
-                )
-            elif k_type == 2:
-                return self.config.api.is_changing(
-                    self._30m_klines.iloc[-1], "datetime"
-                )
-            elif k_type == 3:
-                return self.config.api.is_changing(
-                    self._5m_klines.iloc[-1], "datetime"
-                )
+            return self.config.kline_hub.is_changing(klines)
         except Exception as e:
             self.logger.debug(f"{self.symbol} k_type:{k_type} has error {e}")
         return False
@@ -178,37 +227,115 @@ class TradeStrategy(Strategy):
         在实盘交易中，由于获取的是日线的拷贝数据。故当日线发生变化时，需要重新获取日线数据。
         """
         if self.config.is_backtest:
-            self._d_klines = self.api.get_kline_serial(
+            self._d_klines = self.config.kline_hub.get_kline_serial(
                 self.symbol,
                 self.config.getDailyK_Duration(),
                 self.config.getKlineLength(),
             )
         else:
-            self._d_klines = self.api.get_kline_serial(
+            self._d_klines = self.config.kline_hub.get_kline_serial(
                 self.symbol,
                 self.config.getDailyK_Duration(),
                 self.config.getKlineLength(),
             ).copy()
         return self._d_klines
 
+    def release_klines(self):
+        """策略不再使用时释放其订阅的K线序列"""
+        self.config.kline_hub.release_kline_serial(
+            self.symbol,
+            self.config.getDailyK_Duration(),
+            self.config.getKlineLength(),
+        )
+        self._release_intraday_klines()
+
+    def _subscribe_intraday_klines(self, k_type: int) -> DataFrame:
+        """订阅日内K线并填充指标"""
+        klines = self.config.kline_hub.get_kline_serial(
+            self.symbol, self._get_kline_duration(k_type)
+        )
+        self._intraday_klines[k_type] = klines
+        self.fill_indicators_by_type(k_type)
+        return klines
+
+    def _get_intraday_klines(self, k_type: int) -> DataFrame:
+        """返回日内K线, 惰性订阅模式下未订阅时先订阅"""
+        klines = self._intraday_klines.get(k_type)
+        if klines is None:
+            self.logger.debug(
+                f"{self.symbol} 订阅{self._get_kline_duration(k_type)}秒K线"
+            )
+            klines = self._subscribe_intraday_klines(k_type)
+        return klines
+
+    def _release_intraday_klines(self):
+        for k_type in list(self._intraday_klines):
+            self.config.kline_hub.release_kline_serial(
+                self.symbol, self._get_kline_duration(k_type)
+            )
+            del self._intraday_klines[k_type]
+
+    def _need_intraday_klines(self) -> bool:
+        """惰性订阅模式下, 是否仍需要日内K线, 默认不需要"""
+        return False
+
+    def _try_release_intraday_klines(self):
+        """惰性订阅模式下, 不再需要日内K线时释放它们"""
+        if (
+            self.config.kline_hub.lazy
+            and self._intraday_klines
+            and not self._need_intraday_klines()
+        ):
+            self.logger.debug(f"{self.symbol} 释放日内K线")
+            self._release_intraday_klines()
+
     def _trade_switch_symbol(self):
         record = service.get_switch_symbol_trade_record(self.trade_status)
         if record is not None:
+
+            def on_closed(order_c: Order):
+                record.close_volume_info = order_c.close_volume
+                record.current_close_status = True
+                if record.next_need_open:
+                    # TO-DO: 当需要换月开仓时，需要确定它的止盈止损条件，
+                    # 但目前还无法确定，所以暂时不开仓，等待条件确定后在实现开仓逻辑
+                    record.next_open_status = True
+                service.update_switch_symbol_trade_record(record)
+
             ovi = record.current_open_volume_info
-            order_c = self.close_pos(ovi.volume, 2, "换月平仓")
-            record.close_volume_info = order_c.close_volume
-            if record.next_need_open:
-                # TO-DO: 当需要换月开仓时，需要确定它的止盈止损条件，
-                # 但目前还无法确定，所以暂时不开仓，等待条件确定后在实现开仓逻辑
-                record.next_open_status = True
-            service.update_switch_symbol_trade_record(record)
-
-    def _trade_pos(self, pos: int, offset: str, trade_direction: str) -> Order:
+            self.close_pos(ovi.volume, 2, "换月平仓", on_closed)
+
+    @property
+    def has_pending_order(self) -> bool:
+        """是否有未完成的委托"""
+        return self.config.order_manager.has_pending(self._order_owner)
+
+    @property
+    def _order_owner(self) -> tuple[str, str]:
+        """委托人, 同一合约的不同策略分别委托"""
+        return (type(self).__name__, self.symbol)
+
+    def _trade_pos(
+        self,
+        pos: int,
+        offset: str,
+        trade_direction: str,
+        on_finished: Callable[[Order], None],
+    ) -> Order:
         """和期货交易所进行期货交易
-        先尝试市价下单，如果不支持则将当前价格作为限价尝试下单"""
+        先尝试市价下单，如果不支持则将当前价格作为限价尝试下单
+        委托完成后保存委托信息并调用 on_finished"""
         logger = self.logger
+
+        def on_order_finished(order: Order):
+            service.store_tq_order(order)
+            on_finished(order)
+
+        order_manager = self.config.order_manager
         try:
-            order = self.api.insert_order(
+            order = order_manager.insert_order(
+                self._order_owner,
+                on_order_finished,
                 symbol=self.symbol,
                 direction=trade_direction,
                 offset=offset,
@@ -224,7 +351,9 @@ class TradeStrategy(Strategy):
                 f"限价下单: 交易方向:{trade_direction} Offset:{offset} 手数:{pos} 下单价格:{limit_price} 当前价格:{self.quote.last_price}"
             )
             try:
-                order = self.api.insert_order(
+                order = order_manager.insert_order(
+                    self._order_owner,
+                    on_order_finished,
                     symbol=self.symbol,
                     direction=trade_direction,
                     offset=offset,
@@ -234,11 +363,6 @@ class TradeStrategy(Strategy):
             except Exception as e:
                 logger.error(e)
                 raise e
-        while True:
-            self.api.wait_update()
-            if order.status == "FINISHED":
-                break
-        service.store_tq_order(order)
         return order
 
     def _calc_price(self, o_price: float, scale: float, is_up: bool) -> float:
@@ -279,7 +403,8 @@ class TradeStrategy(Strategy):
         满足条件后平仓。"""
         if self.is_trading:
             self._try_stop_loss()
-            self._try_take_profit()
+            if not self.has_pending_order:
+                self._try_take_profit()
 
     def _try_open_pos(self):
         """交易的主要方法，负责判断是否满足开仓条件：当合约无持仓，且满足条件后开仓。"""
@@ -292,6 +417,55 @@ class TradeStrategy(Strategy):
                     self.logger.debug(f"quote:{self.quote} error: {e}")
                     raise e
 
+    def _get_kline_duration(self, k_type: int) -> int:
+        """返回K线类型对应的K线周期 2:日线 3:3小时线 4:30分钟线 5:5分钟线"""
+        return {
+            2: self.config.getDailyK_Duration(),
+            3: self.config.get3hK_Duration(),
+            4: self.config.get30mK_Duration(),
+            5: self.config.get5mK_Duration(),
+        }[k_type]
+
+    def _fill_indicators(self, k_type: int, klines: DataFrame):
+        """通过共享的指标计算中心为K线填充指标, 同一合约同一周期的指标只计算一次"""
+        get_indicator_hub().fill(
+            self.symbol,
+            self._get_kline_duration(k_type),
+            self.ema_periods,
+            klines,
+        )
+
+    def _get_cross_index(self, k_type: int, klines: DataFrame) -> CrossIndex:
+        """返回与K线序列同步后的交叉事件索引"""
+        crosses = get_indicator_hub().get_cross_index(
+            self.symbol, self._get_kline_duration(k_type)
+        )
+        crosses.sync(klines)
+        return crosses
+
+    def _get_kline_condition(
+        self, klines: DataFrame, pos: int, name: str, evaluate
+    ) -> tuple[float, bool]:
+        """返回K线的条件序号, 以及该序号是否为本次新计算的结果
+
+        条件序号缓存在K线序列的 name 列中。K线未缓存时, 使用 evaluate 对整个K线序列做一次
+        向量化计算, 缓存所有尚未计算的已完成K线及该K线的结果, 之后只需读取数组。
+        """
+        size = len(klines)
+        pos = pos % size
+        if name in klines.columns:
+            cached = klines[name].to_numpy(dtype=float)
+            if not np.isnan(cached[pos]):
+                return cached[pos], False
+        else:
+            cached = np.full(size, np.nan)
+        conds = evaluate(klines)
+        # 正在变化的最后一根K线只有在被判断时才缓存
+        is_fill = np.isnan(cached)
+        is_fill[size - 1] = pos == size - 1
+        klines[name] = np.where(is_fill, conds, cached)
+        return conds[pos], True
+
     def _set_klines_value(self, klines, k_name, k_key, k_value):
         klines.loc[k_name, k_key] = k_value
 
@@ -316,6 +490,16 @@ class TradeStrategy(Strategy):
         """判断是否已经有交易存在"""
         return self.trade_status.trade_status == 1
 
+    @property
+    def is_idle(self) -> bool:
+        """没有持仓, 没有未完成的委托, 也没有换月交易, 只会检测开仓条件"""
+        return (
+            not self.is_trading
+            and not self.has_pending_order
+            and service.get_switch_symbol_trade_record(self.trade_status)
+            is None
+        )
+
     @property
     def trade_date(self) -> datetime:
         """从天勤的报价对象中获取交易的当前时间"""
@@ -336,13 +520,31 @@ class TradeStrategy(Strategy):
         """获取当前交易所交易价格"""
         return self.quote.last_price
 
+    @property
+    def _3h_klines(self) -> DataFrame:
+        return self._get_intraday_klines(3)
+
+    @property
+    def _30m_klines(self) -> DataFrame:
+        return self._get_intraday_klines(4)
+
+    @property
+    def _5m_klines(self) -> DataFrame:
+        return self._get_intraday_klines(5)
+
+    @property
+    def last_daily_pos(self) -> int:
+        """当该品种处于交易时段，为前一根日k线的位置。
+        当处于交易结束时段，为最后一根日K线的位置"""
+        if tq_tools.is_trading_period(self.api, self.quote):
+            return -2
+        return -1
+
     @property
     def last_daily_kline(self):
         """当该品种处于交易时段，要获取前一根日k线。
         当处于交易结束时段，则获取最后一根日K线"""
-        if tq_tools.is_trading_period(self.api, self.quote):
-            return self._d_klines.iloc[-2]
-        return self._d_klines.iloc[-1]
+        return self._d_klines.iloc[self.last_daily_pos]
 
     @property
     @abstractmethod
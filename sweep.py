@@ -0,0 +1,31 @@
+from headquarters.backtest_runner import ParamSweeper
+from utils import common
+import sys
+import logging
+from utils import global_var as gvar
+from utils.param_sweep import get_sweep_spec
+import warnings
+# 忽略所有警告信息
+warnings.filterwarnings("ignore")
+
+log_level = "info"
+logger = logging.getLogger(__name__)
+
+
+def main():
+    '''止盈止损参数扫描, 扫描配置文件路径通过命令行参数或环境变量 SWEEP_CONFIG_PATH 指定
+    回测的起止日期, 交易方向和品种使用系统配置和品种配置文件中的配置
+    '''
+    try:
+        log_config_file = f'log_config_{gvar.ENV_NAME}'
+        common.setup_log_config(log_level, log_config_file)
+        path = sys.argv[1] if len(sys.argv) > 1 else gvar.SWEEP_CONFIG_PATH
+        spec = get_sweep_spec(path)
+        ParamSweeper(spec).start_work()
+    except Exception as e:
+        logger.exception(e)
+        return str(e)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""对比逐行遍历与向量化实现的K线交叉查找耗时
+
+逐行遍历的实现复制自改为向量化查找之前(34ac3df)的策略:
+主策略的 is_within_2days, _match_3hk_c2_distance 和摸底策略的 _is_within_distance,
+只去掉了日志输出和遍历之后的判断。
+
+运行方式: ENV_NAME=dev TQKQ_NUMBER=1 PYTHONPATH=. python test/bench_crossover_scan.py
+"""
+
+import timeit
+
+import numpy as np
+import pandas as pd
+
+import strategies.tools as tools
+import utils.tqsdk_tools as tq_tools
+from strategies.indicators import CrossIndex
+
+
+def make_klines(size: int, is_above: bool) -> pd.DataFrame:
+    """让逐行遍历都遍历整个序列的K线, 即最差情况
+
+    is_above 为真时 EMA60 低于其他价格, 用于 _match_3hk_c2_distance 和
+    _is_within_distance; 为假时 EMA60 高于收盘价, 用于 is_within_2days。
+    两种情况下第一根K线都相反, 遍历在第一根K线停止。
+    """
+    rng = np.random.default_rng(1)
+    close = 3000 + np.cumsum(rng.normal(0, 15, size))
+    klines = pd.DataFrame(
+        {
+            "id": np.arange(size, dtype=float),
+            "datetime": np.arange(size, dtype=float) * 1800e9,
+            "open": np.r_[close[0], close[:-1]],
+            "close": close,
+            "MACD.close": rng.normal(0, 5, size),
+        }
+    )
+    for n in (5, 9, 20, 22):
+        klines[f"ema{n}"] = klines.close.ewm(span=n, adjust=False).mean()
+    prices = klines[["close", "ema5", "ema9", "ema22"]]
+    first = np.where(np.arange(size) == 0, -1, 1)
+    if is_above:
+        klines["ema60"] = prices.min(axis=1) - first
+    else:
+        klines["ema60"] = prices.max(axis=1) + first
+    return klines
+
+
+def get_main_indicators(kline) -> tuple:
+    """主策略的 _get_indicators"""
+    ema9 = kline.ema9
+    ema22 = kline.ema22
+    ema60 = kline.ema60
+    macd = kline["MACD.close"]
+    close = kline.close
+    open_price = kline.open
+    trade_time = None
+    kline_time_str_short = tq_tools.get_date_str_short(kline.datetime)
+    kline_time_str = tq_tools.get_date_str(kline.datetime)
+    return (
+        ema9,
+        ema22,
+        ema60,
+        macd,
+        close,
+        open_price,
+        trade_time,
+        kline_time_str_short,
+        kline_time_str,
+    )
+
+
+def get_bottom_indicators(kline) -> tuple:
+    """摸底策略的 _get_indicators"""
+    ema5 = kline.ema5
+    ema20 = kline.ema20
+    ema60 = kline.ema60
+    macd = kline["MACD.close"]
+    close = kline.close
+    kline_time_str_short = tq_tools.get_date_str_short(kline.datetime)
+    kline_time_str = tq_tools.get_date_str(kline.datetime)
+    return (
+        ema5,
+        ema20,
+        ema60,
+        macd,
+        close,
+        None,
+        kline_time_str_short,
+        kline_time_str,
+    )
+
+
+def is_within_2days_scan(m30_klines):
+    """主策略 is_within_2days 的遍历"""
+    l30m_kline = None
+    temp_df = m30_klines.iloc[::-1]
+    e60, close = 0, 0
+    for i, temp_kline in temp_df.iterrows():
+        _, _, e60, _, close, _, trade_time, _, _ = get_main_indicators(
+            temp_kline
+        )
+        if close >= e60:
+            if i == 199:
+                break
+            else:
+                t30m_kline = m30_klines.iloc[i + 1]
+                _, et22, et60, _, _, _, _, _, _ = get_main_indicators(
+                    t30m_kline
+                )
+                if et22 > et60:
+                    l30m_kline = t30m_kline
+                    break
+    return l30m_kline
+
+
+def c2_distance_scan(h3_klines):
+    """主策略 _match_3hk_c2_distance 的遍历"""
+    klines = h3_klines.iloc[::-1]
+    k1, k2 = 0, 0
+    is_done_1 = False
+    for _, kline in klines.iterrows():
+        e9 = kline.ema9
+        e22 = kline.ema22
+        e60 = kline.ema60
+        if not is_done_1 and e22 <= e60:
+            k1 = kline.id
+            is_done_1 = True
+        if e9 <= e60:
+            k2 = kline.id
+            break
+    return 0 <= k1 - k2 <= 5
+
+
+def within_distance_scan(klines_30m, last_matched_kline):
+    """摸底策略 _is_within_distance 的遍历"""
+    m30_klines = klines_30m
+    m30_klines = m30_klines[
+        m30_klines.datetime < last_matched_kline.datetime
+    ].iloc[::-1]
+    wanted_kline = m30_klines.iloc[-10]
+    for i, t_kline in m30_klines.iterrows():
+        e5, _, e60, _, close, _, _, _ = get_bottom_indicators(t_kline)
+        if close <= e60 or e5 <= e60:
+            wanted_kline = klines_30m.iloc[i + 1]
+            break
+    return wanted_kline
+
+
+def iterrows_scan(above, below):
+    is_within_2days_scan(below)
+    c2_distance_scan(above)
+    within_distance_scan(above, above.iloc[-1])
+
+
+def index_scan(above_crosses, below_crosses, above, below):
+    below_crosses.sync(below)
+    tools.find_last_cross_pos(below_crosses)
+    above_crosses.sync(above)
+    tools.find_ema_cross_ids(above_crosses)
+    tools.find_last_below_pos(above_crosses, above.datetime.iloc[-1])
+
+
+def main():
+    for size in (200, 2000):
+        above = make_klines(size, True)
+        below = make_klines(size, False)
+        number = 20
+        old = timeit.timeit(lambda: iterrows_scan(above, below), number=number)
+        # 新K线生成时需要重建索引
+        crosses = (CrossIndex(), CrossIndex())
+
+        def rebuild_scan():
+            for c in crosses:
+                c.invalidate()
+            index_scan(*crosses, above, below)
+
+        rebuild = timeit.timeit(rebuild_scan, number=number)
+        # 同一根K线内的 tick 只刷新最后一根K线
+        tick = timeit.timeit(
+            lambda: index_scan(*crosses, above, below), number=number
+        )
+        print(
+            f"rows:{size} iterrows:{old / number * 1000:.3f}ms "
+            f"rebuild:{rebuild / number * 1000:.3f}ms "
+            f"tick:{tick / number * 1000:.3f}ms "
+            f"speedup:{old / rebuild:.1f}x/{old / tick:.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""测试共用的配置和行情数据"""
+
+from datetime import date
+from types import SimpleNamespace
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dao.config_service as c_service
+import dao.trade.storage as storage
+import dao.trade_log.log_service as l_service
+import dao.trade.trade_service as service
+import exe_departments.stakers as stakers
+from dao.odm.trade_log import TradeRecord
+from dao.trade.storage import MemoryStorage
+from exe_departments.stakers import BTStaker
+from strategies.indicators import get_indicator_hub
+from utils.config_utils import FutureConfig
+from utils.notifier import get_notifier
+from utils.replay_api import INSTRUMENTS_FILE, ReplayApi
+
+LONG = {
+    "base_scale": 0.03,
+    "stop_loss_scale": 1,
+    "profit_start_scale_1": 3,
+    "promote_scale_1": 6,
+    "promote_target_1": 3,
+    "profit_start_scale_2": 1.5,
+    "promote_scale_2": 3,
+    "promote_target_2": 1,
+}
+SHORT = {
+    "base_scale": 0.03,
+    "stop_loss_scale": 1,
+    "profit_start_scale": 8,
+    "promote_scale": 3,
+    "promote_target": 1,
+}
+# 回放行情的起止交易日, 之前的交易日作为历史K线
+REPLAY_START = date(2024, 1, 2)
+REPLAY_END = date(2024, 1, 10)
+HISTORY_START = "2023-09-01"
+# 每个交易日 15:00 收盘前的5分钟线根数
+REPLAY_BARS_PER_DAY = 24
+# 回放开始后第几个交易日开始下跌
+REPLAY_DROP_DAY = 4
+
+
+class FakeApi:
+    """TqApi 的替代品, 记录订阅次数, 委托在 fill_after 次 wait_update 后完成
+
+    klines 不为空时, get_kline_serial 返回它的最后 length 根K线
+    """
+
+    def __init__(
+        self, fill_after: int = 1, klines: Optional[pd.DataFrame] = None
+    ):
+        self.calls = 0
+        self.updates = 0
+        self.fill_after = fill_after
+        self.klines = klines
+        self.orders = []
+        # 最近一次行情更新的数据包
+        self._sync_diffs = []
+
+    def get_quote(self, symbol):
+        self.calls += 1
+        return SimpleNamespace(
+            symbol=symbol, datetime="2024-01-02 09:00:00.000000"
+        )
+
+    def get_kline_serial(self, symbol, duration, length=200):
+        self.calls += 1
+        if self.klines is not None:
+            return self.klines.iloc[-length:].reset_index(drop=True)
+        return pd.DataFrame(
+            {"datetime": np.arange(length), "close": np.zeros(length)}
+        )
+
+    def is_changing(self, obj, key=None):
+        return True
+
+    def insert_order(self, **kwargs):
+        order = SimpleNamespace(
+            order_id=len(self.orders), status="ALIVE", **kwargs
+        )
+        self.orders.append((order, self.updates + self.fill_after))
+        return order
+
+    def wait_update(self, deadline=None):
+        self.updates += 1
+        for order, filled_at in self.orders:
+            if self.updates >= filled_at:
+                order.status = "FINISHED"
+
+
+def make_future_config(symbol: str = "KQ.m@SHFE.rb", **kwargs):
+    config = {
+        "symbol": symbol,
+        "name": symbol,
+        "is_active": 1,
+        "multiple": 10,
+        "switch_days": [20, 45],
+        "main_symbols": [1, 5, 10],
+        "long": LONG,
+        "short": SHORT,
+    }
+    config.update(kwargs)
+    return FutureConfig(0.2, **config)
+
+
+def write_kline_file(path, starts, close, underlying=None) -> None:
+    """保存回放使用的K线文件, 开盘价为前一根K线的收盘价"""
+    close = np.asarray(close, dtype=float)
+    open_p = np.r_[close[0], close[:-1]]
+    frame = pd.DataFrame(
+        {
+            "datetime": [str(s) for s in starts],
+            "open": open_p,
+            "high": np.maximum(open_p, close) + 0.5,
+            "low": np.minimum(open_p, close) - 0.5,
+            "close": close,
+            "volume": 10,
+        }
+    )
+    if underlying is not None:
+        frame["underlying_symbol"] = underlying
+    frame.to_csv(path, index=False)
+
+
+def get_bar_starts(days, bars_per_day: int) -> list:
+    """每个交易日 15:00 收盘前 bars_per_day 根5分钟线的起始时间
+
+    最后一根K线的 quote 时间为 14:59:59, 盯盘人据此结束当日交易
+    """
+    return [
+        pd.Timestamp(day)
+        + pd.Timedelta(hours=15, minutes=5 * (i - bars_per_day))
+        for day in days
+        for i in range(bars_per_day)
+    ]
+
+
+def make_trend_closes(starts: list, base: float) -> np.ndarray:
+    """缓慢加速上涨, 回放开始后第 REPLAY_DROP_DAY 个交易日开始下跌的价格
+
+    各周期K线都满足主策略的做多条件, 回放开始时开多仓, 下跌后止损
+    """
+    days = np.array([(s - starts[0]) / pd.Timedelta(days=1) for s in starts])
+    close = base * np.exp(1e-6 * days**2)
+    drop_start = pd.bdate_range(REPLAY_START, periods=REPLAY_DROP_DAY + 1)[-1]
+    dropping = np.array([s >= drop_start for s in starts])
+    close[dropping] *= np.linspace(1, 0.9, dropping.sum())
+    return close.round(2)
+
+
+@pytest.fixture
+def fake_api():
+    return FakeApi()
+
+
+@pytest.fixture
+def memory_storage(monkeypatch):
+    """交易数据保存在内存中, 测试结束后清除共享的指标状态"""
+    memory = MemoryStorage("")
+    monkeypatch.setattr(storage, "_storage", memory)
+    service.clear_preloaded_states()
+    yield memory
+    get_indicator_hub().clear()
+
+
+@pytest.fixture
+def replay_dir(tmp_path):
+    """回放行情: 盯盘人判断交易时间用的黄金主连, 会开仓的螺纹和价格不变的铜
+
+    盯盘人订阅 KQ.m@SHFE.au, 交易员订阅品种主连和主连标的及其下一主力合约,
+    这些合约的K线文件都必须存在
+    """
+    days = pd.bdate_range(HISTORY_START, REPLAY_END)
+    starts = get_bar_starts(days, REPLAY_BARS_PER_DAY)
+    flat = np.full(len(starts), 400.0)
+    write_kline_file(
+        tmp_path / "KQ.m@SHFE.au.csv", starts, flat, "SHFE.au2406"
+    )
+    close = make_trend_closes(starts, 3000)
+    write_kline_file(
+        tmp_path / "KQ.m@SHFE.rb.csv", starts, close, "SHFE.rb2405"
+    )
+    write_kline_file(tmp_path / "SHFE.rb2405.csv", starts, close)
+    write_kline_file(tmp_path / "SHFE.rb2410.csv", starts, close - 20)
+    flat = np.full(len(starts), 70000.0)
+    write_kline_file(
+        tmp_path / "KQ.m@SHFE.cu.csv", starts, flat, "SHFE.cu2402"
+    )
+    write_kline_file(tmp_path / "SHFE.cu2402.csv", starts, flat)
+    write_kline_file(tmp_path / "SHFE.cu2405.csv", starts, flat)
+    pd.DataFrame(
+        [
+            {
+                "symbol": symbol,
+                "volume_multiple": 10,
+                "margin_ratio": 0.1,
+                "commission": 2,
+                "expire_datetime": expire,
+            }
+            for symbol, expire in (
+                ("SHFE.rb2405", "2024-05-15"),
+                ("SHFE.rb2410", "2024-10-15"),
+                ("SHFE.cu2402", "2024-02-19"),
+                ("SHFE.cu2405", "2024-05-15"),
+            )
+        ]
+    ).to_csv(tmp_path / INSTRUMENTS_FILE, index=False)
+    return str(tmp_path)
+
+
+@pytest.fixture
+def make_bt_staker(replay_dir, monkeypatch):
+    """在回放行情上创建回测盯盘人, 默认只回测螺纹, 每个盯盘人使用新的内存存储"""
+
+    def make(
+        symbols=("KQ.m@SHFE.rb",), strategy_ids=(1, 2), **kwargs
+    ) -> BTStaker:
+        monkeypatch.setattr(storage, "_storage", MemoryStorage(""))
+        service.clear_preloaded_states()
+        get_indicator_hub().clear()
+        api = ReplayApi(replay_dir, REPLAY_START, REPLAY_END, 1e6)
+        return BTStaker(
+            api,
+            2,
+            list(strategy_ids),
+            future_configs=[make_future_config(s) for s in symbols],
+            keep_alive=False,
+            **kwargs,
+        )
+
+    yield make
+    get_indicator_hub().clear()
+
+
+@pytest.fixture
+def real_configs(monkeypatch):
+    """实盘盯盘人不读写数据库, 只交易螺纹"""
+    monkeypatch.setattr(
+        stakers, "get_future_configs", lambda: [make_future_config()]
+    )
+    monkeypatch.setattr(
+        c_service, "get_future_configs", c_service.build_future_configs
+    )
+    monkeypatch.setattr(
+        l_service,
+        "get_trade_record",
+        lambda day: TradeRecord(trade_date=day),
+    )
+    yield
+    get_notifier().stop()
@@ -0,0 +1,171 @@
+"""生成 conditions_baseline.npz: 改为向量化计算之前的主策略对每根K线判断的条件序号
+
+需要在改动之前的代码(34ac3df)上运行, 例如:
+    git worktree add /tmp/baseline 34ac3df
+    cd /tmp/baseline
+    ENV_NAME=dev TQKQ_NUMBER=1 PYTHONPATH=/tmp/baseline \\
+        python /path/to/test/data/record_conditions_baseline.py \\
+        /path/to/test/data/conditions_baseline.npz
+
+逐根K线判断时, 把该K线复制成两行作为策略的K线, 策略依赖的其他条件直接替换为固定值。
+结果各列的名称见 names, 含义见 test_conditions.py。
+"""
+
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from strategies.trade_strategies.mts.mts_long import MainLongTradeStrategy
+from strategies.trade_strategies.mts.mts_short import MainShortTradeStrategy
+
+SEEDS = range(5)
+SIZE = 1000
+COLUMNS = ["ema60", "ema22", "ema9", "close", "open", "MACD.close"]
+# 做多3小时线条件依赖的日线条件序号
+D_CONDS = [0, 1, 2, 3, 4, 5, np.nan]
+# 保存为整数的 NaN
+NAN_VALUE = np.iinfo(np.int64).min
+
+
+class NullLogger:
+    def debug(self, *args, **kwargs):
+        pass
+
+    info = debug
+
+
+OPEN_CONDITION = SimpleNamespace(
+    daily_condition=None,
+    hourly_condition=None,
+    minute_30_condition=None,
+    minute_5_condition=None,
+)
+
+
+class Long(MainLongTradeStrategy):
+    open_condition = OPEN_CONDITION
+    trade_date = None
+    logger = NullLogger()
+
+    @property
+    def last_daily_kline(self):
+        return self._d_klines.iloc[-2]
+
+    def _set_open_condition(self, *args):
+        pass
+
+
+class Short(MainShortTradeStrategy):
+    open_condition = OPEN_CONDITION
+    trade_date = None
+    logger = NullLogger()
+
+    @property
+    def last_daily_kline(self):
+        return self._d_klines.iloc[-2]
+
+    def _set_open_condition(self, *args):
+        pass
+
+
+def make_klines(seed: int) -> np.ndarray:
+    """EMA 彼此接近的模拟K线, 以覆盖尽量多的条件分支, 价格保存为千分之一的整数"""
+    rng = np.random.default_rng(seed)
+    e60 = 3000 + np.cumsum(rng.normal(0, 5, SIZE))
+    frame = pd.DataFrame(
+        {
+            "ema60": e60,
+            "ema22": e60 * (1 + rng.normal(0, 0.015, SIZE)),
+            "ema9": e60 * (1 + rng.normal(0, 0.025, SIZE)),
+            "close": e60 * (1 + rng.normal(0, 0.03, SIZE)),
+            "open": e60 * (1 + rng.normal(0, 0.03, SIZE)),
+            "MACD.close": rng.normal(0, 5, SIZE),
+        }
+    )
+    values = np.round(frame.to_numpy() * 1000).astype(np.int64)
+    values[:5] = NAN_VALUE
+    return values
+
+
+def to_frame(values: np.ndarray) -> pd.DataFrame:
+    frame = pd.DataFrame(values / 1000, columns=COLUMNS)
+    frame[values == NAN_VALUE] = np.nan
+    return frame
+
+
+def get_one_bar(klines: pd.DataFrame, i: int, **columns) -> pd.DataFrame:
+    """第 i 根K线复制成的两行K线, 策略判断倒数第2根"""
+    frame = klines.iloc[[i, i]].reset_index(drop=True)
+    frame["datetime"] = 0.0
+    for name, value in columns.items():
+        frame[name] = value
+    return frame
+
+
+def record(values: np.ndarray) -> tuple[list[str], np.ndarray]:
+    klines = to_frame(values)
+    names, results = [], []
+
+    def run(name, cls, attr, method, d_klines=None, **patches):
+        strategy = object.__new__(cls)
+        strategy.symbol = "SHFE.rb2405"
+        for key, value in patches.items():
+            setattr(strategy, key, lambda value=value: value)
+        column = []
+        for i in range(len(klines)):
+            setattr(strategy, attr, get_one_bar(klines, i))
+            if d_klines is not None:
+                strategy._d_klines = d_klines
+            column.append(getattr(strategy, method)())
+        names.append(name)
+        results.append(column)
+
+    run("long_daily", Long, "_d_klines", "_match_dk_condition")
+    for d_cond in D_CONDS:
+        d_klines = get_one_bar(klines, 0, l_condition=d_cond)
+        for c2 in (True, False):
+            run(
+                f"long_3h_{d_cond}_{c2}",
+                Long,
+                "_3h_klines",
+                "_match_3h_condition",
+                d_klines,
+                _match_3hk_c2_distance=c2,
+            )
+    run("long_30m", Long, "_30m_klines", "_match_30m_condition")
+    run("long_5m", Long, "_5m_klines", "_match_5m_condition")
+    for veto in (True, False):
+        run(
+            f"short_daily_{veto}",
+            Short,
+            "_d_klines",
+            "_match_dk_condition",
+            _no_matched_open_cond=veto,
+        )
+    run("short_3h", Short, "_3h_klines", "_match_3h_condition")
+    for within in (True, False):
+        run(
+            f"short_30m_{within}",
+            Short,
+            "_30m_klines",
+            "_match_30m_condition",
+            is_within_2days=within,
+        )
+    return names, np.array(results, dtype=float).T.astype(np.int8)
+
+
+def main(path: str):
+    arrays = {"columns": np.array(COLUMNS)}
+    for seed in SEEDS:
+        values = make_klines(seed)
+        names, results = record(values)
+        arrays["names"] = np.array(names)
+        arrays[f"klines_{seed}"] = values
+        arrays[f"results_{seed}"] = results
+    np.savez_compressed(path, **arrays)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
@@ -0,0 +1,185 @@
+"""生成 crossover_baseline.npz: 改为向量化查找之前的策略在模拟K线上的判断结果
+
+需要在改动之前的代码(34ac3df)上运行, 例如:
+    git worktree add /tmp/baseline 34ac3df
+    cd /tmp/baseline
+    ENV_NAME=dev TQKQ_NUMBER=1 PYTHONPATH=/tmp/baseline \\
+        python /path/to/test/data/record_crossover_baseline.py \\
+        /path/to/test/data/crossover_baseline.npz
+
+策略的K线通过 object.__new__ 直接赋值, 不需要天勤和数据库。
+结果各列的含义见 test_crossover_scan.py。
+"""
+
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from strategies.trade_strategies.bts.bts_long import BottomLongTradeStrategy
+from strategies.trade_strategies.mts.mts_short import MainShortTradeStrategy
+
+SEEDS = range(4)
+M30_SIZE = 520
+WINDOW = 200
+# 相邻窗口结束位置的间隔
+STEP = 2
+# 日线窗口的根数
+DAILY_WINDOW = 60
+COLUMNS = [
+    "id",
+    "datetime",
+    "open",
+    "close",
+    "ema5",
+    "ema9",
+    "ema20",
+    "ema22",
+    "ema60",
+    "MACD.close",
+]
+
+
+class Recorded(pd.DataFrame):
+    """记录每次倒序逐行遍历停止的位置, 遍历完所有K线时记为 -1"""
+
+    stops = []
+
+    @property
+    def _constructor(self):
+        return Recorded
+
+    def iterrows(self):
+        last = None
+        try:
+            for i, row in super().iterrows():
+                last = i
+                yield i, row
+        except GeneratorExit:
+            Recorded.stops.append(last)
+            raise
+        Recorded.stops.append(-1)
+
+
+class NullLogger:
+    def debug(self, *args, **kwargs):
+        pass
+
+    info = debug
+
+
+def call(method, *args) -> list[int]:
+    """调用策略的判断方法, 返回结果和逐行遍历停止的位置"""
+    Recorded.stops.clear()
+    result = method(*args)
+    (stop,) = Recorded.stops
+    return [int(result), int(stop)]
+
+
+def get_m30_times(size: int) -> list:
+    """每个交易日白盘12根, 夜盘4根30分钟线"""
+    times = []
+    for day in pd.bdate_range("2024-01-02", periods=size // 16 + 2):
+        for k in range(12):
+            times.append(day + pd.Timedelta(hours=9, minutes=30 * k))
+        for k in range(4):
+            times.append(day + pd.Timedelta(hours=21, minutes=30 * k))
+    return times[:size]
+
+
+def to_ns(times) -> np.ndarray:
+    return np.array(
+        [pd.Timestamp(t, tz="Asia/Shanghai").value for t in times],
+        dtype=float,
+    )
+
+
+def add_emas(frame: pd.DataFrame) -> pd.DataFrame:
+    for n in (5, 9, 20, 22, 60):
+        frame[f"ema{n}"] = (
+            frame.close.ewm(span=n, adjust=False).mean().round(3)
+        )
+    return frame
+
+
+def make_klines(seed: int) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """随机游走的30分钟线和日线, 日线包含30分钟线之前60个交易日"""
+    rng = np.random.default_rng(seed)
+    close = 3000 + np.cumsum(rng.normal(0, 15, M30_SIZE))
+    m30 = pd.DataFrame(
+        {
+            "id": np.arange(5000, 5000 + M30_SIZE, dtype=float),
+            "datetime": to_ns(get_m30_times(M30_SIZE)),
+            "close": close.round(2),
+        }
+    )
+    m30["open"] = np.r_[m30.close.iloc[0], m30.close.iloc[:-1]]
+    m30 = add_emas(m30)
+    m30["MACD.close"] = rng.normal(0, 5, M30_SIZE).round(3)
+    days = pd.bdate_range(end="2024-01-01", periods=DAILY_WINDOW).append(
+        pd.bdate_range("2024-01-02", periods=M30_SIZE // 16 + 2)
+    )
+    d_close = 3000 + np.cumsum(rng.normal(0, 40, len(days)))
+    daily = pd.DataFrame(
+        {
+            "id": np.arange(100, 100 + len(days), dtype=float),
+            "datetime": to_ns(days),
+            "close": d_close.round(2),
+        }
+    )
+    daily["open"] = np.r_[daily.close.iloc[0], daily.close.iloc[:-1]]
+    daily = add_emas(daily)
+    daily["MACD.close"] = rng.normal(0, 5, len(days)).round(3)
+    return m30[COLUMNS], daily[COLUMNS]
+
+
+def make_strategy(cls):
+    strategy = object.__new__(cls)
+    strategy.symbol = "SHFE.rb2405"
+    strategy.quote = SimpleNamespace(datetime="2024-02-01 09:00:00.000000")
+    strategy.logger = NullLogger()
+    return strategy
+
+
+def get_windows(m30: pd.DataFrame, daily: pd.DataFrame):
+    for end in range(WINDOW, M30_SIZE + 1, STEP):
+        m30_w = Recorded(m30.iloc[end - WINDOW : end].reset_index(drop=True))
+        daily_w = daily[daily.datetime <= m30_w.datetime.iloc[-1]]
+        daily_w = daily_w.iloc[-DAILY_WINDOW:].reset_index(drop=True)
+        yield end, m30_w, daily_w
+
+
+def record(m30: pd.DataFrame, daily: pd.DataFrame) -> np.ndarray:
+    main = make_strategy(MainShortTradeStrategy)
+    bottom = make_strategy(BottomLongTradeStrategy)
+    rows = []
+    for end, m30_w, daily_w in get_windows(m30, daily):
+        main._3h_klines = m30_w
+        main._30m_klines = m30_w
+        main._d_klines = daily_w
+        bottom._30m_klines = m30_w
+        row = [end]
+        row += call(main._match_3hk_c2_distance)
+        row += call(main.is_within_2days)
+        for pos in (-1, -15):
+            kline = m30_w.iloc[pos]
+            matched, stop = call(bottom._is_within_distance, kline, True)
+            row += [stop, matched]
+            row.append(call(bottom._is_within_distance, kline, False)[0])
+        rows.append(row)
+    return np.array(rows, dtype=np.int64)
+
+
+def main(path: str):
+    arrays = {"columns": np.array(COLUMNS)}
+    for seed in SEEDS:
+        m30, daily = make_klines(seed)
+        arrays[f"m30_{seed}"] = m30.to_numpy()
+        arrays[f"daily_{seed}"] = daily.to_numpy()
+        arrays[f"results_{seed}"] = record(m30, daily)
+    np.savez_compressed(path, **arrays)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
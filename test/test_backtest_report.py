@@ -0,0 +1,203 @@
+from datetime import date, datetime
+
+import pytest
+
+from headquarters.backtest_runner import (
+    get_shard_dump,
+    split_backtest_days,
+    split_future_configs,
+)
+from utils.backtest_report import (
+    find_splice_day,
+    merge_backtest_results,
+    merge_trade_logs,
+    splice_trade_logs,
+)
+from utils.config_utils import FutureConfig
+
+INIT = 1000000.0
+
+
+def make_account(balance, margin=0.0, commission=0.0):
+    return {
+        "currency": "CNY",
+        "pre_balance": INIT,
+        "static_balance": INIT,
+        "balance": balance,
+        "available": balance - margin,
+        "margin": margin,
+        "commission": commission,
+        "risk_ratio": margin / balance,
+    }
+
+
+def make_trade(symbol, time, direction="BUY", offset="OPEN"):
+    exchange_id, instrument_id = symbol.split(".")
+    return {
+        "exchange_id": exchange_id,
+        "instrument_id": instrument_id,
+        "direction": direction,
+        "offset": offset,
+        "price": 3000.0,
+        "volume": 1,
+        "commission": 2.0,
+        "trade_date_time": time,
+    }
+
+
+def make_log(symbol, days):
+    return {
+        day: {
+            "trades": [make_trade(symbol, time)],
+            "account": make_account(balance, 10000.0, 2.0),
+            "positions": {symbol: {"volume_long": 1}},
+        }
+        for day, balance, time in days
+    }
+
+
+@pytest.fixture
+def shard_logs():
+    return [
+        make_log(
+            "SHFE.rb2405",
+            [("2024-01-02", 1001000.0, 30), ("2024-01-03", 1002000.0, 50)],
+        ),
+        make_log("DCE.m2405", [("2024-01-02", 999500.0, 20)]),
+    ]
+
+
+def make_config(symbol, is_active=True):
+    return FutureConfig(
+        1, symbol=symbol, is_active=is_active, long={}, short={}
+    )
+
+
+def make_chunk_log(days):
+    """days 为 (交易日, 权益, 收盘后持仓手数)"""
+    return {
+        day: {
+            "trades": [],
+            "account": make_account(balance, 1000.0 * volume),
+            "positions": (
+                {"SHFE.rb2405": {"volume_long": volume, "volume_short": 0}}
+                if volume
+                else {}
+            ),
+        }
+        for day, balance, volume in days
+    }
+
+
+class TestClass:
+    def test_merge_trade_logs(self, shard_logs):
+        merged = merge_trade_logs(shard_logs)
+        assert list(merged) == ["2024-01-02", "2024-01-03"]
+        first = merged["2024-01-02"]
+        assert [t["trade_date_time"] for t in first["trades"]] == [20, 30]
+        # 合并后的账户为各组账户之和
+        assert first["account"]["balance"] == 2 * INIT + 1000 - 500
+        assert first["account"]["margin"] == 20000.0
+        assert first["account"]["currency"] == "CNY"
+        assert first["account"]["risk_ratio"] == pytest.approx(
+            20000.0 / (2 * INIT + 500)
+        )
+        assert set(first["positions"]) == {"SHFE.rb2405", "DCE.m2405"}
+        # 第二组在 2024-01-03 没有记录, 沿用上一个交易日的账户截面
+        assert merged["2024-01-03"]["account"]["balance"] == (
+            2 * INIT + 2000 - 500
+        )
+
+    def test_merge_backtest_results(self, shard_logs):
+        results = [
+            {
+                "trade_log": log,
+                "tqsdk_stat": {"balance": log[max(log)]["account"]["balance"]},
+                "quotes": {
+                    symbol: {"volume_multiple": 10} for symbol in quotes
+                },
+            }
+            for log, quotes in zip(
+                shard_logs, (["SHFE.rb2405"], ["DCE.m2405"])
+            )
+        ]
+        report = merge_backtest_results(results)
+        assert report["shard_stats"] == [
+            {"balance": 1002000.0},
+            {"balance": 999500.0},
+        ]
+        assert report["init_balance"] == 2 * INIT
+        assert report["account_count"] == 2
+        assert report["tqsdk_stat"]["init_balance"] == 2 * INIT
+        assert report["tqsdk_stat"]["balance"] == 2 * INIT + 1500
+        assert merge_backtest_results([])["tqsdk_stat"] is None
+
+    def test_split_future_configs(self):
+        configs = [make_config(f"S{i}") for i in range(5)]
+        configs.insert(2, make_config("off", is_active=False))
+        shards = split_future_configs(configs, 2)
+        assert [[c.symbol for c in shard] for shard in shards] == [
+            ["S0", "S2", "S4"],
+            ["S1", "S3"],
+        ]
+        assert len(split_future_configs(configs[:2], 4)) == 2
+        assert get_shard_dump("mongo", 1) == "mongo"
+        assert get_shard_dump("", 1) == ""
+        assert get_shard_dump("out/bt.jsonl", 1) == "out/bt.1.jsonl"
+
+    def test_splice_chunk_logs(self):
+        prev_log = make_chunk_log(
+            [
+                ("2024-01-02", INIT + 100, 0),
+                ("2024-01-03", INIT + 300, 1),
+                ("2024-01-04", INIT + 200, 0),
+                ("2024-01-05", INIT + 500, 1),
+            ]
+        )
+        # 后一段在预热期间开仓, 1月4日两段都没有持仓
+        next_log = make_chunk_log(
+            [
+                ("2024-01-03", INIT - 50, 1),
+                ("2024-01-04", INIT - 100, 0),
+                ("2024-01-05", INIT + 100, 1),
+                ("2024-01-08", INIT + 400, 0),
+            ]
+        )
+        assert find_splice_day(prev_log, next_log) == "2024-01-04"
+        spliced = splice_trade_logs(prev_log, next_log, "2024-01-04")
+        assert list(spliced) == [
+            "2024-01-02",
+            "2024-01-03",
+            "2024-01-04",
+            "2024-01-05",
+            "2024-01-08",
+        ]
+        assert spliced["2024-01-04"] == prev_log["2024-01-04"]
+        assert spliced["2024-01-05"]["account"]["balance"] == INIT + 400
+        assert spliced["2024-01-08"]["account"]["balance"] == INIT + 700
+        assert spliced["2024-01-05"]["account"]["risk_ratio"] == pytest.approx(
+            1000.0 / (INIT + 400)
+        )
+        # 后一段开始前没有持仓, 可以在它的第一个交易日之前衔接
+        later_log = make_chunk_log([("2024-01-08", INIT + 10, 0)])
+        assert find_splice_day(prev_log, later_log) is None
+        assert find_splice_day(prev_log, {**later_log, **next_log}) == (
+            "2024-01-04"
+        )
+        flat_log = make_chunk_log([("2024-01-05", INIT + 500, 0)])
+        assert find_splice_day(flat_log, later_log) == "2024-01-05"
+        assert splice_trade_logs(flat_log, later_log, "2024-01-05")[
+            "2024-01-08"
+        ]["account"]["balance"] == (INIT + 510)
+
+    def test_split_backtest_days(self):
+        start, end = datetime(2024, 1, 1, 9), date(2024, 1, 10)
+        assert split_backtest_days(start, end, 3) == [
+            (start, date(2024, 1, 3)),
+            (date(2024, 1, 4), date(2024, 1, 6)),
+            (date(2024, 1, 7), end),
+        ]
+        assert split_backtest_days(date(2024, 1, 1), date(2024, 1, 2), 5) == [
+            (date(2024, 1, 1), date(2024, 1, 1)),
+            (date(2024, 1, 2), date(2024, 1, 2)),
+        ]
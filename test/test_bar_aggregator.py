@@ -0,0 +1,157 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import FakeApi
+from tqsdk.datetime import _get_trading_day_from_timestamp
+
+from utils.bar_aggregator import BarAggregator, aggregate_bars
+from utils.kline_hub import KlineHub
+
+CST = timezone(timedelta(hours=8))
+SESSIONS = (
+    ((9, 0), (10, 15)),
+    ((10, 30), (11, 30)),
+    ((13, 30), (15, 0)),
+    ((21, 0), (23, 0)),
+)
+KLINE_NAMES = ["open", "high", "low", "close", "volume", "open_oi", "close_oi"]
+
+
+def _to_ns(dt: datetime) -> int:
+    return int(dt.timestamp()) * 10**9
+
+
+def make_base(days: int, seed: int = 0) -> pd.DataFrame:
+    """生成包含日盘和夜盘的5分钟K线, 周末不交易"""
+    rng = np.random.default_rng(seed)
+    times = []
+    day = datetime(2024, 1, 1, tzinfo=CST)
+    end = day + timedelta(days=days)
+    while day < end:
+        if day.weekday() < 5:
+            for (sh, sm), (eh, em) in SESSIONS:
+                t = day.replace(hour=sh, minute=sm)
+                while t < day.replace(hour=eh, minute=em):
+                    times.append(_to_ns(t))
+                    t += timedelta(minutes=5)
+        day += timedelta(days=1)
+    n = len(times)
+    close = 3000 + np.cumsum(rng.normal(0, 5, n))
+    open_p = close + rng.normal(0, 2, n)
+    return pd.DataFrame(
+        {
+            "datetime": np.array(times, dtype=float),
+            "id": np.arange(n, dtype=float),
+            "open": open_p,
+            "high": np.maximum(open_p, close) + 1,
+            "low": np.minimum(open_p, close) - 1,
+            "close": close,
+            "volume": rng.integers(1, 100, n).astype(float),
+            "open_oi": rng.integers(1000, 2000, n).astype(float),
+            "close_oi": rng.integers(1000, 2000, n).astype(float),
+            "symbol": "SHFE.rb2405",
+            "duration": 300.0,
+        }
+    )
+
+
+def reference_bars(base: pd.DataFrame, duration: int) -> pd.DataFrame:
+    if duration == 86400:
+        keys = [
+            _get_trading_day_from_timestamp(int(dt)) for dt in base.datetime
+        ]
+    else:
+        local = pd.to_datetime(base.datetime, unit="ns", utc=True)
+        local = local.dt.tz_convert("Asia/Shanghai")
+        floored = local.dt.floor(f"{duration}s")
+        keys = floored.dt.tz_convert("UTC").astype("int64")
+    grouped = base.groupby(np.asarray(keys), sort=True)
+    return pd.DataFrame(
+        {
+            "open": grouped.open.first(),
+            "high": grouped.high.max(),
+            "low": grouped.low.min(),
+            "close": grouped.close.last(),
+            "volume": grouped.volume.sum(),
+            "open_oi": grouped.open_oi.first(),
+            "close_oi": grouped.close_oi.last(),
+        }
+    )
+
+
+class TestClass:
+    @pytest.mark.parametrize("duration", [300, 1800, 10800, 86400])
+    def test_aggregate_matches_groupby(self, duration):
+        base = make_base(10)
+        bars = aggregate_bars(base, duration)
+        expected = reference_bars(base, duration)
+        assert np.array_equal(bars["datetime"], expected.index.to_numpy(float))
+        for name in KLINE_NAMES:
+            assert np.allclose(bars[name], expected[name].to_numpy()), name
+
+    def test_night_session_belongs_to_next_trading_day(self):
+        base = make_base(10)
+        bars = aggregate_bars(base, 86400)
+        days = [
+            datetime.fromtimestamp(dt / 10**9, CST).strftime("%a")
+            for dt in bars["datetime"]
+        ]
+        # 2024-01-01 是周一, 周一没有前一晚的夜盘, 周五夜盘属于下周一
+        assert days[:6] == ["Mon", "Tue", "Wed", "Thu", "Fri", "Mon"]
+        three_hours = aggregate_bars(base, 10800)
+        hours = {
+            datetime.fromtimestamp(dt / 10**9, CST).hour
+            for dt in three_hours["datetime"]
+        }
+        assert hours == {9, 12, 21}
+
+    def test_sync_matches_rebuild_while_base_slides(self):
+        full = make_base(12, seed=3)
+        window = 600
+        base = full.iloc[:window].reset_index(drop=True)
+        aggregator = BarAggregator(base, 1800, 50)
+        klines = aggregator.klines
+        klines["ema"] = klines["close"]
+        new_bars = 0
+        for stop in range(window + 1, len(full)):
+            rows = full.iloc[stop - window : stop].reset_index(drop=True)
+            # 先模拟正在变化的最后一根K线, 再给出完整的K线
+            forming = rows.copy()
+            forming.loc[window - 1, "close"] = forming.open.iloc[-1]
+            changed = False
+            for frame in (forming, rows):
+                for name in frame.columns:
+                    base[name] = frame[name].to_numpy()
+                changed |= aggregator.sync()
+            new_bars += changed
+            assert aggregator.klines is klines
+            if changed:
+                assert np.isnan(klines["ema"].iat[-1])
+            expected = BarAggregator(base, 1800, 50).klines
+            for name in KLINE_NAMES + ["datetime"]:
+                assert np.allclose(
+                    klines[name].to_numpy()[-40:],
+                    expected[name].to_numpy()[-40:],
+                ), name
+            assert np.all(np.diff(klines["id"].to_numpy()[-40:]) == 1)
+        assert new_bars > 0
+        # 没有更新时不生成新K线
+        assert not aggregator.sync()
+
+    def test_hub_aggregates_intraday_serials_from_one_subscription(self):
+        api = FakeApi(klines=make_base(30))
+        hub = KlineHub(api, aggregate=True)
+        klines = [
+            hub.get_kline_serial("SHFE.rb2405", duration)
+            for duration in (300, 1800, 10800)
+        ]
+        assert api.calls == 1
+        assert hub.stats()["aggregated"] == 3
+        assert klines[1].duration.iat[-1] == 1800
+        hub.update()
+        assert not hub.is_changing(klines[1])
+        for k in klines:
+            hub.release_kline_serial("SHFE.rb2405", int(k.duration.iat[-1]))
+        assert hub.stats()["serials"] == 0
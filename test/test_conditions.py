@@ -0,0 +1,104 @@
+"""开仓条件的向量化计算与逐根K线判断的结果对比
+
+data/conditions_baseline.npz 中保存了模拟的K线(价格为千分之一的整数, 前5根为 NaN),
+以及改为向量化计算之前(34ac3df)的主策略对每根K线判断的条件序号, 各列的名称见 names:
+做多日线, 各日线条件序号和3小时线交叉距离下的做多3小时线, 做多30分钟线和5分钟线,
+前一根日线是否满足不开仓条件时的做空日线, 做空3小时线,
+以及30分钟线是否在两日内交叉时的做空30分钟线。
+基准数据由 data/record_conditions_baseline.py 在 34ac3df 上生成。
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import strategies.conditions as conditions
+from strategies.trade_strategies.mts.mts_long import MainLongTradeStrategy
+
+BASELINE_FILE = Path(__file__).parent / "data" / "conditions_baseline.npz"
+# 保存为整数的 NaN
+NAN_VALUE = np.iinfo(np.int64).min
+
+
+@pytest.fixture(params=range(5))
+def baseline(request) -> tuple[pd.DataFrame, dict]:
+    """EMA 彼此接近的模拟K线, 以覆盖尽量多的条件分支, 以及各条件的基准结果"""
+    with np.load(BASELINE_FILE) as data:
+        values = data[f"klines_{request.param}"]
+        klines = pd.DataFrame(values / 1000, columns=list(data["columns"]))
+        klines[values == NAN_VALUE] = np.nan
+        results = data[f"results_{request.param}"]
+        expected = dict(zip(data["names"], results.T))
+    return klines, expected
+
+
+def assert_same(result, expected):
+    np.testing.assert_array_equal(result, expected.astype(float))
+
+
+class TestClass:
+    def test_main_long_daily(self, baseline):
+        klines, expected = baseline
+        assert_same(conditions.main_long_daily(klines), expected["long_daily"])
+        assert set(expected["long_daily"]) == {0, 1, 2, 3, 4, 5}
+
+    @pytest.mark.parametrize("d_cond", [0, 1, 2, 3, 4, 5, np.nan])
+    @pytest.mark.parametrize("c2", [True, False])
+    def test_main_long_3h(self, baseline, d_cond, c2):
+        klines, expected = baseline
+        assert_same(
+            conditions.main_long_3h(klines, d_cond, c2),
+            expected[f"long_3h_{d_cond}_{c2}"],
+        )
+
+    def test_main_long_minute(self, baseline):
+        klines, expected = baseline
+        result = conditions.main_long_minute(klines)
+        assert_same(result, expected["long_30m"])
+        assert_same(result, expected["long_5m"])
+
+    def test_main_short(self, baseline):
+        klines, expected = baseline
+        assert_same(conditions.main_short_3h(klines), expected["short_3h"])
+        for is_within_2days in (True, False):
+            assert_same(
+                conditions.main_short_30m(klines, is_within_2days),
+                expected[f"short_30m_{is_within_2days}"],
+            )
+        for has_no_matched_cond in (True, False):
+            assert_same(
+                conditions.main_short_daily(klines, has_no_matched_cond),
+                expected[f"short_daily_{has_no_matched_cond}"],
+            )
+
+    def test_kline_condition_is_cached_after_one_pass(
+        self, baseline, make_bt_staker
+    ):
+        klines, _ = baseline
+        (trader,) = make_bt_staker(lazy_kline=True).traders
+        strategy = next(
+            s
+            for s in trader.trade_strategies
+            if isinstance(s, MainLongTradeStrategy)
+        )
+        calls = []
+
+        def evaluate(frame):
+            calls.append(1)
+            return conditions.main_long_minute(frame)
+
+        expected = conditions.main_long_minute(klines)
+        value, is_new = strategy._get_kline_condition(
+            klines, -2, "l_condition", evaluate
+        )
+        assert is_new and value == expected[-2]
+        value, is_new = strategy._get_kline_condition(
+            klines, -2, "l_condition", evaluate
+        )
+        assert not is_new and value == expected[-2]
+        # 已完成的K线一次性缓存, 正在变化的最后一根K线不缓存
+        assert not klines.l_condition.iloc[:-1].isna().any()
+        assert np.isnan(klines.l_condition.iloc[-1])
+        assert len(calls) == 1
@@ -0,0 +1,131 @@
+"""K线交叉查找与逐行遍历实现的结果对比
+
+data/crossover_baseline.npz 中保存了模拟的30分钟线和日线, 以及改为向量化查找之前
+(34ac3df)的策略在每个200根K线窗口上的判断结果和倒序逐行遍历停止的位置
+(遍历完所有K线时为 -1), 每行依次为: 窗口结束位置,
+主策略 _match_3hk_c2_distance 的结果和停止位置, is_within_2days 的结果和停止位置,
+摸底策略以最后一根和倒数第15根K线为最近满足条件的K线时, _is_within_distance
+的停止位置, 以及前一交易日 MACD 满足和不满足时的结果。
+基准数据由 data/record_crossover_baseline.py 在 34ac3df 上生成。
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import REPLAY_END, REPLAY_START
+
+import strategies.tools as tools
+from exe_departments.stakers import RealStaker
+from strategies.indicators import CrossIndex, get_indicator_hub
+from strategies.trade_strategies.bts.bts_long import BottomLongTradeStrategy
+from strategies.trade_strategies.mts.mts_short import MainShortTradeStrategy
+from utils.replay_api import ReplayApi
+
+BASELINE_FILE = Path(__file__).parent / "data" / "crossover_baseline.npz"
+WINDOW = 200
+# 日线窗口的根数
+DAILY_WINDOW = 60
+
+
+def load_baseline(seed: int) -> tuple[pd.DataFrame, pd.DataFrame, np.ndarray]:
+    with np.load(BASELINE_FILE) as data:
+        columns = list(data["columns"])
+        m30 = pd.DataFrame(data[f"m30_{seed}"], columns=columns)
+        daily = pd.DataFrame(data[f"daily_{seed}"], columns=columns)
+        return m30, daily, data[f"results_{seed}"]
+
+
+def get_strategy(staker, cls):
+    (trader,) = staker.traders
+    return next(s for s in trader.trade_strategies if type(s) is cls)
+
+
+def get_results(main, bottom, m30, daily) -> list[int]:
+    """在K线窗口上运行策略的判断和交叉查找, 顺序与基准结果一致"""
+    get_indicator_hub().clear()
+    main._intraday_klines[3] = m30
+    main._intraday_klines[4] = m30
+    main._d_klines = daily
+    bottom._intraday_klines[4] = m30
+    crosses = CrossIndex()
+    crosses.sync(m30)
+    # 倒序遍历在最近的 EMA9 <= EMA60 处停止
+    _, k2 = tools.find_ema_cross_ids(crosses)
+    k2_stop = int(np.flatnonzero(m30.id == k2)[0]) if k2 else -1
+    results = [main._match_3hk_c2_distance(), k2_stop]
+    pos, is_found = tools.find_last_cross_pos(crosses)
+    stop = pos if is_found or pos == len(m30) - 1 else -1
+    results += [main.is_within_2days(), stop]
+    for pos in (-1, -15):
+        kline = m30.iloc[pos]
+        results.append(tools.find_last_below_pos(crosses, kline.datetime))
+        for is_macd_matched in (True, False):
+            results.append(bottom._is_within_distance(kline, is_macd_matched))
+    return results
+
+
+def make_klines(size: int, seed: int) -> pd.DataFrame:
+    """生成带有 EMA 指标的模拟K线, 前几根K线以 NaN 填充"""
+    rng = np.random.default_rng(seed)
+    close = 3000 + np.cumsum(rng.normal(0, 15, size))
+    klines = pd.DataFrame(
+        {
+            "id": np.arange(1000, 1000 + size, dtype=float),
+            "datetime": np.arange(size, dtype=float) * 1800e9,
+            "close": close,
+        }
+    )
+    for n in (5, 9, 22, 60):
+        klines[f"ema{n}"] = (
+            klines.close.ewm(span=n, adjust=False).mean().round(3)
+        )
+    klines.iloc[:3] = np.nan
+    return klines
+
+
+def find_all(crosses: CrossIndex, klines: pd.DataFrame) -> tuple:
+    return (
+        tools.find_last_cross_pos(crosses),
+        tools.find_ema_cross_ids(crosses),
+        [
+            tools.find_last_below_pos(crosses, before)
+            for before in klines.datetime.iloc[[10, 150, -1]]
+        ],
+    )
+
+
+class TestClass:
+    @pytest.mark.parametrize("seed", range(4))
+    def test_strategies_match_baseline(
+        self, replay_dir, memory_storage, real_configs, seed
+    ):
+        api = ReplayApi(replay_dir, REPLAY_START, REPLAY_END, 1e6)
+        staker = RealStaker(api, 2, [1, 2])
+        main = get_strategy(staker, MainShortTradeStrategy)
+        bottom = get_strategy(staker, BottomLongTradeStrategy)
+        m30, daily, baseline = load_baseline(seed)
+        for end, *expected in baseline:
+            m30_w = m30.iloc[end - WINDOW : end].reset_index(drop=True)
+            daily_w = daily[daily.datetime <= m30_w.datetime.iloc[-1]]
+            daily_w = daily_w.iloc[-DAILY_WINDOW:].reset_index(drop=True)
+            results = get_results(main, bottom, m30_w, daily_w)
+            assert results == expected, f"窗口结束位置 {end}"
+
+    def test_cross_index_refreshes_last_kline_without_rebuild(self):
+        klines = make_klines(200, 3)
+        crosses = CrossIndex()
+        crosses.sync(klines)
+        # 模拟最后一根K线价格在 EMA60 上下波动, 结果与重建的索引相同
+        for close in (2500.0, 3500.0, 2500.0):
+            klines.loc[199, ["close", "ema9", "ema22"]] = close
+            crosses.sync(klines)
+            rebuilt = CrossIndex()
+            rebuilt.sync(klines)
+            assert find_all(crosses, klines) == find_all(rebuilt, klines)
+        assert crosses.rebuild_count == 1
+        # 新K线生成后重建索引
+        klines["id"] += 1
+        crosses.sync(klines)
+        assert crosses.rebuild_count == 2
@@ -0,0 +1,36 @@
+from exe_departments.dispatchers import TraderDispatcher
+from utils.tqsdk_tools import get_changed_symbols
+
+
+class FakeTrader:
+    def __init__(self, *symbols):
+        self.symbols = set(symbols)
+
+
+class TestClass:
+    def test_changed_symbols_from_diffs(self, fake_api):
+        fake_api._sync_diffs = [
+            {"quotes": {"KQ.m@SHFE.rb": {"last_price": 1.0}}},
+            {"klines": {"SHFE.rb2405": {"300000000000": {}}}, "trade": {}},
+        ]
+        assert get_changed_symbols(fake_api) == {"KQ.m@SHFE.rb", "SHFE.rb2405"}
+        assert get_changed_symbols(object()) is None
+
+    def test_dispatcher_wakes_only_dependent_traders(self):
+        rb = FakeTrader("KQ.m@SHFE.rb", "SHFE.rb2405", "SHFE.rb2410")
+        cu = FakeTrader("KQ.m@SHFE.cu", "SHFE.cu2405", "SHFE.cu2406")
+        au = FakeTrader("KQ.m@SHFE.au", "SHFE.au2406", "SHFE.au2412")
+        dispatcher = TraderDispatcher([rb, cu, au])
+        assert dispatcher.get_traders({"SHFE.rb2410"}) == [rb]
+        assert dispatcher.get_traders({"SHFE.au2406", "KQ.m@SHFE.rb"}) == [
+            rb,
+            au,
+        ]
+        assert dispatcher.get_traders(set()) == []
+        assert dispatcher.get_traders(None) == [rb, cu, au]
+        assert dispatcher.stats() == {
+            "traders": 3,
+            "symbols": 9,
+            "updates": 4,
+            "dispatched": 6,
+        }
@@ -0,0 +1,108 @@
+import os
+from datetime import datetime
+
+import pytest
+from mongoengine import connect, disconnect
+from pymongo.errors import PyMongoError
+
+import dao.indexes as indexes
+import dao.trade.storage as storage
+from dao.odm.future_trade import BottomOpenVolumeTip
+
+# 需要本地 mongod, 可通过 TEST_MONGO_URL 指定
+MONGO_URL = os.environ.get("TEST_MONGO_URL", "mongodb://localhost:27017")
+TEST_DB = "future_trade_index_test"
+
+
+@pytest.fixture
+def mongo_db():
+    connect(
+        db=TEST_DB,
+        host=MONGO_URL,
+        tz_aware=True,
+        serverSelectionTimeoutMS=500,
+    )
+    try:
+        client = indexes.MainTradeStatus._get_db().client
+        client.admin.command("ping")
+    except PyMongoError:
+        disconnect()
+        pytest.skip("本地 mongod 不可用")
+    yield client
+    client.drop_database(TEST_DB)
+    disconnect()
+
+
+class TestClass:
+    def test_plan_stages_are_collected_recursively(self):
+        plans = {
+            "indexed": {
+                "queryPlanner": {
+                    "winningPlan": {
+                        "stage": "LIMIT",
+                        "inputStage": {
+                            "stage": "FETCH",
+                            "inputStage": {"stage": "IXSCAN"},
+                        },
+                    }
+                }
+            },
+            "scanned": {
+                "queryPlanner": {
+                    "winningPlan": {
+                        "queryPlan": {
+                            "stage": "SORT",
+                            "inputStage": {"stage": "COLLSCAN"},
+                        }
+                    },
+                    "rejectedPlans": [],
+                }
+            },
+        }
+        assert indexes.get_plan_stages(plans["indexed"]) == {
+            "LIMIT",
+            "FETCH",
+            "IXSCAN",
+        }
+        assert indexes.get_collscan_queries(plans) == ["scanned"]
+
+    def test_indexed_documents_declare_indexes(self):
+        for doc_cls in indexes.INDEXED_DOCUMENTS:
+            assert doc_cls._meta["index_specs"], doc_cls.__name__
+
+    def test_hot_queries_are_recorded_from_dao(self, memory_storage):
+        for name, func in indexes.HOT_QUERIES.items():
+            queries = indexes.record_queries(func)
+            assert queries, name
+        assert storage.get_storage() is memory_storage
+        # 先查询最近一日, 再查询该日的所有提示, 未指定排序时使用模型的默认排序
+        last, tips = indexes.record_queries(
+            indexes.HOT_QUERIES["last_bottom_open_volume_tips"]
+        )
+        assert last == ("find_one", BottomOpenVolumeTip, "-dkline_time", {})
+        assert tips == (
+            "find",
+            BottomOpenVolumeTip,
+            None,
+            {"dkline_time": None},
+        )
+        (count,) = indexes.record_queries(
+            indexes.HOT_QUERIES["bottom_open_volume_tips_last_7d"]
+        )
+        assert count == (
+            "count",
+            BottomOpenVolumeTip,
+            None,
+            {
+                "symbol": "SHFE.rb2405",
+                "direction": 1,
+                "dkline_time__gte": datetime(2023, 12, 26),
+            },
+        )
+
+    def test_no_hot_query_scans_collection(self, mongo_db):
+        assert indexes.ensure_indexes() == {}
+        plans = indexes.explain_hot_queries()
+        names = {name.partition("[")[0] for name in plans}
+        assert names == set(indexes.HOT_QUERIES) | set(indexes.DIRECT_QUERIES)
+        assert indexes.get_collscan_queries(plans) == []
@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+import pytest
+from tqsdk.ta import EMA, MACD
+
+from strategies.indicators import (
+    BOTTOM_EMA_PERIODS,
+    MAIN_EMA_PERIODS,
+    IndicatorEngine,
+    IndicatorHub,
+    get_indicator_hub,
+)
+
+KLINE_LENGTH = 200
+
+
+@pytest.fixture
+def prices():
+    rng = np.random.default_rng(7)
+    return 3000 + np.cumsum(rng.normal(0, 20, 1500))
+
+
+def make_klines(prices, last_id: int, last_close=None) -> pd.DataFrame:
+    """模拟天勤K线序列, 不足长度的部分以 NaN 填充"""
+    ids = np.arange(last_id - KLINE_LENGTH + 1, last_id + 1)
+    closes = np.array([prices[i] if i >= 0 else np.nan for i in ids])
+    if last_close is not None:
+        closes[-1] = last_close
+    return pd.DataFrame(
+        {"id": np.where(ids >= 0, ids, np.nan), "close": closes}
+    )
+
+
+def assert_same_as_tqsdk(klines: pd.DataFrame):
+    for n in MAIN_EMA_PERIODS:
+        expected = EMA(klines, n).round(3).ema.to_numpy()
+        np.testing.assert_allclose(klines[f"ema{n}"], expected, atol=1e-3)
+    macd = MACD(klines, 12, 24, 4).round({"bar": 3})
+    np.testing.assert_allclose(klines["MACD.close"], macd["bar"], atol=1e-3)
+    np.testing.assert_allclose(klines["diff"], macd["diff"], atol=1e-8)
+    np.testing.assert_allclose(klines["dea"], macd["dea"], atol=1e-8)
+
+
+class TestClass:
+    def test_incremental_matches_full_recompute(self, prices):
+        engine = IndicatorEngine(MAIN_EMA_PERIODS)
+        for last_id in range(60, 400):
+            # 先模拟K线生成过程中价格变化, 再模拟K线完成
+            klines = make_klines(prices, last_id, prices[last_id] + 3.5)
+            engine.update(klines)
+            assert_same_as_tqsdk(klines)
+            klines = make_klines(prices, last_id)
+            engine.update(klines)
+            assert_same_as_tqsdk(klines)
+        assert engine.full_count == 1
+
+    def test_skipped_bars_use_incremental_update(self, prices):
+        engine = IndicatorEngine(MAIN_EMA_PERIODS)
+        engine.update(make_klines(prices, 400))
+        klines = make_klines(prices, 437)
+        engine.update(klines)
+        assert_same_as_tqsdk(klines)
+        assert engine.incremental_count == 1
+
+    def test_rewritten_history_falls_back_to_full(self, prices):
+        engine = IndicatorEngine(MAIN_EMA_PERIODS)
+        engine.update(make_klines(prices, 400))
+        changed = prices.copy()
+        changed[350] += 50
+        klines = make_klines(changed, 401)
+        engine.update(klines)
+        assert_same_as_tqsdk(klines)
+        assert engine.full_count == 2
+        engine.update(make_klines(prices, 900))
+        assert engine.full_count == 3
+
+    def test_hub_computes_shared_klines_once(self, prices):
+        hub = IndicatorHub()
+        klines = make_klines(prices, 300)
+        # 多空两个主策略和一个摸底策略共用同一个K线序列
+        hub.fill("SHFE.rb2405", 1800, MAIN_EMA_PERIODS, klines)
+        hub.fill("SHFE.rb2405", 1800, MAIN_EMA_PERIODS, klines)
+        hub.fill("SHFE.rb2405", 1800, BOTTOM_EMA_PERIODS, klines)
+        hub.fill("SHFE.rb2405", 1800, MAIN_EMA_PERIODS, klines)
+        assert hub.stats()["engines"] == 1
+        assert hub.computed_count == 2
+        assert hub.saved_count == 2
+        assert_same_as_tqsdk(klines)
+        for n in BOTTOM_EMA_PERIODS:
+            assert f"ema{n}" in klines.columns
+
+    def test_hub_fills_copied_klines_without_recompute(self, prices):
+        hub = IndicatorHub()
+        klines = make_klines(prices, 300)
+        copied = klines.copy()
+        hub.fill("SHFE.rb2405", 86400, MAIN_EMA_PERIODS, klines)
+        hub.fill("SHFE.rb2405", 86400, MAIN_EMA_PERIODS, copied)
+        assert hub.computed_count == 1
+        assert hub.saved_count == 1
+        assert_same_as_tqsdk(copied)
+
+    def test_cross_index_rebuilds_only_on_new_kline(self, prices):
+        hub = IndicatorHub()
+        crosses = hub.get_cross_index("SHFE.rb2405", 1800)
+        for last_close in (3000.0, 3100.0, None):
+            klines = make_klines(prices, 300, last_close)
+            hub.fill("SHFE.rb2405", 1800, MAIN_EMA_PERIODS, klines)
+            crosses.sync(klines)
+        assert crosses.rebuild_count == 1
+        klines = make_klines(prices, 301)
+        hub.fill("SHFE.rb2405", 1800, MAIN_EMA_PERIODS, klines)
+        crosses.sync(klines)
+        assert crosses.rebuild_count == 2
+
+    def test_strategies_fill_each_kline_type(self, make_bt_staker):
+        """每种K线按各自的周期填充指标, 结果与单独计算相同"""
+        staker = make_bt_staker()
+        (trader,) = staker.traders
+        hub = get_indicator_hub()
+        durations = {2: 86400, 3: 10800, 4: 1800, 5: 300}
+        for strategy in trader.trade_strategies:
+            hub.clear()
+            for k_type in (2,) + strategy.intraday_types:
+                if k_type == 2:
+                    klines = strategy._d_klines
+                else:
+                    klines = strategy._intraday_klines[k_type]
+                duration = durations[k_type]
+                assert klines["duration"].iat[-1] == duration
+                strategy._fill_indicators(k_type, klines)
+                assert hub._engines[(strategy.symbol, duration)].is_current(
+                    klines
+                )
+                expected = klines[["id", "close"]].copy()
+                IndicatorEngine(strategy.ema_periods).update(expected)
+                for n in strategy.ema_periods:
+                    np.testing.assert_array_equal(
+                        klines[f"ema{n}"], expected[f"ema{n}"]
+                    )
+            assert hub.stats()["engines"] == 1 + len(strategy.intraday_types)
@@ -0,0 +1,26 @@
+from utils.kline_hub import KlineHub
+
+
+class TestClass:
+    def test_same_subscription_returns_shared_serial(self, fake_api):
+        hub = KlineHub(fake_api)
+        first = hub.get_kline_serial("SHFE.rb2405", 1800)
+        second = hub.get_kline_serial("SHFE.rb2405", 1800, 200)
+        assert first is second
+        assert hub.get_quote("SHFE.rb2405") is hub.get_quote("SHFE.rb2405")
+        assert fake_api.calls == 2
+        stats = hub.stats()
+        assert stats["serials"] == 1
+        assert stats["refs"] == 2
+        assert stats["memory"] > 0
+
+    def test_release_drops_serial_when_unused(self, fake_api):
+        hub = KlineHub(fake_api)
+        hub.get_kline_serial("SHFE.rb2405", 1800)
+        hub.get_kline_serial("SHFE.rb2405", 1800)
+        hub.release_kline_serial("SHFE.rb2405", 1800)
+        assert hub.stats()["serials"] == 1
+        hub.release_kline_serial("SHFE.rb2405", 1800)
+        assert hub.stats()["serials"] == 0
+        # 释放未订阅的序列不报错
+        hub.release_kline_serial("SHFE.rb2405", 1800)
@@ -0,0 +1,119 @@
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from utils.kline_store import KlineStore, read_downloaded_csv
+from utils.replay_api import ReplayApi, to_ns
+
+FIVE_MINUTES = 300
+
+
+def make_frame(base, underlying=None):
+    """2024-01-02 至 01-04 每天 9:00 至 15:00 的5分钟线, 收盘价每根加一"""
+    starts = [
+        pd.Timestamp(day) + pd.Timedelta(minutes=5 * i, hours=9)
+        for day in ("2024-01-02", "2024-01-03", "2024-01-04")
+        for i in range(72)
+    ]
+    close = base + np.arange(1, len(starts) + 1, dtype=float)
+    frame = pd.DataFrame(
+        {
+            "datetime": to_ns(pd.Series(starts).astype(str)),
+            "open": close - 1,
+            "high": close + 0.5,
+            "low": close - 1.5,
+            "close": close,
+            "volume": 10.0,
+        }
+    )
+    if underlying is not None:
+        frame["underlying_symbol"] = underlying
+    return frame
+
+
+class TestClass:
+    def test_write_merge_and_read(self, tmp_path):
+        store = KlineStore(str(tmp_path / "store"))
+        frame = make_frame(3000)
+        first = frame.iloc[:100]
+        assert (
+            store.write(
+                "SHFE.rb2405",
+                FIVE_MINUTES,
+                first,
+                date(2024, 1, 2),
+                date(2024, 1, 3),
+            )
+            == 100
+        )
+        # 重叠部分使用新数据
+        update = frame.iloc[50:].assign(close=frame["close"].iloc[50:] + 0.5)
+        assert store.write("SHFE.rb2405", FIVE_MINUTES, update) == len(frame)
+        assert store.symbols() == ["SHFE.rb2405"]
+        assert store.durations("SHFE.rb2405") == [FIVE_MINUTES]
+        columns = store.read("SHFE.rb2405", FIVE_MINUTES)
+        assert isinstance(columns["close"], np.memmap)
+        assert columns["close"][49] == frame["close"].iat[49]
+        assert columns["close"][50] == frame["close"].iat[50] + 0.5
+        day = store.read(
+            "SHFE.rb2405", FIVE_MINUTES, date(2024, 1, 3), date(2024, 1, 4)
+        )
+        assert len(day["datetime"]) == 72
+        assert day["datetime"][0] == to_ns(pd.Series(["2024-01-03 09:00"]))[0]
+        assert store.covers(
+            "SHFE.rb2405",
+            FIVE_MINUTES,
+            date(2024, 1, 2),
+            datetime(2024, 1, 4, 15),
+        )
+        assert not store.covers(
+            "SHFE.rb2405", FIVE_MINUTES, date(2024, 1, 2), date(2024, 1, 5)
+        )
+
+    def test_read_downloaded_csv(self, tmp_path):
+        path = tmp_path / "download.csv"
+        pd.DataFrame(
+            {
+                "datetime": ["2024-01-02 09:00:00.000000000"],
+                "datetime_nano": [1704157200000000000],
+                "SHFE.rb2405.open": [3000.0],
+                "SHFE.rb2405.high": [3002.0],
+                "SHFE.rb2405.low": [2999.0],
+                "SHFE.rb2405.close": [3001.0],
+                "SHFE.rb2405.volume": [10],
+                "SHFE.rb2405.open_oi": [100],
+                "SHFE.rb2405.close_oi": [101],
+            }
+        ).to_csv(path, index=False)
+        frame = read_downloaded_csv(str(path), "SHFE.rb2405")
+        assert frame.iloc[0].tolist() == [
+            1704157200000000000,
+            3000,
+            3002,
+            2999,
+            3001,
+            10,
+            100,
+            101,
+        ]
+
+    def test_replay_from_store(self, tmp_path):
+        store = KlineStore(str(tmp_path / "store"))
+        store.write(
+            "KQ.m@SHFE.au",
+            FIVE_MINUTES,
+            make_frame(400, "SHFE.au2406"),
+        )
+        store.write("SHFE.rb2405", FIVE_MINUTES, make_frame(3000))
+        store.write_instruments(
+            pd.DataFrame([{"symbol": "SHFE.rb2405", "volume_multiple": 10}])
+        )
+        assert KlineStore.is_store(store.root)
+        api = ReplayApi(store.root, date(2024, 1, 3), date(2024, 1, 4), 1e6)
+        quote = api.get_quote("KQ.m@SHFE.au")
+        assert quote.datetime == "2024-01-03 09:04:59.999999"
+        assert quote.underlying_symbol == "SHFE.au2406"
+        assert api.get_quote("SHFE.rb2405").volume_multiple == 10
+        daily = api.get_kline_serial("SHFE.rb2405", 86400, 3)
+        assert daily["close"].tolist()[1:] == [3072, 3073]
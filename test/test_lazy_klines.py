@@ -0,0 +1,51 @@
+from strategies.trade_strategies.mts.mts_short import MainShortTradeStrategy
+
+
+def get_strategy(staker) -> MainShortTradeStrategy:
+    (trader,) = staker.traders
+    return next(
+        s
+        for s in trader.trade_strategies
+        if isinstance(s, MainShortTradeStrategy)
+    )
+
+
+class TestClass:
+    def test_lazy_mode_subscribes_on_first_use(self, make_bt_staker):
+        strategy = get_strategy(make_bt_staker(lazy_kline=True))
+        hub = strategy.config.kline_hub
+        refs = hub.stats()["refs"]
+        assert strategy._intraday_klines == {}
+        assert not strategy.is_changing(1)
+        klines = strategy._3h_klines
+        assert strategy._3h_klines is klines
+        assert list(strategy._intraday_klines) == [3]
+        assert hub.stats()["refs"] == refs + 1
+        # 订阅时填充指标
+        assert {"ema60", "MACD.close"} <= set(klines.columns)
+        assert not strategy.is_changing(2)
+
+    def test_lazy_mode_releases_when_not_needed(
+        self, make_bt_staker, monkeypatch
+    ):
+        strategy = get_strategy(make_bt_staker(lazy_kline=True))
+        hub = strategy.config.kline_hub
+        refs = hub.stats()["refs"]
+        monkeypatch.setattr(strategy, "_need_intraday_klines", lambda: True)
+        strategy._30m_klines
+        strategy._try_release_intraday_klines()
+        assert hub.stats()["refs"] == refs + 1
+        monkeypatch.setattr(strategy, "_need_intraday_klines", lambda: False)
+        strategy._try_release_intraday_klines()
+        assert hub.stats()["refs"] == refs
+        assert strategy._intraday_klines == {}
+        assert not strategy.is_changing(2)
+
+    def test_default_mode_keeps_all_serials(self, make_bt_staker):
+        strategy = get_strategy(make_bt_staker())
+        hub = strategy.config.kline_hub
+        refs = hub.stats()["refs"]
+        assert set(strategy._intraday_klines) == {3, 4, 5}
+        strategy._try_release_intraday_klines()
+        assert set(strategy._intraday_klines) == {3, 4, 5}
+        assert hub.stats()["refs"] == refs
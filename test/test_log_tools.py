@@ -0,0 +1,76 @@
+import json
+import logging
+
+from utils.log_tools import JsonFormatter, LoggerGetter, LogQueue, log_event
+
+
+class ListHandler(logging.Handler):
+    def __init__(self, level=logging.NOTSET):
+        super().__init__(level)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class Unprintable:
+    def __str__(self):
+        raise AssertionError("日志等级未启用时不应格式化")
+
+
+class Trader:
+    logger = LoggerGetter()
+
+
+class BTTrader(Trader):
+    pass
+
+
+class TestClass:
+    def test_logger_getter_is_cached_per_class(self):
+        trader = Trader()
+        assert trader.logger is logging.getLogger("Trader")
+        assert trader.logger is Trader().logger
+        assert BTTrader().logger.name == "BTTrader"
+        assert Trader.logger.name == "Trader"
+
+    def test_log_event_fields_in_json(self):
+        logger = logging.getLogger("test_log_event")
+        logger.propagate = False
+        handler = ListHandler()
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        log_event(logger, logging.DEBUG, "跳过", value=Unprintable())
+        log_event(logger, logging.INFO, "开仓", symbol="SHFE.rb2405", pos=2)
+        logger.removeHandler(handler)
+        assert len(handler.records) == 1
+        data = json.loads(JsonFormatter().format(handler.records[0]))
+        assert data["message"] == "开仓 symbol:SHFE.rb2405 pos:2"
+        assert data["event"] == "开仓"
+        assert data["fields"] == {"symbol": "SHFE.rb2405", "pos": 2}
+
+    def test_queue_keeps_handlers_and_levels(self):
+        logger = logging.getLogger("test_log_queue")
+        logger.propagate = False
+        debug_handler = ListHandler()
+        warning_handler = ListHandler(logging.WARNING)
+        logger.handlers = [debug_handler, warning_handler]
+        logger.setLevel(logging.DEBUG)
+        log_queue = LogQueue()
+        log_queue.start()
+        try:
+            assert logger.handlers[0] not in (debug_handler, warning_handler)
+            values = [1]
+            logger.debug("%s 手", values)
+            # 消息在调用线程中生成, 之后修改参数不影响输出
+            values.append(2)
+            logger.warning("警告")
+        finally:
+            log_queue.stop()
+        assert logger.handlers == [debug_handler, warning_handler]
+        assert [r.getMessage() for r in debug_handler.records] == [
+            "[1] 手",
+            "警告",
+        ]
+        assert [r.getMessage() for r in warning_handler.records] == ["警告"]
+        logger.handlers = []
@@ -0,0 +1,88 @@
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import dao.trade.storage as storage
+from dao.odm.future_trade import BottomOpenVolumeTip
+from dao.trade.storage import MemoryStorage, TimedStorage
+from utils.metrics import MetricsRegistry, get_metrics
+from utils.order_manager import ORDERS_IN_FLIGHT, OrderManager
+
+
+@pytest.fixture
+def enabled_metrics():
+    get_metrics().enabled = True
+    yield get_metrics()
+    get_metrics().enabled = False
+
+
+class TestClass:
+    def test_disabled_metrics_record_nothing(self):
+        registry = MetricsRegistry()
+        loops = registry.counter("loops_total", "循环次数")
+        seconds = registry.histogram(
+            "call_seconds", "调用时间", buckets=(1.0,)
+        )
+        loops.inc()
+        with seconds.time():
+            pass
+        seconds.observe(0.5)
+        assert loops.value() == 0
+        assert seconds.value() == {"count": 0, "avg": 0.0}
+
+    def test_prometheus_text_over_http(self):
+        registry = MetricsRegistry()
+        loops = registry.counter("loops_total", "循环次数")
+        seconds = registry.histogram(
+            "call_seconds", "调用时间", label="op", buckets=(0.1, 1.0)
+        )
+        depth = registry.gauge("queue_depth", "队列长度")
+        depth.set_function(lambda: 3)
+        registry.start(port=0)
+        try:
+            loops.inc()
+            loops.inc()
+            for value in (0.05, 0.5, 2.0):
+                seconds.labels("find").observe(value)
+            url = f"http://127.0.0.1:{registry.port}/metrics"
+            with urllib.request.urlopen(url, timeout=5) as response:
+                text = response.read().decode("utf-8")
+        finally:
+            registry.stop()
+        lines = text.splitlines()
+        assert "# TYPE loops_total counter" in lines
+        assert "loops_total 2.0" in lines
+        assert 'call_seconds_bucket{op="find",le="0.1"} 1' in lines
+        assert 'call_seconds_bucket{op="find",le="1.0"} 2' in lines
+        assert 'call_seconds_bucket{op="find",le="+Inf"} 3' in lines
+        assert 'call_seconds_count{op="find"} 3' in lines
+        assert "queue_depth 3.0" in lines
+        assert registry.summary()["call_seconds"]["find"]["count"] == 3
+        assert not registry.enabled
+
+    def test_timed_storage_records_each_call(
+        self, monkeypatch, enabled_metrics
+    ):
+        timed = TimedStorage(MemoryStorage())
+        monkeypatch.setattr(storage, "_storage", timed)
+        before = storage.DAO_CALL_SECONDS.labels("find").value()["count"]
+        tip = BottomOpenVolumeTip(
+            custom_symbol="SHFE_rb_bottom_long",
+            symbol="SHFE.rb2405",
+            direction=1,
+            dkline_time=datetime(
+                2024, 1, 2, tzinfo=timezone(timedelta(hours=8))
+            ),
+        )
+        storage.get_storage().save(tip)
+        assert storage.get_storage().find(BottomOpenVolumeTip) == [tip]
+        after = storage.DAO_CALL_SECONDS.labels("find").value()["count"]
+        assert after == before + 1
+
+    def test_orders_in_flight(self, fake_api):
+        # 不更新行情, 委托一直不完成
+        manager = OrderManager(fake_api, is_async=True)
+        manager.insert_order("rb", lambda order: None, symbol="SHFE.rb2405")
+        manager.insert_order("m", lambda order: None, symbol="DCE.m2405")
+        assert ORDERS_IN_FLIGHT.value() == 2
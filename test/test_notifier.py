@@ -0,0 +1,174 @@
+import smtplib
+import threading
+import time
+
+import strategies.tools as tools
+import utils.email_tools as email_tools
+from utils.notifier import (
+    EMAIL,
+    PUSHDEER,
+    Notifier,
+    SmtpTransport,
+    StubTransport,
+)
+
+
+class BlockingTransport(StubTransport):
+    """在 release 之前阻塞发送, 模拟缓慢的网络"""
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def send(self, title, content):
+        self.started.set()
+        self.release.wait(5)
+        super().send(title, content)
+
+
+class FakeSMTP:
+    instances = []
+    disconnect_next = False
+
+    def __init__(self, host, port, timeout=None):
+        self.messages = []
+        FakeSMTP.instances.append(self)
+
+    def login(self, user, password):
+        pass
+
+    def send_message(self, msg):
+        if FakeSMTP.disconnect_next:
+            FakeSMTP.disconnect_next = False
+            raise smtplib.SMTPServerDisconnected()
+        self.messages.append(msg["Subject"])
+
+    def quit(self):
+        pass
+
+
+def join_titles(items):
+    return [(PUSHDEER, "+".join(items), str(len(items)))]
+
+
+class TestClass:
+    def test_retries_in_background(self):
+        stub = StubTransport(fail_times=2)
+        notifier = Notifier({EMAIL: stub}, backoff=0)
+        notifier.start()
+        assert notifier.notify(EMAIL, "开仓提示", "<p>rb2405</p>")
+        notifier.stop()
+        assert stub.sent == [("开仓提示", "<p>rb2405</p>")]
+        assert notifier.stats() == {
+            "pending": 0,
+            "queued": 1,
+            "sent": 1,
+            "retried": 2,
+            "failed": 0,
+            "dropped": 0,
+            "digests": 0,
+            "coalesced": 0,
+        }
+
+    def test_gives_up_after_retries(self):
+        stub = StubTransport(fail_times=10)
+        notifier = Notifier({EMAIL: stub}, retries=2, backoff=0)
+        notifier.start()
+        notifier.notify(EMAIL, "平仓提示", "")
+        notifier.flush()
+        assert stub.attempts == 3
+        assert notifier.stats()["failed"] == 1
+        notifier.stop()
+        # 未启动后台线程时直接发送, 不重试
+        assert not notifier.notify(EMAIL, "平仓提示", "")
+        assert stub.attempts == 4
+
+    def test_drops_when_queue_is_full(self):
+        transport = BlockingTransport()
+        notifier = Notifier({EMAIL: transport}, max_pending=1)
+        notifier.start()
+        assert notifier.notify(EMAIL, "1", "")
+        transport.started.wait(5)
+        # 第一条消息正在发送, 第二条在队列中等待, 第三条被丢弃
+        assert notifier.notify(EMAIL, "2", "")
+        assert not notifier.notify(EMAIL, "3", "")
+        transport.release.set()
+        notifier.stop()
+        assert [title for title, _ in transport.sent] == ["1", "2"]
+        assert notifier.stats()["dropped"] == 1
+        assert not notifier.notify("unknown", "4", "")
+
+    def test_smtp_connection_is_reused(self, monkeypatch):
+        monkeypatch.setattr(smtplib, "SMTP_SSL", FakeSMTP)
+        FakeSMTP.instances = []
+        transport = SmtpTransport("smtp.test", 465, "me", "pwd", "you")
+        transport.send("a", "<p>a</p>")
+        transport.send("b", "<p>b</p>")
+        assert transport.connect_count == 1
+        # 连接被服务器关闭后重新连接
+        FakeSMTP.disconnect_next = True
+        transport.send("c", "<p>c</p>")
+        assert transport.connect_count == 2
+        assert [m.messages for m in FakeSMTP.instances] == [["a", "b"], ["c"]]
+
+    def test_templates_are_compiled_once(self):
+        template = email_tools.get_template("trade_pos_message.html")
+        assert email_tools.get_template("trade_pos_message.html") is template
+
+    def test_digest_coalesces_messages(self):
+        stub = StubTransport()
+        notifier = Notifier({PUSHDEER: stub}, digest_window=60)
+        notifier.start()
+        for title in ("a", "b", "c"):
+            assert notifier.notify_digest("trade", title, join_titles)
+        # 合并窗口未到期时, flush 立即发送等待合并的消息
+        notifier.flush()
+        assert stub.sent == [("a+b+c", "3")]
+        notifier.digest_window = 0.05
+        notifier.notify_digest("trade", "d", join_titles)
+        notifier.notify_digest("trade", "e", join_titles)
+        deadline = time.monotonic() + 5
+        while len(stub.sent) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert stub.sent[1] == ("d+e", "2")
+        notifier.stop()
+        assert notifier.stats()["digests"] == 2
+        assert notifier.stats()["coalesced"] == 5
+
+    def test_digest_disabled_sends_immediately(self):
+        stub = StubTransport()
+        notifier = Notifier({PUSHDEER: stub})
+        notifier.start()
+        notifier.notify_digest("trade", "a", join_titles)
+        notifier.notify_digest("trade", "b", join_titles)
+        notifier.stop()
+        assert stub.sent == [("a", "1"), ("b", "1")]
+        assert notifier.stats()["digests"] == 0
+
+    def test_trade_digest_renders_all_messages(self):
+        msgs = [
+            {
+                "custom_symbol": symbol,
+                "symbol": symbol,
+                "direction": direction,
+                "pos": 2,
+                "price": 3500.0,
+                "t_time": "2024-01-03 10:00:00",
+                "o_or_c": o_or_c,
+                "message": o_or_c,
+                "today": "2024-01-03",
+            }
+            for symbol, direction, o_or_c in (
+                ("SHFE.rb2405", True, "开仓"),
+                ("DCE.m2405", False, "平仓"),
+            )
+        ]
+        (_, title, content), (_, subject, html) = tools.format_trade_messages(
+            msgs
+        )
+        assert title.endswith("2 笔开平仓")
+        assert content.count("成交价") == 2
+        assert subject.startswith("开平仓提示-2024-01-03")
+        assert "SHFE.rb2405 做多 开仓" in html
+        assert "DCE.m2405 做空 平仓" in html
@@ -0,0 +1,67 @@
+from conftest import FakeApi
+
+from utils.order_manager import OrderManager
+
+
+class TestClass:
+    def test_sync_mode_waits_for_fill(self):
+        api = FakeApi(fill_after=3)
+        manager = OrderManager(api)
+        finished = []
+        order = manager.insert_order(
+            "rb", finished.append, symbol="SHFE.rb2405", volume=1
+        )
+        assert order.status == "FINISHED"
+        assert finished == [order]
+        assert api.updates == 3
+        assert not manager.has_pending("rb")
+
+    def test_sync_mode_reports_each_wait_update(self):
+        api = FakeApi(fill_after=3)
+        waits = []
+        manager = OrderManager(api, on_wait_update=lambda: waits.append(1))
+        manager.insert_order(
+            "rb", lambda order: None, symbol="SHFE.rb2405", volume=1
+        )
+        assert len(waits) == api.updates == 3
+
+    def test_async_mode_resolves_fill_on_later_update(self):
+        api = FakeApi(fill_after=2)
+        manager = OrderManager(api, is_async=True)
+        finished = []
+        slow = manager.insert_order(
+            "rb", finished.append, symbol="SHFE.rb2405", volume=1
+        )
+        assert api.updates == 0
+        assert manager.has_pending("rb")
+        api.wait_update()
+        fast = manager.insert_order(
+            "cu", finished.append, symbol="SHFE.cu2405", volume=1
+        )
+        manager.update()
+        assert finished == []
+        api.wait_update()
+        manager.update()
+        assert finished == [slow]
+        assert manager.has_pending("cu") and not manager.has_pending("rb")
+        api.wait_update()
+        manager.update()
+        assert finished == [slow, fast]
+        assert manager.stats() == {"pending": 0, "finished": 2}
+
+    def test_async_callback_error_does_not_block_others(self):
+        api = FakeApi(fill_after=1)
+        manager = OrderManager(api, is_async=True)
+        finished = []
+
+        def fail(order):
+            raise ValueError("bookkeeping failed")
+
+        manager.insert_order("rb", fail, symbol="SHFE.rb2405", volume=1)
+        manager.insert_order(
+            "cu", finished.append, symbol="SHFE.cu2405", volume=1
+        )
+        api.wait_update()
+        manager.update()
+        assert len(finished) == 1
+        assert manager.stats()["pending"] == 0
@@ -0,0 +1,140 @@
+import csv
+
+import pytest
+from conftest import REPLAY_END, REPLAY_START, make_future_config
+
+import headquarters.backtest_runner as runner
+import utils.param_sweep as sweep
+import utils.replay_api as replay_api
+from dao.config_dao import build_fc_odm
+from dao.odm.trade_config import Account, BacktestDays, TradeConfigInfo
+
+
+def make_spec(**kwargs):
+    params = {
+        "long": {"base_scale": [0.02, 0.03], "stop_loss_scale": [1, 2]},
+        "short": {"profit_start_scale": [4, 8, 12]},
+    }
+    return sweep.SweepSpec(params, **kwargs)
+
+
+class TestClass:
+    def test_grid_params_by_direction(self):
+        spec = make_spec()
+        assert len(sweep.get_sweep_params(spec, 2, [1, 2])) == 12
+        long_params = sweep.get_sweep_params(spec, 1, [1])
+        assert len(long_params) == 4
+        assert {
+            "long.base_scale": 0.02,
+            "long.stop_loss_scale": 2,
+        } in long_params
+        assert sweep.get_sweep_params(spec, 0, [1, 2]) == [
+            {"short.profit_start_scale": v} for v in (4, 8, 12)
+        ]
+
+    def test_bottom_long_uses_short_params(self):
+        spec = make_spec()
+        # 做多的摸底策略使用 short 的止盈起始参数, 不使用 long 的止损参数
+        assert len(sweep.get_sweep_params(spec, 1, [1, 2])) == 12
+        bottom_params = sweep.get_sweep_params(spec, 1, [2])
+        assert len(bottom_params) == 6
+        assert all("long.stop_loss_scale" not in p for p in bottom_params)
+
+    def test_unused_params(self):
+        used = sweep.get_used_params(2, [1, 2])
+        for side, names in sweep.SWEEP_PARAMS.items():
+            for name in names:
+                expected = name not in ("promote_scale_2", "promote_target_2")
+                assert (f"{side}.{name}" in used) == expected
+        spec = sweep.SweepSpec({"long": {"promote_scale_2": [1, 2]}})
+        assert sweep.get_sweep_params(spec, 2, [1, 2]) == [{}]
+
+    def test_random_params(self):
+        params = {"long": {"base_scale": {"min": 0.01, "max": 0.05}}}
+        spec = sweep.SweepSpec(params, mode="random", samples=5, seed=1)
+        results = sweep.get_sweep_params(spec, 1, [1])
+        assert len(results) == 5
+        assert all(0.01 <= r["long.base_scale"] <= 0.05 for r in results)
+        assert results == sweep.get_sweep_params(spec, 1, [1])
+        # 取值有限时不重复
+        spec = make_spec(mode="random", samples=100, seed=1)
+        assert len(sweep.get_sweep_params(spec, 1, [1])) == 4
+        with pytest.raises(ValueError):
+            sweep.SweepSpec(params)
+        with pytest.raises(ValueError):
+            sweep.SweepSpec({"long": {"profit_start_scale": [1]}})
+
+    def test_apply_params(self):
+        configs = [make_future_config(), make_future_config("KQ.m@DCE.m")]
+        params = {"long.base_scale": 0.05, "short.promote_target": 2}
+        applied = sweep.apply_params(configs, params)
+        assert configs[0].long_trade_config.base_scale == 0.03
+        fc_odm = build_fc_odm(applied[0])
+        assert fc_odm.long_config.base_scale == 0.05
+        assert fc_odm.short_config.promote_target == 2
+        assert fc_odm.long_config.stop_loss_scale == 1
+
+    def test_group_runs(self):
+        runs = list(enumerate([{}] * 5))
+        groups = sweep.group_runs(runs, 2)
+        assert [[run[0] for run in group] for group in groups] == [
+            [0, 1, 2],
+            [3, 4],
+        ]
+        assert len(sweep.group_runs(runs[:1], 4)) == 1
+
+    def test_rank_and_write_results(self, tmp_path):
+        results = [
+            {
+                "params": {"long.base_scale": 0.02},
+                "tqsdk_stat": None,
+                "error": "x",
+            },
+            {"params": {"long.base_scale": 0.03}, "tqsdk_stat": {"ror": 0.1}},
+            {"params": {"long.base_scale": 0.04}, "tqsdk_stat": {"ror": 0.2}},
+        ]
+        ranked = sweep.rank_results(results, "ror")
+        assert [r["params"]["long.base_scale"] for r in ranked] == [
+            0.04,
+            0.03,
+            0.02,
+        ]
+        path = tmp_path / "sweep.csv"
+        sweep.write_results(ranked, str(path))
+        with open(path, encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        assert rows[0]["rank"] == "1" and rows[0]["ror"] == "0.2"
+        assert rows[2]["error"] == "x"
+
+    def test_sweep_group_shares_replay_data(
+        self, replay_dir, memory_storage, monkeypatch
+    ):
+        """子进程中的各次回测共用本地回放行情, 止损参数不同时结果不同"""
+        trade_config = TradeConfigInfo(
+            is_backtest=True,
+            strategy_ids=[1],
+            replay_dir=replay_dir,
+            backtest_dump="",
+            backtest_days=BacktestDays(
+                start_date=REPLAY_START, end_date=REPLAY_END
+            ),
+            tq_account=Account(user_name="test", password="test"),
+        )
+        monkeypatch.setattr(runner, "_worker_trade_config", trade_config)
+        monkeypatch.setattr(runner, "_replay_data", None)
+        loads = []
+        load = replay_api.load_kline_files
+        monkeypatch.setattr(
+            replay_api,
+            "load_kline_files",
+            lambda data_dir: loads.append(data_dir) or load(data_dir),
+        )
+        runs = [(0, {}), (1, {"long.stop_loss_scale": 0.5})]
+        results = runner._run_sweep_group(runs, [make_future_config()])
+        assert [r.get("error") for r in results] == [None, None]
+        # 行情目录只读取一次
+        assert loads == [replay_dir]
+        data = runner._replay_data
+        assert data.symbols["SHFE.rb2405"]._aggregated
+        balances = [r["tqsdk_stat"]["balance"] for r in results]
+        assert balances[0] != balances[1]
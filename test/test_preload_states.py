@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import dao.trade.bottom_trade_dao as bdao
+import dao.trade.main_trade_dao as mdao
+import dao.trade.trade_dao as dao
+import dao.trade.trade_service as service
+from dao.odm.future_trade import (
+    BottomTradeStatus,
+    MainJointSymbolStatus,
+    MainTradeStatus,
+)
+
+CST = timezone(timedelta(hours=8))
+QUOTE_DATE = "2024-01-02 09:00:00.000000"
+
+
+def make_status(doc_cls, symbol, direction):
+    ts = doc_cls(custom_symbol="SHFE_rb_main_long", symbol=symbol)
+    ts.direction = direction
+    return ts
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    data = {
+        "mj": [MainJointSymbolStatus(custom_symbol="SHFE_rb_main_long")],
+        "main": [make_status(MainTradeStatus, "SHFE.rb2405", 1)],
+        "bottom": [],
+        "tips": [
+            SimpleNamespace(
+                symbol="SHFE.rb2405",
+                direction=1,
+                dkline_time=datetime(2024, 1, 2, tzinfo=CST),
+            )
+        ],
+        "inserted": [],
+        "queries": 0,
+    }
+
+    def query(key):
+        def get_all():
+            data["queries"] += 1
+            return data[key]
+
+        return get_all
+
+    def single_query(*args):
+        raise AssertionError("预加载后不应逐条查询")
+
+    monkeypatch.setattr(dao, "getAllMainJointSymbolStatus", query("mj"))
+    monkeypatch.setattr(mdao, "getAllTradeStatus", query("main"))
+    monkeypatch.setattr(bdao, "getAllTradeStatus", query("bottom"))
+    monkeypatch.setattr(service, "get_last_bottom_tips", query("tips"))
+    monkeypatch.setattr(dao, "getMainJointSymbolStatus", single_query)
+    monkeypatch.setattr(mdao, "getTradeStatus", single_query)
+    monkeypatch.setattr(bdao, "getTradeStatus", single_query)
+    monkeypatch.setattr(dao, "insertDocuments", data["inserted"].append)
+    monkeypatch.setattr(dao, "deleteTradeStatus", lambda ts: None)
+    service.preload_states()
+    yield data
+    service.clear_preloaded_states()
+
+
+class TestClass:
+    def test_existing_states_are_served_from_memory(self, stored):
+        assert stored["queries"] == 4
+        for _ in range(3):
+            mjss = service.get_MJStatus(
+                "KQ.m@SHFE.rb", "", "", 1, QUOTE_DATE, "main"
+            )
+            ts = service.get_main_trade_status(
+                "SHFE_rb_main_long", "SHFE.rb2405", 1, QUOTE_DATE
+            )
+        assert mjss is stored["mj"][0]
+        assert ts is stored["main"][0]
+        assert stored["queries"] == 4
+        service.save_created_states()
+        assert stored["inserted"] == []
+
+    def test_missing_states_are_created_in_bulk(self, stored):
+        created = [
+            service.get_bottom_trade_status(
+                "SHFE_rb_bottom_long", symbol, 1, QUOTE_DATE
+            )
+            for symbol in ("SHFE.rb2405", "SHFE.rb2410", "SHFE.rb2405")
+        ]
+        assert created[0] is created[2]
+        assert all(ts.pk is None for ts in created)
+        mjss = service.get_MJStatus(
+            "KQ.m@SHFE.ag", "SHFE.ag2406", "SHFE.ag2408", 0, QUOTE_DATE, "main"
+        )
+        service.save_created_states()
+        assert stored["inserted"] == [created[:2], [mjss]]
+        # 批量写入后新建的状态直接保存
+        assert service._created_states is None
+
+    def test_deleted_status_is_forgotten(self, stored):
+        ts = stored["main"][0]
+        service.del_trade_status(ts)
+        new_ts = service.get_main_trade_status(
+            "SHFE_rb_main_long", "SHFE.rb2405", 1, QUOTE_DATE
+        )
+        assert new_ts is not ts
+        service._forget_trade_statuses(MainTradeStatus, "SHFE_rb_main_long")
+        assert service._trade_statuses[MainTradeStatus] == {}
+        assert service._trade_statuses[BottomTradeStatus] == {}
+
+    def test_bottom_tips_lookup_matches_query(self, stored):
+        tip = stored["tips"][0]
+        assert service.get_last_bottom_tip_by_symbol("SHFE.rb2405", 1) is tip
+        assert service.get_last_bottom_tip_by_symbol("SHFE.rb2405", 0) is None
+        # 与数据库查询一致, 没有时区的时间按 UTC 处理
+        naive = datetime(2024, 1, 1, 16)
+        assert service.get_lbt_by_symbol_date("SHFE.rb2405", 1, naive) is tip
+        other_day = datetime(2024, 1, 2, tzinfo=CST) + timedelta(days=1)
+        assert (
+            service.get_lbt_by_symbol_date("SHFE.rb2405", 1, other_day) is None
+        )
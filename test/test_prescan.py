@@ -0,0 +1,153 @@
+import json
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import get_bar_starts, write_kline_file
+
+import dao.trade.storage as storage
+from dao.odm.future_trade import MainCloseVolume, MainOpenVolume
+from strategies.indicators import MAIN_EMA_PERIODS, IndicatorEngine
+from strategies.prescan import (
+    SignalScan,
+    get_candidate_days,
+    scan_replay,
+    windowed_indicators,
+)
+from utils.backtest_report import to_plain
+from utils.common_tools import tz_utc_8
+from utils.replay_api import ReplayApi
+
+KLINE_LENGTH = 200
+DAYS = ("2024-01-02", "2024-01-03", "2024-01-04")
+
+
+def to_ns(*args) -> int:
+    return int(datetime(*args, tzinfo=tz_utc_8).timestamp()) * 10**9
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    starts = get_bar_starts(DAYS, 72)
+    for symbol, base in (("KQ.m@SHFE.au", 400), ("SHFE.rb2405", 3000)):
+        close = base + np.arange(1, len(starts) + 1, dtype=float)
+        write_kline_file(tmp_path / f"{symbol}.csv", starts, close)
+    return str(tmp_path)
+
+
+class TestClass:
+    def test_windowed_indicators_match_engine(self):
+        rng = np.random.default_rng(3)
+        closes = 3000 + np.cumsum(rng.normal(0, 20, 400))
+        results = windowed_indicators(closes, KLINE_LENGTH)
+        for i in range(0, 399, 7):
+            # 第 i 根K线位于序列倒数第二根时的K线序列
+            ids = np.arange(i + 2 - KLINE_LENGTH, i + 2)
+            klines = pd.DataFrame(
+                {
+                    "id": np.where(ids >= 0, ids, np.nan),
+                    "close": [closes[j] if j >= 0 else np.nan for j in ids],
+                }
+            )
+            IndicatorEngine(MAIN_EMA_PERIODS).update(klines)
+            for name in ("ema9", "ema22", "ema60", "MACD.close"):
+                assert results[name][i] == klines[name].iat[-2]
+
+    def test_candidate_days(self):
+        bar_days = [date(2024, 1, d) for d in (2, 3, 4, 5)]
+        conds = np.array([0, 1, 0, 0])
+        last_conds = np.array([0, 0, 0, 2])
+        trading_days = [date(2024, 1, d) for d in (3, 4, 5, 8)]
+        # 1月4日和5日的前一根日线可能是1月3日, 1月8日的前一根日线是1月5日
+        assert get_candidate_days(
+            bar_days, conds, last_conds, trading_days
+        ) == {date(2024, 1, 4), date(2024, 1, 5), date(2024, 1, 8)}
+
+    def test_session_of_night_trading(self):
+        days = [date(2024, 1, d) for d in (4, 5, 8)]
+        scan = SignalScan({("SHFE.rb2405", 1): {date(2024, 1, 8)}}, days)
+        assert scan.get_session(to_ns(2024, 1, 4, 10)) == (
+            [date(2024, 1, 4)],
+            to_ns(2024, 1, 4, 15),
+        )
+        # 收盘后到夜盘之间的时刻, 之后的交易属于下一个交易日
+        assert scan.get_session(to_ns(2024, 1, 5, 15, 5)) == (
+            [date(2024, 1, 5), date(2024, 1, 8)],
+            to_ns(2024, 1, 8, 15),
+        )
+        assert scan.is_candidate("SHFE.rb2405", 1, date(2024, 1, 8))
+        assert not scan.is_candidate("SHFE.rb2405", 1, date(2024, 1, 5))
+        assert scan.is_candidate("SHFE.rb2410", 1, date(2024, 1, 5))
+
+    def test_history_klines_include_future_bars(self, data_dir):
+        api = ReplayApi(data_dir, date(2024, 1, 3), date(2024, 1, 4))
+        assert api.get_trading_days() == [date(2024, 1, 3), date(2024, 1, 4)]
+        daily = api.get_history_klines("SHFE.rb2405", 86400)
+        assert daily["close"].tolist() == [3072, 3144, 3216]
+        assert daily["high"].tolist() == [3072.5, 3144.5, 3216.5]
+        assert daily["datetime"].iat[0] == to_ns(2024, 1, 2)
+
+    def test_fast_forward_matches_stepping(self, data_dir):
+        stepped = ReplayApi(data_dir, date(2024, 1, 3), date(2024, 1, 4))
+        skipped = ReplayApi(data_dir, date(2024, 1, 3), date(2024, 1, 4))
+        serials = [
+            api.get_kline_serial("SHFE.rb2405", 1800, 10)
+            for api in (stepped, skipped)
+        ]
+        close_ns = to_ns(2024, 1, 3, 15)
+        assert skipped.fast_forward(close_ns)
+        # 停在收盘时刻之前, 只在同一交易日内前进
+        assert skipped.now == to_ns(2024, 1, 3, 14, 55)
+        assert not skipped.fast_forward(to_ns(2024, 1, 4, 15))
+        while stepped.now < skipped.now:
+            stepped.wait_update()
+        pd.testing.assert_frame_equal(serials[0], serials[1])
+        assert (
+            stepped.get_quote("SHFE.rb2405").last_price
+            == skipped.get_quote("SHFE.rb2405").last_price
+        )
+        # 有未完成的委托时不前进
+        skipped.wait_update()
+        skipped.wait_update()
+        skipped.insert_order("SHFE.rb2405", "BUY", "OPEN", 1, 3000.0)
+        assert not skipped.fast_forward(to_ns(2024, 1, 4, 15))
+
+    def test_scan_shared_by_replay_data(self, data_dir, monkeypatch):
+        """共用行情数据且扫描参数相同的回放不再重复扫描"""
+        days = (date(2024, 1, 3), date(2024, 1, 4))
+        first = ReplayApi(data_dir, *days)
+        scan = scan_replay(first, [1, 0], 86400, KLINE_LENGTH)
+        second = ReplayApi(data_dir, *days, replay_data=first.replay_data)
+        monkeypatch.setattr(second, "get_history_klines", None)
+        cached = scan_replay(second, [1, 0], 86400, KLINE_LENGTH)
+        assert cached.candidates is scan.candidates
+        assert cached is not scan
+        # 回测区间不同时重新扫描
+        third = ReplayApi(
+            data_dir, days[0], days[0], replay_data=first.replay_data
+        )
+        scan_replay(third, [1, 0], 86400, KLINE_LENGTH)
+        assert len(first.replay_data.scans) == 2
+
+    def test_staker_prescan_trades_same_as_stepping(self, make_bt_staker):
+        """铜价不变, 预扫描跳过铜的交易员, 交易记录与逐个时刻回放相同"""
+        results = []
+        for prescan in (False, True):
+            staker = make_bt_staker(
+                ("KQ.m@SHFE.rb", "KQ.m@SHFE.cu"), [1], prescan=prescan
+            )
+            staker.start_work()
+            memory = storage.get_storage()
+            volumes = [
+                (v.symbol, v.direction, v.volume, v.trade_price, v.trade_time)
+                for doc_cls in (MainOpenVolume, MainCloseVolume)
+                for v in memory.find(doc_cls)
+            ]
+            trade_log = to_plain(staker._api._account.trade_log)
+            results.append(
+                (json.dumps(trade_log, sort_keys=True, default=str), volumes)
+            )
+        assert staker._scan.skipped_count > 0
+        assert results[0] == results[1]
+        assert '"offset": "OPEN"' in results[0][0]
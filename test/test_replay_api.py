@@ -0,0 +1,172 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import get_bar_starts, write_kline_file
+from tqsdk import BacktestFinished
+
+import utils.tqsdk_tools as tq_tools
+from dao.odm.future_trade import MainCloseVolume
+from dao.trade.storage import get_storage
+from utils.kline_hub import KlineHub
+from utils.order_manager import OrderManager
+from utils.replay_api import ReplayApi
+
+DAYS = ("2024-01-02", "2024-01-03", "2024-01-04")
+# 每个交易日 9:00 到 15:00 共 72 根5分钟线
+BARS_PER_DAY = 72
+
+
+@pytest.fixture
+def api(tmp_path):
+    starts = get_bar_starts(DAYS, BARS_PER_DAY)
+    prices = np.arange(1, len(starts) + 1)
+    write_kline_file(
+        tmp_path / "KQ.m@SHFE.au.csv", starts, 400 + prices, "SHFE.au2406"
+    )
+    write_kline_file(tmp_path / "SHFE.rb2405.csv", starts, 3000 + prices)
+    pd.DataFrame(
+        [
+            {
+                "symbol": "SHFE.rb2405",
+                "volume_multiple": 10,
+                "margin_ratio": 0.1,
+                "commission": 2,
+                "expire_datetime": "2024-05-15",
+            }
+        ]
+    ).to_csv(tmp_path / "instruments.csv", index=False)
+    return ReplayApi(str(tmp_path), date(2024, 1, 3), date(2024, 1, 4), 1e6)
+
+
+class TestClass:
+    def test_quote_and_klines_without_lookahead(self, api):
+        quote = api.get_quote("KQ.m@SHFE.au")
+        assert quote.datetime == "2024-01-03 09:04:59.999999"
+        assert quote.underlying_symbol == "SHFE.au2406"
+        rb = api.get_quote("SHFE.rb2405")
+        assert rb.last_price == 3073 and rb.expire_rest_days == 133
+        hourly = api.get_kline_serial("SHFE.rb2405", 3600, 3)
+        daily = api.get_kline_serial("SHFE.rb2405", 86400, 3)
+        # 回测开始前的K线作为历史数据, 最后一根只包含已回放的基础K线
+        assert np.isnan(daily["id"].iat[0])
+        assert daily["close"].tolist()[1:] == [3072, 3073]
+        assert hourly["id"].tolist() == [4, 5, 6]
+        assert hourly.iloc[-1][["open", "close", "volume"]].tolist() == [
+            3072,
+            3073,
+            10,
+        ]
+        hourly["flag"] = 1.0
+        api.wait_update()
+        assert not api.is_changing(hourly.iloc[-1], "datetime")
+        assert api.is_changing(rb, "datetime")
+        assert hourly["close"].iat[-1] == 3074 and hourly["flag"].iat[-1] == 1
+        for _ in range(11):
+            api.wait_update()
+        # 生成新K线时整体上移, 新行的附加列为空
+        assert api.is_changing(hourly.iloc[-1], "datetime")
+        assert hourly["id"].tolist() == [5, 6, 7]
+        assert np.isnan(hourly["flag"].iat[-1]) and hourly["flag"].iat[-2] == 1
+        assert tq_tools.get_changed_symbols(api) == {
+            "KQ.m@SHFE.au",
+            "SHFE.rb2405",
+        }
+
+    def test_orders_and_account(self, api):
+        manager = OrderManager(api)
+        finished = []
+        order = manager.insert_order(
+            "owner",
+            finished.append,
+            symbol="SHFE.rb2405",
+            direction="BUY",
+            offset="OPEN",
+            volume=2,
+        )
+        assert finished == [order] and not order.is_error
+        assert order.trade_price == 3073
+        account = api.get_account()
+        assert account.balance == 1e6 - 4
+        assert account.margin == pytest.approx(3073 * 2 * 10 * 0.1)
+        closing = manager.insert_order(
+            "owner",
+            finished.append,
+            symbol="SHFE.rb2405",
+            direction="SELL",
+            offset="CLOSE",
+            volume=3,
+        )
+        assert closing.is_error and closing.last_msg == "平仓手数不足"
+        limit = api.insert_order("SHFE.rb2405", "SELL", "CLOSE", 2, 3080)
+        while limit.status != "FINISHED":
+            api.wait_update()
+        assert limit.trade_price == 3080
+        assert api.get_account().balance == 1e6 - 8 + (3080 - 3073) * 20
+
+    def test_shared_replay_data(self, api):
+        """共用行情数据的回放与单独读取行情的回放结果相同, 合成K线只计算一次"""
+        data = api.replay_data
+        shared = ReplayApi(
+            data.data_dir, date(2024, 1, 3), date(2024, 1, 4), 1e6, data
+        )
+        for replay in (api, shared):
+            replay.get_kline_serial("SHFE.rb2405", 1800, 10)
+            for _ in range(20):
+                replay.wait_update()
+        rb = data.symbols["SHFE.rb2405"]
+        assert list(rb._aggregated) == [1800]
+        fresh = ReplayApi(data.data_dir, date(2024, 1, 3), date(2024, 1, 4))
+        assert fresh.replay_data is not data
+        klines = fresh.get_kline_serial("SHFE.rb2405", 1800, 10)
+        for _ in range(20):
+            fresh.wait_update()
+        pd.testing.assert_frame_equal(
+            shared.get_kline_serial("SHFE.rb2405", 1800, 10), klines
+        )
+
+    def test_backtest_finished(self, api):
+        hub = KlineHub(api)
+        quote = hub.get_quote("KQ.m@SHFE.au")
+        api.insert_order("SHFE.rb2405", "BUY", "OPEN", 1)
+        steps = 0
+        with pytest.raises(BacktestFinished):
+            while True:
+                api.wait_update()
+                steps += 1
+                if not tq_tools.is_trading_period(api, quote):
+                    assert quote.datetime.endswith("14:59:59.999999")
+        # 一次委托回报, 两个交易日的其余K线
+        assert steps == 1 + 2 * BARS_PER_DAY - 1
+        log = api._account.trade_log
+        assert list(log) == ["2024-01-03", "2024-01-04"]
+        assert len(log["2024-01-03"]["trades"]) == 1
+        assert log["2024-01-04"]["account"]["pre_balance"] == (
+            log["2024-01-03"]["account"]["balance"]
+        )
+        stat = api._account.tqsdk_stat
+        assert stat["balance"] == 1e6 - 2 + (3216 - 3073) * 10
+        with pytest.raises(BacktestFinished):
+            api.wait_update()
+
+    def test_staker_backtest_on_replay_dir(self, make_bt_staker):
+        """盯盘人, 交易员和交易策略不经修改在回放行情上完成回测"""
+        staker = make_bt_staker()
+        staker.start_work()
+        trades = [
+            (day, t["instrument_id"], t["direction"], t["offset"])
+            for day, log in staker._api._account.trade_log.items()
+            for t in log["trades"]
+        ]
+        # 主连当前和下一主力合约的主策略在上涨时开多仓, 下跌后止损并开空仓
+        assert trades == [
+            ("2024-01-02", "rb2405", "BUY", "OPEN"),
+            ("2024-01-02", "rb2410", "BUY", "OPEN"),
+            ("2024-01-09", "rb2405", "SELL", "CLOSE"),
+            ("2024-01-09", "rb2410", "SELL", "CLOSE"),
+            ("2024-01-09", "rb2405", "SELL", "OPEN"),
+            ("2024-01-09", "rb2410", "SELL", "OPEN"),
+        ]
+        closes = get_storage().find(MainCloseVolume)
+        assert [c.close_type for c in closes] == [0, 0]
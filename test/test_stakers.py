@@ -0,0 +1,107 @@
+import pytest
+from conftest import REPLAY_END, REPLAY_START
+
+import exe_departments.stakers as stakers
+from dao.odm.trade_log import TradeRecord
+from exe_departments.dispatchers import TraderDispatcher
+from exe_departments.stakers import BTStaker, RealStaker
+from strategies.trade_strategies.mts.mts_long import MainLongTradeStrategy
+from utils.replay_api import ReplayApi
+
+
+class TestClass:
+    def test_create_stakers_without_products(
+        self, fake_api, memory_storage, real_configs, monkeypatch
+    ):
+        bt_staker = BTStaker(fake_api, 2, [1, 2], future_configs=[])
+        assert bt_staker.traders == []
+        monkeypatch.setattr(stakers, "get_future_configs", lambda: [])
+        real_staker = RealStaker(fake_api, 2, [1, 2], async_order=True)
+        assert real_staker.traders == []
+        assert real_staker._order_manager.is_async
+        assert isinstance(real_staker.trade_record, TradeRecord)
+        # 功能开关只能按名称传入, 避免调整顺序后开关错位
+        with pytest.raises(TypeError):
+            BTStaker(fake_api, 2, [1, 2], True, future_configs=[])
+        with pytest.raises(TypeError):
+            RealStaker(fake_api, 2, [1, 2], False, False, True)
+
+    def test_real_staker_creates_traders(
+        self, replay_dir, memory_storage, real_configs
+    ):
+        api = ReplayApi(replay_dir, REPLAY_START, REPLAY_END, 1e6)
+        staker = RealStaker(api, 2, [1, 2], lazy_kline=True, async_order=True)
+        (trader,) = staker.traders
+        assert trader._config.f_info.symbol == "KQ.m@SHFE.rb"
+        assert len(trader.trade_strategies) == 8
+
+    def test_async_take_profit_waits_for_fill(
+        self, make_bt_staker, monkeypatch
+    ):
+        """异步委托时, 止盈阶段在委托完成后才更新"""
+        staker = make_bt_staker(async_order=True)
+        staker._execute_before_trade()
+        (trader,) = staker.traders
+        strategy = next(
+            s
+            for s in trader.trade_strategies
+            if isinstance(s, MainLongTradeStrategy)
+        )
+        while not strategy.is_trading:
+            staker._wait_update()
+            trader.execute_trade()
+        carrying = strategy.carrying_volume
+        sold = carrying // 2 if carrying > 1 else carrying
+        sc = strategy.close_condition
+        sc.take_profit_stage = 1
+        monkeypatch.setattr(strategy, "_get_profit_condition", lambda: 4)
+        strategy._try_take_profit()
+        assert strategy.has_pending_order
+        assert sc.take_profit_stage == 1
+        assert strategy.carrying_volume == carrying
+        staker._wait_update()
+        assert not strategy.has_pending_order
+        assert sc.take_profit_stage == 2
+        assert strategy.carrying_volume == carrying - sold
+
+    @pytest.mark.parametrize("aggregate_kline", [False, True])
+    def test_sync_order_wait_wakes_other_traders(
+        self, make_bt_staker, aggregate_kline
+    ):
+        """同步委托等待成交期间其他品种生成的新K线, 在下一次行情更新时通知对应的交易员"""
+        staker = make_bt_staker(
+            symbols=("KQ.m@SHFE.rb", "KQ.m@SHFE.cu"),
+            aggregate_kline=aggregate_kline,
+        )
+        api = staker._api
+        rb_trader, cu_trader = staker.traders
+        dispatcher = TraderDispatcher(staker.traders)
+        staker._wait_update()
+        klines = staker._kline_hub.get_kline_serial("KQ.m@SHFE.cu", 5 * 60)
+        last_id = klines.id.iloc[-1]
+        # 价格上涨到限价后才成交, 等待期间铜生成新K线
+        price = api.get_quote("SHFE.rb2405").last_price
+        order = staker._order_manager.insert_order(
+            "rb",
+            lambda order: None,
+            symbol="SHFE.rb2405",
+            direction="SELL",
+            offset="OPEN",
+            volume=1,
+            limit_price=price + 0.5,
+        )
+        assert order.status == "FINISHED"
+        assert klines.id.iloc[-1] > last_id
+        # 下一次行情更新只有委托回报, 行情不变
+        api.insert_order(
+            symbol="SHFE.rb2405", direction="BUY", offset="CLOSE", volume=1
+        )
+        staker._wait_update()
+        assert cu_trader in dispatcher.get_traders(staker._changed_symbols)
+        assert staker._kline_hub.is_changing(klines)
+        api.insert_order(
+            symbol="SHFE.rb2405", direction="SELL", offset="OPEN", volume=1
+        )
+        staker._wait_update()
+        assert dispatcher.get_traders(staker._changed_symbols) == []
+        assert not staker._kline_hub.is_changing(klines)
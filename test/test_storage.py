@@ -0,0 +1,133 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+
+import dao.trade.bottom_trade_dao as bdao
+import dao.trade.main_trade_dao as mdao
+import dao.trade.trade_service as service
+from dao.odm.future_trade import (
+    BottomIndicatorValues,
+    BottomOpenCondition,
+    BottomOpenVolumeTip,
+    CloseCondition,
+    MainOpenCondition,
+    MainTradeStatus,
+)
+
+CST = timezone(timedelta(hours=8))
+QUOTE_DATE = "2024-01-02 09:00:00.000000"
+
+
+def make_tip(symbol, day, direction=1):
+    return BottomOpenVolumeTip(
+        custom_symbol="SHFE_rb_bottom_long",
+        symbol=symbol,
+        direction=direction,
+        dkline_time=datetime(2024, 1, day, tzinfo=CST),
+    )
+
+
+class TestClass:
+    def test_memory_storage_queries(self, memory_storage):
+        tips = [make_tip("SHFE.rb2405", day) for day in (3, 1, 2)]
+        tips.append(make_tip("SHFE.rb2410", 3))
+        memory_storage.save(*tips)
+        assert all(isinstance(tip.pk, str) for tip in tips)
+        ordered = memory_storage.find(
+            BottomOpenVolumeTip, order_by="-dkline_time"
+        )
+        assert [t.dkline_time.day for t in ordered] == [3, 3, 2, 1]
+        since = datetime(2024, 1, 2, tzinfo=CST)
+        assert (
+            memory_storage.count(
+                BottomOpenVolumeTip,
+                symbol="SHFE.rb2405",
+                dkline_time__gte=since,
+            )
+            == 2
+        )
+        # 与数据库查询一致, 没有时区的时间按 UTC 处理
+        naive = datetime(2024, 1, 1, 16)
+        assert (
+            memory_storage.find_one(BottomOpenVolumeTip, dkline_time=naive)
+            is tips[2]
+        )
+        memory_storage.delete(tips[2])
+        assert (
+            memory_storage.find_one(BottomOpenVolumeTip, dkline_time=naive)
+            is None
+        )
+        with pytest.raises(ValueError):
+            memory_storage.find(
+                BottomOpenVolumeTip, symbol__in=["SHFE.rb2405"]
+            )
+
+    def test_trade_flow_without_database(self, memory_storage):
+        ts = service.get_main_trade_status(
+            "SHFE_rb_main_long", "SHFE.rb2405", 1, QUOTE_DATE
+        )
+        assert isinstance(ts.pk, ObjectId)
+        assert mdao.getTradeStatus("SHFE.rb2405", 1) is ts
+        trade_time = datetime(2024, 1, 2, 9, 30, tzinfo=CST)
+        opd = {
+            "trade_price": 3000.0,
+            "volume": 2,
+            "trade_time": trade_time,
+            "order_id": "o1",
+        }
+        ov = mdao.openPosAndUpdateStatus(
+            ts, MainOpenCondition(), CloseCondition(), opd
+        )
+        assert ts.trade_status == 1 and ts.open_pos_info is ov
+        assert mdao.getOpenVolume("SHFE.rb2405", 1) is ov
+        cpd = dict(opd, order_id="o2", close_type=1, close_message="止盈")
+        mdao.closePosAndUpdateStatus(ts, cpd)
+        assert ts.trade_status == 2 and ov.is_close
+        service.del_trade_status(ts)
+        assert memory_storage.find(MainTradeStatus) == []
+
+    def test_tip_upsert_and_last_tips(self, memory_storage):
+        bts = service.get_bottom_trade_status(
+            "SHFE_rb_bottom_long", "SHFE.rb2405", 1, QUOTE_DATE
+        )
+        assert service.get_last_bottom_tips() is None
+        condition = BottomOpenCondition(
+            daily_condition=BottomIndicatorValues(
+                kline_time=datetime(2024, 1, 2, tzinfo=CST), close=3000.0
+            )
+        )
+        for pos in (1, 3):
+            service.store_b_open_volume_tip(bts, condition, pos)
+        tips = service.get_last_bottom_tips()
+        assert len(tips) == 1 and tips[0].volume == 3
+        assert (
+            service.get_last_bottom_tip_by_symbol("SHFE.rb2405", 1) is tips[0]
+        )
+        assert service.get_last7d_count(tips[0]) == 1
+        assert bdao.getBottomOpenVolumeTips() == tips
+
+    def test_dump_to_file(self, memory_storage, tmp_path):
+        memory_storage.save(make_tip("SHFE.rb2405", 2))
+        service.get_main_trade_status(
+            "SHFE_rb_main_long", "SHFE.rb2405", 1, QUOTE_DATE
+        )
+        path = tmp_path / "backtest.jsonl"
+        memory_storage.dump = str(path)
+        memory_storage.close()
+        lines = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [line["collection"] for line in lines] == [
+            "bottom_open_volume_tip",
+            "main_trade_status",
+        ]
+        assert lines[1]["document"]["symbol"] == "SHFE.rb2405"
+
+    def test_close_dumps_once(self, memory_storage, tmp_path):
+        path = tmp_path / "backtest.jsonl"
+        memory_storage.dump = str(path)
+        memory_storage.save(make_tip("SHFE.rb2405", 2))
+        memory_storage.close()
+        path.unlink()
+        memory_storage.close()
+        assert not path.exists()
@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import pytest
+
+import dao.trade.trade_dao as dao
+import dao.trade.trade_service as service
+
+
+def make_record(symbol, quote_time, closed=False):
+    return SimpleNamespace(
+        custom_symbol="rb_long",
+        current_symbol=symbol,
+        quote_time=quote_time,
+        current_close_status=closed,
+    )
+
+
+@pytest.fixture
+def records(monkeypatch):
+    # 按交易时间倒序, 与 SwitchSymbolTradeRecord.objects 一致
+    stored = [
+        make_record("SHFE.rb2405", 2),
+        make_record("SHFE.rb2405", 1),
+        make_record("SHFE.rb2410", 1),
+    ]
+    calls = []
+
+    def get_pending():
+        calls.append(1)
+        return stored
+
+    monkeypatch.setattr(dao, "getPendingSwitchSymbolTradeRecords", get_pending)
+    monkeypatch.setattr(dao, "updateSwitchSymbolTradeRecord", lambda r: None)
+    monkeypatch.setattr(service, "_switch_records", None)
+    return stored, calls
+
+
+class TestClass:
+    def test_lookup_loads_once_and_keeps_latest(self, records):
+        stored, calls = records
+        status = SimpleNamespace(custom_symbol="rb_long", symbol="SHFE.rb2405")
+        for _ in range(3):
+            assert service.get_switch_symbol_trade_record(status) is stored[0]
+        other = SimpleNamespace(custom_symbol="rb_long", symbol="SHFE.rb2501")
+        assert service.get_switch_symbol_trade_record(other) is None
+        assert len(calls) == 1
+
+    def test_closed_record_is_removed(self, records):
+        stored, _ = records
+        status = SimpleNamespace(custom_symbol="rb_long", symbol="SHFE.rb2410")
+        record = service.get_switch_symbol_trade_record(status)
+        record.current_close_status = True
+        service.update_switch_symbol_trade_record(record)
+        assert service.get_switch_symbol_trade_record(status) is None
+        new_record = make_record("SHFE.rb2410", 3)
+        service._register_switch_symbol_trade_record(new_record)
+        assert service.get_switch_symbol_trade_record(status) is new_record
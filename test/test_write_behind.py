@@ -0,0 +1,87 @@
+from bson import SON
+
+from dao.write_behind import WriteBehindWriter
+
+
+class FakeCollection:
+    def __init__(self, fail=False):
+        self.writes = []
+        self.fail = fail
+
+    def bulk_write(self, operations, ordered=True):
+        if self.fail:
+            raise RuntimeError("mongo unavailable")
+        self.writes.append(operations)
+
+
+class FakeDoc:
+    collection = FakeCollection()
+
+    def __init__(self, pk, stop_loss_price=0.0):
+        self.pk = pk
+        self.stop_loss_price = stop_loss_price
+        self.saved = 0
+
+    def save(self):
+        self.saved += 1
+
+    def to_mongo(self):
+        return SON(_id=self.pk, stop_loss_price=self.stop_loss_price)
+
+    @classmethod
+    def _get_collection_name(cls):
+        return "trade_status"
+
+    @classmethod
+    def _get_collection(cls):
+        return cls.collection
+
+
+class TestClass:
+    def test_saves_directly_when_not_running(self):
+        writer = WriteBehindWriter()
+        doc = FakeDoc(1)
+        writer.save(doc, None)
+        assert doc.saved == 1
+        assert writer.stats()["queued"] == 0
+
+    def test_coalesces_updates_and_flushes_in_one_batch(self):
+        FakeDoc.collection = FakeCollection()
+        writer = WriteBehindWriter()
+        writer.start(interval=3600)
+        try:
+            first, second = FakeDoc(1), FakeDoc(2)
+            for price in (10.0, 11.0, 12.0):
+                first.stop_loss_price = price
+                writer.save(first, second)
+            assert first.saved == 0 and FakeDoc.collection.writes == []
+            # 开平仓时同步写入
+            writer.save(first, durable=True)
+        finally:
+            writer.stop()
+        writes = FakeDoc.collection.writes
+        assert len(writes) == 1
+        assert len(writes[0]) == 2
+        replaced = {op._filter["_id"]: op._doc for op in writes[0]}
+        assert replaced[1]["stop_loss_price"] == 12.0
+        assert writer.stats() == {
+            "pending": 0,
+            "queued": 7,
+            "written": 2,
+            "flushes": 1,
+        }
+
+    def test_failed_flush_keeps_newer_snapshot(self):
+        FakeDoc.collection = FakeCollection(fail=True)
+        writer = WriteBehindWriter()
+        writer.start(interval=3600)
+        doc = FakeDoc(1, 10.0)
+        writer.save(doc)
+        writer.flush()
+        assert writer.stats()["pending"] == 1
+        FakeDoc.collection.fail = False
+        doc.stop_loss_price = 11.0
+        writer.save(doc)
+        writer.stop()
+        (operations,) = FakeDoc.collection.writes
+        assert operations[0]._doc["stop_loss_price"] == 11.0
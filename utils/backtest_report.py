@@ -0,0 +1,169 @@
+"""合并分组回测的结果
+
+每组回测使用独立的 TqSim 账户, 结果为 TqSim.trade_log:
+    {"2024-01-02": {"trades": [...], "account": {...}, "positions": {...}}, ...}
+各组都按自己账户的全部初始资金计算开仓手数, 所以合并后的账户是各组账户之和:
+初始资金为各组初始资金之和, 数值字段(权益, 可用资金, 盈亏, 保证金, 手续费等)直接相加,
+风险度按合并后的保证金和权益重新计算。合并后的收益率, 年化收益, 最大回撤和夏普比率都以
+各组初始资金之和为基数, 与单个账户回测全部品种的结果不同。
+某组在某个交易日没有记录时沿用该组上一个交易日的账户截面。
+
+按日期分段的回测在相邻两段都没有持仓的交易日衔接, 之后的账户截面使用后一段的结果,
+资金类字段平移到与前一段的权益衔接。
+"""
+
+from typing import Optional
+
+from tqsdk.report import TqReport
+
+# 以初始资金为基础的资金类字段
+LEVEL_FIELDS = (
+    "pre_balance",
+    "static_balance",
+    "balance",
+    "available",
+    "ctp_balance",
+    "ctp_available",
+)
+
+
+def to_plain(obj):
+    """把天勤的数据对象转换为普通的 dict 和 list, 以便在进程间传递"""
+    if isinstance(obj, dict):
+        return {key: to_plain(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_plain(value) for value in obj]
+    return obj
+
+
+def _get_init_balance(trade_log: dict) -> float:
+    first = trade_log[min(trade_log)]["account"]
+    return first.get("pre_balance", first.get("balance", 0.0))
+
+
+def _merge_accounts(accounts: list[dict]) -> dict:
+    merged = {}
+    for account in accounts:
+        for key, value in account.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                merged.setdefault(key, value)
+            else:
+                merged[key] = merged.get(key, 0) + value
+    balance = merged.get("balance", 0)
+    merged["risk_ratio"] = merged.get("margin", 0) / balance if balance else 0
+    return merged
+
+
+def merge_trade_logs(trade_logs: list[dict]) -> dict:
+    """合并多个账户的 trade_log, 合并后的初始资金为各账户初始资金之和"""
+    trade_logs = [log for log in trade_logs if log]
+    if not trade_logs:
+        return {}
+    init_balances = [_get_init_balance(log) for log in trade_logs]
+    # 各组最近的账户截面, 第一个交易日之前为初始资金
+    last_accounts = [
+        {name: balance for name in LEVEL_FIELDS} for balance in init_balances
+    ]
+    merged = {}
+    for day in sorted(set().union(*trade_logs)):
+        trades, positions = [], {}
+        for i, log in enumerate(trade_logs):
+            if day not in log:
+                continue
+            last_accounts[i] = log[day]["account"]
+            trades.extend(log[day]["trades"])
+            positions.update(log[day].get("positions", {}))
+        trades.sort(key=lambda t: t["trade_date_time"])
+        merged[day] = {
+            "trades": trades,
+            "account": _merge_accounts(last_accounts),
+            "positions": positions,
+        }
+    return merged
+
+
+def get_stat(trade_log: dict, quotes: dict) -> Optional[dict]:
+    """按天勤的方式计算 trade_log 的回测统计, 没有记录时返回 None"""
+    if not trade_log:
+        return None
+    return TqReport(
+        report_id="combined", trade_log=trade_log, quotes=quotes
+    ).default_metrics
+
+
+def is_flat(day_log: dict) -> bool:
+    """交易日收盘后账户是否没有持仓"""
+    return not any(
+        position.get("volume_long", 0) or position.get("volume_short", 0)
+        for position in day_log.get("positions", {}).values()
+    )
+
+
+def find_splice_day(prev_log: dict, next_log: dict) -> Optional[str]:
+    """返回可以衔接两段回测结果的最后一个交易日, 没有时返回 None
+
+    两个账户在该交易日收盘后都没有持仓, 之后使用后一段的结果。
+    后一段回测开始前没有持仓, 所以也可以是后一段第一个交易日之前的交易日
+    """
+    if not prev_log or not next_log:
+        return None
+    first = min(next_log)
+    for day in sorted(prev_log, reverse=True):
+        if day < first:
+            return day if is_flat(prev_log[day]) else None
+        if (
+            day in next_log
+            and is_flat(prev_log[day])
+            and is_flat(next_log[day])
+        ):
+            return day
+    return None
+
+
+def splice_trade_logs(prev_log: dict, next_log: dict, day: str) -> dict:
+    """day 及之前使用 prev_log, 之后使用 next_log
+
+    next_log 的资金类字段平移到在 day 收盘时与 prev_log 的权益相同
+    """
+    if day in next_log:
+        next_balance = next_log[day]["account"]["balance"]
+    else:
+        next_balance = _get_init_balance(next_log)
+    offset = prev_log[day]["account"]["balance"] - next_balance
+    spliced = {d: value for d, value in prev_log.items() if d <= day}
+    for d in sorted(next_log):
+        if d <= day:
+            continue
+        account = dict(next_log[d]["account"])
+        for key in LEVEL_FIELDS:
+            if key in account:
+                account[key] += offset
+        balance = account.get("balance", 0)
+        account["risk_ratio"] = (
+            account.get("margin", 0) / balance if balance else 0
+        )
+        spliced[d] = {**next_log[d], "account": account}
+    return spliced
+
+
+def merge_backtest_results(results: list[dict]) -> dict:
+    """合并各组回测结果, 每组结果包含 trade_log, tqsdk_stat 和 quotes
+
+    quotes 为成交合约的合约信息, 至少包含合约乘数 volume_multiple,
+    返回合并后的 trade_log, 按合并账户计算的 tqsdk_stat, 各组的 tqsdk_stat,
+    合并账户的初始资金(各组初始资金之和)和参与合并的账户数
+    """
+    quotes = {}
+    for result in results:
+        quotes.update(result["quotes"])
+    trade_logs = [result["trade_log"] for result in results]
+    trade_log = merge_trade_logs(trade_logs)
+    return {
+        "trade_log": trade_log,
+        "tqsdk_stat": get_stat(trade_log, quotes),
+        "shard_stats": [result["tqsdk_stat"] for result in results],
+        "init_balance": sum(
+            _get_init_balance(log) for log in trade_logs if log
+        ),
+        "account_count": sum(1 for log in trade_logs if log),
+    }
@@ -0,0 +1,169 @@
+"""由一个基础K线序列在本地合成更大周期的K线序列
+
+小于一天的周期按北京时间自然对齐(与天勤一致, 如3小时线为 9:00, 12:00, 21:00, 0:00),
+日线按交易日对齐: 18点以后的夜盘属于下一个交易日, 周五夜盘属于下周一。
+这两种对齐方式都不会把不同交易日的K线合成到同一根K线中。
+"""
+
+from typing import Optional
+
+import numpy as np
+from pandas import DataFrame
+
+# 1990-01-01 00:00:00 北京时间(星期一), 与天勤计算交易日的起点一致
+_BEGIN_MARK = 631123200000000000
+_DAY_NS = 86400 * 10**9
+_NIGHT_START_NS = 18 * 3600 * 10**9
+_CST_OFFSET_NS = 8 * 3600 * 10**9
+DAILY_DURATION = 24 * 60 * 60
+
+# 合成K线的行情列
+KLINE_COLUMNS = (
+    "datetime",
+    "id",
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "open_oi",
+    "close_oi",
+)
+
+
+def get_bucket_starts(datetimes: np.ndarray, duration: int) -> np.ndarray:
+    """返回每根K线所属的合成K线的起始时间(纳秒)"""
+    dts = datetimes.astype(np.int64)
+    if duration >= DAILY_DURATION:
+        elapsed = dts - _BEGIN_MARK
+        days = elapsed // _DAY_NS + (elapsed % _DAY_NS >= _NIGHT_START_NS)
+        week_day = days % 7
+        days = np.where(week_day >= 5, days + 7 - week_day, days)
+        return _BEGIN_MARK + days * _DAY_NS
+    duration_ns = duration * 10**9
+    return (dts + _CST_OFFSET_NS) // duration_ns * duration_ns - _CST_OFFSET_NS
+
+
+def aggregate_bars(base: DataFrame, duration: int) -> dict[str, np.ndarray]:
+    """把基础K线合成为指定周期的K线, 返回除 id 以外的行情列数组
+
+    base 中不能有空行, 需按时间排序
+    """
+    if len(base) == 0:
+        return {
+            name: np.array([], dtype=float)
+            for name in KLINE_COLUMNS
+            if name != "id"
+        }
+    values = {
+        name: base[name].to_numpy(dtype=float)
+        for name in KLINE_COLUMNS
+        if name != "id"
+    }
+    buckets = get_bucket_starts(values["datetime"], duration)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(buckets)] - 1
+    return {
+        "datetime": buckets[starts].astype(float),
+        "open": values["open"][starts],
+        "high": np.maximum.reduceat(values["high"], starts),
+        "low": np.minimum.reduceat(values["low"], starts),
+        "close": values["close"][ends],
+        "volume": np.add.reduceat(values["volume"], starts),
+        "open_oi": values["open_oi"][starts],
+        "close_oi": values["close_oi"][ends],
+    }
+
+
+class BarAggregator:
+    """由基础K线序列合成的K线序列
+
+    klines 与天勤K线序列的结构相同: 长度固定, 数据不足时前面为空行,
+    生成新K线时整体上移, 新行的附加列(如指标)为 NaN, 各行的 id 连续递增。
+    基础K线更新后调用 sync 同步, 只重新合成最后一根及之后的K线。
+    天勤K线序列前面的空行只会出现在数据不足时, 基础K线中的空行只能在最前面。
+    """
+
+    def __init__(self, base: DataFrame, duration: int, length: int):
+        self.base = base
+        self.duration = duration
+        self.length = length
+        # 最近一次同步是否生成了新K线
+        self.changed = False
+        self._symbol = base["symbol"].iloc[-1] if "symbol" in base else ""
+        self._base_state: Optional[tuple] = None
+        self._last_id = -1
+        self.klines = DataFrame(index=range(length))
+        self._rebuild()
+
+    def sync(self) -> bool:
+        """根据基础K线更新合成K线, 生成新K线时返回 True"""
+        state = self._get_base_state()
+        if state == self._base_state:
+            return False
+        self._base_state = state
+        last_dt = self.klines["datetime"].iat[-1]
+        if np.isnan(last_dt):
+            return self._rebuild()
+        dts = self.base["datetime"].to_numpy(dtype=float)
+        first = len(dts) - np.count_nonzero(~np.isnan(dts))
+        pos = first + np.searchsorted(dts[first:], last_dt, side="left")
+        bars = aggregate_bars(self.base.iloc[pos:], self.duration)
+        if len(bars["datetime"]) == 0 or bars["datetime"][0] != last_dt:
+            # 基础K线已不包含最后一根合成K线, 无法增量合成
+            return self._rebuild()
+        count = len(bars["datetime"]) - 1
+        if count > 0:
+            self._shift(count)
+        bars["id"] = self._last_id + np.arange(count + 1, dtype=float)
+        self._last_id += count
+        self._write_tail(bars)
+        return count > 0
+
+    def _rebuild(self) -> bool:
+        """根据全部基础K线重新合成, 附加列全部清空"""
+        self._base_state = self._get_base_state()
+        base = self.base
+        bars = aggregate_bars(base[~base["datetime"].isna()], self.duration)
+        # 基础K线的第一根合成K线可能不完整, 不使用
+        bars = {name: v[1:][-self.length :] for name, v in bars.items()}
+        count = len(bars["datetime"])
+        bars["id"] = self._last_id + 1 + np.arange(count, dtype=float)
+        self._last_id += count
+        frame = self.klines
+        for name in list(frame.columns):
+            if name not in KLINE_COLUMNS and name not in (
+                "symbol",
+                "duration",
+            ):
+                frame[name] = np.nan
+        for name in KLINE_COLUMNS:
+            frame[name] = np.nan
+        frame["symbol"] = self._symbol
+        frame["duration"] = float(self.duration)
+        if count > 0:
+            self._write_tail(bars)
+        return True
+
+    def _shift(self, count: int) -> None:
+        """整体上移 count 行, 新行的行情列和附加列为空"""
+        frame = self.klines
+        for name in frame.columns:
+            if name in ("symbol", "duration"):
+                continue
+            values = frame[name].to_numpy(dtype=float)
+            frame[name] = np.concatenate(
+                [values[count:], np.full(min(count, len(values)), np.nan)]
+            )[-len(values) :]
+
+    def _write_tail(self, bars: dict[str, np.ndarray]) -> None:
+        frame = self.klines
+        count = min(len(bars["datetime"]), self.length)
+        for name in KLINE_COLUMNS:
+            values = frame[name].to_numpy(dtype=float, copy=True)
+            values[len(values) - count :] = bars[name][-count:]
+            frame[name] = values
+
+    def _get_base_state(self) -> tuple:
+        base = self.base
+        return tuple(base[name].iat[-1] for name in KLINE_COLUMNS)
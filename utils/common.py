@@ -1,10 +1,11 @@
 import argparse
 from datetime import date
 import sys
-from logging import Logger
 import logging.config
 import yaml
 
+from utils.log_tools import get_log_queue
+
 now = date.today()
 
 
@@ -95,12 +96,13 @@ def setup_log_config(log_level: str, config_file_name='log_config'):
         raise ValueError('Invalid log level: %s' % log_level)
     with open(f'conf/{config_file_name}.yaml', 'r') as f:
         config = yaml.safe_load(f.read())
-        logging.config.dictConfig(config)
-
-
-class LoggerGetter:
-    def __get__(self, obj, objtype=None) -> Logger:
-        return logging.getLogger(obj.__class__.__name__)
+    # queue: 是否由后台线程输出日志, 不是 dictConfig 的配置项
+    use_queue = config.pop('queue', False)
+    log_queue = get_log_queue()
+    log_queue.stop()
+    logging.config.dictConfig(config)
+    if use_queue:
+        log_queue.start()
 
 
 class TradeConfigGetter:
@@ -2,22 +2,17 @@ import logging
 import re
 from datetime import date, datetime, timedelta, timezone
 
-import requests
 import yaml
-from pypushdeer import PushDeer
 
 from utils import global_var as gvar
+from utils.notifier import PUSHDEER, SERVER_CHAN, get_notifier
 
-pushdeer = PushDeer(pushkey=gvar.PUSH_KEY)
 tz_utc_8 = timezone(timedelta(hours=8))  # 创建时区UTC+8:00，即东八区对应的时区
 logger = logging.getLogger(__name__)
 
 
 def sendPushDeerMsg(title: str, content: str):
-    try:
-        pushdeer.send_markdown(title, desp=content)
-    except Exception as e:
-        logger.exception(e)
+    get_notifier().notify(PUSHDEER, title, content)
 
 
 def sendSystemStartupMsg(
@@ -45,15 +40,7 @@ def send_msg(title: str, content: str) -> None:
     """使用 Server Chan 发送相关消息。
     参考地址：https://sct.ftqq.com/after
     """
-    logger = LoggerGetter()
-    send_key = "SCT172591Tn14G9JYc890AUJyvsNUiuCcL"
-    url = f"https://sctapi.ftqq.com/{send_key}.send"
-    headers = {"content-type": "application/x-www-form-urlencoded"}
-    data = {"title": title, "channel": 9, "desp": content}
-    try:
-        requests.post(url, data=data, headers=headers, timeout=10)
-    except requests.RequestException as e:
-        logger.exception(e)
+    get_notifier().notify(SERVER_CHAN, title, content)
 
 
 def get_custom_symbol(zl_symbol: str, l_or_s: bool, s_name: str) -> str:
@@ -225,8 +212,3 @@ def _is_weekend(date: datetime) -> bool:
     if date.isoweekday() in (6, 7):
         return True
     return False
-
-
-class LoggerGetter:
-    def __get__(self, obj, objtype=None) -> logging.Logger:
-        return logging.getLogger(obj.__class__.__name__)
@@ -1,13 +1,12 @@
-import smtplib
 from datetime import datetime
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+from functools import lru_cache
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, Template
 
 import dao.trade.trade_service as t_service
 from dao.odm.future_trade import BottomOpenVolumeTip, MainDailyConditionTip
 from utils import global_var as gvar
+from utils.notifier import EMAIL, get_notifier
 
 
 def render_tip(tip: BottomOpenVolumeTip):
@@ -22,29 +21,22 @@ def render_dctips(tip: MainDailyConditionTip):
     return tip
 
 
-def _send_email(subject: str, text: str):
-    me = "173028718@qq.com"
-    pwd = "vuyiuqsnxuribgia"
-
-    msg = MIMEMultipart()
+@lru_cache(maxsize=None)
+def get_template(name: str) -> Template:
+    """返回编译后的邮件模板, 每个模板只编译一次"""
+    return Environment(loader=FileSystemLoader("templates/")).get_template(
+        name
+    )
 
-    msg["Subject"] = subject
-    msg["From"] = me
-    msg["To"] = "471176315@qq.com,86077076@qq.com,173028718@qq.com"
-    msg.attach(MIMEText(text, "html"))
 
-    s = smtplib.SMTP_SSL("smtp.qq.com", 465)
-    s.login(me, pwd)
-    s.send_message(msg)
-    s.quit()
+def _send_email(subject: str, text: str):
+    get_notifier().notify(EMAIL, subject, text)
 
 
 def send_before_trading_message():
     """盘前提示操作完成后，将生成的相关信息发送给相关人员"""
     today = datetime.now().strftime("%Y-%m-%d")
-    template = Environment(loader=FileSystemLoader("templates/")).get_template(
-        "before_trading_tips.html"
-    )
+    template = get_template("before_trading_tips.html")
     context = {
         "today": today,
         "daily_condition_tips": map(
@@ -56,11 +48,18 @@ def send_before_trading_message():
     _send_email(f"盘前提示-{today}-{gvar.ENV_NAME}", template.render(context))
 
 
-def send_trade_message(context: dict):
-    template = Environment(loader=FileSystemLoader("templates/")).get_template(
-        "trade_pos_message.html"
-    )
-    _send_email(
-        f"{context['o_or_c']}提示-{context['today']}-{context['env_name']}",
+def render_trade_message(
+    today: str, o_or_c: str, messages: list[dict]
+) -> tuple[str, str]:
+    """生成开平仓提示邮件的标题和内容, 一封邮件可以包含多条提示"""
+    template = get_template("trade_pos_message.html")
+    context = {
+        "today": today,
+        "env_name": gvar.ENV_NAME,
+        "o_or_c": o_or_c,
+        "messages": messages,
+    }
+    return (
+        f"{o_or_c}提示-{today}-{gvar.ENV_NAME}",
         template.render(context),
     )
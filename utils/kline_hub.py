@@ -0,0 +1,185 @@
+from typing import Callable, Optional
+
+from pandas import DataFrame
+from tqsdk import TqApi
+from tqsdk.objs import Quote
+
+from utils.bar_aggregator import DAILY_DURATION, BarAggregator
+from utils.log_tools import LoggerGetter
+
+# 天勤K线序列的默认长度
+DEFAULT_KLINE_LENGTH = 200
+# 本地合成K线模式下, 基础K线的周期和长度
+# 长度需要保证3小时线有足够的K线数量, 天勤K线序列的最大长度为 10000
+AGGREGATE_BASE_DURATION = 5 * 60
+AGGREGATE_BASE_LENGTH = 8000
+
+
+class KlineHub:
+    """行情订阅中心
+
+    盯盘人, 交易员, 策略配置和交易策略都通过订阅中心获取 quote 和K线序列,
+    相同 (合约, 周期, 长度) 的订阅只向天勤请求一次, 返回同一个对象。
+    订阅中心记录每个K线序列的引用数, 使用者释放后引用数归零的序列将不再被持有。
+    天勤不提供取消订阅的接口, 这里的释放只是不再持有序列的引用。
+
+    lazy 为真时使用惰性订阅模式: 交易策略只在日线条件满足时才订阅日内K线, 不再需要时释放。
+
+    aggregate 为真时使用本地合成K线模式: 每个合约只订阅一个5分钟基础K线序列,
+    5分钟线, 30分钟线和3小时线都由它在本地合成, 日线需要较长的历史数据, 仍然向天勤订阅。
+    合成K线需要在每次 wait_update 之后调用 update 同步, 并通过 is_changing 判断是否生成了新K线。
+    """
+
+    logger = LoggerGetter()
+
+    def __init__(
+        self, api: TqApi, lazy: bool = False, aggregate: bool = False
+    ):
+        self._api = api
+        self.lazy = lazy
+        self.aggregate = aggregate
+        self._quotes: dict[str, Quote] = {}
+        self._serials: dict[tuple[str, int, int], DataFrame] = {}
+        self._refs: dict[tuple[str, int, int], int] = {}
+        self._aggregators: dict[tuple[str, int, int], BarAggregator] = {}
+        # 合成K线序列的 id 与合成器的对应关系, 用于 is_changing
+        self._aggregated: dict[int, BarAggregator] = {}
+        # 同步委托等待成交期间生成了新K线的序列 id, 下一次行情更新时标记为变化
+        self._waited: set[int] = set()
+        # 本次行情更新时因上述原因标记为变化的序列 id
+        self._missed: set[int] = set()
+        # 累计向天勤请求K线序列的次数
+        self.subscribe_count = 0
+
+    def get_quote(self, symbol: str) -> Quote:
+        quote = self._quotes.get(symbol)
+        if quote is None:
+            quote = self._api.get_quote(symbol)
+            self._quotes[symbol] = quote
+        return quote
+
+    def get_kline_serial(
+        self,
+        symbol: str,
+        duration: int,
+        length: int = DEFAULT_KLINE_LENGTH,
+    ) -> DataFrame:
+        """获取K线序列并增加其引用数"""
+        key = (symbol, duration, length)
+        if self._can_aggregate(duration):
+            return self._acquire(key, self._create_aggregated)
+        return self._acquire(key, self._subscribe)
+
+    def release_kline_serial(
+        self,
+        symbol: str,
+        duration: int,
+        length: int = DEFAULT_KLINE_LENGTH,
+    ) -> None:
+        """减少K线序列的引用数, 引用数为0时不再持有该序列"""
+        key = (symbol, duration, length)
+        if key not in self._refs:
+            return
+        self._refs[key] -= 1
+        if self._refs[key] <= 0:
+            del self._refs[key]
+            del self._serials[key]
+            aggregator = self._aggregators.pop(key, None)
+            if aggregator is not None:
+                del self._aggregated[id(aggregator.klines)]
+                self.release_kline_serial(
+                    symbol, AGGREGATE_BASE_DURATION, AGGREGATE_BASE_LENGTH
+                )
+
+    def update(
+        self, symbols: Optional[set[str]] = None, is_order_wait: bool = False
+    ) -> None:
+        """同步合成K线, 本地合成K线模式下需要在每次 wait_update 之后调用
+
+        symbols: 本次行情更新中发生变化的合约, 为 None 时同步所有合成K线
+        is_order_wait: 是否为同步委托等待成交期间的行情更新, 这期间生成的新K线
+        在下一次行情更新时才标记为变化, 交易员在下一轮调度时处理
+        """
+        if is_order_wait:
+            self._update_order_wait(symbols)
+            return
+        self._missed, self._waited = self._waited, set()
+        for (symbol, _, _), aggregator in self._aggregators.items():
+            if symbols is None or symbol in symbols:
+                aggregator.changed = aggregator.sync()
+            else:
+                aggregator.changed = False
+
+    def is_changing(self, klines: DataFrame) -> bool:
+        """K线序列在本次行情更新中是否生成了新K线"""
+        if id(klines) in self._missed:
+            return True
+        aggregator = self._aggregated.get(id(klines))
+        if aggregator is not None:
+            return aggregator.changed
+        return self._api.is_changing(klines.iloc[-1], "datetime")
+
+    def _update_order_wait(self, symbols: Optional[set[str]]) -> None:
+        for key, klines in self._serials.items():
+            if symbols is not None and key[0] not in symbols:
+                continue
+            aggregator = self._aggregators.get(key)
+            if aggregator is not None:
+                changed = aggregator.sync()
+            else:
+                changed = self._api.is_changing(klines.iloc[-1], "datetime")
+            if changed:
+                self._waited.add(id(klines))
+
+    def stats(self) -> dict:
+        """返回订阅统计: quote 数量, K线序列数量, 引用总数, K线序列占用内存(字节)"""
+        return {
+            "quotes": len(self._quotes),
+            "serials": len(self._serials),
+            "refs": sum(self._refs.values()),
+            "subscribed": self.subscribe_count,
+            "aggregated": len(self._aggregators),
+            "memory": int(
+                sum(
+                    serial.memory_usage(index=True).sum()
+                    for serial in self._serials.values()
+                )
+            ),
+        }
+
+    def _can_aggregate(self, duration: int) -> bool:
+        return (
+            self.aggregate
+            and duration < DAILY_DURATION
+            and duration % AGGREGATE_BASE_DURATION == 0
+        )
+
+    def _acquire(
+        self,
+        key: tuple[str, int, int],
+        create: Callable[[tuple[str, int, int]], DataFrame],
+    ) -> DataFrame:
+        serial = self._serials.get(key)
+        if serial is None:
+            serial = create(key)
+            self._serials[key] = serial
+            self._refs[key] = 0
+        self._refs[key] += 1
+        return serial
+
+    def _subscribe(self, key: tuple[str, int, int]) -> DataFrame:
+        """向天勤请求K线序列"""
+        self.subscribe_count += 1
+        return self._api.get_kline_serial(*key)
+
+    def _create_aggregated(self, key: tuple[str, int, int]) -> DataFrame:
+        """由合约的基础K线序列合成K线序列"""
+        symbol, duration, length = key
+        base = self._acquire(
+            (symbol, AGGREGATE_BASE_DURATION, AGGREGATE_BASE_LENGTH),
+            self._subscribe,
+        )
+        aggregator = BarAggregator(base, duration, length)
+        self._aggregators[key] = aggregator
+        self._aggregated[id(aggregator.klines)] = aggregator
+        return aggregator.klines
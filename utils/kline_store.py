@@ -0,0 +1,381 @@
+"""本地K线数据仓库
+
+回测反复使用同一段历史K线, 数据仓库把下载过的K线按合约和周期保存在本地,
+之后的回放直接读取, 不再访问网络。目录结构:
+
+    <root>/instruments.csv                  合约信息, 与回放行情目录中的格式相同
+    <root>/<合约>/<周期秒数>/meta.json       起止时间和K线数量
+    <root>/<合约>/<周期秒数>/<列名>.npy      每列一个 NumPy 文件
+
+datetime 列为K线起始时间的纳秒时间戳, 行情列为 float64, 主连合约另有
+underlying_symbol 列。读取时使用内存映射, 按时间范围切片不复制数据。
+写入时与已有数据按时间合并, 新数据覆盖相同时间的旧数据, 整个目录写好后再替换旧目录。
+
+数据通过 download_klines 用天勤的 DataDownloader 下载, 需要联网和天勤账户。
+"""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from utils.common_tools import get_next_symbol, tz_utc_8
+
+logger = logging.getLogger(__name__)
+
+META_FILE = "meta.json"
+INSTRUMENTS_FILE = "instruments.csv"
+PRICE_COLUMNS = (
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "open_oi",
+    "close_oi",
+)
+UNDERLYING_COLUMN = "underlying_symbol"
+# 回放使用的基础K线周期
+DEFAULT_DURATION = 5 * 60
+# 回测开始前需要下载的历史天数, 保证日线序列有足够的长度
+DEFAULT_HISTORY_DAYS = 300
+
+
+class KlineStore:
+    """按合约和周期保存K线的本地数据仓库"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    @staticmethod
+    def is_store(path: str) -> bool:
+        """目录是否为数据仓库: 包含保存了K线的 <合约>/<周期> 子目录"""
+        if not os.path.isdir(path):
+            return False
+        for name in os.listdir(path):
+            sub = os.path.join(path, name)
+            if os.path.isdir(sub) and any(
+                os.path.exists(os.path.join(sub, d, META_FILE))
+                for d in os.listdir(sub)
+            ):
+                return True
+        return False
+
+    def symbols(self) -> list[str]:
+        """返回仓库中所有的合约"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root) if self.durations(name)
+        )
+
+    def durations(self, symbol: str) -> list[int]:
+        """返回合约已保存的K线周期, 从小到大排列"""
+        path = os.path.join(self.root, symbol)
+        if not os.path.isdir(path):
+            return []
+        return sorted(
+            int(name)
+            for name in os.listdir(path)
+            if name.isdigit()
+            and os.path.exists(os.path.join(path, name, META_FILE))
+        )
+
+    def get_meta(self, symbol: str, duration: int) -> Optional[dict]:
+        """返回K线的起止时间(纳秒)和数量, 没有数据时返回 None"""
+        path = os.path.join(self._get_dir(symbol, duration), META_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def covers(
+        self, symbol: str, duration: int, start: datetime, end: datetime
+    ) -> bool:
+        """仓库中的K线是否覆盖 [start, end) 时间段
+
+        下载过的时间段记录在 meta.json 中, 节假日和合约上市前没有K线也算作覆盖
+        """
+        meta = self.get_meta(symbol, duration)
+        if meta is None:
+            return False
+        start, end = _to_ns(start), _to_ns(end)
+        return any(
+            first <= start and last >= end
+            for first, last in meta.get("ranges", [])
+        )
+
+    def read(
+        self,
+        symbol: str,
+        duration: int,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> dict[str, np.ndarray]:
+        """读取 [start, end) 时间段的K线, 返回列名到内存映射数组的映射"""
+        directory = self._get_dir(symbol, duration)
+        if self.get_meta(symbol, duration) is None:
+            raise KeyError(f"数据仓库中没有 {symbol} {duration} 秒的K线")
+        columns = {
+            name[:-4]: np.load(os.path.join(directory, name), mmap_mode="r")
+            for name in os.listdir(directory)
+            if name.endswith(".npy")
+        }
+        dts = columns["datetime"]
+        first = 0 if start is None else np.searchsorted(dts, _to_ns(start))
+        last = len(dts) if end is None else np.searchsorted(dts, _to_ns(end))
+        return {name: values[first:last] for name, values in columns.items()}
+
+    def write(
+        self,
+        symbol: str,
+        duration: int,
+        frame: DataFrame,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> int:
+        """保存K线, 与已有数据合并, 返回合并后的K线数量
+
+        frame 需要 datetime(纳秒)列和行情列, 可以有 underlying_symbol 列,
+        start 和 end 为下载的时间段, 不指定时使用K线的起止时间
+        """
+        frame = frame.dropna(subset=["datetime"])
+        frame = frame.assign(datetime=frame["datetime"].astype(np.int64))
+        meta = self.get_meta(symbol, duration)
+        ranges = meta.get("ranges", []) if meta else []
+        if len(frame):
+            ranges = _merge_ranges(
+                ranges
+                + [
+                    [
+                        (
+                            _to_ns(start)
+                            if start
+                            else int(frame["datetime"].min())
+                        ),
+                        (
+                            _to_ns(end)
+                            if end
+                            else int(frame["datetime"].max())
+                            + duration * 10**9
+                        ),
+                    ]
+                ]
+            )
+        if meta is not None:
+            old = DataFrame(
+                {
+                    k: np.asarray(v)
+                    for k, v in self.read(symbol, duration).items()
+                }
+            )
+            frame = pd.concat([old, frame], ignore_index=True)
+        frame = frame.drop_duplicates("datetime", keep="last").sort_values(
+            "datetime"
+        )
+        directory = self._get_dir(symbol, duration)
+        os.makedirs(os.path.dirname(directory), exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=os.path.dirname(directory))
+        np.save(
+            os.path.join(tmp, "datetime.npy"),
+            frame["datetime"].to_numpy(dtype=np.int64),
+        )
+        for name in PRICE_COLUMNS:
+            values = frame[name] if name in frame else np.zeros(len(frame))
+            np.save(
+                os.path.join(tmp, f"{name}.npy"),
+                np.asarray(values, dtype=np.float64),
+            )
+        if UNDERLYING_COLUMN in frame:
+            np.save(
+                os.path.join(tmp, f"{UNDERLYING_COLUMN}.npy"),
+                frame[UNDERLYING_COLUMN].fillna("").to_numpy(dtype=str),
+            )
+        meta = {
+            "symbol": symbol,
+            "duration": duration,
+            "count": len(frame),
+            "start": int(frame["datetime"].iat[0]) if len(frame) else 0,
+            "end": int(frame["datetime"].iat[-1]) if len(frame) else 0,
+            "ranges": ranges,
+        }
+        with open(os.path.join(tmp, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        # 先写入临时目录再替换, 中途失败不会损坏已有数据
+        if os.path.exists(directory):
+            old_dir = tempfile.mkdtemp(dir=os.path.dirname(directory))
+            os.replace(directory, os.path.join(old_dir, "old"))
+            os.replace(tmp, directory)
+            shutil.rmtree(old_dir)
+        else:
+            os.replace(tmp, directory)
+        return len(frame)
+
+    def read_instruments(self) -> DataFrame:
+        path = os.path.join(self.root, INSTRUMENTS_FILE)
+        if not os.path.exists(path):
+            return DataFrame(columns=["symbol"])
+        return pd.read_csv(path)
+
+    def write_instruments(self, instruments: DataFrame) -> None:
+        """保存合约信息, 与已有的合约信息合并"""
+        os.makedirs(self.root, exist_ok=True)
+        merged = pd.concat(
+            [self.read_instruments(), instruments], ignore_index=True
+        ).drop_duplicates("symbol", keep="last")
+        merged.to_csv(os.path.join(self.root, INSTRUMENTS_FILE), index=False)
+
+    def _get_dir(self, symbol: str, duration: int) -> str:
+        return os.path.join(self.root, symbol, str(int(duration)))
+
+
+def _to_ns(value) -> int:
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=tz_utc_8)
+    return int(value.timestamp()) * 10**9 + value.microsecond * 1000
+
+
+def _merge_ranges(ranges: list[list[int]]) -> list[list[int]]:
+    """合并重叠或相连的时间段"""
+    merged: list[list[int]] = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+    return merged
+
+
+def read_downloaded_csv(path: str, symbol: str) -> DataFrame:
+    """读取 DataDownloader 下载的单个合约的K线文件"""
+    frame = pd.read_csv(path)
+    columns = {f"{symbol}.{name}": name for name in PRICE_COLUMNS}
+    frame = frame.rename(columns=columns)
+    frame["datetime"] = frame["datetime_nano"].astype(np.int64)
+    return frame[["datetime", *PRICE_COLUMNS]].dropna(subset=["close"])
+
+
+def download_klines(
+    api,
+    store: KlineStore,
+    symbol: str,
+    duration: int,
+    start_dt: date,
+    end_dt: date,
+) -> int:
+    """用天勤的 DataDownloader 下载K线并保存到数据仓库, 已覆盖的时间段不再下载"""
+    from tqsdk.tools import DataDownloader
+
+    if store.covers(symbol, duration, start_dt, end_dt):
+        logger.info(f"{symbol} {duration} 秒K线已在数据仓库中")
+        return 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "klines.csv")
+        task = DataDownloader(api, symbol, duration, start_dt, end_dt, path)
+        while not task.is_finished():
+            api.wait_update()
+        frame = read_downloaded_csv(path, symbol)
+    if frame.empty:
+        logger.warning(f"{symbol} 在 {start_dt} 至 {end_dt} 没有K线")
+        return 0
+    count = store.write(symbol, duration, frame, start_dt, end_dt)
+    logger.info(f"已下载 {symbol} {duration} 秒K线 {len(frame)} 根")
+    return count
+
+
+def download_underlying(
+    api, store: KlineStore, symbol: str, duration: int, days: int
+) -> set[str]:
+    """下载主连合约最近 days 个交易日的标的合约, 写入主连K线的 underlying_symbol 列
+
+    返回这段时间内的标的合约
+    """
+    conts = api.query_his_cont_quotes(symbol=symbol, n=days)
+    conts = conts[conts[symbol] != ""]
+    columns = store.read(symbol, duration)
+    frame = DataFrame({k: np.asarray(v) for k, v in columns.items()})
+    # 每根K线按交易日取标的合约, 夜盘属于下一个交易日
+    trading_days = get_trading_days(frame["datetime"].to_numpy())
+    by_day = dict(zip(pd.to_datetime(conts["date"]).dt.date, conts[symbol]))
+    frame[UNDERLYING_COLUMN] = [by_day.get(day, "") for day in trading_days]
+    store.write(symbol, duration, frame)
+    return set(conts[symbol])
+
+
+def get_trading_days(datetimes: np.ndarray) -> list[date]:
+    """返回每根K线所属的交易日"""
+    from utils.bar_aggregator import DAILY_DURATION, get_bucket_starts
+
+    starts = get_bucket_starts(datetimes.astype(np.int64), DAILY_DURATION)
+    return [
+        datetime.fromtimestamp(int(ns) // 10**9, tz_utc_8).date()
+        for ns in starts
+    ]
+
+
+def get_instruments(api, symbols: list[str]) -> DataFrame:
+    """返回合约的合约乘数, 最小变动价位, 每手手续费和到期日"""
+    rows = []
+    for symbol in symbols:
+        quote = api.get_quote(symbol)
+        expire = quote.expire_datetime
+        rows.append(
+            {
+                "symbol": symbol,
+                "volume_multiple": quote.volume_multiple,
+                "price_tick": quote.price_tick,
+                "commission": quote.commission,
+                "expire_datetime": (
+                    datetime.fromtimestamp(expire, tz_utc_8).date()
+                    if expire == expire and expire
+                    else None
+                ),
+            }
+        )
+    return DataFrame(rows)
+
+
+def fill_store(
+    api,
+    store: KlineStore,
+    cont_symbols: list[str],
+    main_months: dict[str, list[int]],
+    start_dt: date,
+    end_dt: date,
+    duration: int = DEFAULT_DURATION,
+    history_days: int = DEFAULT_HISTORY_DAYS,
+) -> list[str]:
+    """为回测下载主连合约, 期间的标的合约及其下一个主力合约的K线和合约信息
+
+    main_months 为主连合约到主力合约月份列表的映射, 用于确定下一个主力合约。
+    返回下载的所有合约
+    """
+    history_start = start_dt - timedelta(days=history_days)
+    end = end_dt + timedelta(days=1)
+    days = (date.today() - history_start).days
+    symbols = []
+    for cont in cont_symbols:
+        download_klines(api, store, cont, duration, history_start, end)
+        underlyings = download_underlying(api, store, cont, duration, days)
+        months = main_months.get(cont)
+        if months:
+            underlyings |= {get_next_symbol(s, months) for s in underlyings}
+        symbols.append(cont)
+        for symbol in sorted(underlyings):
+            download_klines(api, store, symbol, duration, history_start, end)
+            symbols.append(symbol)
+    store.write_instruments(
+        get_instruments(api, [s for s in symbols if not s.startswith("KQ.")])
+    )
+    return symbols
@@ -0,0 +1,152 @@
+"""日志的缓存, 异步输出和 JSON 格式
+
+LoggerGetter 按类缓存 logger, 避免每次访问都调用 logging.getLogger。
+启用日志队列后交易线程只把日志记录放入队列, 由后台线程格式化并写入控制台和文件,
+各 logger 原来配置的 handlers 和等级不变。
+log_event 输出带键值字段的事件, JsonFormatter 把每条日志输出为一行 JSON, 便于后续分析。
+"""
+
+import atexit
+import copy
+import json
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+
+class LoggerGetter:
+    """以类名作为 logger 名称, 每个类只查找一次"""
+
+    def __init__(self):
+        self._loggers: dict[type, logging.Logger] = {}
+
+    def __get__(self, obj, objtype=None) -> logging.Logger:
+        cls = objtype if obj is None else obj.__class__
+        logger = self._loggers.get(cls)
+        if logger is None:
+            logger = logging.getLogger(cls.__name__)
+            self._loggers[cls] = logger
+        return logger
+
+
+class Event:
+    """带键值字段的日志消息, 输出时才转换为文本"""
+
+    __slots__ = ("name", "fields")
+
+    def __init__(self, name: str, fields: dict):
+        self.name = name
+        self.fields = fields
+
+    def __str__(self) -> str:
+        text = " ".join(f"{key}:{value}" for key, value in self.fields.items())
+        return f"{self.name} {text}"
+
+
+def log_event(
+    logger: logging.Logger, level: int, event: str, **fields
+) -> None:
+    """输出事件名和键值字段, 日志等级未启用时不做任何格式化
+
+    tqsdk 替换了 logger 的类, extra 参数不会写入日志记录, 所以字段保存在消息对象中
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, Event(event, fields), stacklevel=2)
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON, log_event 输出的事件名和字段单独保存"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "name": record.name,
+            "message": record.getMessage(),
+        }
+        if isinstance(record.msg, Event):
+            data["event"] = record.msg.name
+            data["fields"] = record.msg.fields
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc_info"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _RoutedQueueHandler(QueueHandler):
+    """把日志记录和所属 logger 原来的 handlers 一起放入队列"""
+
+    def __init__(self, log_queue: queue.SimpleQueue, targets: list):
+        super().__init__(log_queue)
+        self.targets = targets
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 参数可能在之后被修改, 在调用线程中生成消息, 其余格式化在后台线程中完成,
+        # 事件保留字段供 JsonFormatter 使用
+        record = copy.copy(record)
+        if not isinstance(record.msg, Event):
+            record.msg = record.getMessage()
+            record.args = None
+        record.targets = self.targets
+        return record
+
+
+class _RoutedQueueListener(QueueListener):
+    def handle(self, record: logging.LogRecord) -> None:
+        for handler in record.targets:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+class LogQueue:
+    """把已配置的日志输出移到后台线程"""
+
+    def __init__(self):
+        self._listener: Optional[_RoutedQueueListener] = None
+        self._handlers: dict[logging.Logger, list] = {}
+
+    @property
+    def is_running(self) -> bool:
+        return self._listener is not None
+
+    def start(self) -> None:
+        """把各 logger 的 handlers 替换为队列, 启动后台输出线程"""
+        if self.is_running:
+            return
+        log_queue = queue.SimpleQueue()
+        manager = logging.Logger.manager
+        loggers = [logging.getLogger()] + [
+            logger
+            for logger in manager.loggerDict.values()
+            if isinstance(logger, logging.Logger)
+        ]
+        for logger in loggers:
+            if not logger.handlers:
+                continue
+            self._handlers[logger] = logger.handlers
+            logger.handlers = [
+                _RoutedQueueHandler(log_queue, list(logger.handlers))
+            ]
+        self._listener = _RoutedQueueListener(log_queue)
+        self._listener.start()
+
+    def stop(self) -> None:
+        """恢复原来的 handlers, 输出队列中剩余的日志后停止后台线程"""
+        if not self.is_running:
+            return
+        for logger, handlers in self._handlers.items():
+            logger.handlers = handlers
+        self._handlers = {}
+        self._listener.stop()
+        self._listener = None
+
+
+_log_queue = LogQueue()
+atexit.register(_log_queue.stop)
+
+
+def get_log_queue() -> LogQueue:
+    """返回进程内共享的日志队列"""
+    return _log_queue
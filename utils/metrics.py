@@ -0,0 +1,352 @@
+"""运行指标的统计和导出
+
+各模块在导入时定义计数器, 仪表和直方图, 默认不启用, 记录时只检查一次启用标志,
+仪表在导出时才调用取值函数, 不启用时几乎没有开销。
+启用后可以在本地 HTTP 端口以 Prometheus 文本格式导出, 也可以定期把指标汇总写入日志。
+"""
+
+import bisect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 直方图默认的分桶上界(秒)
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+)
+# HTTP 服务只监听本机
+METRICS_HOST = "127.0.0.1"
+
+
+class _NullTimer:
+    """未启用时使用的计时器, 不做任何操作"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, histogram: "Histogram"):
+        self._histogram = histogram
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._histogram.observe(time.perf_counter() - self._start)
+
+
+class Metric:
+    """指标, 有标签时每个标签值对应一个子指标"""
+
+    kind = ""
+
+    def __init__(
+        self,
+        registry: "MetricsRegistry",
+        name: str,
+        help_text: str,
+        label: Optional[str] = None,
+        label_value: str = "",
+    ):
+        self._registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.label_value = label_value
+        self._children: dict[str, Metric] = {}
+
+    def labels(self, value: str) -> "Metric":
+        """返回标签值对应的子指标"""
+        child = self._children.get(value)
+        if child is None:
+            child = self._new_child(value)
+            self._children[value] = child
+        return child
+
+    def _new_child(self, value: str) -> "Metric":
+        return type(self)(
+            self._registry, self.name, self.help_text, self.label, value
+        )
+
+    def _series(self) -> list["Metric"]:
+        if self.label is None:
+            return [self]
+        return list(self._children.values())
+
+    def _label_str(self, extra: str = "") -> str:
+        pairs = []
+        if self.label is not None:
+            pairs.append(f'{self.label}="{self.label_value}"')
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for series in self._series():
+            lines.extend(series._render_samples())
+        return lines
+
+    def _render_samples(self) -> list[str]:
+        return [f"{self.name}{self._label_str()} {self.value()}"]
+
+    def value(self):
+        raise NotImplementedError
+
+    def summary(self):
+        """写入日志的汇总值, 有标签时按标签值汇总"""
+        if self.label is None:
+            return self.value()
+        return {
+            series.label_value: series.value() for series in self._series()
+        }
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        if self._registry.enabled:
+            self._value += amount
+
+    def value(self) -> float:
+        return self._value
+
+
+class Gauge(Metric):
+    """导出时调用取值函数得到当前值"""
+
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._func: Optional[Callable[[], float]] = None
+
+    def set_function(self, func: Callable[[], float]) -> None:
+        self._func = func
+
+    def value(self) -> float:
+        if self._func is None:
+            return 0.0
+        try:
+            return float(self._func())
+        except Exception as e:
+            logger.warning(f"指标 {self.name} 取值失败: {e}")
+            return 0.0
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: tuple = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+        # 每个分桶(最后一个为 +Inf)的观测次数, 导出时再累加
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def _new_child(self, value: str) -> "Histogram":
+        return Histogram(
+            self._registry,
+            self.name,
+            self.help_text,
+            self.label,
+            value,
+            buckets=self.buckets,
+        )
+
+    def observe(self, value: float) -> None:
+        if not self._registry.enabled:
+            return
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sum += value
+        self._count += 1
+
+    def time(self):
+        """对 with 语句中的代码计时, 未启用时不计时"""
+        if not self._registry.enabled:
+            return _NULL_TIMER
+        return _Timer(self)
+
+    def _render_samples(self) -> list[str]:
+        lines = []
+        total = 0
+        bounds = [str(b) for b in self.buckets] + ["+Inf"]
+        for bound, count in zip(bounds, self._counts):
+            total += count
+            labels = self._label_str(f'le="{bound}"')
+            lines.append(f"{self.name}_bucket{labels} {total}")
+        lines.append(f"{self.name}_sum{self._label_str()} {self._sum}")
+        lines.append(f"{self.name}_count{self._label_str()} {self._count}")
+        return lines
+
+    def value(self) -> dict:
+        avg = self._sum / self._count if self._count else 0.0
+        return {"count": self._count, "avg": round(avg, 6)}
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: "MetricsRegistry"
+
+    def do_GET(self):
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsRegistry:
+    """进程内的全部指标, 启用后通过 HTTP 和日志导出"""
+
+    def __init__(self):
+        self.enabled = False
+        self._metrics: dict[str, Metric] = {}
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._log_thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def counter(
+        self, name: str, help_text: str, label: Optional[str] = None
+    ) -> Counter:
+        return self._register(Counter(self, name, help_text, label))
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._register(Gauge(self, name, help_text))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        label: Optional[str] = None,
+        buckets: tuple = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(
+            Histogram(self, name, help_text, label, buckets=buckets)
+        )
+
+    def _register(self, metric: Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"指标已存在: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    @property
+    def port(self) -> int:
+        """HTTP 服务实际监听的端口, 未启动时为 0"""
+        if self._server is None:
+            return 0
+        return self._server.server_address[1]
+
+    def start(
+        self, port: Optional[int] = None, log_interval: float = 0
+    ) -> None:
+        """启用指标统计
+
+        port 不为 None 时在本机该端口启动 HTTP 服务, 为 0 时使用任意空闲端口;
+        log_interval 大于 0 时每隔 log_interval 秒把指标汇总写入日志
+        """
+        self.enabled = True
+        if port is not None and self._server is None:
+            handler = type(
+                "MetricsHandler", (_MetricsHandler,), {"registry": self}
+            )
+            try:
+                self._server = ThreadingHTTPServer(
+                    (METRICS_HOST, port), handler
+                )
+            except OSError as e:
+                logger.warning(f"指标 HTTP 服务启动失败: {e}")
+            else:
+                self._server.daemon_threads = True
+                threading.Thread(
+                    target=self._server.serve_forever,
+                    name="metrics-http",
+                    daemon=True,
+                ).start()
+                logger.info(f"指标地址: http://{METRICS_HOST}:{self.port}/")
+        if log_interval > 0 and self._log_thread is None:
+            self._stopped.clear()
+            self._log_thread = threading.Thread(
+                target=self._log_periodically,
+                args=(log_interval,),
+                name="metrics-log",
+                daemon=True,
+            )
+            self._log_thread.start()
+
+    def stop(self) -> None:
+        """停止 HTTP 服务和定期日志, 启用时最后写入一次指标汇总"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._log_thread is not None:
+            self._stopped.set()
+            self._log_thread.join()
+            self._log_thread = None
+        if self.enabled:
+            self.log_summary()
+        self.enabled = False
+
+    def render(self) -> str:
+        """Prometheus 文本格式的全部指标"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict:
+        return {
+            name: metric.summary()
+            for name, metric in list(self._metrics.items())
+        }
+
+    def log_summary(self) -> None:
+        logger.info(f"运行指标: {self.summary()}")
+
+    def _log_periodically(self, interval: float) -> None:
+        while not self._stopped.wait(interval):
+            self.log_summary()
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """返回进程内共享的指标"""
+    return _registry
@@ -0,0 +1,368 @@
+"""交易通知的异步发送
+
+邮件, PushDeer 和 Server Chan 消息先放入有界队列, 由后台线程依次发送,
+发送失败时按指数退避重试, 交易线程不等待网络 I/O。队列已满时丢弃新消息。
+邮件使用同一个 SMTP 连接发送, 连接断开后重新连接。
+合并模式下, 同一组的消息(如开平仓提示)在 digest_window 秒内合并为一条摘要发送。
+未启动后台线程时在调用线程中直接发送, 不重试。
+"""
+
+import logging
+import queue
+import smtplib
+import threading
+import time
+from abc import ABC, abstractmethod
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Callable, Optional
+
+import requests
+from pypushdeer import PushDeer
+
+from utils import global_var as gvar
+from utils.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# 通知渠道
+EMAIL = "email"
+PUSHDEER = "pushdeer"
+SERVER_CHAN = "serverchan"
+
+EMAIL_HOST = "smtp.qq.com"
+EMAIL_PORT = 465
+EMAIL_USER = "173028718@qq.com"
+EMAIL_PASSWORD = "vuyiuqsnxuribgia"
+EMAIL_TO = "471176315@qq.com,86077076@qq.com,173028718@qq.com"
+# Server Chan 的 SendKey, 参考地址：https://sct.ftqq.com/after
+SERVER_CHAN_KEY = "SCT172591Tn14G9JYc890AUJyvsNUiuCcL"
+
+# 队列中最多等待发送的消息数
+DEFAULT_MAX_PENDING = 1000
+# 发送失败后的重试次数和第一次重试前的等待时间(秒), 之后每次等待时间加倍
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+_STOP = object()
+_FLUSH = object()
+# 队列中的消息类型: 直接发送的消息和需要合并的消息
+_SEND = "send"
+_DIGEST = "digest"
+
+# 把一组需要合并的消息转换为各渠道的 (渠道, 标题, 内容)
+DigestFormatter = Callable[[list], list[tuple[str, str, str]]]
+
+
+class Transport(ABC):
+    """通知渠道的发送方式"""
+
+    @abstractmethod
+    def send(self, title: str, content: str) -> None:
+        """发送一条消息, 失败时抛出异常"""
+
+    def close(self) -> None:
+        """释放连接"""
+
+
+class SmtpTransport(Transport):
+    """通过 SMTP_SSL 发送 html 邮件, 多封邮件复用同一个连接"""
+
+    def __init__(
+        self, host: str, port: int, user: str, password: str, to_addrs: str
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.to_addrs = to_addrs
+        self._smtp: Optional[smtplib.SMTP_SSL] = None
+        self.connect_count = 0
+
+    def send(self, title: str, content: str) -> None:
+        msg = MIMEMultipart()
+        msg["Subject"] = title
+        msg["From"] = self.user
+        msg["To"] = self.to_addrs
+        msg.attach(MIMEText(content, "html"))
+        try:
+            self._connect().send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # 空闲的连接会被服务器关闭, 重新连接后再发送一次
+            self._smtp = None
+            self._connect().send_message(msg)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except smtplib.SMTPException:
+            pass
+        finally:
+            self._smtp = None
+
+    def _connect(self) -> smtplib.SMTP_SSL:
+        if self._smtp is None:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=30)
+            smtp.login(self.user, self.password)
+            self._smtp = smtp
+            self.connect_count += 1
+        return self._smtp
+
+
+class PushDeerTransport(Transport):
+    def __init__(self, push_key: str):
+        self._pushdeer = PushDeer(pushkey=push_key)
+
+    def send(self, title: str, content: str) -> None:
+        self._pushdeer.send_markdown(title, desp=content)
+
+
+class ServerChanTransport(Transport):
+    def __init__(self, send_key: str):
+        self.url = f"https://sctapi.ftqq.com/{send_key}.send"
+
+    def send(self, title: str, content: str) -> None:
+        headers = {"content-type": "application/x-www-form-urlencoded"}
+        data = {"title": title, "channel": 9, "desp": content}
+        requests.post(
+            self.url, data=data, headers=headers, timeout=10
+        ).raise_for_status()
+
+
+class StubTransport(Transport):
+    """记录消息而不发送, 用于测试, 前 fail_times 次发送抛出异常"""
+
+    def __init__(self, fail_times: int = 0):
+        self.sent: list[tuple[str, str]] = []
+        self.fail_times = fail_times
+        self.attempts = 0
+
+    def send(self, title: str, content: str) -> None:
+        self.attempts += 1
+        if self.attempts <= self.fail_times:
+            raise ConnectionError("stub transport failure")
+        self.sent.append((title, content))
+
+
+class Notifier:
+    """按渠道发送通知, 后台线程运行时异步发送"""
+
+    def __init__(
+        self,
+        transports: Optional[dict[str, Transport]] = None,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+        digest_window: float = 0.0,
+    ):
+        self.transports: dict[str, Transport] = dict(transports or {})
+        self.retries = retries
+        self.backoff = backoff
+        # 合并消息的时间窗口(秒), 0: 不合并
+        self.digest_window = digest_window
+        self._queue: queue.Queue = queue.Queue(max_pending)
+        self._thread: Optional[threading.Thread] = None
+        # 等待合并的消息, 只在后台线程中访问, 键为分组
+        self._digests: dict[str, tuple[float, DigestFormatter, list]] = {}
+        self.queued_count = 0
+        self.sent_count = 0
+        self.retry_count = 0
+        self.failed_count = 0
+        self.dropped_count = 0
+        self.digest_count = 0
+        self.coalesced_count = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None
+
+    def set_transport(self, channel: str, transport: Transport) -> None:
+        """替换渠道的发送方式, 如测试时使用 StubTransport"""
+        old = self.transports.get(channel)
+        if old is not None:
+            old.close()
+        self.transports[channel] = transport
+
+    def start(self) -> None:
+        """启动后台发送线程"""
+        if self.is_running:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="notifier", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """发送完队列中的消息后停止后台线程, 并关闭连接"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+        for transport in self.transports.values():
+            transport.close()
+
+    def notify(self, channel: str, title: str, content: str) -> bool:
+        """发送消息, 后台线程运行时放入队列后立即返回, 队列已满时丢弃并返回 False"""
+        if channel not in self.transports:
+            logger.error(f"未知的通知渠道: {channel}")
+            return False
+        if not self.is_running:
+            return self._deliver(channel, title, content, 0)
+        return self._put((_SEND, channel, title, content), title)
+
+    def notify_digest(
+        self, group: str, item, formatter: DigestFormatter
+    ) -> bool:
+        """发送需要合并的消息
+
+        合并模式下同一组的消息从第一条开始等待 digest_window 秒, 由 formatter 合并为一条摘要,
+        否则立即由 formatter 转换后发送
+        """
+        if not self.is_running or self.digest_window <= 0:
+            return all(
+                [
+                    self.notify(channel, title, content)
+                    for channel, title, content in formatter([item])
+                ]
+            )
+        return self._put((_DIGEST, group, item, formatter), group)
+
+    def flush(self) -> None:
+        """等待队列中的消息发送完成, 等待合并的消息也立即发送"""
+        if self.is_running:
+            self._queue.put(_FLUSH)
+            self._queue.join()
+
+    def stats(self) -> dict:
+        """返回发送统计: 待发送数量, 入队次数, 发送成功, 重试, 最终失败和丢弃的消息数"""
+        return {
+            "pending": self._queue.qsize(),
+            "queued": self.queued_count,
+            "sent": self.sent_count,
+            "retried": self.retry_count,
+            "failed": self.failed_count,
+            "dropped": self.dropped_count,
+            "digests": self.digest_count,
+            "coalesced": self.coalesced_count,
+        }
+
+    def _put(self, item: tuple, name: str) -> bool:
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped_count += 1
+            logger.warning(f"通知队列已满, 丢弃消息: {name}")
+            return False
+        self.queued_count += 1
+        return True
+
+    def _deliver(
+        self,
+        channel: str,
+        title: str,
+        content: str,
+        retries: Optional[int] = None,
+    ) -> bool:
+        transport = self.transports[channel]
+        if retries is None:
+            retries = self.retries
+        for attempt in range(retries + 1):
+            if attempt > 0:
+                self.retry_count += 1
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                transport.send(title, content)
+                self.sent_count += 1
+                return True
+            except Exception as e:
+                logger.warning(
+                    f"{channel} 消息发送失败({attempt + 1}次): {title} {e}"
+                )
+        self.failed_count += 1
+        logger.error(f"{channel} 消息发送失败, 不再重试: {title}")
+        return False
+
+    def _add_digest(
+        self, group: str, item, formatter: DigestFormatter
+    ) -> None:
+        if group not in self._digests:
+            deadline = time.monotonic() + self.digest_window
+            self._digests[group] = (deadline, formatter, [])
+        self._digests[group][2].append(item)
+
+    def _send_digests(self, due_only: bool = False) -> None:
+        """发送到期的合并消息, due_only 为假时发送全部"""
+        now = time.monotonic()
+        for group in list(self._digests):
+            deadline, formatter, items = self._digests[group]
+            if due_only and deadline > now:
+                continue
+            del self._digests[group]
+            if len(items) > 1:
+                self.digest_count += 1
+                self.coalesced_count += len(items)
+            try:
+                messages = formatter(items)
+            except Exception as e:
+                logger.exception(e)
+                self.failed_count += 1
+                continue
+            for channel, title, content in messages:
+                if channel not in self.transports:
+                    logger.error(f"未知的通知渠道: {channel}")
+                    continue
+                self._deliver(channel, title, content)
+
+    def _get_timeout(self) -> Optional[float]:
+        """距离最早的合并消息到期的时间, 没有等待合并的消息时返回 None"""
+        if not self._digests:
+            return None
+        deadline = min(d for d, _, _ in self._digests.values())
+        return max(deadline - time.monotonic(), 0.0)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                item = self._queue.get(timeout=self._get_timeout())
+            except queue.Empty:
+                self._send_digests(due_only=True)
+                continue
+            try:
+                if item is _STOP:
+                    self._send_digests()
+                    return
+                if item is _FLUSH:
+                    self._send_digests()
+                elif item[0] == _DIGEST:
+                    self._add_digest(*item[1:])
+                else:
+                    self._deliver(*item[1:])
+                self._send_digests(due_only=True)
+            finally:
+                self._queue.task_done()
+
+
+_notifier = Notifier(
+    {
+        EMAIL: SmtpTransport(
+            EMAIL_HOST, EMAIL_PORT, EMAIL_USER, EMAIL_PASSWORD, EMAIL_TO
+        ),
+        PUSHDEER: PushDeerTransport(gvar.PUSH_KEY),
+        SERVER_CHAN: ServerChanTransport(SERVER_CHAN_KEY),
+    }
+)
+
+
+NOTIFY_QUEUE_DEPTH = get_metrics().gauge(
+    "notify_queue_depth", "等待后台线程发送的通知数量"
+)
+NOTIFY_QUEUE_DEPTH.set_function(lambda: _notifier.stats()["pending"])
+
+
+def get_notifier() -> Notifier:
+    """返回进程内共享的通知发送器"""
+    return _notifier
@@ -0,0 +1,109 @@
+from typing import Callable, Hashable, Optional
+
+from tqsdk import TqApi
+from tqsdk.objs import Order
+
+from utils.log_tools import LoggerGetter
+from utils.metrics import get_metrics
+
+ORDERS_IN_FLIGHT = get_metrics().gauge("orders_in_flight", "未完成的委托数量")
+ORDER_WAIT_SECONDS = get_metrics().histogram(
+    "order_wait_seconds", "同步模式下等待委托完成的时间(秒)"
+)
+
+
+class OrderManager:
+    """委托管理
+
+    同步模式下, 下单后循环 wait_update 直到委托完成, 再调用回调并返回,
+    每次 wait_update 之后调用 on_wait_update, 由盯盘人记录这期间的行情变化;
+    异步模式下, 下单后立即返回, 未完成的委托由 update 在每次 wait_update 之后检查,
+    委托完成时调用回调。每个委托人(owner)同一时间只有一个未完成的委托。
+    """
+
+    logger = LoggerGetter()
+
+    def __init__(
+        self,
+        api: TqApi,
+        is_async: bool = False,
+        on_wait_update: Optional[Callable[[], None]] = None,
+    ):
+        self._api = api
+        self.is_async = is_async
+        self._on_wait_update = on_wait_update
+        self._pending: dict[
+            Hashable, tuple[Order, Callable[[Order], None]]
+        ] = {}
+        # 已完成的委托数量
+        self.finished_count = 0
+        # 同步模式下正在等待完成的委托数量
+        self._waiting_count = 0
+        ORDERS_IN_FLIGHT.set_function(
+            lambda: len(self._pending) + self._waiting_count
+        )
+
+    def insert_order(
+        self,
+        owner: Hashable,
+        on_finished: Callable[[Order], None],
+        **order_args,
+    ) -> Order:
+        """下单, 委托完成时调用 on_finished
+
+        order_args 为 TqApi.insert_order 的参数, 下单失败时抛出异常且不记录委托
+        """
+        order = self._api.insert_order(**order_args)
+        if self.is_async:
+            self._pending[owner] = (order, on_finished)
+            return order
+        self._waiting_count += 1
+        try:
+            with ORDER_WAIT_SECONDS.time():
+                while True:
+                    self._api.wait_update()
+                    if self._on_wait_update is not None:
+                        self._on_wait_update()
+                    if order.status == "FINISHED":
+                        break
+        finally:
+            self._waiting_count -= 1
+        self._finish(order, on_finished)
+        return order
+
+    def has_pending(self, owner: Hashable) -> bool:
+        """委托人是否有未完成的委托"""
+        return owner in self._pending
+
+    def update(self) -> None:
+        """检查未完成的委托, 对已完成的委托调用回调"""
+        if not self._pending:
+            return
+        finished = [
+            owner
+            for owner, (order, _) in self._pending.items()
+            if order.status == "FINISHED"
+        ]
+        for owner in finished:
+            order, on_finished = self._pending.pop(owner)
+            try:
+                self._finish(order, on_finished)
+            except Exception as e:
+                # 一个委托的回调出错不影响其他委托
+                self.logger.error(
+                    f"委托 {order.order_id} 完成后处理出错: {e}",
+                    exc_info=True,
+                )
+
+    def stats(self) -> dict:
+        """返回委托统计: 未完成的委托数量, 已完成的委托数量"""
+        return {
+            "pending": len(self._pending),
+            "finished": self.finished_count,
+        }
+
+    def _finish(
+        self, order: Order, on_finished: Callable[[Order], None]
+    ) -> None:
+        self.finished_count += 1
+        on_finished(order)
@@ -0,0 +1,256 @@
+"""止盈止损参数扫描
+
+扫描配置为 YAML 文件, 例如:
+
+    mode: grid            # grid: 网格搜索, random: 随机搜索
+    samples: 20           # 随机搜索的次数
+    seed: 1               # 随机搜索的种子
+    processes: 0          # 进程数, 0 为 CPU 核数
+    metric: sharpe_ratio  # 排序使用的 tqsdk_stat 指标
+    output: sweep_results.csv
+    params:
+      long:
+        base_scale: [0.02, 0.03, 0.04]
+        stop_loss_scale: [1, 1.5]
+      short:
+        profit_start_scale: {min: 4, max: 10}
+
+参数取值为列表时从列表中选取, 为 min/max 区间时随机搜索在区间内均匀取值,
+网格搜索只支持列表。参数名为 LongConfig 和 ShortConfig 的字段, 扫描时覆盖所有品种的
+long 或 short 配置, 未扫描的参数使用品种配置文件中的值。
+
+参数是否有效取决于交易方向和策略实际读取的字段, 见 STRATEGY_PARAMS: 做多的摸底策略的
+止损和止盈起始价使用 short 配置, 没有策略使用 long 的 promote_scale_2 和 promote_target_2。
+交易方向和策略都不读取的参数不参与组合, 不会重复回测相同的实际参数。
+
+参数组合平均分到各进程中依次回测, 复用进程中已建立的数据库连接和已读取的系统配置。
+使用本地行情回放时, 进程中的各次回测还共用已读取的K线, 合成K线和日线条件的预扫描结果;
+使用天勤行情时, 每次回测都重新从天勤获取行情。
+"""
+
+import copy
+import csv
+import itertools
+import random
+from typing import Optional
+
+from dao.odm.future_config import LongConfig, ShortConfig
+from utils.common_tools import get_yaml_config
+from utils.config_utils import FutureConfig
+
+# 可扫描的参数, 键为品种配置中的 long 或 short
+SWEEP_PARAMS: dict[str, tuple[str, ...]] = {
+    "long": tuple(n for n in LongConfig._fields_ordered if n != "id"),
+    "short": tuple(n for n in ShortConfig._fields_ordered if n != "id"),
+}
+# 各交易策略读取的参数, 键为 (方向, 策略id), 方向 1: 多头 0: 空头, 策略id 1: 主策略 2: 摸底策略
+STRATEGY_PARAMS: dict[tuple[int, int], tuple[str, ...]] = {
+    (1, 1): (
+        "long.base_scale",
+        "long.stop_loss_scale",
+        "long.profit_start_scale_1",
+        "long.profit_start_scale_2",
+        "long.promote_scale_1",
+        "long.promote_target_1",
+    ),
+    (0, 1): (
+        "short.base_scale",
+        "short.stop_loss_scale",
+        "short.profit_start_scale",
+        "short.promote_scale",
+        "short.promote_target",
+    ),
+    (1, 2): (
+        "long.base_scale",
+        "short.stop_loss_scale",
+        "short.profit_start_scale",
+    ),
+    (0, 2): (
+        "short.base_scale",
+        "short.stop_loss_scale",
+        "short.profit_start_scale",
+    ),
+}
+# 交易方向包含的方向, 交易方向 1: 多头, 0: 空头, 2: 多空
+DIRECTION_SIDES: dict[int, tuple[int, ...]] = {1: (1,), 0: (0,), 2: (1, 0)}
+# 结果表中的统计指标
+REPORT_METRICS = (
+    "init_balance",
+    "balance",
+    "ror",
+    "annual_yield",
+    "max_drawdown",
+    "sharpe_ratio",
+    "sortino_ratio",
+    "winning_rate",
+    "profit_loss_ratio",
+)
+# 数值越小越好的指标
+ASCENDING_METRICS = ("max_drawdown",)
+
+
+class SweepSpec:
+    """参数扫描配置"""
+
+    def __init__(
+        self,
+        params: dict,
+        mode: str = "grid",
+        samples: int = 10,
+        seed: Optional[int] = None,
+        processes: int = 0,
+        metric: str = "sharpe_ratio",
+        output: str = "sweep_results.csv",
+    ):
+        if mode not in ("grid", "random"):
+            raise ValueError(f"不支持的扫描方式: {mode}")
+        self.space = parse_space(params)
+        if mode == "grid":
+            for name, values in self.space.items():
+                if not isinstance(values, list):
+                    raise ValueError(f"网格搜索的参数 {name} 需为取值列表")
+        self.mode = mode
+        self.samples = samples
+        self.seed = seed
+        self.processes = processes
+        self.metric = metric
+        self.output = output
+
+
+def get_sweep_spec(path: str) -> SweepSpec:
+    """从 YAML 文件读取参数扫描配置"""
+    return SweepSpec(**get_yaml_config(path))
+
+
+def parse_space(params: dict) -> dict:
+    """把扫描配置中的参数转换为 "long.base_scale" 形式的参数名到取值的映射
+
+    取值为列表, 或 (最小值, 最大值) 区间
+    """
+    space = {}
+    for side, values in params.items():
+        if side not in SWEEP_PARAMS:
+            raise ValueError(f"未知的参数类型: {side}")
+        for name, value in values.items():
+            if name not in SWEEP_PARAMS[side]:
+                raise ValueError(f"未知的参数: {side}.{name}")
+            if isinstance(value, dict):
+                space[f"{side}.{name}"] = (value["min"], value["max"])
+            elif isinstance(value, list) and value:
+                space[f"{side}.{name}"] = value
+            else:
+                space[f"{side}.{name}"] = [value]
+    return space
+
+
+def get_used_params(direction: int, strategy_ids: list[int]) -> set[str]:
+    """返回交易方向和策略实际读取的参数"""
+    return {
+        name
+        for side in DIRECTION_SIDES[direction]
+        for sid in strategy_ids
+        for name in STRATEGY_PARAMS[(side, sid)]
+    }
+
+
+def filter_space(space: dict, direction: int, strategy_ids: list[int]) -> dict:
+    """去掉交易方向和策略不读取的参数"""
+    used = get_used_params(direction, strategy_ids)
+    return {name: values for name, values in space.items() if name in used}
+
+
+def grid_params(space: dict) -> list[dict]:
+    """网格搜索, 返回所有参数组合"""
+    names = list(space)
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*(space[name] for name in names))
+    ]
+
+
+def random_params(
+    space: dict, samples: int, seed: Optional[int] = None
+) -> list[dict]:
+    """随机搜索, 返回不重复的参数组合, 组合数量不超过 samples"""
+    rng = random.Random(seed)
+    results, seen = [], set()
+    # 取值都是列表时组合数有限, 限制尝试次数防止死循环
+    for _ in range(samples * 10):
+        if len(results) >= samples:
+            break
+        params = {}
+        for name, values in space.items():
+            if isinstance(values, tuple):
+                params[name] = round(rng.uniform(*values), 4)
+            else:
+                params[name] = rng.choice(values)
+        key = tuple(sorted(params.items()))
+        if key not in seen:
+            seen.add(key)
+            results.append(params)
+    return results
+
+
+def get_sweep_params(
+    spec: SweepSpec, direction: int, strategy_ids: list[int]
+) -> list[dict]:
+    """根据扫描配置, 交易方向和策略生成参数组合"""
+    space = filter_space(spec.space, direction, strategy_ids)
+    if spec.mode == "grid":
+        return grid_params(space)
+    return random_params(space, spec.samples, spec.seed)
+
+
+def apply_params(
+    configs: list[FutureConfig], params: dict
+) -> list[FutureConfig]:
+    """返回使用参数组合覆盖后的品种配置, 不修改原配置"""
+    results = []
+    for config in configs:
+        config = copy.deepcopy(config)
+        for key, value in params.items():
+            side, name = key.split(".")
+            setattr(getattr(config, f"{side}_trade_config"), name, value)
+        results.append(config)
+    return results
+
+
+def group_runs(runs: list[tuple], group_count: int) -> list[list[tuple]]:
+    """把 (序号, 参数组合) 依次平均分为不超过 group_count 组"""
+    group_count = max(min(group_count, len(runs)), 1)
+    size = -(-len(runs) // group_count)
+    return [runs[i : i + size] for i in range(0, len(runs), size)]
+
+
+def rank_results(results: list[dict], metric: str) -> list[dict]:
+    """按指标排序, 没有该指标的结果排在最后, 返回带名次的结果"""
+    reverse = metric not in ASCENDING_METRICS
+
+    def sort_key(result):
+        value = (result.get("tqsdk_stat") or {}).get(metric)
+        if not isinstance(value, (int, float)) or value != value:
+            return (1, 0)
+        return (0, -value if reverse else value)
+
+    ranked = sorted(results, key=sort_key)
+    for rank, result in enumerate(ranked, 1):
+        result["rank"] = rank
+    return ranked
+
+
+def write_results(results: list[dict], path: str) -> None:
+    """把排序后的结果写入 CSV 文件, 每行为一个参数组合"""
+    param_names = sorted({name for r in results for name in r["params"]})
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["rank", *param_names, *REPORT_METRICS, "error"])
+        for result in results:
+            stat = result.get("tqsdk_stat") or {}
+            writer.writerow(
+                [
+                    result["rank"],
+                    *(result["params"].get(name) for name in param_names),
+                    *(stat.get(metric) for metric in REPORT_METRICS),
+                    result.get("error", ""),
+                ]
+            )
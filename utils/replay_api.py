@@ -0,0 +1,896 @@
+"""使用本地K线文件回放行情的 TqApi 替代品
+
+只实现本项目用到的接口: get_quote, get_kline_serial, wait_update, is_changing,
+insert_order, get_account, get_trading_status, close, 以及盯盘人回测时读取的
+_backtest, _account 和 _data。盯盘人, 交易员和交易策略不需要修改即可在其上运行,
+回测不需要连接天勤服务器, 也不需要网络和账户。
+
+行情目录中每个合约一个文件, 文件名为合约代码, 如 SHFE.rb2405.csv, KQ.m@SHFE.au.parquet,
+列为 datetime(K线起始时间, 纳秒时间戳或北京时间字符串), open, high, low, close, volume,
+open_oi, close_oi, 主连合约的文件还需要 underlying_symbol 列表示当时的标的合约。
+每个文件只保存一种周期的K线(基础K线, 如5分钟线), 更大周期的K线在回放时由基础K线合成,
+最后一根合成K线只包含已回放的基础K线, 不会用到未来的数据。
+回测开始前的K线作为历史数据, 基础K线需覆盖日线等序列所需的历史长度。
+合约信息保存在 instruments.csv 中, 列为 symbol, volume_multiple, price_tick,
+margin_ratio, commission(每手手续费), expire_datetime, 缺少的合约或列使用默认值。
+行情目录也可以是 utils.kline_store 的K线数据仓库, 此时直接读取仓库中的内存映射数组。
+同一进程中的多次回测可以通过 ReplayData 共用已读取的行情, 不必每次重新读取文件。
+
+盯盘人回测时订阅以下合约, 行情目录中必须有它们的K线, 缺少时订阅会报错:
+KQ.m@SHFE.au(盯盘人用它的行情时间判断是否处于交易时间), 每个回测品种的主连
+(如 KQ.m@SHFE.rb, 需要 underlying_symbol 列), 以及回测期间主连的各个标的合约和
+各自的下一主力合约(如 SHFE.rb2405 和 SHFE.rb2410)。
+
+回放以所有合约基础K线的结束时间为时钟, 每次 wait_update 前进到下一个时刻。
+成交模型: 委托在下一次 wait_update 时按最新价成交, 限价单在最新价优于委托价时成交,
+开仓资金不足或平仓手数不足时为错单。每个交易日结束时记录账户截面,
+回放结束时按天勤的方式计算回测统计 tqsdk_stat。
+"""
+
+import os
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from tqsdk import BacktestFinished
+from tqsdk.report import TqReport
+
+from utils.bar_aggregator import (
+    DAILY_DURATION,
+    KLINE_COLUMNS,
+    get_bucket_starts,
+)
+from utils.common_tools import tz_utc_8
+from utils.kline_store import UNDERLYING_COLUMN, KlineStore
+
+INSTRUMENTS_FILE = "instruments.csv"
+KLINE_FILE_TYPES = (".csv", ".parquet")
+# 天勤K线序列的最大长度
+MAX_KLINE_LENGTH = 10000
+DEFAULT_INSTRUMENT = {
+    "volume_multiple": 1.0,
+    "price_tick": 1.0,
+    "margin_ratio": 0.1,
+    "commission": 0.0,
+    "expire_datetime": None,
+}
+_SECOND_NS = 10**9
+# quote 时间为基础K线结束前 1 微秒, 与天勤回测中 K 线最后一笔行情的时间一致
+_QUOTE_OFFSET_NS = 1000
+
+
+def to_ns(values: pd.Series) -> np.ndarray:
+    """把K线文件中的时间转换为纳秒时间戳, 字符串按北京时间处理"""
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=np.int64)
+    dts = pd.to_datetime(values)
+    if dts.dt.tz is None:
+        dts = dts.dt.tz_localize(tz_utc_8)
+    return dts.dt.as_unit("ns").astype("int64").to_numpy()
+
+
+def format_ns(ns: int) -> str:
+    """返回与天勤 quote.datetime 格式一致的北京时间字符串"""
+    seconds, rest = divmod(int(ns), _SECOND_NS)
+    dt = datetime.fromtimestamp(seconds, tz_utc_8)
+    return dt.replace(microsecond=rest // 1000).strftime(
+        "%Y-%m-%d %H:%M:%S.%f"
+    )
+
+
+def get_trading_day(ns: int) -> date:
+    """返回时间所属的交易日"""
+    start = get_bucket_starts(np.array([ns], dtype=np.int64), DAILY_DURATION)
+    return datetime.fromtimestamp(int(start[0]) // _SECOND_NS, tz_utc_8).date()
+
+
+def _date_to_ns(d: date) -> int:
+    return int(
+        datetime(d.year, d.month, d.day, tzinfo=tz_utc_8).timestamp()
+        * _SECOND_NS
+    )
+
+
+class SymbolData:
+    """一个合约的基础K线
+
+    starts 为K线起始时间的纳秒时间戳, columns 为行情列, 可以是数据仓库中的内存映射数组
+    """
+
+    def __init__(
+        self,
+        symbol: str,
+        starts: np.ndarray,
+        columns: dict[str, np.ndarray],
+        underlying: Optional[np.ndarray] = None,
+    ):
+        if len(starts) == 0:
+            raise ValueError(f"{symbol} 的行情文件没有数据")
+        self.symbol = symbol
+        self.starts = starts
+        diffs = np.diff(starts)
+        diffs = diffs[diffs > 0]
+        # 基础K线的周期(秒), 只有一根K线时按日线处理
+        self.duration = (
+            int(diffs.min()) // _SECOND_NS if len(diffs) else DAILY_DURATION
+        )
+        self.ends = starts + self.duration * _SECOND_NS
+        self.columns = {
+            name: columns[name] if name in columns else np.zeros(len(starts))
+            for name in KLINE_COLUMNS
+            if name not in ("datetime", "id")
+        }
+        self.underlying = underlying
+        # 各周期的合成结果, 共用行情数据的回放共用
+        self._aggregated: dict[int, tuple] = {}
+
+    @classmethod
+    def from_frame(cls, symbol: str, frame: DataFrame) -> "SymbolData":
+        """从K线文件读取的 DataFrame 创建"""
+        frame = frame.sort_values("datetime", kind="stable")
+        columns = {
+            name: frame[name].to_numpy(dtype=float)
+            for name in KLINE_COLUMNS
+            if name in frame and name not in ("datetime", "id")
+        }
+        underlying = (
+            frame["underlying_symbol"].to_numpy(dtype=object)
+            if "underlying_symbol" in frame
+            else None
+        )
+        return cls(symbol, to_ns(frame["datetime"]), columns, underlying)
+
+    def get_pos(self, now: int) -> int:
+        """返回在 now 时已经结束的最后一根基础K线的位置, 没有时为 -1"""
+        return int(np.searchsorted(self.ends, now, side="right")) - 1
+
+    def is_bar_end(self, now: int) -> bool:
+        """now 是否为某根基础K线的结束时间"""
+        pos = int(np.searchsorted(self.ends, now))
+        return pos < len(self.ends) and self.ends[pos] == now
+
+    def aggregate(self, duration: int) -> tuple[np.ndarray, dict, dict]:
+        """按周期合成K线, 每个周期只合成一次
+
+        返回每根基础K线所属合成K线的序号, 合成K线的时间, 开盘价和开盘持仓量,
+        以及合成K线截至每根基础K线的最高价, 最低价和成交量
+        """
+        result = self._aggregated.get(duration)
+        if result is not None:
+            return result
+        buckets = get_bucket_starts(self.starts, duration)
+        first = np.r_[True, buckets[1:] != buckets[:-1]]
+        starts = np.flatnonzero(first)
+        bar_index = np.cumsum(first) - 1
+        cols = self.columns
+        groups = pd.Series(bar_index)
+        bars = {
+            "datetime": buckets[starts].astype(float),
+            "open": cols["open"][starts],
+            "open_oi": cols["open_oi"][starts],
+        }
+        partial = {
+            "high": pd.Series(cols["high"]).groupby(groups).cummax().values,
+            "low": pd.Series(cols["low"]).groupby(groups).cummin().values,
+            "volume": pd.Series(cols["volume"])
+            .groupby(groups)
+            .cumsum()
+            .values,
+        }
+        result = (bar_index, bars, partial)
+        self._aggregated[duration] = result
+        return result
+
+
+class ReplaySerial:
+    """回放中的一个K线序列, 结构与天勤K线序列相同
+
+    长度固定, 数据不足时前面为空行, 生成新K线时整体上移, 新行的附加列为 NaN。
+    最后一根K线由已回放的基础K线合成。
+    """
+
+    def __init__(self, data: SymbolData, duration: int, length: int):
+        if duration < data.duration:
+            raise ValueError(
+                f"{data.symbol} 的基础K线周期为 {data.duration} 秒, "
+                f"不能生成 {duration} 秒的K线"
+            )
+        self.data = data
+        self.duration = duration
+        self.length = length
+        # 每根基础K线所属合成K线的序号, 合成K线的开盘数据,
+        # 以及合成K线截至每根基础K线的最高价, 最低价和成交量
+        self.bar_index, self.bars, self.partial = data.aggregate(duration)
+        self.klines = DataFrame(index=range(length))
+        for name in KLINE_COLUMNS:
+            self.klines[name] = np.nan
+        self.klines["symbol"] = data.symbol
+        self.klines["duration"] = float(duration)
+        self._last_id = -1
+        self._pos = -1
+
+    def update(self, pos: int) -> bool:
+        """同步到第 pos 根基础K线, 生成新K线时返回 True"""
+        if pos == self._pos or pos < 0:
+            return False
+        self._pos = pos
+        last_id = int(self.bar_index[pos])
+        count = last_id - self._last_id
+        if self._last_id < 0 or count >= self.length:
+            count = self.length
+        if count > 0:
+            self._shift(count)
+        self._write(max(last_id - max(count, 1) + 1, 0), last_id)
+        self._last_id = last_id
+        return count > 0
+
+    def _shift(self, count: int) -> None:
+        """整体上移 count 行, 新行的行情列和附加列为空"""
+        frame = self.klines
+        for name in frame.columns:
+            if name in ("symbol", "duration"):
+                continue
+            values = frame[name].to_numpy(dtype=float)
+            frame[name] = np.concatenate(
+                [values[count:], np.full(min(count, len(values)), np.nan)]
+            )[-len(values) :]
+
+    def get_bars(self, first_id: int, last_id: int, pos: int) -> dict:
+        """返回序号为 first_id 到 last_id 的K线, 最后一根为截至第 pos 根基础K线的合成结果"""
+        ids = np.arange(first_id, last_id + 1)
+        # 已完成的K线取其最后一根基础K线的结果
+        ends = np.searchsorted(self.bar_index, ids, side="right") - 1
+        ends[-1] = pos
+        cols = self.data.columns
+        return {
+            "datetime": self.bars["datetime"][ids],
+            "id": ids.astype(float),
+            "open": self.bars["open"][ids],
+            "high": self.partial["high"][ends],
+            "low": self.partial["low"][ends],
+            "close": cols["close"][ends],
+            "volume": self.partial["volume"][ends],
+            "open_oi": self.bars["open_oi"][ids],
+            "close_oi": cols["close_oi"][ends],
+        }
+
+    def _write(self, first_id: int, last_id: int) -> None:
+        """写入序号为 first_id 到 last_id 的K线, 最后一根为已回放部分的合成结果"""
+        frame = self.klines
+        values = self.get_bars(first_id, last_id, self._pos)
+        count = min(last_id - first_id + 1, self.length)
+        for name in KLINE_COLUMNS:
+            column = frame[name].to_numpy(dtype=float, copy=True)
+            column[len(column) - count :] = values[name][-count:]
+            frame[name] = column
+
+
+class ReplayQuote:
+    """回放中的行情报价, 字段与天勤 Quote 一致"""
+
+    def __init__(self, symbol: str, instrument: dict):
+        self.symbol = symbol
+        self.exchange_id, _, self.instrument_id = symbol.rpartition(".")
+        self.volume_multiple = instrument["volume_multiple"]
+        self.price_tick = instrument["price_tick"]
+        self.expire_datetime = instrument["expire_datetime"]
+        self.datetime = ""
+        self.last_price = float("nan")
+        self.bid_price1 = float("nan")
+        self.ask_price1 = float("nan")
+        self.highest = float("nan")
+        self.lowest = float("nan")
+        self.volume = 0
+        self.underlying_symbol = ""
+        self.expire_rest_days = float("nan")
+
+
+class ReplayTradingStatus:
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        # 回放只在有K线的时刻进行, 总是处于连续交易状态
+        self.trade_status = "CONTINOUS"
+
+
+class ReplayTrade:
+    """成交记录, 字段与天勤 Trade 一致"""
+
+    def __init__(self, order: "ReplayOrder", price: float, commission, now):
+        self.order_id = order.order_id
+        self.trade_id = f"{order.order_id}|{order.volume_orign}"
+        self.exchange_trade_id = self.trade_id
+        self.exchange_id = order.exchange_id
+        self.instrument_id = order.instrument_id
+        self.direction = order.direction
+        self.offset = order.offset
+        self.price = price
+        self.volume = order.volume_orign
+        self.commission = commission
+        self.trade_date_time = now
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+class ReplayOrder:
+    """委托单, 字段与天勤 Order 一致"""
+
+    def __init__(self, order_id: str, symbol: str, **order_args):
+        self.order_id = order_id
+        self.exchange_order_id = order_id
+        self.exchange_id, _, self.instrument_id = symbol.rpartition(".")
+        self.symbol = symbol
+        self.direction = order_args["direction"]
+        self.offset = order_args["offset"]
+        self.volume_orign = int(order_args["volume"])
+        self.volume_left = self.volume_orign
+        limit_price = order_args.get("limit_price")
+        self.limit_price = (
+            float("nan") if limit_price is None else float(limit_price)
+        )
+        self.price_type = "ANY" if limit_price is None else "LIMIT"
+        self.volume_condition = "ANY"
+        self.time_condition = "IOC" if limit_price is None else "GFD"
+        self.insert_date_time = 0
+        self.last_msg = ""
+        self.status = "ALIVE"
+        self.is_dead = False
+        self.is_online = True
+        self.is_error = False
+        self.trade_price = float("nan")
+        self.trade_records: dict[str, ReplayTrade] = {}
+
+
+class ReplayAccount:
+    """账户资金, 字段与天勤 Account 一致"""
+
+    def __init__(self, init_balance: float):
+        self.currency = "CNY"
+        self.pre_balance = init_balance
+        self.static_balance = init_balance
+        self.balance = init_balance
+        self.available = init_balance
+        self.float_profit = 0.0
+        self.position_profit = 0.0
+        self.close_profit = 0.0
+        self.frozen_margin = 0.0
+        self.margin = 0.0
+        self.frozen_commission = 0.0
+        self.commission = 0.0
+        self.frozen_premium = 0.0
+        self.premium = 0.0
+        self.deposit = 0.0
+        self.withdraw = 0.0
+        self.risk_ratio = 0.0
+        self.market_value = 0.0
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+class ReplayPosition:
+    """一个合约的持仓, 开仓均价在平仓时保持不变"""
+
+    def __init__(self, symbol: str):
+        self.exchange_id, _, self.instrument_id = symbol.rpartition(".")
+        self.volume_long = 0
+        self.volume_short = 0
+        self.open_price_long = float("nan")
+        self.open_price_short = float("nan")
+        self.float_profit = 0.0
+        self.margin = 0.0
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+class ReplaySim:
+    """模拟账户, 按简单成交模型撮合委托并记录每个交易日的账户截面
+
+    trade_log 和 tqsdk_stat 的结构与 TqSim 一致
+    """
+
+    def __init__(self, init_balance: float):
+        self.init_balance = init_balance
+        self.account = ReplayAccount(init_balance)
+        self.positions: dict[str, ReplayPosition] = {}
+        self.orders: dict[str, ReplayOrder] = {}
+        self.trade_log: dict[str, dict] = {}
+        self.tqsdk_stat: dict = {}
+        self._trading_day: Optional[date] = None
+        self._day_trades: list[dict] = []
+        self._total_close_profit = 0.0
+        self._total_commission = 0.0
+
+    def match(self, order: ReplayOrder, quote: ReplayQuote, info, now):
+        """按最新价撮合委托, 不能成交时保持委托有效"""
+        price = quote.last_price
+        if np.isnan(price):
+            return self._reject(order, "合约没有行情")
+        is_buy = order.direction == "BUY"
+        if order.price_type == "LIMIT":
+            if is_buy and price > order.limit_price:
+                return
+            if not is_buy and price < order.limit_price:
+                return
+        position = self.positions.setdefault(
+            order.symbol, ReplayPosition(order.symbol)
+        )
+        volume = order.volume_orign
+        multiple = quote.volume_multiple
+        commission = info["commission"] * volume
+        if order.offset == "OPEN":
+            margin = price * volume * multiple * info["margin_ratio"]
+            if margin + commission > self.account.available:
+                return self._reject(order, "开仓资金不足")
+            side = "long" if is_buy else "short"
+            held = getattr(position, f"volume_{side}")
+            avg = getattr(position, f"open_price_{side}")
+            avg = (
+                price
+                if held == 0
+                else (avg * held + price * volume) / (held + volume)
+            )
+            setattr(position, f"volume_{side}", held + volume)
+            setattr(position, f"open_price_{side}", avg)
+        else:
+            side = "short" if is_buy else "long"
+            held = getattr(position, f"volume_{side}")
+            if held < volume:
+                return self._reject(order, "平仓手数不足")
+            avg = getattr(position, f"open_price_{side}")
+            sign = 1 if side == "long" else -1
+            profit = (price - avg) * volume * multiple * sign
+            self.account.close_profit += profit
+            self._total_close_profit += profit
+            setattr(position, f"volume_{side}", held - volume)
+        self.account.commission += commission
+        self._total_commission += commission
+        trade = ReplayTrade(order, price, commission, now)
+        order.trade_records[trade.trade_id] = trade
+        order.volume_left = 0
+        order.trade_price = price
+        order.status = "FINISHED"
+        order.is_dead = True
+        order.last_msg = "全部成交"
+        self._day_trades.append(trade.to_dict())
+
+    def settle(self, quotes: dict, instruments: dict) -> None:
+        """按最新价计算持仓盈亏, 保证金和账户权益"""
+        float_profit = margin = 0.0
+        for symbol, position in self.positions.items():
+            quote = quotes.get(symbol)
+            if quote is None or np.isnan(quote.last_price):
+                continue
+            price, multiple = quote.last_price, quote.volume_multiple
+            ratio = instruments[symbol]["margin_ratio"]
+            profit = 0.0
+            if position.volume_long:
+                profit += (
+                    (price - position.open_price_long)
+                    * position.volume_long
+                    * multiple
+                )
+            if position.volume_short:
+                profit += (
+                    (position.open_price_short - price)
+                    * position.volume_short
+                    * multiple
+                )
+            volume = position.volume_long + position.volume_short
+            position.float_profit = profit
+            position.margin = price * volume * multiple * ratio
+            float_profit += profit
+            margin += position.margin
+        account = self.account
+        account.float_profit = account.position_profit = float_profit
+        account.margin = margin
+        account.balance = (
+            self.init_balance
+            + self._total_close_profit
+            + float_profit
+            - self._total_commission
+        )
+        account.available = account.balance - margin
+        account.risk_ratio = margin / account.balance if account.balance else 0
+
+    def roll(self, trading_day: date) -> None:
+        """进入新的交易日, 记录上一个交易日的账户截面"""
+        if self._trading_day is not None and trading_day != self._trading_day:
+            self.record_day()
+            self.account.pre_balance = self.account.balance
+            self.account.static_balance = self.account.balance
+            self.account.close_profit = 0.0
+            self.account.commission = 0.0
+            self._day_trades = []
+        self._trading_day = trading_day
+
+    def record_day(self) -> None:
+        if self._trading_day is None:
+            return
+        self.trade_log[self._trading_day.strftime("%Y-%m-%d")] = {
+            "trades": list(self._day_trades),
+            "account": self.account.to_dict(),
+            "positions": {
+                symbol: position.to_dict()
+                for symbol, position in self.positions.items()
+                if position.volume_long or position.volume_short
+            },
+        }
+
+    def finish(self, quotes: dict) -> None:
+        """回放结束, 记录最后一个交易日并计算回测统计"""
+        self.record_day()
+        if not self.trade_log:
+            return
+        report = TqReport(
+            report_id="replay",
+            trade_log=self.trade_log,
+            quotes={
+                symbol: {"volume_multiple": quote.volume_multiple}
+                for symbol, quote in quotes.items()
+            },
+        )
+        self.tqsdk_stat = report.default_metrics
+
+    @staticmethod
+    def _reject(order: ReplayOrder, message: str) -> None:
+        order.status = "FINISHED"
+        order.is_dead = True
+        order.is_error = True
+        order.last_msg = message
+
+
+class ReplayBacktest:
+    """与 TqBacktest 一致, 保存回测的起止时间(纳秒)"""
+
+    def __init__(self, start_dt: date, end_dt: date):
+        self._start_dt = _date_to_ns(start_dt)
+        self._end_dt = _date_to_ns(end_dt + timedelta(days=1)) - 1
+
+
+class ReplayData:
+    """行情目录中的基础K线和合约信息
+
+    回放时只读, 同一进程中的多次回测可以共用, 合成的K线和预扫描结果也随之共用
+    """
+
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self.symbols = load_kline_files(data_dir)
+        self.instruments = load_instruments(data_dir)
+        # 预扫描的结果, 键为扫描参数, 由 strategies.prescan 读写
+        self.scans: dict[tuple, dict] = {}
+
+
+class ReplayApi:
+    """使用本地K线文件回放行情的 TqApi 替代品
+
+    start_dt 和 end_dt 为回测的起止交易日, 之前的K线只作为历史数据,
+    replay_data 为已读取的行情数据, 为 None 时读取 data_dir
+    """
+
+    def __init__(
+        self,
+        data_dir: str,
+        start_dt: date,
+        end_dt: date,
+        init_balance: float = 10000000.0,
+        replay_data: Optional[ReplayData] = None,
+    ):
+        self._data_dir = data_dir
+        self._backtest = ReplayBacktest(start_dt, end_dt)
+        self._account = ReplaySim(init_balance)
+        if replay_data is None:
+            replay_data = ReplayData(data_dir)
+        self.replay_data = replay_data
+        self._symbols = replay_data.symbols
+        self._instruments = replay_data.instruments
+        self._quotes: dict[str, ReplayQuote] = {}
+        self._serials: dict[tuple[str, int, int], ReplaySerial] = {}
+        self._serial_ids: dict[int, ReplaySerial] = {}
+        # 与天勤一致, 保存订阅过的合约信息
+        self._data: dict = {"quotes": {}}
+        # 本次更新中发生变化的合约和生成新K线的序列
+        self._changed: set[str] = set()
+        self._new_bars: set[tuple[str, int]] = set()
+        self._sync_diffs: list[dict] = []
+        # 新的委托, 在下一次 wait_update 时撮合
+        self._pending: list[ReplayOrder] = []
+        # 未能立即成交的限价单, 之后每次行情更新时撮合
+        self._resting: list[ReplayOrder] = []
+        self._order_count = 0
+        self._clock = self._build_clock(start_dt, end_dt)
+        self._step = 0
+        self._finished = len(self._clock) == 0
+        if not self._finished:
+            self._apply(self._clock[0])
+
+    @property
+    def now(self) -> int:
+        """当前回放时刻(纳秒), 为刚结束的基础K线的结束时间"""
+        return int(self._clock[min(self._step, len(self._clock) - 1)])
+
+    def get_quote(self, symbol: str) -> ReplayQuote:
+        quote = self._quotes.get(symbol)
+        if quote is None:
+            self._get_symbol_data(symbol)
+            quote = ReplayQuote(symbol, self._get_instrument(symbol))
+            self._quotes[symbol] = quote
+            self._data["quotes"][symbol] = {
+                "volume_multiple": quote.volume_multiple
+            }
+            self._update_quote(quote, self.now)
+        return quote
+
+    def get_kline_serial(
+        self, symbol: str, duration_seconds: int, data_length: int = 200
+    ) -> DataFrame:
+        key = (symbol, int(duration_seconds), int(data_length))
+        serial = self._serials.get(key)
+        if serial is None:
+            data = self._get_symbol_data(symbol)
+            serial = ReplaySerial(data, key[1], min(key[2], MAX_KLINE_LENGTH))
+            serial.update(data.get_pos(self.now))
+            self._serials[key] = serial
+            self._serial_ids[id(serial.klines)] = serial
+        return serial.klines
+
+    def get_symbols(self) -> list[str]:
+        """返回行情目录中的所有合约"""
+        return list(self._symbols)
+
+    def get_trading_days(self) -> list[date]:
+        """返回回放区间内的所有交易日"""
+        days = get_bucket_starts(
+            self._clock - _QUOTE_OFFSET_NS, DAILY_DURATION
+        )
+        return [
+            datetime.fromtimestamp(int(ns) // _SECOND_NS, tz_utc_8).date()
+            for ns in np.unique(days)
+        ]
+
+    def get_history_klines(self, symbol: str, duration: int) -> DataFrame:
+        """返回行情目录中合约的全部K线, 包括尚未回放的K线
+
+        只用于回测开始前的预扫描, 交易策略不能使用
+        """
+        serial = ReplaySerial(self._get_symbol_data(symbol), duration, 1)
+        last_id = int(serial.bar_index[-1])
+        bars = serial.get_bars(0, last_id, len(serial.bar_index) - 1)
+        bars["datetime"] = serial.bars["datetime"].astype(np.int64)
+        return DataFrame({name: bars[name] for name in KLINE_COLUMNS})
+
+    def fast_forward(self, until: int) -> bool:
+        """直接前进到 until 之前的最后一个时刻, 中间的时刻不单独更新
+
+        只能在同一个交易日内前进, 有未完成的委托时不前进。
+        前进后的行情, K线和账户与逐个时刻回放的结果相同, 前进了返回 True
+        """
+        if self._pending or self._resting or self._finished:
+            return False
+        target = int(np.searchsorted(self._clock, until)) - 1
+        if target <= self._step + 1:
+            return False
+        now = self.now
+        day = get_trading_day(now - _QUOTE_OFFSET_NS)
+        if get_trading_day(int(self._clock[target]) - _QUOTE_OFFSET_NS) != day:
+            return False
+        self._step = target
+        self._apply(self._clock[target], since=now)
+        return True
+
+    def get_account(self) -> ReplayAccount:
+        return self._account.account
+
+    def get_trading_status(self, symbol: str) -> ReplayTradingStatus:
+        return ReplayTradingStatus(symbol)
+
+    def insert_order(
+        self,
+        symbol: str,
+        direction: str,
+        offset: str,
+        volume: int,
+        limit_price: Optional[float] = None,
+        **kwargs,
+    ) -> ReplayOrder:
+        """下单, 委托在下一次 wait_update 时撮合"""
+        self._get_symbol_data(symbol)
+        self._order_count += 1
+        order = ReplayOrder(
+            f"replay_{self._order_count}",
+            symbol,
+            direction=direction,
+            offset=offset,
+            volume=volume,
+            limit_price=limit_price,
+        )
+        order.insert_date_time = self.now - _QUOTE_OFFSET_NS
+        self._account.orders[order.order_id] = order
+        self._pending.append(order)
+        return order
+
+    def wait_update(self, deadline: Optional[float] = None) -> bool:
+        """有新委托时撮合新委托, 否则前进到下一个时刻并撮合未成交的限价单
+
+        与天勤一致, 新委托的回报单独作为一次更新, 此时行情不变。
+        回放结束时抛出 BacktestFinished
+        """
+        if self._pending:
+            orders, self._pending = self._pending, []
+            self._match_orders(orders)
+            self._changed = set()
+            self._new_bars = set()
+            self._sync_diffs = [{}]
+            return True
+        if self._finished:
+            raise BacktestFinished(self)
+        self._step += 1
+        if self._step >= len(self._clock):
+            self._finished = True
+            self._account.finish(self._quotes)
+            raise BacktestFinished(self)
+        self._apply(self._clock[self._step])
+        if self._resting:
+            orders, self._resting = self._resting, []
+            self._match_orders(orders)
+        return True
+
+    def is_changing(self, obj, key=None) -> bool:
+        """quote 和K线序列最后一行是否在本次更新中变化, 不区分字段"""
+        if isinstance(obj, ReplayQuote):
+            return obj.symbol in self._changed
+        if isinstance(obj, DataFrame):
+            serial = self._serial_ids.get(id(obj))
+            return serial is not None and (
+                (serial.data.symbol, serial.duration) in self._new_bars
+            )
+        if isinstance(obj, pd.Series) and "symbol" in obj.index:
+            return (obj["symbol"], int(obj["duration"])) in self._new_bars
+        return False
+
+    def close(self) -> None:
+        pass
+
+    def _build_clock(self, start_dt: date, end_dt: date) -> np.ndarray:
+        """回放的时刻: 回测区间内所有基础K线的结束时间"""
+        first = _date_to_ns(start_dt)
+        last = _date_to_ns(end_dt)
+        clock = []
+        for data in self._symbols.values():
+            days = get_bucket_starts(data.starts, DAILY_DURATION)
+            clock.append(data.ends[(days >= first) & (days <= last)])
+        if not clock:
+            return np.array([], dtype=np.int64)
+        return np.unique(np.concatenate(clock))
+
+    def _apply(self, now: int, since: Optional[int] = None) -> None:
+        """把行情同步到 now 时刻, since 为跳过的时刻之前的时刻"""
+        now = int(now)
+        self._account.roll(get_trading_day(now - _QUOTE_OFFSET_NS))
+        if since is None:
+            self._changed = {
+                symbol
+                for symbol, data in self._symbols.items()
+                if data.is_bar_end(now)
+            }
+        else:
+            self._changed = {
+                symbol
+                for symbol, data in self._symbols.items()
+                if data.get_pos(now) != data.get_pos(since)
+            }
+        for quote in self._quotes.values():
+            if quote.symbol in self._changed:
+                self._update_quote(quote, now)
+        self._new_bars = set()
+        for serial in self._serials.values():
+            if serial.data.symbol in self._changed and serial.update(
+                serial.data.get_pos(now)
+            ):
+                self._new_bars.add((serial.data.symbol, serial.duration))
+        self._account.settle(self._quotes, self._instruments_of_quotes())
+        self._sync_diffs = [
+            {
+                "quotes": {symbol: {} for symbol in self._changed},
+                "klines": {symbol: {} for symbol in self._changed},
+            }
+        ]
+
+    def _update_quote(self, quote: ReplayQuote, now: int) -> None:
+        data = self._symbols[quote.symbol]
+        pos = data.get_pos(now)
+        if pos < 0:
+            return
+        end = int(data.ends[pos])
+        price = data.columns["close"][pos]
+        quote.datetime = format_ns(end - _QUOTE_OFFSET_NS)
+        quote.last_price = quote.bid_price1 = quote.ask_price1 = price
+        quote.highest = data.columns["high"][pos]
+        quote.lowest = data.columns["low"][pos]
+        quote.volume = data.columns["volume"][pos]
+        if data.underlying is not None:
+            quote.underlying_symbol = str(data.underlying[pos])
+        if quote.expire_datetime:
+            today = get_trading_day(end - _QUOTE_OFFSET_NS)
+            expire = pd.Timestamp(quote.expire_datetime).date()
+            quote.expire_rest_days = (expire - today).days
+
+    def _match_orders(self, orders: list[ReplayOrder]) -> None:
+        now = self.now - _QUOTE_OFFSET_NS
+        for order in orders:
+            quote = self.get_quote(order.symbol)
+            info = self._get_instrument(order.symbol)
+            self._account.match(order, quote, info, now)
+            if order.status != "FINISHED":
+                self._resting.append(order)
+        self._account.settle(self._quotes, self._instruments_of_quotes())
+
+    def _instruments_of_quotes(self) -> dict:
+        return {
+            symbol: self._get_instrument(symbol) for symbol in self._quotes
+        }
+
+    def _get_instrument(self, symbol: str) -> dict:
+        return self._instruments.get(symbol, DEFAULT_INSTRUMENT)
+
+    def _get_symbol_data(self, symbol: str) -> SymbolData:
+        data = self._symbols.get(symbol)
+        if data is None:
+            raise ValueError(
+                f"行情目录 {self._data_dir} 中没有 {symbol} 的K线文件"
+            )
+        return data
+
+
+def load_kline_files(data_dir: str) -> dict[str, SymbolData]:
+    """读取行情目录中的K线文件, 返回合约代码到基础K线的映射
+
+    行情目录为K线数据仓库时, 每个合约使用仓库中周期最小的K线
+    """
+    if KlineStore.is_store(data_dir):
+        return load_kline_store(KlineStore(data_dir))
+    symbols = {}
+    for name in sorted(os.listdir(data_dir)):
+        symbol, ext = os.path.splitext(name)
+        if ext not in KLINE_FILE_TYPES or name == INSTRUMENTS_FILE:
+            continue
+        path = os.path.join(data_dir, name)
+        if ext == ".csv":
+            frame = pd.read_csv(path)
+        else:
+            frame = pd.read_parquet(path)
+        symbols[symbol] = SymbolData.from_frame(symbol, frame)
+    return symbols
+
+
+def load_kline_store(store: KlineStore) -> dict[str, SymbolData]:
+    """从K线数据仓库读取基础K线, 行情列直接使用内存映射数组, 不复制数据"""
+    symbols = {}
+    for symbol in store.symbols():
+        columns = store.read(symbol, store.durations(symbol)[0])
+        symbols[symbol] = SymbolData(
+            symbol,
+            columns.pop("datetime"),
+            columns,
+            columns.pop(UNDERLYING_COLUMN, None),
+        )
+    return symbols
+
+
+def load_instruments(data_dir: str) -> dict[str, dict]:
+    """读取合约信息, 没有合约信息文件时返回空字典"""
+    path = os.path.join(data_dir, INSTRUMENTS_FILE)
+    if not os.path.exists(path):
+        return {}
+    instruments = {}
+    for row in pd.read_csv(path).to_dict("records"):
+        info = dict(DEFAULT_INSTRUMENT)
+        info.update(
+            {k: v for k, v in row.items() if k != "symbol" and pd.notna(v)}
+        )
+        instruments[row["symbol"]] = info
+    return instruments
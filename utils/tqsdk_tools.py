@@ -1,4 +1,5 @@
 import logging
+from typing import Optional
 
 from tqsdk import TqApi, tafunc
 from tqsdk.objs import Quote
@@ -134,3 +135,18 @@ def get_break_time(quote: Quote) -> int:
     该函数的前提假设是 quote.datetime 已经处于14:59:59
     """
     return tafunc.time_to_s_timestamp(quote.datetime) + 60 * 30
+
+
+def get_changed_symbols(api: TqApi) -> Optional[set[str]]:
+    """返回本次行情更新中 quote 或K线发生变化的合约
+
+    通过天勤本次 wait_update 收到的更新数据判断, 无法获取更新数据时返回 None
+    """
+    diffs = getattr(api, "_sync_diffs", None)
+    if diffs is None:
+        return None
+    symbols: set[str] = set()
+    for diff in diffs:
+        for name in ("quotes", "klines", "ticks"):
+            symbols.update(diff.get(name, {}))
+    return symbols